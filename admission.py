@@ -0,0 +1,233 @@
+"""
+Admission control and load shedding for the WebSocket servers.
+
+Limits how many requests are in flight globally and per client. A request
+that would have to queue longer than it can afford to is answered at once
+with a ``busy`` frame carrying a retry hint, instead of piling up behind
+a slow Gemini backend. New connections are refused past a configurable
+capacity so memory stays bounded.
+"""
+import math
+import time
+import asyncio
+from collections import deque
+from dataclasses import dataclass
+from functools import wraps
+from http import HTTPStatus
+from typing import Callable, Deque, Dict, Optional
+
+from metrics import Counter, Gauge
+from protocol import encode
+from settings import EnvSettings
+
+REJECTED = Counter("admission_rejected_total", "Requests and connections refused by admission control", ["reason"])
+QUEUED = Gauge("admission_queued_requests", "Requests waiting for an in-flight slot")
+
+
+@dataclass
+class AdmissionSettings(EnvSettings):
+    """
+    Admission limits for one server.
+
+    Attributes:
+        max_inflight: Requests processed at once across all clients
+        max_inflight_per_client: Requests one client may have in flight or queued
+        max_queue: Requests allowed to wait for a slot once all are taken
+        deadline: Seconds a request may take from arrival to answer; requests
+            expected to miss it are refused instead of queued
+        max_connections: Open connections accepted before new ones are refused
+        min_retry_after: Smallest retry hint sent to refused clients, in seconds
+    """
+    env_prefix = "ADMISSION"
+
+    max_inflight: int = 32
+    max_inflight_per_client: int = 2
+    max_queue: int = 256
+    deadline: float = 30.0
+    max_connections: int = 1000
+    min_retry_after: float = 0.5
+
+
+class Busy(Exception):
+    """Raised when a request is refused; carries the suggested retry delay."""
+
+    def __init__(self, retry_after: float, reason: str):
+        super().__init__(f"Server busy ({reason}), retry after {retry_after}s")
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+def busy_frame(retry_after: float, request_id: Optional[str] = None) -> str:
+    """Build the reply sent to a client whose request was refused."""
+    frame = {"type": "busy", "retry_after": retry_after}
+    if request_id:
+        frame["request_id"] = request_id
+    return encode(frame)
+
+
+class AdmissionController:
+    """
+    Tracks in-flight requests and decides whether new ones are admitted.
+
+    Service time is estimated with an exponentially weighted moving average
+    of completed requests, and used to predict how long a queued request
+    would wait for a slot.
+    """
+
+    def __init__(self, settings: Optional[AdmissionSettings] = None, smoothing: float = 0.2):
+        self.settings = settings or AdmissionSettings()
+        self.smoothing = smoothing
+        self.inflight = 0
+        self.per_client: Dict[str, int] = {}
+        self.service_time = 0.0
+        self._waiters: Deque[asyncio.Future] = deque()
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    def estimated_wait(self) -> float:
+        """Seconds a request arriving now would wait for a slot."""
+        if self.inflight < self.settings.max_inflight:
+            return 0.0
+        # Slots free up max_inflight at a time, one service time apart
+        rounds = math.ceil((len(self._waiters) + 1) / self.settings.max_inflight)
+        return rounds * self.service_time
+
+    def retry_after(self, wait: float = 0.0) -> float:
+        return round(max(self.settings.min_retry_after, wait or self.service_time), 1)
+
+    def _reject(self, reason: str, wait: float = 0.0):
+        REJECTED.labels(reason=reason).inc()
+        raise Busy(self.retry_after(wait), reason)
+
+    def check(self, client_id: str):
+        """
+        Refuse a request that acquire() would refuse right now, without taking a slot.
+
+        For callers that have to answer before they can hold a slot, e.g.
+        with an HTTP status ahead of a streamed body.
+
+        Raises:
+            Busy: If the client is at its limit, the queue is full or the
+                request is not expected to be answered within the deadline
+        """
+        settings = self.settings
+        if self.per_client.get(client_id, 0) >= settings.max_inflight_per_client:
+            self._reject("client_limit")
+        if self.inflight >= settings.max_inflight:
+            if len(self._waiters) >= settings.max_queue:
+                self._reject("queue_full", self.estimated_wait())
+            wait = self.estimated_wait()
+            if wait > settings.deadline - self.service_time:
+                self._reject("deadline", wait)
+
+    async def acquire(self, client_id: str):
+        """
+        Take an in-flight slot for a client, waiting briefly if needed.
+
+        Raises:
+            Busy: If the client is at its limit, the queue is full or the
+                request is not expected to be answered within the deadline
+        """
+        settings = self.settings
+        self.check(client_id)
+        if self.inflight >= settings.max_inflight:
+            budget = settings.deadline - self.service_time
+            self.per_client[client_id] = self.per_client.get(client_id, 0) + 1
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                # release() hands its slot over by resolving the future
+                await asyncio.wait_for(asyncio.shield(waiter), max(budget, 0.0))
+            except BaseException as e:
+                if waiter.done() and not waiter.cancelled():
+                    # The slot arrived as we gave up; pass it on
+                    self._release_slot()
+                else:
+                    waiter.cancel()
+                    self._waiters.remove(waiter)
+                self._forget_client(client_id)
+                if isinstance(e, asyncio.TimeoutError):
+                    self._reject("deadline", self.estimated_wait())
+                raise
+        else:
+            self.inflight += 1
+            self.per_client[client_id] = self.per_client.get(client_id, 0) + 1
+        return time.perf_counter()
+
+    def release(self, client_id: str, started: float):
+        """Return a slot taken by acquire() and update the service time estimate."""
+        elapsed = time.perf_counter() - started
+        if self.service_time == 0.0:
+            self.service_time = elapsed
+        else:
+            self.service_time += self.smoothing * (elapsed - self.service_time)
+        self._forget_client(client_id)
+        self._release_slot()
+
+    def _forget_client(self, client_id: str):
+        count = self.per_client.get(client_id, 0) - 1
+        if count > 0:
+            self.per_client[client_id] = count
+        else:
+            self.per_client.pop(client_id, None)
+
+    def _release_slot(self):
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                # The slot passes straight to the next waiter; inflight is unchanged
+                waiter.set_result(None)
+                return
+        self.inflight -= 1
+
+    def guard(self, handler: Callable):
+        """
+        Wrap a dispatcher handler ``(message, client_id, send)`` so it only
+        runs once admitted, replying with a busy frame otherwise.
+        """
+        @wraps(handler)
+        async def admitted(message, client_id: str, send):
+            try:
+                started = await self.acquire(client_id)
+            except Busy as e:
+                await send(busy_frame(e.retry_after, getattr(message, "request_id", None)))
+                return
+            try:
+                return await handler(message, client_id, send)
+            finally:
+                self.release(client_id, started)
+        return admitted
+
+    def at_capacity(self, connections: int) -> bool:
+        """Whether a new connection should be refused, counting it as rejected if so."""
+        if connections >= self.settings.max_connections:
+            REJECTED.labels(reason="capacity").inc()
+            return True
+        return False
+
+    def connection_gate(self, count: Callable[[], int], process_request=None):
+        """
+        Build a ``process_request`` hook for ``websockets.serve`` that
+        refuses handshakes with 503 once ``count()`` reaches capacity.
+
+        Args:
+            count: Returns the number of open connections
+            process_request: Hook to run first, e.g. the /metrics handler
+        """
+        async def gate(path, request_headers):
+            if process_request is not None:
+                response = await process_request(path, request_headers)
+                if response is not None:
+                    return response
+            if self.at_capacity(count()):
+                retry_after = str(math.ceil(self.retry_after()))
+                return (HTTPStatus.SERVICE_UNAVAILABLE, [("Retry-After", retry_after)],
+                        b"Server at capacity, try again later\n")
+            return None
+        return gate
+
+    def bind_metrics(self):
+        """Report this controller's queue length on /metrics."""
+        QUEUED.set_function(lambda: self.queued)
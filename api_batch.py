@@ -0,0 +1,158 @@
+"""
+Concurrent forwarding of batched api_requests.
+
+An ``api_batch`` message carries several api_request objects, which run
+concurrently on the pooled HTTP session: at most ``concurrency`` at once,
+each with its own timeout, so one slow endpoint does not hold up the rest.
+Results come back either
+
+- streamed (``"mode": "stream"``, the default): an ``api_batch_item`` frame
+  per request as soon as it completes, tagged with its ``index`` in the
+  batch, then an ``api_batch_end`` frame; or
+- aggregated (``"mode": "aggregate"``): one ``api_batch_response`` frame
+  with every result in request order.
+
+A request that times out is answered with status 504 and one that fails
+with status 500, like a lone api_request.
+
+Environment variables:
+    API_BATCH_MAX_REQUESTS: Most requests in one batch (default 50)
+    API_BATCH_CONCURRENCY: Most requests of one batch running at once (default 10)
+    API_BATCH_TIMEOUT: Seconds each request may take (default 30)
+"""
+import time
+import asyncio
+from dataclasses import dataclass, replace
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
+
+from metrics import Counter, Histogram
+from protocol import ApiBatch, ApiRequest, ProtocolError, build, encode
+from settings import EnvSettings
+
+BATCH_REQUESTS = Counter("api_batch_requests_total", "Requests forwarded in api_batch messages, by outcome",
+                         ["outcome"])
+BATCH_SIZE = Histogram("api_batch_size", "Requests per api_batch message", buckets=(1, 2, 5, 10, 20, 50, 100))
+BATCH_DURATION = Histogram("api_batch_seconds", "Time to complete every request of an api_batch")
+
+MODES = ("stream", "aggregate")
+
+
+@dataclass
+class BatchSettings(EnvSettings):
+    """
+    Server-side limits for api_batch messages.
+
+    Attributes:
+        max_requests: Most requests in one batch
+        concurrency: Most requests of one batch running at once
+        timeout: Seconds each request may take
+    """
+    env_prefix = "API_BATCH"
+
+    max_requests: int = 50
+    concurrency: int = 10
+    timeout: float = 30.0
+
+    def limits(self, batch: ApiBatch) -> Tuple[int, float]:
+        """Concurrency and per-request timeout for a batch; clients may only lower ours."""
+        concurrency = self.concurrency
+        if batch.concurrency is not None and batch.concurrency > 0:
+            concurrency = min(concurrency, batch.concurrency)
+        timeout = self.timeout
+        if batch.timeout is not None and batch.timeout > 0:
+            timeout = min(timeout, batch.timeout)
+        return max(1, concurrency), timeout
+
+
+def parse_requests(batch: ApiBatch, settings: BatchSettings) -> List[ApiRequest]:
+    """
+    Validate a batch and its requests.
+
+    Raises:
+        ProtocolError: If the batch is empty or too large, the mode is
+            unknown, or a request is invalid or asks to be streamed
+    """
+    if batch.mode not in MODES:
+        raise ProtocolError(f"Invalid value for 'mode' for {batch.type}")
+    if not batch.requests:
+        raise ProtocolError("api_batch has no requests")
+    if len(batch.requests) > settings.max_requests:
+        raise ProtocolError(f"api_batch has {len(batch.requests)} requests, the limit is {settings.max_requests}")
+    requests = []
+    for index, item in enumerate(batch.requests):
+        try:
+            request = build(ApiRequest, item)
+        except ProtocolError as e:
+            raise ProtocolError(f"requests[{index}]: {e}")
+        if request.stream:
+            raise ProtocolError(f"requests[{index}]: streaming is not supported in api_batch")
+        requests.append(request)
+    return requests
+
+
+async def run_batch(batch: ApiBatch, fetch: Callable[[ApiRequest], Awaitable[Dict[str, Any]]],
+                    send: Callable[[str], Awaitable], settings: BatchSettings) -> List[Dict[str, Any]]:
+    """
+    Run a batch's requests concurrently and send their results.
+
+    Args:
+        batch: Decoded api_batch message
+        fetch: Makes one request and returns its api_response frame as a dict
+        send: Coroutine sending one encoded frame to the client
+        settings: Server-side limits
+
+    Returns:
+        Results in request order
+    """
+    requests = parse_requests(batch, settings)
+    concurrency, timeout = settings.limits(batch)
+    semaphore = asyncio.Semaphore(concurrency)
+    outcomes = {"ok": 0, "error": 0, "timeout": 0}
+    started = time.perf_counter()
+    BATCH_SIZE.observe(len(requests))
+
+    def frame(kind: str, **fields) -> str:
+        if batch.request_id:
+            fields["request_id"] = batch.request_id
+        return encode({"type": kind, **fields})
+
+    async def run(index: int, request: ApiRequest) -> Dict[str, Any]:
+        if not request.timeout or request.timeout > timeout:
+            # Also the upstream call's own deadline, so circuit breakers see the timeout
+            request = replace(request, timeout=timeout)
+        async with semaphore:
+            try:
+                # The timeout starts once the request has a concurrency slot
+                result = await asyncio.wait_for(fetch(request), timeout)
+                outcome = "ok"
+            except asyncio.TimeoutError:
+                result = {"status": 504, "data": {"error": f"Timed out after {request.timeout:g}s"}}
+                outcome = "timeout"
+            except Exception as e:
+                result = {"status": 500, "data": {"error": f"Error forwarding API request: {str(e) or type(e).__name__}"}}
+                outcome = "error"
+        outcomes[outcome] += 1
+        BATCH_REQUESTS.labels(outcome=outcome).inc()
+        result.pop("type", None)
+        result["index"] = index
+        if request.request_id:
+            result["request_id"] = request.request_id
+        if batch.mode == "stream":
+            await send(frame("api_batch_item", index=index, response=result))
+        return result
+
+    tasks = [asyncio.create_task(run(index, request)) for index, request in enumerate(requests)]
+    try:
+        results = await asyncio.gather(*tasks)
+    finally:
+        # e.g. the client went away while streaming results
+        for task in tasks:
+            task.cancel()
+    elapsed = time.perf_counter() - started
+    BATCH_DURATION.observe(elapsed)
+    summary = {"count": len(results), **outcomes, "elapsed_ms": round(elapsed * 1000, 1)}
+    if batch.mode == "stream":
+        await send(frame("api_batch_end", **summary))
+    else:
+        await send(frame("api_batch_response", results=results, **summary))
+    return results
@@ -0,0 +1,153 @@
+"""
+Chunked relay of forwarded API responses.
+
+With ``"stream": true`` an ``api_request`` is answered without buffering
+the upstream body: it is read in bounded chunks and each chunk is sent as
+it arrives, so memory per request stays constant whatever the response
+size. The client receives:
+
+1. ``api_response_chunk`` frames with ``seq`` 0, 1, 2, ... The first also
+   carries ``status`` and ``headers``. Text bodies (text/*, JSON, XML,
+   JavaScript) are sent as text, decoded incrementally so multi-byte
+   characters are never split. Other bodies are base64 encoded
+   (``"encoding": "base64"``).
+2. One ``api_response_end`` frame with the number of chunks and bytes
+   relayed. ``truncated`` is true if the byte cap cut the body short, and
+   ``error`` is set if the upstream failed mid-stream.
+
+Environment variables:
+    API_STREAM_CHUNK_BYTES: Upstream bytes per chunk frame (default 64 KiB)
+    API_STREAM_MAX_BYTES: Most bytes relayed per response; requests may ask
+        for less with "max_bytes" (default 16 MiB, 0 = unlimited)
+"""
+import time
+import base64
+import codecs
+import asyncio
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from metrics import Counter
+from protocol import encode
+from settings import EnvSettings
+from tracing import tracer
+
+STREAM_BYTES = Counter("api_stream_bytes_total", "Upstream response bytes relayed in api_response_chunk frames")
+STREAM_TRUNCATED = Counter("api_streams_truncated_total", "Streamed API responses cut short by the byte cap")
+
+TEXT_TYPES = ("text/", "application/json", "application/xml", "application/javascript", "+json", "+xml")
+
+
+@dataclass
+class StreamSettings(EnvSettings):
+    """
+    Chunked relay settings.
+
+    Attributes:
+        chunk_bytes: Upstream bytes read per chunk frame
+        max_bytes: Most bytes relayed per response (0 = unlimited)
+    """
+    env_prefix = "API_STREAM"
+
+    chunk_bytes: int = 64 * 1024
+    max_bytes: int = 16 * 1024 * 1024
+
+    def cap(self, requested: Optional[int] = None) -> int:
+        """Byte cap for one response: the smaller of ours and the client's (0 = unlimited)."""
+        if requested and requested > 0:
+            return min(requested, self.max_bytes) if self.max_bytes else requested
+        return self.max_bytes
+
+
+def is_text(content_type: Optional[str]) -> bool:
+    """Whether a body of this Content-Type is relayed as text rather than base64."""
+    content_type = (content_type or "").split(";")[0].strip().lower()
+    return any(marker in content_type for marker in TEXT_TYPES)
+
+
+async def relay(response, send: Callable[[str], Awaitable], settings: StreamSettings,
+                request_id: Optional[str] = None, max_bytes: Optional[int] = None, call=None) -> Dict[str, Any]:
+    """
+    Relay an aiohttp response body to a client in chunk frames.
+
+    Reading stops at the byte cap. The caller then releases the response,
+    which closes the upstream connection instead of draining the rest.
+
+    Args:
+        response: aiohttp ClientResponse whose body has not been read
+        send: Coroutine sending one encoded frame to the client
+        settings: Chunk size and server-wide byte cap
+        request_id: Echoed in every frame
+        max_bytes: Byte cap asked for by the client
+        call: Call yielded by CircuitBreaker.guard(); time spent sending to
+            the client is added to its ``excluded`` seconds, so a slow client
+            doesn't count as a slow upstream
+
+    Returns:
+        The api_response_end frame that was sent
+    """
+    # Imported here so fast-starting servers don't load aiohttp before binding
+    import aiohttp
+
+    cap = settings.cap(max_bytes)
+    text = is_text(response.headers.get("Content-Type"))
+    decoder = codecs.getincrementaldecoder(response.charset or "utf-8")(errors="replace") if text else None
+    seq = 0
+    relayed = 0
+    truncated = False
+    error = None
+
+    def frame(kind: str, **fields) -> str:
+        if request_id:
+            fields["request_id"] = request_id
+        return encode({"type": kind, **fields})
+
+    async def deliver(encoded: str):
+        started = time.monotonic()
+        try:
+            await send(encoded)
+        finally:
+            if call is not None:
+                call.excluded += time.monotonic() - started
+
+    async def send_chunk(data: str):
+        nonlocal seq
+        chunk = {"seq": seq, "data": data}
+        if seq == 0:
+            chunk["status"] = response.status
+            chunk["headers"] = dict(response.headers)
+        if not text:
+            chunk["encoding"] = "base64"
+        with tracer.span("send", frame="api_response_chunk", seq=seq, bytes=len(data)):
+            await deliver(frame("api_response_chunk", **chunk))
+        seq += 1
+
+    try:
+        async for block in response.content.iter_chunked(settings.chunk_bytes):
+            if cap and relayed + len(block) > cap:
+                block = block[:cap - relayed]
+                truncated = True
+            relayed += len(block)
+            STREAM_BYTES.inc(len(block))
+            data = decoder.decode(block) if text else base64.b64encode(block).decode()
+            if data:
+                # A block ending mid-character decodes to nothing until the next one
+                await send_chunk(data)
+            if truncated:
+                STREAM_TRUNCATED.inc()
+                break
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        # Upstream failed mid-body; tell the client what it got
+        error = str(e) or type(e).__name__
+    if text:
+        tail = decoder.decode(b"", final=True)
+        if tail:
+            await send_chunk(tail)
+    if seq == 0:
+        # Empty body: still report status and headers
+        await send_chunk("")
+    end = {"chunks": seq, "bytes": relayed, "truncated": truncated}
+    if error:
+        end["error"] = error
+    await deliver(frame("api_response_end", **end))
+    return end
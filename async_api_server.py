@@ -0,0 +1,178 @@
+"""
+Async production server for the HTTP chat API.
+
+Serves the same ``POST /api/chat`` contract as simple_api_server.py, which
+runs on Flask's development server and holds a thread for every Gemini
+call. This is an ASGI app run by Uvicorn, and Gemini calls use the SDK's
+async path (``send_message_async``), so one process waits on many answers
+at once without a thread per request.
+
+Chat sessions live in the worker process that created them, so the server
+runs a single worker by default. More workers (ASYNC_API_WORKERS) are
+opt-in: a conversation then only continues while its requests reach the
+same worker, which needs a sticky load balancer in front for clients that
+open a new connection per request, as minimal_websocket_client.py does.
+``/metrics`` reports the worker that answers the scrape.
+
+Usage:
+    python async_api_server.py
+
+Environment variables:
+    ASYNC_API_HOST: Interface to listen on (default 0.0.0.0)
+    ASYNC_API_PORT: Port to listen on (default 5000, as simple_api_server.py)
+    ASYNC_API_WORKERS: Worker processes (default 1; see above before raising it)
+"""
+import os
+import math
+import time
+import asyncio
+import logging
+import weakref
+from dataclasses import dataclass
+from dotenv import load_dotenv
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import JSONResponse
+from admission import AdmissionController, AdmissionSettings, Busy
+from connection import ConnectionTable
+from history_compaction import CompactionSettings, HistoryCompactor
+from log_setup import setup_logging
+from metrics import CHAT_SESSIONS, CONTENT_TYPE, ERRORS, GEMINI_LATENCY, INFLIGHT_REQUESTS, QUEUE_WAIT, REGISTRY
+from protocol import ChatRequest, ProtocolError, decode
+from settings import EnvSettings
+
+setup_logging()
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ServerSettings(EnvSettings):
+    """
+    Where and how the server runs.
+
+    Attributes:
+        host: Interface to listen on
+        port: Port to listen on
+        workers: Uvicorn worker processes, each with its own chat sessions
+    """
+    env_prefix = "ASYNC_API"
+
+    host: str = "0.0.0.0"
+    port: int = 5000
+    workers: int = 1
+
+
+# Load API key
+load_dotenv()
+api_key = os.getenv("GOOGLE_API_KEY")
+if not api_key:
+    logger.warning("No API key found. Please set GOOGLE_API_KEY in .env file or environment variables.")
+
+# Initialize Gemini API
+try:
+    from gemini_api import GeminiAPI
+    gemini_api = GeminiAPI(api_key=api_key)
+    logger.info("Gemini API initialized successfully")
+except Exception as e:
+    logger.error("Failed to initialize Gemini API: %s", e)
+    raise
+
+# In-flight request limits per worker (override with ADMISSION_* environment variables)
+admission = AdmissionController(AdmissionSettings.from_env("ADMISSION"))
+admission.bind_metrics()
+
+# Store chat sessions, one compact record per client (see connection.py)
+connections = ConnectionTable()
+chat_sessions = connections.view("session")
+CHAT_SESSIONS.set_function(lambda: len(chat_sessions))
+
+# Idle chat histories are compressed until the client's next message
+# (override with HISTORY_COMPACTION_* environment variables)
+history_compactor = HistoryCompactor(connections, gemini_api.export_history, gemini_api.restore_session,
+                                     CompactionSettings.from_env("HISTORY_COMPACTION"))
+history_compactor.bind_metrics()
+history_compactor.start()
+
+# One Gemini call per chat session at a time, as the scheduler gives the Flask server;
+# a client's lock lives only while one of its requests holds or waits for it
+session_locks = weakref.WeakValueDictionary()
+
+app = FastAPI(title="Gemini Chat API")
+
+@app.post("/api/chat")
+async def chat(request: Request):
+    """Handle chat requests"""
+    raw = await request.body()
+    if not raw:
+        return JSONResponse(content={"error": "No data provided"}, status_code=400)
+
+    # Decode and validate the request body in one pass
+    try:
+        chat_request = decode(raw, ChatRequest)
+    except ProtocolError as e:
+        ERRORS.labels(type="protocol").inc()
+        return JSONResponse(content={"error": str(e)}, status_code=400)
+
+    client_id = chat_request.client_id
+    message = chat_request.message
+
+    if not message:
+        return JSONResponse(content={"error": "No message provided"}, status_code=400)
+
+    try:
+        started = await admission.acquire(client_id)
+    except Busy as e:
+        return JSONResponse(content={"error": str(e)}, status_code=503,
+                            headers={"Retry-After": str(math.ceil(e.retry_after))})
+
+    lock = session_locks.get(client_id)
+    if lock is None:
+        lock = session_locks[client_id] = asyncio.Lock()
+    INFLIGHT_REQUESTS.inc()
+    try:
+        # The session is kept out of idle sweeps, queued or answering, until the answer is in
+        async with lock:
+            with history_compactor.hold(client_id):
+                # Create a new chat session if one doesn't exist
+                if client_id not in chat_sessions:
+                    chat_sessions[client_id] = gemini_api.chat_session()
+                    logger.info("Created new chat session for client %s", client_id)
+                chat_session = history_compactor.session(chat_sessions, client_id)
+
+                QUEUE_WAIT.observe(time.perf_counter() - chat_request.received_at)
+                with GEMINI_LATENCY.time():
+                    response = await chat_session.send_message_async(message)
+                response_text = response.text
+
+        return {"response": response_text, "client_id": client_id}
+
+    except Exception as e:
+        ERRORS.labels(type="gemini").inc()
+        logger.error("Error processing message from %s: %s", client_id, e)
+        return JSONResponse(content={"error": str(e)}, status_code=500)
+    finally:
+        INFLIGHT_REQUESTS.dec()
+        admission.release(client_id, started)
+
+@app.get("/metrics")
+def metrics():
+    """Prometheus metrics of this worker"""
+    return Response(content=REGISTRY.render(), media_type=CONTENT_TYPE)
+
+@app.get("/")
+def index():
+    """Index route"""
+    return Response(content="Gemini API Server is running", media_type="text/plain")
+
+@app.on_event("shutdown")
+def shutdown():
+    history_compactor.stop()
+
+if __name__ == "__main__":
+    import uvicorn
+
+    settings = ServerSettings.from_env("ASYNC_API")
+    logger.info("Starting async API server on %s:%d with %d worker(s)", settings.host, settings.port,
+                settings.workers)
+    # Uvicorn stops gracefully on SIGTERM: it closes the socket and lets requests in flight finish
+    uvicorn.run("async_api_server:app", host=settings.host, port=settings.port, workers=settings.workers,
+                log_level=os.getenv("LOG_LEVEL", "info").lower())
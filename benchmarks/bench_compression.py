@@ -0,0 +1,116 @@
+"""
+Benchmark permessage-deflate settings: CPU time against bytes on the wire.
+
+Encodes typical server frames (pongs, status updates, model answers and
+forwarded api_response bodies) through the same extension the servers use
+and reports the compressed size and per-frame CPU cost for each setting.
+
+Usage:
+    python benchmarks/bench_compression.py [--variants N]
+"""
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from websockets.frames import Frame, Opcode
+from compression import CompressionSettings, ThresholdPerMessageDeflate
+from protocol import encode
+
+WORDS = (
+    "the model response includes several paragraphs of generated text about "
+    "python websocket servers latency throughput gemini session history "
+    "request streaming chunk client token answer example code function value "
+    "configuration error status result data because however therefore with"
+).split()
+
+# Candidate settings to compare
+SETTINGS = {
+    "off": CompressionSettings(enabled=False),
+    "default (12 bits, mem 5, level 6, min 512)": CompressionSettings(),
+    "no threshold (min 0)": CompressionSettings(min_size=0),
+    "fast (level 1)": CompressionSettings(level=1),
+    "max window (15 bits, mem 8)": CompressionSettings(window_bits=15, mem_level=8),
+    "small window (9 bits, mem 1)": CompressionSettings(window_bits=9, mem_level=1),
+}
+
+def make_text(rng, size):
+    """Generate pseudo-English text of roughly the given size"""
+    words = []
+    length = 0
+    while length < size:
+        word = rng.choice(WORDS)
+        words.append(word)
+        length += len(word) + 1
+    return " ".join(words)[:size]
+
+def make_payloads(variants):
+    """
+    Typical frames sent by the servers, keyed by a short label.
+
+    Each label maps to several distinct frames so that context takeover
+    between messages is measured realistically instead of re-sending
+    the exact same bytes.
+    """
+    rng = random.Random(42)
+
+    def records(count):
+        return [
+            {"id": i, "name": make_text(rng, 20), "status": rng.choice(["open", "closed"]),
+             "score": round(rng.random(), 4), "tags": [rng.choice(WORDS) for _ in range(3)]}
+            for i in range(count)
+        ]
+
+    return {
+        "pong": [encode({"type": "pong"})] * variants,
+        "status": [encode({"type": "status", "content": "processing"})] * variants,
+        "short answer (300 B)": [encode({"type": "response", "content": make_text(rng, 300)}) for _ in range(variants)],
+        "answer (2 KB)": [encode({"type": "response", "content": make_text(rng, 2048)}) for _ in range(variants)],
+        "long answer (16 KB)": [encode({"type": "response", "content": make_text(rng, 16384)}) for _ in range(variants)],
+        "api_response (32 KB)": [encode({"type": "api_response", "status": 200, "data": records(300)}) for _ in range(variants)],
+        "api_response (256 KB)": [encode({"type": "api_response", "status": 200, "data": records(2400)}) for _ in range(variants)],
+    }
+
+def wire_size(payload_size):
+    """Frame header plus payload size for a server-to-client frame"""
+    if payload_size < 126:
+        return 2 + payload_size
+    if payload_size < 65536:
+        return 4 + payload_size
+    return 10 + payload_size
+
+def run(settings, payloads):
+    """Return (average bytes on wire per frame, CPU microseconds per frame)"""
+    frames = [payload.encode() for payload in payloads]
+    if not settings.enabled:
+        return sum(wire_size(len(data)) for data in frames) / len(frames), 0.0
+    extension = ThresholdPerMessageDeflate(
+        False, False, 15, settings.window_bits,
+        {"memLevel": settings.mem_level, "level": settings.level},
+        min_size=settings.min_size,
+    )
+    size = 0
+    start = time.process_time()
+    for data in frames:
+        size += wire_size(len(extension.encode(Frame(Opcode.TEXT, data)).data))
+    elapsed = time.process_time() - start
+    return size / len(frames), elapsed / len(frames) * 1e6
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--variants", type=int, default=20, help="distinct frames encoded per measurement")
+    args = parser.parse_args()
+
+    for label, payloads in make_payloads(args.variants).items():
+        raw = sum(len(payload.encode()) for payload in payloads) / len(payloads)
+        print(f"\n{label}: {raw:.0f} bytes uncompressed")
+        print(f"  {'setting':<44} {'wire bytes':>10} {'ratio':>7} {'cpu us':>9}")
+        for name, settings in SETTINGS.items():
+            size, cpu = run(settings, payloads)
+            print(f"  {name:<44} {size:>10.0f} {size / wire_size(raw):>7.2f} {cpu:>9.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+"""
+Benchmark server memory per idle WebSocket connection.
+
+Starts a server with the offline fake model (see fake_backend.py), opens
+the given numbers of idle connections from separate client processes and
+reports how much the server's resident set size (RSS) grew per connection.
+Clients answer protocol and application pings, so connections stay open
+while they are counted.
+
+Each client process opens at most --per-process connections, and each
+process connects from its own loopback address (127.0.0.2, 127.0.0.3, ...)
+so large runs do not run out of ephemeral ports. 100k connections need an
+open file limit above 100k for the server (ulimit -n).
+
+The script exits with status 1 if any run uses more than --budget bytes per
+connection.
+
+Usage:
+    python benchmarks/bench_connection_memory.py [--server simple_websocket_server] [--connections 10000 100000]
+"""
+import os
+import sys
+import time
+import base64
+import struct
+import socket
+import asyncio
+import argparse
+import subprocess
+import multiprocessing
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+
+sys.path.insert(0, BENCH_DIR)
+
+from fake_backend import SERVERS, raise_open_file_limit
+
+# Bytes of server RSS per idle connection a run may use
+DEFAULT_BUDGET = 20 * 1024
+
+def rss(pid):
+    """Resident set size of a process in bytes (Linux)"""
+    with open(f"/proc/{pid}/status") as status:
+        for line in status:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) * 1024
+    raise RuntimeError(f"no VmRSS for process {pid}")
+
+def masked_frame(opcode, payload):
+    """Client-to-server frame; clients must mask their payloads"""
+    mask = os.urandom(4)
+    header = bytes([0x80 | opcode])
+    if len(payload) < 126:
+        header += bytes([0x80 | len(payload)])
+    else:
+        header += bytes([0x80 | 126]) + struct.pack("!H", len(payload))
+    return header + mask + bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+
+async def read_frame(reader):
+    """Read one unmasked server frame; returns (opcode, payload)"""
+    first, second = await reader.readexactly(2)
+    length = second & 0x7F
+    if length == 126:
+        length = struct.unpack("!H", await reader.readexactly(2))[0]
+    elif length == 127:
+        length = struct.unpack("!Q", await reader.readexactly(8))[0]
+    return first & 0x0F, await reader.readexactly(length)
+
+async def connect(host, port, path, local_host):
+    """Open one connection with a raw handshake; returns (reader, writer) once welcomed"""
+    reader, writer = await asyncio.open_connection(host, port, local_addr=(local_host, 0))
+    key = base64.b64encode(os.urandom(16)).decode()
+    writer.write((f"GET {path} HTTP/1.1\r\nHost: {host}:{port}\r\nUpgrade: websocket\r\n"
+                  f"Connection: Upgrade\r\nSec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\n\r\n").encode())
+    response = await reader.readuntil(b"\r\n\r\n")
+    if not response.startswith(b"HTTP/1.1 101"):
+        raise ConnectionError(response.split(b"\r\n")[0].decode())
+    # The welcome frame means the server has set the connection up
+    await read_frame(reader)
+    return reader, writer
+
+async def idle(reader, writer):
+    """Only answer protocol and application pings until the server closes"""
+    while True:
+        opcode, payload = await read_frame(reader)
+        if opcode == 0x9:
+            writer.write(masked_frame(0xA, payload))
+        elif opcode == 0x1 and b'"ping"' in payload:
+            writer.write(masked_frame(0x1, b'{"type": "pong"}'))
+        elif opcode == 0x8:
+            return
+
+def client_process(host, port, local_host, first, count, concurrency, opened, failed, stop):
+    """Open count idle connections and hold them until stop is set"""
+    raise_open_file_limit()
+
+    async def run():
+        slots = asyncio.Semaphore(concurrency)
+
+        async def one(index):
+            try:
+                async with slots:
+                    reader, writer = await connect(host, port, f"/mem-{index}", local_host)
+                with opened.get_lock():
+                    opened.value += 1
+                await idle(reader, writer)
+            except Exception:
+                with failed.get_lock():
+                    failed.value += 1
+
+        tasks = [asyncio.create_task(one(first + i)) for i in range(count)]
+        while not stop.is_set():
+            await asyncio.sleep(0.2)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    asyncio.run(run())
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def start_server(server, connections):
+    port = free_port()
+    command = [sys.executable, os.path.join(BENCH_DIR, "fake_backend.py"), "--server", server,
+               "--port", str(port), "--latency", "0"]
+    # Let every benchmark connection past admission control
+    env = dict(os.environ, ADMISSION_MAX_CONNECTIONS=str(connections + 1000))
+    process = subprocess.Popen(command, env=env, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    if not process.stdout.readline().startswith("READY"):
+        process.kill()
+        raise SystemExit(f"{server} failed to start")
+    return process, port
+
+def hold(port, count, args):
+    """
+    Open count idle connections across client processes.
+
+    Returns:
+        (connections open, failures, stop event, client processes)
+    """
+    opened = multiprocessing.Value("i", 0)
+    failed = multiprocessing.Value("i", 0)
+    stop = multiprocessing.Event()
+    processes = []
+    for n, first in enumerate(range(0, count, args.per_process)):
+        process = multiprocessing.Process(target=client_process, daemon=True, args=(
+            "127.0.0.1", port, f"127.0.0.{2 + n % 250}", first, min(args.per_process, count - first),
+            args.concurrency, opened, failed, stop))
+        process.start()
+        processes.append(process)
+    deadline = time.monotonic() + args.timeout
+    while opened.value + failed.value < count and time.monotonic() < deadline:
+        time.sleep(0.2)
+    return opened.value, failed.value, stop, processes
+
+def release(stop, processes):
+    stop.set()
+    for process in processes:
+        process.join(30)
+        if process.is_alive():
+            process.kill()
+
+def measure(args, count):
+    """Return (connections open, failures, RSS before, RSS after, bytes per connection)"""
+    server, port = start_server(args.server, count)
+    try:
+        # Warm up code paths and allocator pools, then let the server settle
+        warm = hold(port, min(100, count), args)
+        release(*warm[2:])
+        time.sleep(args.settle)
+        before = rss(server.pid)
+        opened, failed, stop, processes = hold(port, count, args)
+        time.sleep(args.settle)
+        after = rss(server.pid)
+        release(stop, processes)
+    finally:
+        server.terminate()
+        server.wait(30)
+    return opened, failed, before, after, (after - before) / max(opened, 1)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--server", choices=sorted(SERVERS), default="simple_websocket_server")
+    parser.add_argument("--connections", type=int, nargs="+", default=[10000, 100000],
+                        help="idle connection counts to measure")
+    parser.add_argument("--per-process", type=int, default=8000, help="connections per client process")
+    parser.add_argument("--concurrency", type=int, default=200, help="handshakes in flight per client process")
+    parser.add_argument("--settle", type=float, default=2.0, help="seconds to wait before reading RSS")
+    parser.add_argument("--timeout", type=float, default=600.0, help="seconds to wait for connections to open")
+    parser.add_argument("--budget", type=int, default=DEFAULT_BUDGET, help="bytes per connection allowed")
+    args = parser.parse_args()
+    raise_open_file_limit()
+
+    print(f"{args.server}: server RSS per idle connection (budget {args.budget} bytes)")
+    print(f"{'connections':>11} {'open':>8} {'failed':>7} {'RSS before':>11} {'RSS after':>11} {'bytes/conn':>11}")
+    over = False
+    for count in args.connections:
+        opened, failed, before, after, per_connection = measure(args, count)
+        over |= per_connection > args.budget
+        print(f"{count:>11} {opened:>8} {failed:>7} {before / 2**20:>9.1f}MB {after / 2**20:>9.1f}MB "
+              f"{per_connection:>11.0f}{'  over budget' if per_connection > args.budget else ''}")
+    sys.exit(1 if over else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Benchmark heartbeat cost as the number of connections grows.
+
+Compares the old keep-alive (one asyncio task per connection sleeping in
+a loop, as periodic_ping did) with the shared timer wheel in heartbeat.py,
+for the same number of idle connections pinged once per interval. Reports
+CPU time per heartbeat and memory per connection.
+
+Usage:
+    python benchmarks/bench_heartbeat.py [--connections 1000 10000 50000] [--interval 1] [--duration 5]
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tracemalloc
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from heartbeat import HeartbeatMonitor, TimerWheel
+from protocol import encode
+
+class FakeWebSocket:
+    """Connection whose client answers every ping at once"""
+    def __init__(self, client_id, monitor=None):
+        self.client_id = client_id
+        self.monitor = monitor
+        self.pings = 0
+
+    async def send(self, message):
+        self.pings += 1
+        if self.monitor is not None:
+            self.monitor.seen(self.client_id, active=False)
+
+    async def close(self, code, reason):
+        pass
+
+async def periodic_ping(websocket, interval):
+    """The per-connection keep-alive task being replaced"""
+    while True:
+        await asyncio.sleep(interval)
+        await websocket.send(encode({"type": "ping"}))
+
+def start_tasks(count, interval):
+    sockets = [FakeWebSocket(f"client-{i}") for i in range(count)]
+    tasks = [asyncio.create_task(periodic_ping(ws, interval)) for ws in sockets]
+    return sockets, lambda: [task.cancel() for task in tasks]
+
+def start_wheel(count, interval):
+    monitor = HeartbeatMonitor(TimerWheel(tick=interval / 10), interval=interval, idle_timeout=3600)
+    sockets = [FakeWebSocket(f"client-{i}", monitor) for i in range(count)]
+    for ws in sockets:
+        monitor.register(ws.client_id, ws)
+    return sockets, monitor.wheel.stop
+
+async def measure(start, count, interval, duration):
+    """Return (CPU microseconds per heartbeat, bytes per connection)"""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    sockets, stop = start(count, interval)
+    memory = (tracemalloc.get_traced_memory()[0] - before) / count
+    tracemalloc.stop()
+
+    # Let the first heartbeats spread out before measuring
+    await asyncio.sleep(2 * interval)
+    pings = sum(ws.pings for ws in sockets)
+    cpu = time.process_time()
+    await asyncio.sleep(duration)
+    cpu = time.process_time() - cpu
+    pings = sum(ws.pings for ws in sockets) - pings
+    stop()
+    await asyncio.sleep(0)
+    return cpu / max(pings, 1) * 1e6, memory
+
+async def run(args):
+    print(f"{'connections':>11} {'scenario':<26} {'us/heartbeat':>13} {'bytes/conn':>11}")
+    for count in args.connections:
+        for label, start in (("task per connection", start_tasks), ("shared timer wheel", start_wheel)):
+            micros, memory = await measure(start, count, args.interval, args.duration)
+            print(f"{count:>11} {label:<26} {micros:>13.2f} {memory:>11.0f}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--connections", type=int, nargs="+", default=[1000, 10000, 50000],
+                        help="connection counts to measure")
+    parser.add_argument("--interval", type=float, default=1.0, help="seconds between heartbeats")
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds to measure each scenario")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+if __name__ == "__main__":
+    main()
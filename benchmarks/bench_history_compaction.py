@@ -0,0 +1,129 @@
+"""
+Benchmark memory saved by compacting idle chat histories.
+
+Builds idle conversations as real Gemini SDK chat sessions (no network
+calls are made) and reports how much the process's resident set size (RSS)
+grows per conversation held compacted by history_compaction.HistoryCompactor
+and per conversation held live. RSS is used rather than tracemalloc because
+the SDK's protobuf messages are allocated outside Python's allocator.
+Compacted histories are measured first, so memory freed by compaction is not
+reused by the live sessions and hidden.
+
+Every conversation opens with the same system prompt, as a deployment that
+pastes one into each chat would, so interning shows up in the compacted size.
+
+Usage:
+    python benchmarks/bench_history_compaction.py [--conversations 1000] [--turns 10]
+"""
+import gc
+import os
+import sys
+import time
+import random
+import argparse
+import warnings
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+
+sys.path.insert(0, os.path.abspath(os.path.join(BENCH_DIR, '..')))
+
+from connection import ConnectionTable
+from history_compaction import CompactionSettings, HistoryCompactor
+
+SYSTEM_PROMPT = ("You are an assistant answering questions about UK statistics. Cite the dataset, "
+                 "the period it covers and its publisher, and say when figures are provisional. ") * 4
+
+WORDS = ("population inflation region unemployment household income survey quarter annual rate "
+         "england scotland wales northern ireland median estimate release revised index growth").split()
+
+def rss():
+    """Resident set size of this process in bytes (Linux)"""
+    with open("/proc/self/status") as status:
+        for line in status:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) * 1024
+    raise RuntimeError("no VmRSS")
+
+def sentence(rng, words):
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+def turns(rng, count):
+    """A conversation's history of alternating user and model turns"""
+    history = [("user", [SYSTEM_PROMPT, sentence(rng, 15)])]
+    for n in range(1, count):
+        if n % 2:
+            history.append(("model", [" ".join(sentence(rng, 20) for _ in range(6))]))
+        else:
+            history.append(("user", [sentence(rng, 15)]))
+    return history
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--conversations", type=int, default=1000)
+    parser.add_argument("--turns", type=int, default=10, help="turns per conversation")
+    parser.add_argument("--level", type=int, default=6, help="zlib compression level")
+    args = parser.parse_args()
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        import google.generativeai as genai
+    from gemini_api import GeminiAPI
+
+    # Only the model object is needed to build and restore sessions
+    api = GeminiAPI.__new__(GeminiAPI)
+    api.text_model = genai.GenerativeModel("gemini-1.5-flash")
+
+    def conversation(n):
+        return turns(random.Random(n), args.turns)
+
+    # Warm up the SDK's code paths and allocator pools
+    for n in range(50):
+        api.restore_session(conversation(n))
+
+    # Compacted: each conversation is compacted as soon as it is created
+    table = ConnectionTable()
+    sessions = table.view("session")
+    compactor = HistoryCompactor(table, api.export_history, api.restore_session,
+                                 CompactionSettings(idle_seconds=1, level=args.level))
+    gc.collect()
+    base = rss()
+    compacted = 0
+    compact_seconds = 0.0
+    for n in range(args.conversations):
+        sessions[f"client-{n}"] = api.restore_session(conversation(n))
+        table.get(f"client-{n}").last_active -= 2
+        started = time.perf_counter()
+        compacted += compactor.sweep()
+        compact_seconds += time.perf_counter() - started
+    gc.collect()
+    held = rss() - base
+    blob_bytes = sum(len(history.blob) for history in compactor.compacted())
+
+    # Live: every conversation kept as an SDK session
+    live_sessions = []
+    text_bytes = 0
+    base = rss()
+    for n in range(args.conversations):
+        history = conversation(n)
+        text_bytes += sum(len(text.encode()) for _, parts in history for text in parts)
+        live_sessions.append(api.restore_session(history))
+    gc.collect()
+    live = rss() - base
+
+    started = time.perf_counter()
+    for n in range(args.conversations):
+        compactor.session(sessions, f"client-{n}")
+    expand_seconds = time.perf_counter() - started
+
+    print(f"{args.conversations} conversations x {args.turns} turns, {text_bytes / args.conversations:.0f} "
+          f"bytes of text each, {compacted} compacted")
+    print(f"{'':>10} {'total':>10} {'per conversation':>17}")
+    print(f"{'live':>10} {live / 2**20:>8.1f}MB {live / args.conversations:>16.0f}B")
+    print(f"{'compacted':>10} {held / 2**20:>8.1f}MB {held / args.conversations:>16.0f}B")
+    print(f"saved {(live - held) / 2**20:.1f}MB ({1 - held / live:.0%}); compressed blobs "
+          f"{blob_bytes / args.conversations:.0f}B per conversation")
+    print(f"compact {compact_seconds / compacted * 1e6:.0f}us, expand {expand_seconds / compacted * 1e6:.0f}us "
+          f"per conversation")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Benchmark the HTTP chat API: Flask server against the async server.
+
+Serves simple_api_server.py (Flask development server, a thread per
+request) and async_api_server.py (Uvicorn workers, async Gemini calls) in
+turn with the offline fake model (see fake_backend.py), and drives
+POST /api/chat from --clients concurrent clients, each with its own client
+ID and keep-alive connection, for --duration seconds. Reports requests per
+second, latency percentiles and non-200 answers for each.
+
+Both servers may make --upstream-concurrency Gemini calls at once (the
+Flask server's scheduler threads and the async server's admission limit;
+default: one per client), so the difference measured is the cost of
+serving the requests, not a different cap on calls.
+
+Usage:
+    python benchmarks/bench_http_api.py [--clients 100] [--duration 10] [--latency 0.05] [--workers 1]
+"""
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import statistics
+import subprocess
+
+import aiohttp
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+
+SERVERS = ("simple_api_server", "async_api_server")
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def start_server(server, args):
+    port = free_port()
+    command = [sys.executable, os.path.join(BENCH_DIR, "fake_backend.py"), "--server", server,
+               "--port", str(port), "--latency", str(args.latency), "--workers", str(args.workers)]
+    env = dict(os.environ, SCHEDULER_CONCURRENCY=str(args.upstream_concurrency),
+               ADMISSION_MAX_INFLIGHT=str(args.upstream_concurrency))
+    process = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return process, port
+
+async def wait_ready(session, url, process, timeout=120.0):
+    """Poll the index route until the server (every worker's socket is shared) answers"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit("server exited during start-up")
+        try:
+            async with session.get(url) as response:
+                if response.status == 200:
+                    return
+        except aiohttp.ClientError:
+            pass
+        await asyncio.sleep(0.2)
+    raise SystemExit("server did not start in time")
+
+async def client(session, url, n, stop_at, latencies, statuses):
+    """Send one prompt after another until the run ends"""
+    count = 0
+    while time.monotonic() < stop_at:
+        body = json.dumps({"client_id": f"client-{n}", "message": f"prompt {count} from client {n}"})
+        started = time.perf_counter()
+        try:
+            async with session.post(url, data=body, headers={"Content-Type": "application/json"}) as response:
+                await response.read()
+                status = response.status
+        except aiohttp.ClientError:
+            status = "error"
+        latencies.append(time.perf_counter() - started)
+        statuses[status] = statuses.get(status, 0) + 1
+        count += 1
+
+async def load(port, process, args):
+    base = f"http://127.0.0.1:{port}"
+    connector = aiohttp.TCPConnector(limit=0)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        await wait_ready(session, f"{base}/", process)
+        # Warm up sessions and code paths on every client
+        warm_latencies, warm_statuses = [], {}
+        await asyncio.gather(*(client(session, f"{base}/api/chat", n, time.monotonic() + 1, warm_latencies,
+                                      warm_statuses) for n in range(args.clients)))
+        latencies, statuses = [], {}
+        started = time.monotonic()
+        await asyncio.gather(*(client(session, f"{base}/api/chat", n, started + args.duration, latencies,
+                                      statuses) for n in range(args.clients)))
+        elapsed = time.monotonic() - started
+    return latencies, statuses, elapsed
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--clients", type=int, default=100, help="concurrent clients")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds to measure")
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds per fake Gemini call")
+    parser.add_argument("--workers", type=int, default=1, help="Uvicorn workers")
+    parser.add_argument("--upstream-concurrency", type=int, help="Gemini calls at once per server (default --clients)")
+    parser.add_argument("--servers", nargs="+", choices=SERVERS, default=list(SERVERS))
+    args = parser.parse_args()
+    args.upstream_concurrency = args.upstream_concurrency or args.clients
+
+    print(f"{args.clients} clients for {args.duration:.0f}s, fake Gemini latency {args.latency * 1000:.0f} ms, "
+          f"{args.upstream_concurrency} Gemini calls at once, {args.workers} Uvicorn worker(s)")
+    print(f"{'server':>18} {'requests':>9} {'req/s':>8} {'p50':>9} {'p99':>9} {'non-200':>8}")
+    for server in args.servers:
+        process, port = start_server(server, args)
+        try:
+            latencies, statuses, elapsed = asyncio.run(load(port, process, args))
+        finally:
+            process.terminate()
+            process.wait(30)
+        failed = sum(count for status, count in statuses.items() if status != 200)
+        print(f"{server:>18} {len(latencies):>9} {len(latencies) / elapsed:>8.1f} "
+              f"{statistics.median(latencies) * 1000:>7.1f}ms {percentile(latencies, 0.99) * 1000:>7.1f}ms "
+              f"{failed:>8}")
+
+if __name__ == "__main__":
+    main()
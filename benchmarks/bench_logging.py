@@ -0,0 +1,111 @@
+"""
+Benchmark logging overhead on the chat message hot path.
+
+Replays the log calls made for one chat turn in websocket_server.py and
+compares the time spent on the calling (event loop) thread for:
+
+- the old setup: basicConfig at DEBUG with eager f-strings
+- the queue listener with lazy formatting at INFO
+- the queue listener at DEBUG with payload records sampled
+
+Output goes to os.devnull so only logging overhead is measured.
+
+Usage:
+    python benchmarks/bench_logging.py [--turns N]
+"""
+import os
+import sys
+import time
+import logging
+import argparse
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from log_setup import get_logger, setup_logging, stop_logging
+
+class FakeGeminiResponse:
+    """Stand-in for a Gemini response object with an expensive repr"""
+    def __init__(self, text):
+        self.text = text
+
+    def __repr__(self):
+        return "GenerateContentResponse(" + repr({"candidates": [{"content": {"parts": [{"text": self.text}]}}] * 3}) + ")"
+
+CLIENT_ID = "bench-client"
+RAW_MESSAGE = '{"type": "message", "content": "' + "Tell me about websockets. " * 8 + '"}'
+PROMPT = "Tell me about websockets. " * 8
+RESPONSE = FakeGeminiResponse("WebSockets provide full-duplex communication. " * 40)
+RESPONSE_STR = '{"type": "response", "content": "' + RESPONSE.text + '"}'
+
+def eager_turn(logger):
+    """Log calls made per chat turn before the logging overhaul"""
+    logger.info(f"Received raw message from client {CLIENT_ID}: {RAW_MESSAGE}")
+    logger.info(f"Received message from client {CLIENT_ID}: {PROMPT}")
+    logger.info(f"Processing message from {CLIENT_ID}: {PROMPT[:100]}...")
+    logger.info(f"Sending request to Gemini API for client {CLIENT_ID}")
+    logger.info(f"Full response object from Gemini: {RESPONSE}")
+    logger.info(f"Response text from Gemini: {RESPONSE.text[:200]}...")
+    logger.info(f"Formatted JSON response to send: {RESPONSE_STR[:200]}...")
+    logger.debug(f"Sending to client {CLIENT_ID}: {RESPONSE_STR}")
+    logger.info(f"Sent response to client {CLIENT_ID}")
+
+def lazy_turn(logger, payload_logger):
+    """Log calls made per chat turn with lazy formatting and payload sampling"""
+    payload_logger.debug("Received raw message: %s", RAW_MESSAGE, extra={"client_id": CLIENT_ID})
+    logger.info("Processing message from %s (%d chars)", CLIENT_ID, len(PROMPT))
+    payload_logger.debug("Prompt: %s", PROMPT, extra={"client_id": CLIENT_ID})
+    payload_logger.debug("Full response object from Gemini: %s", RESPONSE, extra={"client_id": CLIENT_ID})
+    payload_logger.debug("Sending to client: %s", RESPONSE_STR, extra={"client_id": CLIENT_ID})
+    logger.info("Sent response to client %s (%d chars)", CLIENT_ID, len(RESPONSE.text))
+
+def reset_root():
+    """Remove handlers installed by a previous scenario"""
+    stop_logging()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+        handler.close()
+
+def time_turns(turn, turns):
+    """Return microseconds per turn spent on the calling thread"""
+    start = time.perf_counter()
+    for _ in range(turns):
+        turn()
+    return (time.perf_counter() - start) / turns * 1e6
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--turns", type=int, default=20000, help="chat turns to simulate per scenario")
+    args = parser.parse_args()
+
+    devnull = open(os.devnull, "w")
+    logger = logging.getLogger("bench")
+    results = {}
+
+    # Old setup: synchronous StreamHandler at DEBUG, eager f-strings
+    reset_root()
+    logging.basicConfig(level=logging.DEBUG, stream=devnull, force=True,
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    results["basicConfig DEBUG, eager f-strings"] = time_turns(lambda: eager_turn(logger), args.turns)
+
+    # Same eager call sites, but through the queue listener at INFO
+    reset_root()
+    setup_logging(level="INFO", handlers=[logging.StreamHandler(devnull)])
+    results["queue listener INFO, eager f-strings"] = time_turns(lambda: eager_turn(logger), args.turns)
+
+    # Queue listener with lazy call sites
+    payload_logger = get_logger("bench.payload", category="payload")
+    for level, rate in (("INFO", 0.1), ("DEBUG", 0.0), ("DEBUG", 0.01), ("DEBUG", 0.1), ("DEBUG", 1.0)):
+        reset_root()
+        setup_logging(level=level, sample_rates={"payload": rate}, handlers=[logging.StreamHandler(devnull)])
+        label = f"queue listener {level}, lazy, payload sampled at {rate:g}"
+        results[label] = time_turns(lambda: lazy_turn(logger, payload_logger), args.turns)
+
+    reset_root()
+    baseline = next(iter(results.values()))
+    print(f"{'scenario':<52} {'us/turn':>9} {'speedup':>8}")
+    for label, micros in results.items():
+        print(f"{label:<52} {micros:>9.1f} {baseline / micros:>7.1f}x")
+
+if __name__ == "__main__":
+    main()
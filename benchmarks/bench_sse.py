@@ -0,0 +1,104 @@
+"""
+Benchmark time to first byte of the chat endpoints on the FastAPI app.
+
+Serves websocket_server's FastAPI app with the offline fake model (see
+fake_backend.py), whose answers stream in chunks over --latency seconds,
+and times one prompt at a time over:
+
+- POST /api/chat/stream (Server-Sent Events): first byte, first answer
+  chunk and end of the answer
+- the /ws/{client_id} WebSocket: first frame (status) and the answer
+
+Usage:
+    python benchmarks/bench_sse.py [--requests 20] [--latency 1.0]
+"""
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import statistics
+import subprocess
+
+import aiohttp
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def start_server(latency):
+    port = free_port()
+    command = [sys.executable, os.path.join(BENCH_DIR, "fake_backend.py"), "--server", "websocket_server",
+               "--asgi", "--port", str(port), "--latency", str(latency)]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    if not process.stdout.readline().startswith("READY"):
+        process.kill()
+        raise SystemExit("websocket_server failed to start")
+    return process, port
+
+async def time_sse(session, url, n):
+    """Seconds to (first byte, first chunk event, end of stream)"""
+    started = time.perf_counter()
+    first_byte = first_chunk = None
+    body = json.dumps({"client_id": f"sse-{n}", "message": f"prompt {n}"})
+    async with session.post(url, data=body) as response:
+        async for line in response.content:
+            now = time.perf_counter() - started
+            if first_byte is None:
+                first_byte = now
+            if first_chunk is None and line.startswith(b"event: chunk"):
+                first_chunk = now
+    return first_byte, first_chunk, time.perf_counter() - started
+
+async def time_websocket(session, url, n):
+    """Seconds to (first frame, answer) after sending a prompt"""
+    async with session.ws_connect(url) as ws:
+        started = time.perf_counter()
+        await ws.send_str(json.dumps({"type": "message", "content": f"prompt {n}"}))
+        first = None
+        async for message in ws:
+            if first is None:
+                first = time.perf_counter() - started
+            if json.loads(message.data)["type"] in ("response", "error"):
+                return first, time.perf_counter() - started
+
+async def run(args, port):
+    results = {"sse": [], "websocket": []}
+    async with aiohttp.ClientSession() as session:
+        # Warm up sessions and code paths
+        await time_sse(session, f"http://127.0.0.1:{port}/api/chat/stream", -1)
+        for n in range(args.requests):
+            results["sse"].append(await time_sse(session, f"http://127.0.0.1:{port}/api/chat/stream", n))
+            results["websocket"].append(await time_websocket(session, f"ws://127.0.0.1:{port}/ws/ws-{n}", n))
+    return results
+
+def median_ms(samples, index):
+    return statistics.median(sample[index] for sample in samples) * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=1.0, help="seconds the fake model takes per answer")
+    args = parser.parse_args()
+
+    server, port = start_server(args.latency)
+    try:
+        results = asyncio.run(run(args, port))
+    finally:
+        server.terminate()
+        server.wait(30)
+
+    print(f"median of {args.requests} prompts, answers generated over {args.latency * 1000:.0f} ms")
+    print(f"{'endpoint':>20} {'first byte':>11} {'first chunk':>12} {'full answer':>12}")
+    sse, ws = results["sse"], results["websocket"]
+    print(f"{'/api/chat/stream':>20} {median_ms(sse, 0):>9.1f}ms {median_ms(sse, 1):>10.1f}ms "
+          f"{median_ms(sse, 2):>10.1f}ms")
+    print(f"{'/ws/{client_id}':>20} {median_ms(ws, 0):>9.1f}ms {'-':>12} {median_ms(ws, 1):>10.1f}ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+Benchmark server start-up with and without fast start.
+
+For websocket_server with the normal start-up and with FAST_START=1:
+
+1. Runs ``python -X importtime`` on the server import and reports how long
+   the import takes and which top-level packages it spends that time in
+   (self time summed per package, so nested imports are not counted twice).
+2. Starts the server with benchmarks/fake_backend.py and reports the time
+   from spawning the process until the port accepts connections, and
+   until GET /ready answers 200.
+
+The fake backend is installed lazily, so the Gemini SDK import is still
+paid where the server pays it; only the model listing network call made
+by the real GeminiAPI is skipped, so real start-ups gain more.
+
+Usage:
+    python benchmarks/bench_startup.py [--runs 5] [--top 12] [--server websocket_server]
+"""
+import os
+import re
+import sys
+import time
+import socket
+import argparse
+import statistics
+import subprocess
+import urllib.error
+import urllib.request
+from collections import defaultdict
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.abspath(os.path.join(BENCH_DIR, '..'))
+
+MODES = {"normal": "0", "fast start": "1"}
+
+# Import the server as fake_backend would, then exit without waiting for a warm-up
+IMPORT_SNIPPET = (
+    "import sys; sys.path[:0] = [{root!r}, {bench!r}]; "
+    "import fake_backend; fake_backend.install(lazy=True); import {server}"
+)
+
+IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+def environment(fast_start):
+    env = dict(os.environ, FAST_START=fast_start, LOG_LEVEL="WARNING", PYTHONWARNINGS="ignore")
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [ROOT, env.get("PYTHONPATH")]))
+    return env
+
+def importtime(server, fast_start):
+    """
+    Run one -X importtime import of the server.
+
+    Returns:
+        (seconds to import the server module, {top-level package: self seconds})
+    """
+    code = IMPORT_SNIPPET.format(root=ROOT, bench=BENCH_DIR, server=server)
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], env=environment(fast_start),
+                            capture_output=True, text=True, timeout=300)
+    if result.returncode != 0:
+        raise SystemExit(f"import failed:\n{result.stderr[-2000:]}")
+    server_us = 0
+    packages = defaultdict(int)
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if not match:
+            continue
+        self_us, cumulative_us, _, name = match.groups()
+        packages[name.split(".")[0]] += int(self_us)
+        if name == server:
+            server_us = int(cumulative_us)
+    return server_us / 1e6, {name: us / 1e6 for name, us in packages.items()}
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def start_up(server, fast_start, timeout=120.0):
+    """
+    Start the server and time it.
+
+    Returns:
+        (seconds until the port accepts connections, seconds until /ready answers 200)
+    """
+    port = free_port()
+    command = [sys.executable, os.path.join(BENCH_DIR, "fake_backend.py"), "--server", server,
+               "--port", str(port), "--latency", "0"]
+    started = time.perf_counter()
+    process = subprocess.Popen(command, env=environment(fast_start),
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    bound = ready = None
+    try:
+        while ready is None:
+            if process.poll() is not None:
+                raise SystemExit(f"server exited with status {process.returncode}")
+            if time.perf_counter() - started > timeout:
+                raise SystemExit("server did not become ready in time")
+            if bound is None:
+                try:
+                    socket.create_connection(("127.0.0.1", port), timeout=0.5).close()
+                    bound = time.perf_counter() - started
+                except OSError:
+                    time.sleep(0.005)
+                    continue
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/ready", timeout=2) as response:
+                    if response.status == 200:
+                        ready = time.perf_counter() - started
+            except (urllib.error.HTTPError, OSError):
+                # 503 while warming up; poll gently so the checks don't slow the warm-up
+                time.sleep(0.025)
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+    return bound, ready
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--server", default="websocket_server", help="server module to start")
+    parser.add_argument("--runs", type=int, default=5, help="runs per mode; medians are reported")
+    parser.add_argument("--top", type=int, default=12, help="packages to list in the import breakdown")
+    args = parser.parse_args()
+
+    summary = {}
+    for mode, fast_start in MODES.items():
+        imports = [importtime(args.server, fast_start) for _ in range(args.runs)]
+        import_seconds = statistics.median(seconds for seconds, _ in imports)
+        packages = defaultdict(list)
+        for _, breakdown in imports:
+            for name, seconds in breakdown.items():
+                packages[name].append(seconds)
+        print(f"\n{mode}: importing {args.server} takes {import_seconds * 1000:.0f} ms (median of {args.runs})")
+        print(f"  {'package':<28} {'self ms':>9}")
+        ranked = sorted(packages.items(), key=lambda item: -statistics.median(item[1]))
+        for name, samples in ranked[:args.top]:
+            print(f"  {name:<28} {statistics.median(samples) * 1000:>9.1f}")
+
+        timings = [start_up(args.server, fast_start) for _ in range(args.runs)]
+        summary[mode] = (import_seconds, statistics.median(bound for bound, _ in timings),
+                         statistics.median(ready for _, ready in timings))
+
+    print(f"\n{'mode':<12} {'import ms':>10} {'bound ms':>10} {'ready ms':>10}")
+    for mode, (import_seconds, bound, ready) in summary.items():
+        print(f"{mode:<12} {import_seconds * 1000:>10.0f} {bound * 1000:>10.0f} {ready * 1000:>10.0f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,249 @@
+"""
+Offline stand-in for the Gemini backend, used by the benchmarks.
+
+FakeGeminiAPI has the same interface as gemini_api.GeminiAPI, but its chat
+sessions answer with deterministic text after a fixed delay, without an
+API key or network access. Run this module as a script to serve one of
+the WebSocket servers with the fake installed, or with --asgi the
+server's FastAPI app under Uvicorn. The HTTP chat servers are served as
+HTTP apps: async_api_server under Uvicorn (--workers processes) and
+simple_api_server on Flask's development server, as it runs itself.
+
+Usage:
+    python benchmarks/fake_backend.py --server websocket_server_simple --port 8765 [--latency 0.02]
+    python benchmarks/fake_backend.py --server websocket_server --asgi --port 8000
+    python benchmarks/fake_backend.py --server async_api_server --port 5000 --workers 4
+"""
+import os
+import sys
+import time
+import zlib
+import random
+import asyncio
+import logging
+import argparse
+import importlib
+import importlib.abc
+import importlib.util
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Connection handler of each WebSocket server module
+SERVERS = {
+    "websocket_server": "handle_websocket",
+    "websocket_server_simple": "handle_client",
+    "simple_websocket_server": "handle_websocket",
+}
+
+# How each module's HTTP app is served: "asgi" (Uvicorn) or "wsgi" (Flask development server)
+HTTP_SERVERS = {
+    "websocket_server": "asgi",
+    "async_api_server": "asgi",
+    "simple_api_server": "wsgi",
+}
+
+WORDS = (
+    "the model response includes several paragraphs of generated text about "
+    "python websocket servers latency throughput gemini session history "
+    "request streaming chunk client token answer example code function value"
+).split()
+
+# Characters per chunk of a streamed fake answer
+STREAM_CHUNK_CHARS = 100
+
+class FakeResponse:
+    """Stand-in for a Gemini response"""
+    def __init__(self, text):
+        self.text = text
+
+class FakeChatSession:
+    """Chat session that answers deterministically after a fixed delay"""
+    def __init__(self, latency, response_chars):
+        self.latency = latency
+        self.response_chars = response_chars
+        self.history = []
+
+    def send_message(self, content, stream=False):
+        if stream:
+            return self._stream(content)
+        if self.latency:
+            # Blocking, like the real SDK call the servers make
+            time.sleep(self.latency)
+        return FakeResponse(self._answer(content))
+
+    async def send_message_async(self, content):
+        if self.latency:
+            # Waits without holding a thread, like the SDK's async path
+            await asyncio.sleep(self.latency)
+        return FakeResponse(self._answer(content))
+
+    def _answer(self, content):
+        rng = random.Random(zlib.crc32(content.encode()) + len(self.history))
+        text = " ".join(rng.choice(WORDS) for _ in range(self.response_chars // 5))[:self.response_chars]
+        self.history.append((content, text))
+        return text
+
+    def _stream(self, content):
+        # The same latency in total, spread over the chunks as a model generates them
+        text = self._answer(content)
+        chunks = [text[i:i + STREAM_CHUNK_CHARS] for i in range(0, len(text), STREAM_CHUNK_CHARS)]
+        for chunk in chunks:
+            if self.latency:
+                time.sleep(self.latency / len(chunks))
+            yield FakeResponse(chunk)
+
+class FakeGeminiAPI:
+    """Drop-in replacement for GeminiAPI that never touches the network"""
+    latency = 0.02
+    response_chars = 800
+    session_latency = 0.0
+
+    def __init__(self, api_key=None):
+        self.api_key = api_key
+
+    def generate_text(self, prompt):
+        return FakeChatSession(self.latency, self.response_chars).send_message(prompt).text
+
+    def chat_session(self):
+        if self.session_latency:
+            # Blocking session setup, e.g. an SDK that loads state or makes a call
+            time.sleep(self.session_latency)
+        return FakeChatSession(self.latency, self.response_chars)
+
+    def export_history(self, chat_session):
+        turns = []
+        for prompt, answer in chat_session.history:
+            turns += [("user", [prompt]), ("model", [answer])]
+        return turns
+
+    def restore_session(self, turns):
+        session = FakeChatSession(self.latency, self.response_chars)
+        texts = [parts[0] for _, parts in turns]
+        session.history = list(zip(texts[::2], texts[1::2]))
+        return session
+
+class InstallOnImport(importlib.abc.MetaPathFinder):
+    """Import hook that installs the fake once gemini_api is first imported"""
+    def find_spec(self, name, path, target=None):
+        if name != "gemini_api":
+            return None
+        sys.meta_path.remove(self)
+        spec = importlib.util.find_spec(name)
+        exec_module = spec.loader.exec_module
+
+        def exec_and_install(module):
+            exec_module(module)
+            module.GeminiAPI = FakeGeminiAPI
+        spec.loader.exec_module = exec_and_install
+        return spec
+
+def install(latency=0.02, response_chars=800, lazy=False, session_latency=0.0):
+    """
+    Replace gemini_api.GeminiAPI with the fake; call before importing a server.
+
+    With lazy=True the Gemini SDK is not imported here: the fake is installed
+    when the server first imports gemini_api, e.g. during a fast-start warm-up.
+    """
+    FakeGeminiAPI.latency = latency
+    FakeGeminiAPI.response_chars = response_chars
+    FakeGeminiAPI.session_latency = session_latency
+    if lazy and "gemini_api" not in sys.modules:
+        sys.meta_path.insert(0, InstallOnImport())
+        return
+    import gemini_api
+    gemini_api.GeminiAPI = FakeGeminiAPI
+
+def raise_open_file_limit():
+    """Allow as many sockets as the hard limit permits"""
+    try:
+        import resource
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        if soft < hard:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    except (ImportError, ValueError, OSError):
+        pass
+
+async def serve(server, host, port, backlog):
+    """Serve the given WebSocket server module's handler until drained (SIGTERM) or cancelled"""
+    import websockets
+
+    module = importlib.import_module(server)
+    handler = getattr(module, SERVERS[server])
+    async with websockets.serve(handler, host, port, process_request=module.process_request, backlog=backlog,
+                                **getattr(module, "SERVE_KWARGS", {}), **module.compression_settings.serve_kwargs()):
+        # The load generator waits for this line before connecting
+        print(f"READY ws://{host}:{port}", flush=True)
+        # Fast-starting servers warm up once they are listening
+        if hasattr(module, "warmup"):
+            module.warmup.start()
+        module.drain.handle_signals()
+        await module.drain.stopped.wait()
+
+def app_factory():
+    """
+    ASGI app of the FAKE_SERVER module with the fake installed, for Uvicorn
+    worker processes, which import the app afresh; settings come from
+    FAKE_LATENCY and FAKE_RESPONSE_CHARS.
+    """
+    install(float(os.environ["FAKE_LATENCY"]), int(os.environ["FAKE_RESPONSE_CHARS"]))
+    return importlib.import_module(os.environ["FAKE_SERVER"]).app
+
+def serve_asgi(server, host, port, log_level, workers=1, latency=0.02, response_chars=800):
+    """Serve the given server module's FastAPI app with Uvicorn until stopped"""
+    import uvicorn
+
+    if workers > 1:
+        os.environ.update(FAKE_SERVER=server, FAKE_LATENCY=str(latency), FAKE_RESPONSE_CHARS=str(response_chars))
+        uvicorn.run("fake_backend:app_factory", factory=True, app_dir=os.path.dirname(os.path.abspath(__file__)),
+                    host=host, port=port, workers=workers, log_level=log_level.lower())
+        return
+
+    module = importlib.import_module(server)
+
+    class ReadyServer(uvicorn.Server):
+        async def startup(self, sockets=None):
+            await super().startup(sockets)
+            print(f"READY http://{host}:{port}", flush=True)
+
+    ReadyServer(uvicorn.Config(module.app, host=host, port=port, log_level=log_level.lower())).run()
+
+def serve_wsgi(server, host, port):
+    """Serve the given server module's Flask app on its development server, as the module runs itself"""
+    module = importlib.import_module(server)
+    module.app.run(host=host, port=port, threaded=True)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--server", choices=sorted(set(SERVERS) | set(HTTP_SERVERS)), default="websocket_server_simple")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds per fake Gemini call")
+    parser.add_argument("--response-chars", type=int, default=800, help="length of each fake answer")
+    parser.add_argument("--session-latency", type=float, default=0.0, help="seconds to create a fake chat session")
+    parser.add_argument("--backlog", type=int, default=4096, help="listen backlog for connection bursts")
+    parser.add_argument("--log-level", default="WARNING", help="server log level during the run")
+    parser.add_argument("--asgi", action="store_true", help="serve the module's FastAPI app with Uvicorn")
+    parser.add_argument("--workers", type=int, default=1, help="Uvicorn worker processes for an ASGI app")
+    args = parser.parse_args()
+
+    raise_open_file_limit()
+    os.environ.setdefault("LOG_LEVEL", args.log_level)
+    # Lazily, so start-up is measured as the server would pay for it (see bench_startup.py)
+    install(args.latency, args.response_chars, lazy=True, session_latency=args.session_latency)
+    # Servers configure logging at import time; quieten them for the run
+    importlib.import_module(args.server)
+    logging.getLogger().setLevel(args.log_level.upper())
+    mode = HTTP_SERVERS.get(args.server) if args.asgi or args.server not in SERVERS else None
+    try:
+        if mode == "asgi":
+            serve_asgi(args.server, args.host, args.port, args.log_level, args.workers, args.latency,
+                       args.response_chars)
+        elif mode == "wsgi":
+            serve_wsgi(args.server, args.host, args.port)
+        else:
+            asyncio.run(serve(args.server, args.host, args.port, args.backlog))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+"""
+Load generator for the Gemini WebSocket servers.
+
+Opens many concurrent connections, replays conversation scripts on each
+one and reports connections/sec, messages/sec, and latency and
+time-to-first-chunk percentiles. With --fake-backend the chosen server is
+started with the offline fake model (see fake_backend.py), so runs are
+repeatable without an API key or network access.
+
+Usage:
+    python benchmarks/load_test.py --fake-backend websocket_server_simple --connections 2000
+    python benchmarks/load_test.py --url ws://127.0.0.1:8766 --connections 500 --script convo.json
+
+A script file is a JSON list of conversations. Each conversation is a list
+of messages, given either as prompt strings or as raw message objects:
+
+    [["Hello", "Tell me a joke"], [{"type": "ping"}, "What is a websocket?"]]
+
+Each connection replays one conversation, chosen with --seed, --iterations times.
+"""
+import os
+import sys
+import json
+import time
+import random
+import socket
+import asyncio
+import argparse
+import subprocess
+from collections import Counter
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import websockets
+from fake_backend import SERVERS, raise_open_file_limit
+
+DEFAULT_SCRIPTS = [
+    ["Hello!", "What is a WebSocket?", "How does it compare to HTTP polling?"],
+    [{"type": "ping"}, "Summarise the benefits of connection reuse.", {"type": "ping"}],
+    ["Write a haiku about latency."],
+]
+
+# Frames carrying (part of) an answer, and frames that complete a request
+CHUNK_TYPES = {"response", "response_chunk", "api_response", "api_response_chunk", "api_batch_item",
+               "api_batch_response"}
+FINAL_TYPES = {"response", "api_response", "api_response_end", "api_batch_end", "api_batch_response", "error",
+               "pong", "busy"}
+
+class Stats:
+    """Measurements collected across all connections"""
+    def __init__(self):
+        self.connect_times = []
+        self.latencies = []
+        self.first_chunk = []
+        self.errors = Counter()
+        self.connected = 0
+        self.sent = 0
+        self.completed = 0
+        self.connect_start = None
+        self.connect_end = None
+        self.first_send = None
+        self.last_reply = None
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a sorted list"""
+    if not values:
+        return float("nan")
+    index = min(len(values) - 1, max(0, int(round(fraction * len(values) + 0.5)) - 1))
+    return values[index]
+
+def load_scripts(path):
+    """Load conversation scripts from a JSON file, or return the defaults"""
+    if not path:
+        return DEFAULT_SCRIPTS
+    with open(path) as f:
+        scripts = json.load(f)
+    if not scripts or not all(isinstance(script, list) and script for script in scripts):
+        raise SystemExit(f"{path}: expected a non-empty list of non-empty conversations")
+    return scripts
+
+def to_frame(message):
+    """Turn a script entry into the JSON frame to send"""
+    if isinstance(message, str):
+        return json.dumps({"type": "message", "content": message})
+    return json.dumps(message)
+
+async def exchange(ws, frame, stats, timeout):
+    """Send one frame and wait for the reply that completes it"""
+    sent = time.perf_counter()
+    if stats.first_send is None:
+        stats.first_send = sent
+    await ws.send(frame)
+    stats.sent += 1
+    first_chunk = None
+    while True:
+        reply = json.loads(await asyncio.wait_for(ws.recv(), timeout))
+        kind = reply.get("type")
+        now = time.perf_counter()
+        if kind == "ping":
+            # Server keep-alive (simple_websocket_server)
+            await ws.send(json.dumps({"type": "pong"}))
+            continue
+        if first_chunk is None and kind in CHUNK_TYPES:
+            first_chunk = now - sent
+            stats.first_chunk.append(first_chunk)
+        if kind in FINAL_TYPES:
+            break
+    stats.last_reply = now
+    if kind == "busy":
+        # Shed by admission control; kept out of the latency figures
+        stats.errors["busy"] += 1
+        return
+    stats.latencies.append(now - sent)
+    if kind == "error":
+        stats.errors["error frame"] += 1
+    else:
+        stats.completed += 1
+
+async def run_connection(index, args, script, stats, connect_slots, start):
+    """Connect one client, wait for the others, then replay its conversation"""
+    uri = f"{args.url.rstrip('/')}/load-{index}"
+    if args.rate:
+        await asyncio.sleep(index / args.rate)
+    try:
+        async with connect_slots:
+            begin = time.perf_counter()
+            if stats.connect_start is None:
+                stats.connect_start = begin
+            ws = await websockets.connect(uri, open_timeout=args.timeout, max_size=None,
+                                          ping_interval=None)
+            # Wait for the welcome frame so a connection counts once it is usable
+            welcome = json.loads(await asyncio.wait_for(ws.recv(), args.timeout))
+            stats.connect_end = time.perf_counter()
+            stats.connect_times.append(stats.connect_end - begin)
+            if welcome.get("type") != "connected":
+                stats.errors["rejected"] += 1
+                await ws.close()
+                return
+            stats.connected += 1
+    except Exception as e:
+        stats.errors[f"connect: {type(e).__name__}"] += 1
+        return
+
+    try:
+        await start.wait()
+        for _ in range(args.iterations):
+            for message in script:
+                await exchange(ws, to_frame(message), stats, args.timeout)
+                if args.think_time:
+                    await asyncio.sleep(args.think_time)
+    except Exception as e:
+        stats.errors[type(e).__name__] += 1
+    finally:
+        await ws.close()
+
+async def run(args, scripts):
+    """Drive all connections and return the collected stats"""
+    stats = Stats()
+    rng = random.Random(args.seed)
+    connect_slots = asyncio.Semaphore(args.connect_concurrency)
+    start = asyncio.Event()
+    tasks = [
+        asyncio.create_task(run_connection(i, args, rng.choice(scripts), stats, connect_slots, start))
+        for i in range(args.connections)
+    ]
+    # Conversations start together once every connection attempt has finished,
+    # so all connections are open concurrently while messages are exchanged
+    while stats.connected + sum(stats.errors.values()) < args.connections:
+        if all(task.done() for task in tasks):
+            break
+        await asyncio.sleep(0.01)
+    start.set()
+    await asyncio.gather(*tasks)
+    return stats
+
+def report(args, stats):
+    """Print a summary and return it as a dict"""
+    connect_elapsed = (stats.connect_end or 0) - (stats.connect_start or 0)
+    message_elapsed = (stats.last_reply or 0) - (stats.first_send or 0)
+    summary = {
+        "url": args.url,
+        "server": args.fake_backend,
+        "connections": args.connections,
+        "connected": stats.connected,
+        "messages_sent": stats.sent,
+        "messages_completed": stats.completed,
+        "connections_per_sec": stats.connected / connect_elapsed if connect_elapsed > 0 else 0.0,
+        "messages_per_sec": stats.completed / message_elapsed if message_elapsed > 0 else 0.0,
+        "errors": dict(stats.errors),
+    }
+    print(f"connections      {stats.connected}/{args.connections} open, "
+          f"{summary['connections_per_sec']:.0f} conn/s")
+    print(f"messages         {stats.completed}/{stats.sent} completed, "
+          f"{summary['messages_per_sec']:.0f} msg/s")
+    print(f"\n{'ms':<16} {'p50':>9} {'p95':>9} {'p99':>9} {'p999':>9} {'max':>9}")
+    for label, values in (("connect", stats.connect_times), ("latency", stats.latencies),
+                          ("first chunk", stats.first_chunk)):
+        ordered = sorted(values)
+        points = {name: percentile(ordered, q) * 1000
+                  for name, q in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99), ("p999", 0.999))}
+        points["max"] = ordered[-1] * 1000 if ordered else float("nan")
+        summary[label.replace(" ", "_") + "_ms"] = points
+        print(f"{label:<16} " + " ".join(f"{value:>9.2f}" for value in points.values()))
+    if stats.errors:
+        print("\nerrors: " + ", ".join(f"{name}={count}" for name, count in stats.errors.most_common()))
+    return summary
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def start_fake_backend(args):
+    """Start a server with the fake model in a subprocess and wait until it listens"""
+    port = free_port()
+    command = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_backend.py"),
+               "--server", args.fake_backend, "--port", str(port),
+               "--latency", str(args.fake_latency), "--response-chars", str(args.fake_response_chars),
+               "--session-latency", str(args.fake_session_latency)]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    line = process.stdout.readline()
+    if not line.startswith("READY"):
+        process.kill()
+        raise SystemExit(f"fake backend for {args.fake_backend} failed to start")
+    return process, line.split()[1]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--url", default="ws://127.0.0.1:8765", help="server URL; client IDs are appended as the path")
+    parser.add_argument("--fake-backend", choices=sorted(SERVERS),
+                        help="start this server with the offline fake model instead of using --url")
+    parser.add_argument("--fake-latency", type=float, default=0.02, help="seconds per fake Gemini call")
+    parser.add_argument("--fake-response-chars", type=int, default=800, help="length of each fake answer")
+    parser.add_argument("--fake-session-latency", type=float, default=0.0,
+                        help="seconds to create each fake chat session")
+    parser.add_argument("--connections", type=int, default=1000, help="concurrent connections to open")
+    parser.add_argument("--connect-concurrency", type=int, default=200, help="handshakes in flight at once")
+    parser.add_argument("--rate", type=float, default=0.0, help="connections opened per second (0 = as fast as possible)")
+    parser.add_argument("--script", help="JSON file of conversation scripts")
+    parser.add_argument("--iterations", type=int, default=1, help="times each connection replays its conversation")
+    parser.add_argument("--think-time", type=float, default=0.0, help="seconds between messages on a connection")
+    parser.add_argument("--timeout", type=float, default=60.0, help="seconds to wait for a handshake or reply")
+    parser.add_argument("--seed", type=int, default=1, help="seed for assigning conversations to connections")
+    parser.add_argument("--json", help="also write the summary to this file")
+    args = parser.parse_args()
+
+    raise_open_file_limit()
+    scripts = load_scripts(args.script)
+    process = None
+    if args.fake_backend:
+        process, args.url = start_fake_backend(args)
+    try:
+        stats = asyncio.run(run(args, scripts))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+    summary = report(args, stats)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(summary, f, indent=2)
+
+if __name__ == "__main__":
+    main()
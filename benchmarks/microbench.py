@@ -0,0 +1,311 @@
+"""
+Microbenchmarks for the server hot paths, with regression gating.
+
+Covers message encode/decode, ConnectionManager connect/disconnect/send,
+chat session creation, forward_api_request against a local HTTP stub and
+a full chat turn through websocket_server.handle_frame with the fake model.
+Results are compared against a committed baseline and any benchmark whose
+best round is slower than the baseline by more than the threshold is
+flagged; the exit status is 1 if there are regressions.
+
+Each benchmark is run in several worker processes and the median of their
+best rounds is compared. Timings differ between processes (hash seeds,
+memory layout) by more than they differ between rounds in one process,
+so a single process is not a reliable sample.
+
+The baseline is machine-specific: regenerate it on the machine that runs
+the comparison with --update-baseline.
+
+Usage:
+    python benchmarks/microbench.py [--filter codec] [--output results.json]
+    python benchmarks/microbench.py --update-baseline
+"""
+import gc
+import os
+import sys
+import json
+import time
+import asyncio
+import inspect
+import argparse
+import platform
+import tempfile
+import subprocess
+import statistics
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+# Keep per-message server logging out of the measurements
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+import gemini_api
+from fake_backend import install
+
+# The real GeminiAPI is kept for the session creation benchmark; the servers get the fake
+RealGeminiAPI = gemini_api.GeminiAPI
+install(latency=0.0, response_chars=800)
+
+from protocol import ApiRequest, decode, encode
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+CHAT_FRAME = json.dumps({"type": "message", "content": "Tell me about websockets. " * 8})
+API_FRAME = json.dumps({"type": "api_request", "endpoint": "https://example.com/items", "method": "POST",
+                        "params": {"page": "1"}, "headers": {"Accept": "application/json"},
+                        "body": {"name": "item", "tags": ["a", "b", "c"]}})
+RESPONSE = {"type": "response", "content": "WebSockets provide full-duplex communication. " * 45}
+API_RESPONSE = {"type": "api_response", "status": 200,
+                "data": [{"id": i, "name": f"item {i}", "score": i / 7, "tags": ["x", "y"]} for i in range(300)]}
+
+BENCHMARKS = {}
+
+def bench(name, number):
+    """Register a benchmark; the decorated factory returns the operation to time"""
+    def register(factory):
+        BENCHMARKS[name] = (factory, number)
+        return factory
+    return register
+
+class FakeWebSocket:
+    """Minimal stand-in for a FastAPI WebSocket"""
+    headers = {}
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, message):
+        pass
+
+async def discard(message):
+    pass
+
+class Fixtures:
+    """Resources shared by the benchmarks: the server module and a local HTTP stub"""
+
+    async def start(self):
+        from aiohttp import web
+        import websocket_server
+
+        self.server = websocket_server
+        self.manager = websocket_server.ConnectionManager()
+
+        async def items(request):
+            return web.json_response(API_RESPONSE["data"][:20])
+
+        app = web.Application()
+        app.router.add_get("/items", items)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        host, port = self.runner.addresses[0][:2]
+        self.url = f"http://{host}:{port}/items"
+
+    async def stop(self):
+        if self.manager.http_session is not None:
+            await self.manager.http_session.close()
+        await self.runner.cleanup()
+
+@bench("codec.decode.message", number=20000)
+async def decode_message(fx):
+    return lambda: decode(CHAT_FRAME)
+
+@bench("codec.decode.api_request", number=20000)
+async def decode_api_request(fx):
+    return lambda: decode(API_FRAME)
+
+@bench("codec.encode.response_2kb", number=20000)
+async def encode_response(fx):
+    return lambda: encode(RESPONSE)
+
+@bench("codec.encode.api_response_32kb", number=500)
+async def encode_api_response(fx):
+    return lambda: encode(API_RESPONSE)
+
+@bench("manager.connect_disconnect", number=5000)
+async def connect_disconnect(fx):
+    websocket = FakeWebSocket()
+
+    async def op():
+        await fx.manager.connect(websocket, "bench")
+        fx.manager.disconnect("bench")
+    return op
+
+@bench("manager.send_message", number=20000)
+async def send_message(fx):
+    await fx.manager.connect(FakeWebSocket(), "bench-send")
+    frame = encode(RESPONSE)
+    return lambda: fx.manager.send_message(frame, "bench-send")
+
+@bench("session.chat_session", number=5000)
+async def chat_session(fx):
+    # Real GeminiAPI without the model listing network call in __init__
+    api = RealGeminiAPI.__new__(RealGeminiAPI)
+    api.text_model = gemini_api.genai.GenerativeModel("gemini-1.5-flash")
+    return api.chat_session
+
+@bench("http.aiohttp_get_direct", number=300)
+async def direct_get(fx):
+    session = await fx.manager.get_http_session()
+
+    async def op():
+        async with session.request("GET", fx.url) as response:
+            await response.json()
+    return op
+
+@bench("http.forward_api_request", number=300)
+async def forward_api_request(fx):
+    request = ApiRequest(endpoint=fx.url)
+    return lambda: fx.manager.forward_api_request(request, "bench", discard)
+
+@bench("e2e.chat_turn_fake_model", number=2000)
+async def chat_turn(fx):
+    fx.server.manager.chat_sessions["bench-e2e"] = fx.server.gemini_api.chat_session()
+    return lambda: fx.server.handle_frame(CHAT_FRAME, "bench-e2e", discard)
+
+async def measure(op, number, repeat):
+    """Return per-operation times in seconds, one per round"""
+    # Operations may be plain callables or return a coroutine to await
+    first = op()
+    is_async = inspect.iscoroutine(first)
+    if is_async:
+        await first
+    rounds = []
+    # Like timeit, keep garbage collection pauses out of the timed rounds
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(repeat + 1):
+            start = time.perf_counter()
+            if is_async:
+                for _ in range(number):
+                    await op()
+            else:
+                for _ in range(number):
+                    op()
+            rounds.append((time.perf_counter() - start) / number)
+            gc.collect()
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    # The first round is warm-up
+    return rounds[1:]
+
+async def run(selected, repeat, scale):
+    fixtures = Fixtures()
+    await fixtures.start()
+    results = {}
+    try:
+        for name in selected:
+            factory, number = BENCHMARKS[name]
+            op = await factory(fixtures)
+            rounds = await measure(op, max(1, int(number * scale)), repeat)
+            results[name] = {
+                "median_us": statistics.median(rounds) * 1e6,
+                "min_us": min(rounds) * 1e6,
+                "stdev_us": statistics.stdev(rounds) * 1e6 if len(rounds) > 1 else 0.0,
+            }
+            print(f"  {name:<34} {results[name]['min_us']:>10.2f} us", flush=True)
+    finally:
+        await fixtures.stop()
+    return results
+
+def run_processes(args, selected):
+    """Run the benchmarks in worker processes and combine their results"""
+    samples = {name: [] for name in selected}
+    for index in range(args.processes):
+        print(f"worker {index + 1}/{args.processes}", flush=True)
+        with tempfile.TemporaryDirectory() as tmp:
+            output = os.path.join(tmp, "results.json")
+            command = [sys.executable, os.path.abspath(__file__), "--worker", "--filter", args.filter,
+                       "--repeat", str(args.repeat), "--scale", str(args.scale), "--output", output]
+            worker = subprocess.run(command, capture_output=True, text=True)
+            if worker.returncode != 0:
+                sys.stderr.write(worker.stderr)
+                raise SystemExit(f"benchmark worker failed with exit status {worker.returncode}")
+            with open(output) as f:
+                for name, result in json.load(f)["results"].items():
+                    samples[name].append(result)
+    results = {}
+    for name, runs in samples.items():
+        bests = [run["min_us"] for run in runs]
+        results[name] = {
+            "median_us": statistics.median(run["median_us"] for run in runs),
+            "min_us": statistics.median(bests),
+            "stdev_us": statistics.stdev(bests) if len(bests) > 1 else 0.0,
+        }
+    return results
+
+def compare(results, baseline, threshold):
+    """Print results against the baseline and return the names that regressed"""
+    regressions = []
+    print(f"\n{'benchmark':<34} {'best us':>10} {'baseline':>10} {'change':>8} {'median us':>10}")
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            print(f"{name:<34} {result['min_us']:>10.2f} {'-':>10} {'new':>8} {result['median_us']:>10.2f}")
+            continue
+        change = result["min_us"] / base["min_us"] - 1
+        flag = ""
+        if change > threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:<34} {result['min_us']:>10.2f} {base['min_us']:>10.2f} {change:>+7.0%} "
+              f"{result['median_us']:>10.2f}{flag}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--filter", default="", help="only run benchmarks whose name contains this")
+    parser.add_argument("--repeat", type=int, default=7, help="timed rounds per benchmark and process")
+    parser.add_argument("--processes", type=int, default=5, help="worker processes to spread each benchmark over")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiply iterations per round")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="flag benchmarks slower than the baseline by more than this fraction")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="baseline JSON to compare against")
+    parser.add_argument("--output", help="write results to this JSON file")
+    parser.add_argument("--update-baseline", action="store_true", help="write results to the baseline file")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    selected = [name for name in BENCHMARKS if args.filter in name]
+    if not selected:
+        raise SystemExit(f"no benchmarks match {args.filter!r}")
+    if args.worker:
+        results = asyncio.run(run(selected, args.repeat, args.scale))
+    else:
+        results = run_processes(args, selected)
+    report = {
+        "meta": {"python": platform.python_version(), "platform": platform.platform(),
+                 "created": time.strftime("%Y-%m-%dT%H:%M:%S")},
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.worker:
+        return
+    if args.update_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f)["results"]
+        # Keep entries for benchmarks that were filtered out of this run
+        report["results"] = {**baseline, **results}
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nBaseline written to {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print(f"\nNo baseline at {args.baseline}; run with --update-baseline to create one")
+        return
+    with open(args.baseline) as f:
+        baseline = json.load(f)["results"]
+    regressions = compare(results, baseline, args.threshold)
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) beyond {args.threshold:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
+    print(f"\nNo regressions beyond {args.threshold:.0%}")
+
+if __name__ == "__main__":
+    main()
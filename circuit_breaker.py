@@ -0,0 +1,284 @@
+"""
+Per-host circuit breakers for forwarded API requests.
+
+Each upstream host gets a breaker that watches its recent calls:
+
+- closed: calls go through. Once a rolling window holds at least
+  ``min_calls`` calls and the share that failed (exceptions, timeouts and
+  5xx responses) or was slow reaches its threshold, the breaker opens.
+- open: calls fail fast with ``CircuitOpen`` (answered with 503 and a
+  ``retry_after``), so a known-bad host stops holding connections,
+  admission slots and client time. After ``open_seconds`` the breaker
+  goes half-open.
+- half-open: up to ``half_open_calls`` probe calls go through. If they all
+  succeed quickly the breaker closes; any failure or slow call opens it
+  again.
+
+Environment variables:
+    BREAKER_WINDOW: Seconds of calls the error and slow rates are taken over (default 30)
+    BREAKER_MIN_CALLS: Calls in the window before the breaker may open (default 10)
+    BREAKER_FAILURE_RATE: Share of failed calls that opens the breaker (default 0.5)
+    BREAKER_SLOW_CALL_SECONDS: Calls taking at least this long count as slow (default 5)
+    BREAKER_SLOW_CALL_RATE: Share of slow calls that opens the breaker (default 0.8, 0 disables)
+    BREAKER_OPEN_SECONDS: Seconds a breaker stays open before probing (default 30)
+    BREAKER_HALF_OPEN_CALLS: Probe calls allowed while half-open (default 1)
+    BREAKER_MAX_HOSTS: Hosts tracked at once; the least recently used closed
+        breakers are dropped beyond this (default 1000)
+"""
+import time
+import asyncio
+import logging
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from dataclasses import dataclass
+from types import SimpleNamespace
+from typing import Any, Dict, Optional
+from urllib.parse import urlsplit
+
+from metrics import Counter, Gauge
+from settings import EnvSettings
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+# Values of the circuit_breaker_state gauge
+STATE_VALUES = {CLOSED: 0, OPEN: 1, HALF_OPEN: 2}
+
+BREAKER_STATE = Gauge("circuit_breaker_state", "Upstream circuit breaker state (0 closed, 1 open, 2 half-open)",
+                      ["host"])
+BREAKER_TRANSITIONS = Counter("circuit_breaker_transitions_total", "Circuit breaker state changes",
+                              ["host", "state"])
+BREAKER_REJECTED = Counter("circuit_breaker_rejected_total", "Upstream calls refused by an open circuit breaker",
+                           ["host"])
+
+
+class CircuitOpen(Exception):
+    """Raised instead of calling a host whose breaker is open."""
+
+    def __init__(self, host: str, retry_after: float):
+        super().__init__(f"Circuit open for {host}; retry in {retry_after:.0f}s")
+        self.host = host
+        self.retry_after = retry_after
+
+
+def open_response(error: CircuitOpen) -> Dict[str, Any]:
+    """Build the api_response frame for a call refused by an open breaker."""
+    return {
+        "type": "api_response",
+        "status": 503,
+        "data": {"error": str(error)},
+        "retry_after": round(error.retry_after, 1),
+    }
+
+
+@dataclass
+class BreakerSettings(EnvSettings):
+    """
+    Circuit breaker thresholds.
+
+    Attributes:
+        window: Seconds of calls the error and slow rates are taken over
+        min_calls: Calls in the window before the breaker may open
+        failure_rate: Share of failed calls that opens the breaker
+        slow_call_seconds: Calls taking at least this long count as slow
+        slow_call_rate: Share of slow calls that opens the breaker (0 disables)
+        open_seconds: Seconds a breaker stays open before probing
+        half_open_calls: Probe calls allowed while half-open
+        max_hosts: Hosts tracked at once
+    """
+    env_prefix = "BREAKER"
+
+    window: float = 30.0
+    min_calls: int = 10
+    failure_rate: float = 0.5
+    slow_call_seconds: float = 5.0
+    slow_call_rate: float = 0.8
+    open_seconds: float = 30.0
+    half_open_calls: int = 1
+    max_hosts: int = 1000
+
+
+class CircuitBreaker:
+    """
+    Breaker for one upstream host.
+
+    Args:
+        host: Host the breaker guards, used in metrics and errors
+        settings: Thresholds
+    """
+
+    def __init__(self, host: str, settings: BreakerSettings):
+        self.host = host
+        self.settings = settings
+        self.state = CLOSED
+        self.opened_at = 0.0
+        # (finished_at, failed, slow) for calls in the rolling window
+        self.calls = deque()
+        self.failures = 0
+        self.slow = 0
+        self.probes = 0
+        self.probe_successes = 0
+        BREAKER_STATE.labels(host=host).set(0)
+
+    def _transition(self, state: str):
+        logger.log(logging.WARNING if state == OPEN else logging.INFO,
+                   "Circuit breaker for %s: %s -> %s", self.host, self.state, state)
+        self.state = state
+        BREAKER_STATE.labels(host=self.host).set(STATE_VALUES[state])
+        BREAKER_TRANSITIONS.labels(host=self.host, state=state).inc()
+        if state == OPEN:
+            self.opened_at = time.monotonic()
+        self.calls.clear()
+        self.failures = self.slow = 0
+        self.probes = self.probe_successes = 0
+
+    def _expire(self, now: float):
+        cutoff = now - self.settings.window
+        while self.calls and self.calls[0][0] < cutoff:
+            _, failed, slow = self.calls.popleft()
+            self.failures -= failed
+            self.slow -= slow
+
+    def retry_after(self) -> float:
+        """Seconds until an open breaker lets a probe through."""
+        return max(0.0, self.opened_at + self.settings.open_seconds - time.monotonic())
+
+    def acquire(self):
+        """
+        Ask to make a call; pair with record() or release().
+
+        Raises:
+            CircuitOpen: If the breaker is open, or half-open with all probes taken
+        """
+        if self.state == OPEN:
+            if self.retry_after() > 0:
+                BREAKER_REJECTED.labels(host=self.host).inc()
+                raise CircuitOpen(self.host, self.retry_after())
+            self._transition(HALF_OPEN)
+        if self.state == HALF_OPEN:
+            if self.probes >= self.settings.half_open_calls:
+                BREAKER_REJECTED.labels(host=self.host).inc()
+                # A probe is already deciding; its answer is due shortly
+                raise CircuitOpen(self.host, 1.0)
+            self.probes += 1
+
+    def release(self):
+        """Give back a call that ended without an outcome (e.g. it was cancelled)."""
+        if self.state == HALF_OPEN and self.probes:
+            self.probes -= 1
+
+    def record(self, ok: bool, duration: float):
+        """
+        Record the outcome of a call made after acquire().
+
+        Args:
+            ok: False for exceptions, timeouts and 5xx responses
+            duration: Seconds the call took
+        """
+        slow = duration >= self.settings.slow_call_seconds
+        if self.state == HALF_OPEN:
+            if not ok or slow:
+                self._transition(OPEN)
+                return
+            self.probe_successes += 1
+            if self.probe_successes >= self.settings.half_open_calls:
+                self._transition(CLOSED)
+            return
+        if self.state == OPEN:
+            # A call that started before the breaker opened
+            return
+        now = time.monotonic()
+        self.calls.append((now, not ok, slow))
+        self.failures += not ok
+        self.slow += slow
+        self._expire(now)
+        calls = len(self.calls)
+        if calls < self.settings.min_calls:
+            return
+        if (self.failures / calls >= self.settings.failure_rate
+                or (self.settings.slow_call_rate and self.slow / calls >= self.settings.slow_call_rate)):
+            self._transition(OPEN)
+
+    @contextmanager
+    def guard(self):
+        """
+        Acquire for one call and record its outcome when the block exits.
+
+        Exceptions count as failures; cancellation gives the call back
+        without an outcome. Set ``call.ok = False`` on the yielded object
+        for failed responses such as 5xx, and add to ``call.excluded`` any
+        seconds that shouldn't count towards the call's duration.
+
+        Raises:
+            CircuitOpen: If the call may not be made
+        """
+        self.acquire()
+        call = SimpleNamespace(ok=True, excluded=0.0)
+        started = time.monotonic()
+        try:
+            yield call
+        except asyncio.CancelledError:
+            self.release()
+            raise
+        except Exception:
+            self.record(False, time.monotonic() - started - call.excluded)
+            raise
+        self.record(call.ok, time.monotonic() - started - call.excluded)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Current state and window rates, for the /breakers endpoint."""
+        self._expire(time.monotonic())
+        calls = len(self.calls)
+        snapshot = {
+            "state": self.state,
+            "calls": calls,
+            "failure_rate": round(self.failures / calls, 3) if calls else 0.0,
+            "slow_call_rate": round(self.slow / calls, 3) if calls else 0.0,
+        }
+        if self.state == OPEN:
+            snapshot["retry_after"] = round(self.retry_after(), 1)
+        return snapshot
+
+
+class BreakerRegistry:
+    """
+    Circuit breakers keyed by upstream host.
+
+    Args:
+        settings: Thresholds shared by every breaker
+    """
+
+    def __init__(self, settings: Optional[BreakerSettings] = None):
+        self.settings = settings or BreakerSettings()
+        self.breakers: "OrderedDict[str, CircuitBreaker]" = OrderedDict()
+
+    @staticmethod
+    def host(url: str) -> str:
+        """Host (and port, if given) a URL's breaker is keyed by."""
+        return urlsplit(url).netloc.lower() or url
+
+    def get(self, url: str) -> CircuitBreaker:
+        """The breaker for a URL's host, created closed on first use."""
+        host = self.host(url)
+        breaker = self.breakers.get(host)
+        if breaker is not None:
+            self.breakers.move_to_end(host)
+            return breaker
+        breaker = self.breakers[host] = CircuitBreaker(host, self.settings)
+        if len(self.breakers) > self.settings.max_hosts:
+            # Forget the least recently used closed breaker; open ones keep protecting
+            for old_host, old in self.breakers.items():
+                if old.state == CLOSED and old_host != host:
+                    del self.breakers[old_host]
+                    # Drop every per-host series so label cardinality stays bounded too
+                    BREAKER_STATE.remove(host=old_host)
+                    BREAKER_REJECTED.remove(host=old_host)
+                    for state in STATE_VALUES:
+                        BREAKER_TRANSITIONS.remove(host=old_host, state=state)
+                    break
+        return breaker
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        return {host: breaker.snapshot() for host, breaker in self.breakers.items()}
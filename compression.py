@@ -0,0 +1,103 @@
+"""
+permessage-deflate settings for the WebSocket servers.
+
+Builds the extension factories passed to ``websockets.serve`` and a uvicorn
+protocol class for the FastAPI endpoint, so each server can enable or tune
+compression and skip it for frames too small to benefit.
+"""
+from dataclasses import dataclass
+from typing import Any, Dict, List
+
+from websockets.extensions.permessage_deflate import PerMessageDeflate, ServerPerMessageDeflateFactory
+from websockets.frames import CTRL_OPCODES, Frame, Opcode
+
+from settings import EnvSettings
+
+
+@dataclass
+class CompressionSettings(EnvSettings):
+    """
+    Compression settings for one server.
+
+    Attributes:
+        enabled: Negotiate permessage-deflate with clients that offer it
+        window_bits: Server LZ77 window size in bits (9-15); smaller uses less memory
+        mem_level: zlib memory level (1-9); smaller uses less memory per connection
+        level: zlib compression level (0-9); lower is cheaper on CPU
+        min_size: Frames smaller than this many bytes are sent uncompressed
+    """
+    env_prefix = "WS_COMPRESSION"
+    env_switch = "enabled"
+
+    enabled: bool = True
+    window_bits: int = 12
+    mem_level: int = 5
+    level: int = 6
+    min_size: int = 512
+
+    def extensions(self) -> List[ServerPerMessageDeflateFactory]:
+        """Extension factories to offer during the handshake."""
+        if not self.enabled:
+            return []
+        return [ThresholdPerMessageDeflateFactory(
+            min_size=self.min_size,
+            server_max_window_bits=self.window_bits,
+            compress_settings={"memLevel": self.mem_level, "level": self.level},
+        )]
+
+    def serve_kwargs(self) -> Dict[str, Any]:
+        """Keyword arguments for ``websockets.serve``."""
+        return {"compression": None, "extensions": self.extensions()}
+
+
+class ThresholdPerMessageDeflate(PerMessageDeflate):
+    """permessage-deflate that leaves small single-frame messages uncompressed."""
+
+    def __init__(self, *args, min_size: int = 0, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.min_size = min_size
+
+    def encode(self, frame: Frame) -> Frame:
+        # RFC 7692 compression is per message (RSV1 on the first frame), so a
+        # complete message can be sent as-is without touching the compressor
+        if (frame.fin and frame.opcode not in CTRL_OPCODES and frame.opcode is not Opcode.CONT
+                and len(frame.data) < self.min_size):
+            return frame
+        return super().encode(frame)
+
+
+class ThresholdPerMessageDeflateFactory(ServerPerMessageDeflateFactory):
+    """Server extension factory producing ThresholdPerMessageDeflate instances."""
+
+    def __init__(self, min_size: int = 0, **kwargs):
+        super().__init__(**kwargs)
+        self.min_size = min_size
+
+    def process_request_params(self, params, accepted_extensions):
+        response_params, extension = super().process_request_params(params, accepted_extensions)
+        return response_params, ThresholdPerMessageDeflate(
+            extension.remote_no_context_takeover,
+            extension.local_no_context_takeover,
+            extension.remote_max_window_bits,
+            extension.local_max_window_bits,
+            extension.compress_settings,
+            min_size=self.min_size,
+        )
+
+
+def uvicorn_ws_protocol(settings: CompressionSettings):
+    """
+    Build a uvicorn WebSocket protocol class applying the given settings.
+
+    uvicorn only exposes an on/off switch for permessage-deflate, so the
+    returned class replaces the extensions it offers. Pass it as
+    ``uvicorn.run(app, ws=...)``.
+    """
+    from uvicorn.protocols.websockets.websockets_impl import WebSocketProtocol
+
+    class CompressedWebSocketProtocol(WebSocketProtocol):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.available_extensions = settings.extensions()
+
+    return CompressedWebSocketProtocol
@@ -0,0 +1,140 @@
+"""
+Compact per-connection state for the WebSocket servers.
+
+Everything a server tracks about an open connection lives in one
+``Connection`` record: its socket, chat session, message counters,
+timestamps and heartbeat timer. Records use ``__slots__``, so at 100k idle
+connections the server holds one small fixed-size object per connection
+rather than an entry in a parallel dict per attribute.
+
+``ConnectionTable`` keys the records by client ID. Its ``view()`` mappings
+(``active_connections``, ``chat_sessions``) read and write one field of
+every record, so code written against per-attribute dicts keeps working.
+"""
+import time
+from collections.abc import MutableMapping
+from typing import Any, Dict, Iterator, Optional
+
+# Fields a table hands out as mappings; a record lives while any is set
+VIEW_FIELDS = ("websocket", "session")
+
+
+class Connection:
+    """
+    State of one client connection.
+
+    Attributes:
+        client_id: Client the connection belongs to
+        websocket: The connection's socket
+        session: Its chat session
+        connected_at: time.time() at connect
+        last_seen: time.monotonic() of the last frame received
+        last_active: time.monotonic() of the last application message
+        pinged_at: time.monotonic() of an unanswered heartbeat ping, else None
+        timer: Pending heartbeat timer, if monitored
+        messages_in: Messages received
+        messages_out: Messages sent
+    """
+    __slots__ = ("client_id", "websocket", "session", "connected_at", "last_seen", "last_active",
+                 "pinged_at", "timer", "messages_in", "messages_out")
+
+    def __init__(self, client_id: str, websocket: Any = None):
+        self.client_id = client_id
+        self.websocket = websocket
+        self.session = None
+        self.connected_at = time.time()
+        self.last_seen = self.last_active = time.monotonic()
+        self.pinged_at: Optional[float] = None
+        self.timer = None
+        self.messages_in = 0
+        self.messages_out = 0
+
+    async def send(self, frame: str):
+        """Send a frame on a websockets connection, counting it."""
+        self.messages_out += 1
+        await self.websocket.send(frame)
+
+
+class FieldView(MutableMapping):
+    """Mapping of client ID to one field of each record that has it set."""
+
+    def __init__(self, table: "ConnectionTable", field: str):
+        self.table = table
+        self.field = field
+        # Kept up to date on every change, so len() is O(1) at any scale
+        self.count = 0
+
+    def __getitem__(self, client_id: str) -> Any:
+        value = getattr(self.table.records[client_id], self.field)
+        if value is None:
+            raise KeyError(client_id)
+        return value
+
+    def __setitem__(self, client_id: str, value: Any):
+        record = self.table.records.get(client_id)
+        if record is None:
+            record = self.table.records[client_id] = Connection(client_id)
+        if getattr(record, self.field) is None:
+            self.count += value is not None
+        elif value is None:
+            self.count -= 1
+        setattr(record, self.field, value)
+        if value is None:
+            self.table._discard_if_empty(record)
+
+    def __delitem__(self, client_id: str):
+        record = self.table.records.get(client_id)
+        if record is None or getattr(record, self.field) is None:
+            raise KeyError(client_id)
+        self[client_id] = None
+
+    def __contains__(self, client_id) -> bool:
+        record = self.table.records.get(client_id)
+        return record is not None and getattr(record, self.field) is not None
+
+    def __iter__(self) -> Iterator[str]:
+        field = self.field
+        return (client_id for client_id, record in list(self.table.records.items())
+                if getattr(record, field) is not None)
+
+    def __len__(self) -> int:
+        return self.count
+
+
+class ConnectionTable:
+    """
+    Connection records keyed by client ID.
+
+    Use ``view("websocket")`` and ``view("session")`` as the server's
+    active connection and chat session mappings; ``get()`` returns the whole
+    record.
+    """
+
+    def __init__(self):
+        self.records: Dict[str, Connection] = {}
+        self._views = {field: FieldView(self, field) for field in VIEW_FIELDS}
+
+    def view(self, field: str) -> FieldView:
+        return self._views[field]
+
+    def open(self, client_id: str, websocket: Any) -> Connection:
+        """Start a fresh record for a new connection, replacing any earlier one for the client."""
+        old = self.records.get(client_id)
+        if old is not None:
+            for field, view in self._views.items():
+                view.count -= getattr(old, field) is not None
+        record = self.records[client_id] = Connection(client_id, websocket)
+        self._views["websocket"].count += websocket is not None
+        return record
+
+    def get(self, client_id: str) -> Optional[Connection]:
+        return self.records.get(client_id)
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def _discard_if_empty(self, record: Connection):
+        # Once neither the socket nor the session is held, the record is done
+        if all(getattr(record, field) is None for field in VIEW_FIELDS):
+            if self.records.get(record.client_id) is record:
+                del self.records[record.client_id]
@@ -4,6 +4,7 @@ import logging
 import datetime
 from dotenv import load_dotenv
 import google.generativeai as genai
+from tracing import new_request_id
 
 # Configure logging
 logging.basicConfig(
@@ -84,7 +85,7 @@ def main():
             continue
         
         # Generate a unique request ID
-        request_id = f"req_{int(time.time())}"
+        request_id = new_request_id()
         
         try:
             # Get response from Gemini
@@ -0,0 +1,213 @@
+"""
+Graceful drain for zero-downtime deploys.
+
+On SIGTERM or an admin request a server enters drain mode:
+
+1. New connections are refused (503 with Retry-After on the handshake), and
+   new requests on open connections are answered with a ``reconnect`` frame.
+2. In-flight requests get until the drain deadline to finish.
+3. Flush hooks run, e.g. closing the outbound HTTP pool.
+4. Every client still connected is sent ``{"type": "reconnect"}`` and its
+   connection is closed with 1012 (service restart), so it can reconnect
+   to another instance.
+5. The server stops.
+
+Environment variables:
+    DRAIN_DEADLINE: Seconds in-flight requests get to finish (default 30)
+    DRAIN_TOKEN: Token the admin endpoint requires in an X-Admin-Token header;
+        the endpoint is disabled when unset
+"""
+import os
+import hmac
+import time
+import signal
+import asyncio
+import inspect
+import logging
+from functools import wraps
+from http import HTTPStatus
+from typing import Callable, Iterable, List, Optional
+
+from metrics import Gauge
+from protocol import encode
+
+logger = logging.getLogger(__name__)
+
+DRAINING = Gauge("server_draining", "1 while the server is draining, else 0")
+
+ADMIN_PATH = "/admin/drain"
+# WebSocket close code for "service restart": the client should reconnect
+CLOSE_SERVICE_RESTART = 1012
+
+
+def reconnect_frame(request_id: Optional[str] = None) -> str:
+    """Build the frame telling a client to reconnect to another instance."""
+    frame = {"type": "reconnect", "reason": "server draining"}
+    if request_id:
+        frame["request_id"] = request_id
+    return encode(frame)
+
+
+class Drain:
+    """
+    Drain state and procedure for one server.
+
+    Args:
+        inflight: Returns the number of requests still being processed
+        connections: Returns the open WebSocket connections
+        deadline: Seconds in-flight requests get to finish
+        token: Token required by the admin endpoint; None disables it
+    """
+
+    def __init__(self, inflight: Callable[[], int], connections: Callable[[], Iterable] = lambda: (),
+                 deadline: float = 30.0, token: Optional[str] = None):
+        self.inflight = inflight
+        self.connections = connections
+        self.deadline = deadline
+        self.token = token
+        self.draining = False
+        self.stopped = asyncio.Event()
+        self.flush_hooks: List[Callable] = []
+        self._task: Optional[asyncio.Task] = None
+        DRAINING.set(0)
+
+    @classmethod
+    def from_env(cls, inflight: Callable[[], int], connections: Callable[[], Iterable] = lambda: (),
+                 **defaults):
+        settings = dict(defaults)
+        if os.getenv("DRAIN_DEADLINE"):
+            settings["deadline"] = float(os.getenv("DRAIN_DEADLINE"))
+        if os.getenv("DRAIN_TOKEN"):
+            settings["token"] = os.getenv("DRAIN_TOKEN")
+        return cls(inflight, connections, **settings)
+
+    def on_flush(self, hook: Callable) -> Callable:
+        """Register a (sync or async) callable to run once in-flight work is done."""
+        self.flush_hooks.append(hook)
+        return hook
+
+    def authorized(self, token: Optional[str]) -> bool:
+        """Whether an admin request carrying token may start a drain."""
+        return bool(self.token) and token is not None and hmac.compare_digest(token, self.token)
+
+    def begin(self) -> bool:
+        """Enter drain mode; returns False if the server was already draining."""
+        if self.draining:
+            return False
+        self.draining = True
+        DRAINING.set(1)
+        logger.info("Draining: %d request(s) in flight, deadline %.0fs", self.inflight(), self.deadline)
+        return True
+
+    def start(self) -> bool:
+        """Start draining in the background on the running loop (e.g. from a signal handler)."""
+        if not self.begin():
+            return False
+        self._task = asyncio.get_running_loop().create_task(self.drain())
+        return True
+
+    async def drain(self):
+        """Run the whole drain procedure and set ``stopped`` when it is done."""
+        self.begin()
+        try:
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + self.deadline
+            while self.inflight() and loop.time() < deadline:
+                await asyncio.sleep(0.05)
+            self._report_leftover()
+            for hook in self.flush_hooks:
+                try:
+                    result = hook()
+                    if inspect.isawaitable(result):
+                        await result
+                except Exception:
+                    logger.exception("Drain flush hook failed")
+            connections = list(self.connections())
+            await asyncio.gather(*(self._goodbye(ws) for ws in connections), return_exceptions=True)
+            logger.info("Drain complete; told %d client(s) to reconnect", len(connections))
+        finally:
+            self.stopped.set()
+
+    def drain_sync(self):
+        """Drain a threaded server from a non-async thread: wait for in-flight work, then flush."""
+        self.begin()
+        deadline = time.monotonic() + self.deadline
+        while self.inflight() and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self._report_leftover()
+        for hook in self.flush_hooks:
+            try:
+                hook()
+            except Exception:
+                logger.exception("Drain flush hook failed")
+        logger.info("Drain complete")
+
+    def _report_leftover(self):
+        leftover = self.inflight()
+        if leftover:
+            logger.warning("Drain deadline passed with %d request(s) still in flight", leftover)
+
+    async def _goodbye(self, websocket):
+        # websockets connections have send(); Starlette WebSockets have send_text()
+        send = getattr(websocket, "send_text", None) or websocket.send
+        await send(reconnect_frame())
+        await websocket.close(CLOSE_SERVICE_RESTART, "server draining")
+
+    def handle_signals(self):
+        """Start draining on SIGTERM (websockets servers; call from the running loop)."""
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, self.start)
+
+    def guard(self, handler: Callable):
+        """
+        Wrap a dispatcher handler ``(message, client_id, send)`` so requests
+        arriving during a drain get a reconnect frame instead of running.
+        """
+        @wraps(handler)
+        async def guarded(message, client_id: str, send):
+            if self.draining:
+                await send(reconnect_frame(getattr(message, "request_id", None)))
+                return
+            return await handler(message, client_id, send)
+        return guarded
+
+    def admin_response(self, token: Optional[str], start: Optional[Callable[[], bool]] = None):
+        """
+        Handle an admin drain request; returns ``(status, body)``.
+
+        The endpoint is hidden (404) unless a token is configured.
+
+        Args:
+            token: Token sent with the request
+            start: Starts the drain and returns False if already draining
+                (default: start())
+        """
+        if not self.token:
+            return HTTPStatus.NOT_FOUND, "Not found\n"
+        if not self.authorized(token):
+            return HTTPStatus.FORBIDDEN, "Forbidden\n"
+        if not (start or self.start)():
+            return HTTPStatus.ACCEPTED, "Already draining\n"
+        return HTTPStatus.ACCEPTED, "Draining\n"
+
+    def gate(self, process_request=None):
+        """
+        Build a ``process_request`` hook for ``websockets.serve`` that serves
+        the admin endpoint (GET /admin/drain) and refuses handshakes with 503
+        while draining.
+
+        Args:
+            process_request: Hook to run first, e.g. the /metrics handler
+        """
+        async def gate(path, request_headers):
+            if path == ADMIN_PATH:
+                status, body = self.admin_response(request_headers.get("X-Admin-Token"))
+                return status, [("Content-Type", "text/plain")], body.encode()
+            if process_request is not None:
+                response = await process_request(path, request_headers)
+                if response is not None:
+                    return response
+            if self.draining:
+                return (HTTPStatus.SERVICE_UNAVAILABLE, [("Retry-After", "1")],
+                        b"Server draining, connect to another instance\n")
+            return None
+        return gate
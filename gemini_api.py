@@ -94,4 +94,34 @@ class GeminiAPI:
         Returns:
             Chat session object
         """
-        return self.text_model.start_chat(history=[]) 
\ No newline at end of file
+        return self.text_model.start_chat(history=[])
+
+    def export_history(self, chat_session):
+        """
+        Export a chat session's history as plain text, e.g. to store it compactly.
+        
+        Args:
+            chat_session: Session from chat_session() or restore_session()
+            
+        Returns:
+            List of (role, [text of each part]) turns, or None if the history
+            holds anything other than text
+        """
+        turns = []
+        for content in chat_session.history:
+            if not all("text" in part for part in content.parts):
+                return None
+            turns.append((content.role, [part.text for part in content.parts]))
+        return turns
+
+    def restore_session(self, turns):
+        """
+        Create a chat session that continues an exported history.
+        
+        Args:
+            turns: History from export_history()
+            
+        Returns:
+            Chat session object
+        """
+        return self.text_model.start_chat(history=[{"role": role, "parts": parts} for role, parts in turns]) 
\ No newline at end of file
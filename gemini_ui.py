@@ -5,6 +5,7 @@ import datetime
 import streamlit as st
 from dotenv import load_dotenv
 import google.generativeai as genai
+from tracing import new_request_id
 
 # Configure logging
 logging.basicConfig(
@@ -54,7 +55,7 @@ with col1:
     if st.button("Submit to Gemini"):
         if user_prompt:
             # Log the request
-            request_id = f"req_{int(time.time())}"
+            request_id = new_request_id()
             log_message = f"REQUEST [{request_id}]: {user_prompt}"
             logger.info(log_message)
             
@@ -0,0 +1,565 @@
+"""
+Client SDK for the Gemini WebSocket servers.
+
+``GeminiWSClient`` keeps a small pool of long-lived WebSockets to a
+server. Prompts are pipelined: each is sent as soon as it is made, tagged
+with a ``request_id``, without waiting for earlier answers. One reader
+task per connection routes every frame to its request, answers the
+server's heartbeat pings, and reopens the connection in the background
+when it drops. The delays between attempts grow exponentially, with full
+jitter, so many clients don't reconnect in lockstep after a restart.
+WebSocket pings keep idle connections open through proxies and detect
+dead ones.
+
+A ``Response`` can be awaited for the whole answer or iterated with
+``async for`` to receive its text as it arrives::
+
+    async with GeminiWSClient(settings=ClientSettings(pool_size=4)) as client:
+        print(await client.ask("Hello"))
+        async for text in await client.send("Tell me a story", key="story", stream=True):
+            print(text, end="")
+
+Every pooled connection has its own chat session on the server (client
+ID ``<client_id>-<n>``). Prompts with the same ``key`` always use the same
+connection, so they continue one conversation. Prompts without a key go
+to the least busy connection. Servers answer a connection's prompts in
+order, so replies without a ``request_id`` go to the oldest pending
+request. A reconnect starts a new chat session on the server.
+
+Requests still pending when a connection drops are resumed once it is
+reopened: the server replays the rest of each answer from its replay
+buffer, after the last chunk received (see replay.py), without calling
+Gemini again. A request the server can't resume fails with
+``ConnectionLost`` and may be sent again.
+
+``SyncGeminiWSClient`` runs a client on its own event loop in a daemon
+thread, for callers that aren't async, such as a Streamlit script: keep
+one per browser session (in ``st.session_state``) so every rerun reuses
+the same connections and conversations.
+
+Environment variables:
+    GEMINI_WS_URL: Server URL; the client ID is appended as the path (default ws://127.0.0.1:8765)
+    GEMINI_WS_POOL_SIZE: Connections per client (default 1)
+    GEMINI_WS_INITIAL_DELAY: Seconds before the first reconnect attempt (default 0.5)
+    GEMINI_WS_MAX_DELAY: Longest wait between reconnect attempts (default 30)
+    GEMINI_WS_CONNECT_TIMEOUT: Seconds a connection attempt may take (default 10)
+    GEMINI_WS_KEEPALIVE: Seconds between keep-alive pings on a connection (default 20, 0 disables)
+    GEMINI_WS_RESUME: Set to 0 to fail pending requests on a dropped connection instead of resuming them
+"""
+import os
+import json
+import uuid
+import random
+import asyncio
+import logging
+import threading
+import weakref
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+import websockets
+from websockets.exceptions import ConnectionClosed
+
+from settings import EnvSettings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_URL = "ws://127.0.0.1:8765"
+
+# Frames that end a request
+FINAL_FRAMES = ("response", "done", "error", "busy", "reconnect", "resume_failed")
+
+# Ends a response's queue of text pieces
+_END = object()
+
+
+class ChatError(Exception):
+    """The server answered a prompt with an error frame."""
+
+
+class ServerBusy(ChatError):
+    """The server refused a prompt (busy or draining); it may be sent again after ``retry_after`` seconds."""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class ConnectionLost(ConnectionError):
+    """The connection dropped before the answer arrived; the prompt may be sent again."""
+
+
+@dataclass
+class ClientSettings(EnvSettings):
+    """
+    Client settings.
+
+    Attributes:
+        pool_size: Connections per client
+        initial_delay: Seconds before the first reconnect attempt
+        max_delay: Longest wait between attempts
+        multiplier: Growth of the delay after each failed attempt
+        connect_timeout: Seconds a connection attempt may take
+        keepalive: Seconds between keep-alive pings; a connection is dropped if a ping
+            goes unanswered for as long (0 disables)
+        resume: Resume pending requests after a reconnect rather than failing them
+    """
+    env_prefix = "GEMINI_WS"
+
+    pool_size: int = 1
+    initial_delay: float = 0.5
+    max_delay: float = 30.0
+    multiplier: float = 2.0
+    connect_timeout: float = 10.0
+    keepalive: float = 20.0
+    resume: bool = True
+
+    def delays(self) -> Iterator[float]:
+        """Jittered delays for successive attempts: uniform up to the exponential bound."""
+        bound = self.initial_delay
+        while True:
+            yield random.uniform(0, bound)
+            bound = min(self.max_delay, bound * self.multiplier)
+
+
+class Response:
+    """
+    The answer to one prompt.
+
+    Await it for the whole answer, or iterate it with ``async for`` for the
+    answer's text as it arrives (chunk frames, or the single response frame).
+    ``status`` holds the latest status frame's content.
+    """
+
+    def __init__(self, request_id: str):
+        self.request_id = request_id
+        self.status: Optional[str] = None
+        # Highest chunk seq received, sent when resuming after a reconnect
+        self.last_seq = -1
+        self.resuming = False
+        self._parts: List[str] = []
+        self._pieces: asyncio.Queue = asyncio.Queue()
+        self._result = asyncio.get_running_loop().create_future()
+
+    @property
+    def done(self) -> bool:
+        return self._result.done()
+
+    def feed(self, frame: Dict[str, Any]) -> bool:
+        """Take one frame for this request; returns whether it ended the request."""
+        kind = frame.get("type")
+        if kind == "status":
+            self.status = frame.get("content")
+        elif kind == "chunk" and frame.get("seq", self.last_seq + 1) <= self.last_seq:
+            # Already received before the connection dropped
+            return False
+        elif kind in ("chunk", "response"):
+            self.last_seq = frame.get("seq", self.last_seq)
+            self._parts.append(frame.get("content", ""))
+            self._pieces.put_nowait(frame.get("content", ""))
+        if kind not in FINAL_FRAMES:
+            return False
+        if kind in ("response", "done"):
+            self._finish(result="".join(self._parts))
+        elif kind == "error":
+            self._finish(error=ChatError(frame.get("content") or kind))
+        elif kind == "resume_failed":
+            self._finish(error=ConnectionLost(f"connection lost and the answer could not be resumed: "
+                                              f"{frame.get('content') or kind}"))
+        else:
+            self._finish(error=ServerBusy(frame.get("reason") or kind, frame.get("retry_after")))
+        return True
+
+    def fail(self, error: BaseException):
+        """End the request with an error, e.g. when its connection drops."""
+        self._finish(error=error)
+
+    def _finish(self, result: Optional[str] = None, error: Optional[BaseException] = None):
+        if self._result.done():
+            # Abandoned by a caller that timed out or was cancelled
+            return
+        if error is not None:
+            self._result.set_exception(error)
+        else:
+            self._result.set_result(result)
+        self._pieces.put_nowait(_END)
+
+    def __await__(self):
+        return asyncio.shield(self._result).__await__()
+
+    def __aiter__(self) -> AsyncIterator[str]:
+        return self._iterate()
+
+    async def _iterate(self) -> AsyncIterator[str]:
+        while True:
+            piece = await self._pieces.get()
+            if piece is _END:
+                break
+            yield piece
+        # Raise the request's error, if it failed
+        await self
+
+    def cancel(self):
+        """Stop waiting for the answer; frames that still arrive for it are dropped."""
+        if not self._result.done():
+            self._result.cancel()
+            self._pieces.put_nowait(_END)
+
+
+class ChatConnection:
+    """
+    One persistent, self-healing connection to a Gemini WebSocket server.
+
+    Args:
+        url: Server URL, without the client ID
+        client_id: Client ID sent as the connection path
+        settings: Reconnect and keep-alive settings
+    """
+
+    def __init__(self, url: str, client_id: str, settings: Optional[ClientSettings] = None):
+        self.url = f"{url.rstrip('/')}/{client_id}"
+        self.client_id = client_id
+        self.settings = settings or ClientSettings()
+        self.websocket = None
+        self.connected = asyncio.Event()
+        self.connects = 0
+        self.last_error: Optional[str] = None
+        # Requests sent on the current connection and not yet answered, oldest first
+        self.pending: "OrderedDict[str, Response]" = OrderedDict()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def state(self) -> str:
+        if self._task is None or self._task.done():
+            return "closed"
+        return "connected" if self.connected.is_set() else "connecting"
+
+    def start(self):
+        """Connect, and keep reconnecting, in a background task."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        """Close the connection and stop reconnecting; pending requests fail."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        self.connected.clear()
+        self._fail_pending(ConnectionLost("connection closed"))
+
+    async def _run(self):
+        keepalive = self.settings.keepalive or None
+        delays = None
+        while True:
+            try:
+                async with websockets.connect(self.url, open_timeout=self.settings.connect_timeout,
+                                              ping_interval=keepalive, ping_timeout=keepalive) as websocket:
+                    self.websocket = websocket
+                    delays = None
+                    await self._read(websocket)
+            except asyncio.CancelledError:
+                raise
+            except (OSError, ConnectionClosed, asyncio.TimeoutError, websockets.exceptions.WebSocketException) as e:
+                self.last_error = str(e) or type(e).__name__
+            finally:
+                self.websocket = None
+                self.connected.clear()
+                self._drop_pending()
+            delays = delays or self.settings.delays()
+            delay = next(delays)
+            logger.info("Connection to %s lost (%s), reconnecting in %.1fs", self.url, self.last_error, delay)
+            await asyncio.sleep(delay)
+
+    async def _read(self, websocket):
+        """Receive every frame on the connection until it closes."""
+        async for raw in websocket:
+            try:
+                frame = json.loads(raw)
+            except ValueError:
+                frame = None
+            if not isinstance(frame, dict):
+                logger.warning("Skipping malformed frame from %s: %.100r", self.url, raw)
+                continue
+            kind = frame.get("type")
+            if kind == "ping":
+                await websocket.send(json.dumps({"type": "pong"}))
+            elif kind == "connected":
+                self.connects += 1
+                await self._resume_pending(websocket)
+                self.connected.set()
+            elif kind != "pong":
+                self._route(frame)
+        self.last_error = "closed by server"
+
+    def _route(self, frame: Dict[str, Any]):
+        """Hand a frame to its request: by request_id, or else the oldest pending one."""
+        request_id = frame.get("request_id")
+        if request_id is None and self.pending:
+            request_id = next(iter(self.pending))
+            if self.pending[request_id].resuming and frame.get("type") == "error":
+                # A server without replay buffers refusing the resume frame
+                frame = dict(frame, type="resume_failed")
+        response = self.pending.get(request_id)
+        if response is None:
+            logger.debug("Dropping %s frame for no pending request", frame.get("type"))
+            return
+        if response.feed(frame):
+            del self.pending[request_id]
+
+    def _drop_pending(self):
+        """After a disconnect, keep the requests to resume, or fail them all."""
+        if not self.settings.resume:
+            self._fail_pending(ConnectionLost(f"connection lost before the answer: {self.last_error}"))
+            return
+        for request_id, response in list(self.pending.items()):
+            if response.done:
+                # Abandoned by its caller; nothing to resume
+                del self.pending[request_id]
+            else:
+                response.resuming = True
+
+    async def _resume_pending(self, websocket):
+        """Ask a reopened connection for the rest of every pending answer."""
+        for response in list(self.pending.values()):
+            await websocket.send(json.dumps({"type": "resume", "request_id": response.request_id,
+                                             "last_seq": response.last_seq}))
+        if self.pending:
+            logger.info("Resuming %d answer(s) on %s", len(self.pending), self.url)
+
+    def _fail_pending(self, error: BaseException):
+        pending, self.pending = self.pending, OrderedDict()
+        for response in pending.values():
+            response.fail(error)
+
+    async def send(self, prompt: str, stream: bool = False) -> Response:
+        """
+        Send a prompt without waiting for earlier prompts' answers.
+
+        Waits for the connection if it is (re)connecting.
+
+        Args:
+            prompt: User message
+            stream: Have the server send the answer in chunks as it is generated
+
+        Returns:
+            The prompt's Response
+
+        Raises:
+            ConnectionLost: If the connection dropped while sending
+        """
+        await self.connected.wait()
+        request_id = uuid.uuid4().hex
+        response = Response(request_id)
+        # Registered before sending, so an answer can't arrive first
+        self.pending[request_id] = response
+        frame = {"type": "message", "content": prompt, "request_id": request_id}
+        if stream:
+            frame["stream"] = True
+        try:
+            await self.websocket.send(json.dumps(frame))
+        except (AttributeError, ConnectionClosed) as e:
+            self.pending.pop(request_id, None)
+            raise ConnectionLost(f"connection lost while sending: {e}") from e
+        return response
+
+    async def ask(self, prompt: str, timeout: Optional[float] = None) -> str:
+        """
+        Send a prompt and wait for the answer.
+
+        Args:
+            prompt: User message
+            timeout: Seconds to wait for the connection and the answer
+
+        Returns:
+            The answer text
+
+        Raises:
+            ChatError: If the server answered with an error
+            ConnectionLost: If the connection dropped before the answer
+            asyncio.TimeoutError: If the timeout passed first
+        """
+        return await _answer(self.send(prompt), timeout)
+
+
+async def _answer(sending, timeout: Optional[float]) -> str:
+    """Await a send() and its answer within one timeout, abandoning the answer if it passes."""
+    response = None
+
+    async def answer():
+        nonlocal response
+        response = await sending
+        return await response
+
+    try:
+        return await asyncio.wait_for(answer(), timeout)
+    except (asyncio.TimeoutError, asyncio.CancelledError):
+        if response is not None:
+            response.cancel()
+        raise
+
+
+class GeminiWSClient:
+    """
+    A pool of persistent connections to a Gemini WebSocket server.
+
+    Args:
+        url: Server URL, without the client ID (default GEMINI_WS_URL)
+        client_id: Client ID; pooled connections use ``<client_id>-<n>`` (default: random)
+        settings: Pool, reconnect and keep-alive settings (default: from the environment)
+    """
+
+    def __init__(self, url: Optional[str] = None, client_id: Optional[str] = None,
+                 settings: Optional[ClientSettings] = None):
+        self.url = url or os.getenv("GEMINI_WS_URL", DEFAULT_URL)
+        self.client_id = client_id or uuid.uuid4().hex
+        self.settings = settings or ClientSettings.from_env()
+        size = max(1, self.settings.pool_size)
+        client_ids = [self.client_id] if size == 1 else [f"{self.client_id}-{n}" for n in range(size)]
+        self.connections = [ChatConnection(self.url, client_id, self.settings) for client_id in client_ids]
+
+    async def __aenter__(self):
+        self.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    def start(self):
+        """Open every connection in the background."""
+        for connection in self.connections:
+            connection.start()
+
+    async def close(self):
+        """Close every connection."""
+        await asyncio.gather(*(connection.close() for connection in self.connections))
+
+    @property
+    def state(self) -> str:
+        """"connected" while any connection is, else "connecting" or "closed"."""
+        states = {connection.state for connection in self.connections}
+        for state in ("connected", "connecting"):
+            if state in states:
+                return state
+        return "closed"
+
+    def status(self) -> Dict[str, Any]:
+        errors = [connection.last_error for connection in self.connections if connection.last_error]
+        return {
+            "state": self.state,
+            "connections": sum(connection.connected.is_set() for connection in self.connections),
+            "pending": sum(len(connection.pending) for connection in self.connections),
+            "connects": sum(connection.connects for connection in self.connections),
+            "last_error": errors[-1] if errors else None,
+        }
+
+    def connection(self, key: Optional[str] = None) -> ChatConnection:
+        """The connection for a conversation key, or the least busy connected one."""
+        if key is not None:
+            return self.connections[hash(key) % len(self.connections)]
+        return min(self.connections, key=lambda c: (not c.connected.is_set(), len(c.pending)))
+
+    async def send(self, prompt: str, key: Optional[str] = None, stream: bool = False) -> Response:
+        """
+        Send a prompt; await or iterate the returned Response for the answer.
+
+        Args:
+            prompt: User message
+            key: Conversation key; prompts with the same key share a chat session
+            stream: Have the server send the answer in chunks as it is generated
+        """
+        return await self.connection(key).send(prompt, stream)
+
+    async def ask(self, prompt: str, key: Optional[str] = None, timeout: Optional[float] = None) -> str:
+        """Send a prompt and wait for the answer; raises as ChatConnection.ask does."""
+        return await _answer(self.send(prompt, key), timeout)
+
+
+class SyncGeminiWSClient:
+    """
+    A GeminiWSClient run on a background thread, for non-async callers.
+
+    The thread and connections stop when this object is closed or garbage
+    collected, e.g. when Streamlit drops an ended browser session's state.
+
+    Args:
+        url: Server URL, without the client ID (default GEMINI_WS_URL)
+        client_id: Client ID sent as the connection path
+        settings: Pool, reconnect and keep-alive settings
+    """
+
+    def __init__(self, url: Optional[str] = None, client_id: Optional[str] = None,
+                 settings: Optional[ClientSettings] = None):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self._serve, args=(self.loop,),
+                                       name=f"ws-client-{client_id}", daemon=True)
+        self.thread.start()
+        # The client's queues and futures belong to the background loop
+        self.client = self._call(self._create(url, client_id, settings))
+        self._finalizer = weakref.finalize(self, _stop, self.loop, self.client)
+
+    @staticmethod
+    def _serve(loop):
+        asyncio.set_event_loop(loop)
+        loop.run_forever()
+        loop.close()
+
+    @staticmethod
+    async def _create(url, client_id, settings) -> GeminiWSClient:
+        client = GeminiWSClient(url, client_id, settings)
+        client.start()
+        return client
+
+    def _call(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    @property
+    def state(self) -> str:
+        """"connecting", "connected" or "closed"."""
+        return self.client.state
+
+    def status(self) -> Dict[str, Any]:
+        return self.client.status()
+
+    def ask(self, prompt: str, key: Optional[str] = None, timeout: Optional[float] = 120.0) -> str:
+        """Send a prompt and block until the answer; raises as ChatConnection.ask does."""
+        return self._call(self.client.ask(prompt, key, timeout))
+
+    def stream(self, prompt: str, key: Optional[str] = None, timeout: Optional[float] = 120.0) -> Iterator[str]:
+        """
+        Send a prompt and yield the answer's text as it arrives.
+
+        Args:
+            prompt: User message
+            key: Conversation key
+            timeout: Seconds to wait for each piece of the answer
+        """
+        response = self._call(asyncio.wait_for(self.client.send(prompt, key, stream=True), timeout))
+        pieces = response.__aiter__()
+        try:
+            while True:
+                try:
+                    yield self._call(asyncio.wait_for(pieces.__anext__(), timeout))
+                except StopAsyncIteration:
+                    return
+        finally:
+            self.loop.call_soon_threadsafe(response.cancel)
+
+    def close(self):
+        self._finalizer()
+
+
+def _stop(loop, client):
+    """Close a background client and stop its loop (safe from any thread)."""
+    if loop.is_closed():
+        return
+
+    async def stop():
+        await client.close()
+        loop.stop()
+
+    try:
+        asyncio.run_coroutine_threadsafe(stop(), loop)
+    except RuntimeError:
+        # Loop already shut down
+        pass
@@ -0,0 +1,312 @@
+"""
+Heartbeats and idle reaping driven by one shared timer wheel.
+
+Instead of a sleeping asyncio task per connection, every connection's
+heartbeat is a timer in a hierarchical timing wheel advanced by a single
+task. Scheduling and cancelling a timer is O(1), and each tick only
+touches the timers that are due, so heartbeat cost stays flat as the
+number of connections grows.
+
+On each heartbeat a connection that has been quiet for an interval is
+sent a ping. A connection that sent nothing back by its next heartbeat is
+treated as dead, and one with no application messages for the idle TTL
+is reaped; both are closed and their chat sessions freed.
+
+Environment variables:
+    HEARTBEAT_INTERVAL: Seconds between heartbeats per connection (default 30)
+    IDLE_TIMEOUT: Seconds without application messages before a connection is reaped (default 600)
+"""
+import os
+import time
+import random
+import asyncio
+import logging
+from typing import Callable, Dict, List, Optional, Set
+
+from connection import Connection
+from metrics import Counter, Gauge
+from protocol import encode
+
+logger = logging.getLogger(__name__)
+
+REAPED = Counter("connections_reaped_total", "Connections closed by the heartbeat monitor", ["reason"])
+TIMERS = Gauge("heartbeat_timers", "Timers pending in the heartbeat timer wheel")
+
+
+class Timer:
+    """Handle for a callback scheduled on a TimerWheel."""
+    __slots__ = ("deadline", "callback", "args", "cancelled", "_wheel")
+
+    def __init__(self, wheel: "TimerWheel", deadline: int, callback: Callable, args: tuple):
+        self._wheel = wheel
+        self.deadline = deadline
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        """Stop the callback from running; the slot entry is dropped lazily."""
+        if not self.cancelled:
+            self.cancelled = True
+            self._wheel.pending -= 1
+
+
+class TimerWheel:
+    """
+    Hierarchical timing wheel advanced by one asyncio task.
+
+    Level 0 has one slot per tick; each higher level has slots spanning a
+    full rotation of the level below, and its timers are cascaded down
+    when that rotation completes.
+
+    Args:
+        tick: Seconds per tick, i.e. timer resolution
+        slots: Slots per level
+        levels: Number of levels; the wheel spans tick * slots ** levels
+            seconds, and longer timers wait in the top level until due
+    """
+
+    def __init__(self, tick: float = 0.5, slots: int = 64, levels: int = 4):
+        self.tick = tick
+        self.slots = slots
+        self.levels = levels
+        self.pending = 0
+        self._wheels: List[List[List[Timer]]] = [[[] for _ in range(slots)] for _ in range(levels)]
+        self._ticks = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def schedule(self, delay: float, callback: Callable, *args) -> Timer:
+        """Run callback(*args) after roughly delay seconds (rounded up to a tick)."""
+        ticks = -int(-delay // self.tick)
+        if ticks < 1:
+            ticks = 1
+        timer = Timer(self, self._ticks + ticks, callback, args)
+        self._place(timer)
+        self.pending += 1
+        return timer
+
+    def _place(self, timer: Timer):
+        remaining = timer.deadline - self._ticks
+        span = self.slots
+        for level in range(self.levels):
+            if remaining < span or level == self.levels - 1:
+                slot = (timer.deadline // (span // self.slots)) % self.slots
+                self._wheels[level][slot].append(timer)
+                return
+            span *= self.slots
+
+    def advance(self):
+        """Move forward one tick and run the timers that are due."""
+        self._ticks += 1
+        # Cascade higher levels whose lower level just completed a rotation
+        divisor = 1
+        for level in range(1, self.levels):
+            divisor *= self.slots
+            if self._ticks % divisor:
+                break
+            slot = self._wheels[level][(self._ticks // divisor) % self.slots]
+            timers = slot[:]
+            slot.clear()
+            for timer in timers:
+                if not timer.cancelled:
+                    self._place(timer)
+
+        slot = self._wheels[0][self._ticks % self.slots]
+        due = slot[:]
+        slot.clear()
+        for timer in due:
+            if timer.cancelled:
+                continue
+            if timer.deadline > self._ticks:
+                # Longer than the wheel's span; not due on this rotation
+                self._place(timer)
+                continue
+            timer.cancelled = True
+            self.pending -= 1
+            try:
+                timer.callback(*timer.args)
+            except Exception:
+                logger.exception("Timer callback failed")
+
+    async def run(self):
+        """Advance the wheel in real time; catches up if the loop falls behind."""
+        loop = asyncio.get_running_loop()
+        next_tick = loop.time() + self.tick
+        while True:
+            await asyncio.sleep(max(0.0, next_tick - loop.time()))
+            while loop.time() >= next_tick:
+                self.advance()
+                next_tick += self.tick
+
+    def start(self):
+        """Start the driver task on the running loop if it is not running yet."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self.run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+
+class HeartbeatMonitor:
+    """
+    Pings quiet connections, and closes dead or idle ones.
+
+    Args:
+        wheel: Timer wheel that drives the heartbeats
+        interval: Seconds between heartbeats for a connection
+        idle_timeout: Seconds without application messages before reaping
+        on_reap: Called as on_reap(client_id, reason) when a connection is
+            reaped, e.g. to free its chat session
+    """
+
+    def __init__(self, wheel: TimerWheel, interval: float = 30.0, idle_timeout: float = 600.0,
+                 on_reap: Optional[Callable[[str, str], None]] = None):
+        self.wheel = wheel
+        self.interval = interval
+        self.idle_timeout = idle_timeout
+        self.on_reap = on_reap
+        self.connections: Dict[str, Connection] = {}
+        self._pings: List[Connection] = []
+        self._closes: List[tuple] = []
+        self._flush_scheduled = False
+        # Flush and close tasks, kept referenced until done
+        self._tasks: Set[asyncio.Task] = set()
+        TIMERS.set_function(lambda: self.wheel.pending)
+
+    @classmethod
+    def from_env(cls, wheel: TimerWheel, **defaults):
+        settings = dict(defaults)
+        if os.getenv("HEARTBEAT_INTERVAL"):
+            settings["interval"] = float(os.getenv("HEARTBEAT_INTERVAL"))
+        if os.getenv("IDLE_TIMEOUT"):
+            settings["idle_timeout"] = float(os.getenv("IDLE_TIMEOUT"))
+        return cls(wheel, **settings)
+
+    def register(self, client_id: str, websocket, conn: Optional[Connection] = None):
+        """
+        Start monitoring a connection.
+
+        Args:
+            client_id: Client the connection belongs to
+            websocket: Connection to ping and close
+            conn: The server's record for the connection, to keep the
+                heartbeat state in rather than a record of our own
+        """
+        self.unregister(client_id)
+        self.wheel.start()
+        if conn is None:
+            conn = Connection(client_id, websocket)
+        else:
+            conn.last_seen = conn.last_active = time.monotonic()
+            conn.pinged_at = None
+        self.connections[client_id] = conn
+        # Spread first heartbeats over an interval so ticks carry an even load
+        conn.timer = self.wheel.schedule(self.interval * (1 + random.random()), self._beat, conn)
+
+    def unregister(self, client_id: str):
+        """Stop monitoring a connection, e.g. once it has closed."""
+        conn = self.connections.pop(client_id, None)
+        if conn is not None and conn.timer is not None:
+            conn.timer.cancel()
+            conn.timer = None
+
+    def seen(self, client_id: str, active: bool = True):
+        """
+        Record a frame from a client.
+
+        Args:
+            client_id: Client the frame came from
+            active: False for heartbeat traffic (ping/pong), which proves the
+                peer is alive but does not keep an idle connection open
+        """
+        conn = self.connections.get(client_id)
+        if conn is not None:
+            conn.last_seen = time.monotonic()
+            conn.pinged_at = None
+            if active:
+                conn.last_active = conn.last_seen
+
+    def _beat(self, conn: Connection):
+        if self.connections.get(conn.client_id) is not conn:
+            return
+        now = time.monotonic()
+        if now - conn.last_active >= self.idle_timeout:
+            self._reap(conn, "idle")
+            return
+        if conn.pinged_at is not None:
+            # Nothing received for a whole interval after a ping
+            self._reap(conn, "dead")
+            return
+        quiet = now - conn.last_seen
+        # A reply to the last ping lands just under an interval before this beat;
+        # counting within a tick as due avoids an extra beat per ping
+        if quiet >= self.interval - self.wheel.tick:
+            self._pings.append(conn)
+            self._schedule_flush()
+            delay = self.interval
+        else:
+            # Recent traffic already proves the peer is alive
+            delay = self.interval - quiet
+        conn.timer = self.wheel.schedule(min(delay, self.idle_timeout - (now - conn.last_active)), self._beat, conn)
+
+    def _reap(self, conn: Connection, reason: str):
+        logger.info("Reaping %s connection for client %s", reason, conn.client_id)
+        REAPED.labels(reason=reason).inc()
+        self.unregister(conn.client_id)
+        if self.on_reap is not None:
+            self.on_reap(conn.client_id, reason)
+        self._closes.append((conn, reason))
+        self._schedule_flush()
+
+    def _schedule_flush(self):
+        # All pings and closes due in a tick share one task
+        if not self._flush_scheduled:
+            self._flush_scheduled = True
+            self._spawn(self._flush())
+
+    def _spawn(self, coro):
+        task = asyncio.get_running_loop().create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._task_done)
+
+    def _task_done(self, task: asyncio.Task):
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("Heartbeat task failed", exc_info=task.exception())
+
+    async def _flush(self):
+        self._flush_scheduled = False
+        pings, self._pings = self._pings, []
+        closes, self._closes = self._closes, []
+        if closes:
+            # A close waits for the peer's handshake, so closes run alongside the pings
+            self._spawn(self._close(closes))
+        if pings:
+            try:
+                await asyncio.wait_for(self._send_pings(pings), self.interval)
+            except asyncio.TimeoutError:
+                # A peer that stopped reading holds up the batch; the rest are pinged next beat
+                logger.warning("Timed out sending heartbeat pings")
+
+    async def _close(self, closes: List[tuple]):
+        results = await asyncio.gather(*(conn.websocket.close(1001 if reason == "idle" else 1011, f"{reason} timeout")
+                                         for conn, reason in closes), return_exceptions=True)
+        for (conn, reason), result in zip(closes, results):
+            if isinstance(result, Exception):
+                logger.warning("Failed to close %s connection for client %s: %s", reason, conn.client_id, result)
+
+    async def _send_pings(self, pings: List[Connection]):
+        # Sends to healthy peers complete without blocking, so one task
+        # sends the whole batch rather than a task per ping
+        ping = encode({"type": "ping"})
+        for conn in pings:
+            if self.connections.get(conn.client_id) is not conn:
+                continue
+            conn.pinged_at = time.monotonic()
+            try:
+                await conn.websocket.send(ping)
+            except Exception as e:
+                logger.warning("Failed to send ping to client %s: %s", conn.client_id, e)
+                self._reap(conn, "dead")
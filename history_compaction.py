@@ -0,0 +1,326 @@
+"""
+Compressed storage for idle chat histories.
+
+A chat session holds its whole history as SDK ``Content`` objects, with
+Python object and string overhead per turn, for as long as the client is
+connected, even when the conversation has gone quiet. A background sweep
+compacts sessions that have been idle for ``idle_seconds``: the history's
+text is serialised and zlib compressed into one bytes blob, and the
+session object is dropped. The client's next message expands the blob
+back into a fresh session, so the conversation continues where it left
+off.
+
+Long texts that recur across conversations, such as a system prompt
+pasted at the start of every chat, are interned: stored once per process
+and referenced from each blob by index.
+
+The same sweep drops the sessions of clients without an open connection,
+such as HTTP event-stream and API clients, once they have been idle for
+``expire_seconds``, so they don't pile up for the life of the process.
+Their next message starts a new conversation.
+
+Environment variables:
+    HISTORY_COMPACTION_IDLE_SECONDS: Seconds without a message before a history
+        is compacted (default 300, 0 disables compaction)
+    HISTORY_COMPACTION_EXPIRE_SECONDS: Seconds without a message before the session
+        of a client with no open connection is dropped (default 3600, 0 keeps them)
+    HISTORY_COMPACTION_INTERVAL: Seconds between sweeps for idle histories (default 30)
+    HISTORY_COMPACTION_LEVEL: zlib compression level, 1-9 (default 6)
+    HISTORY_COMPACTION_INTERN_MIN_CHARS: Shortest text that may be interned (default 200)
+    HISTORY_COMPACTION_MAX_INTERNED: Most texts interned per process (default 1024)
+"""
+import json
+import time
+import zlib
+import logging
+import threading
+from collections.abc import MutableMapping
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from connection import ConnectionTable
+from metrics import Counter, Gauge
+from settings import EnvSettings
+
+logger = logging.getLogger(__name__)
+
+COMPACTIONS = Counter("chat_history_compactions_total", "Idle chat histories compacted")
+EXPANSIONS = Counter("chat_history_expansions_total", "Compacted chat histories expanded for a new message")
+EXPIRED = Counter("chat_sessions_expired_total", "Idle chat sessions of clients without a connection dropped")
+COMPACTED = Gauge("chat_histories_compacted", "Chat histories currently held compacted")
+TEXT_BYTES = Gauge("chat_history_text_bytes", "UTF-8 bytes of text in the compacted chat histories")
+BLOB_BYTES = Gauge("chat_history_compacted_bytes", "Bytes of the compressed blobs holding compacted histories")
+INTERNED = Gauge("chat_history_interned_texts", "Texts interned across compacted chat histories")
+
+# Exported history: (role, [text of each part]) per turn
+Turns = List[Tuple[str, List[str]]]
+
+
+@dataclass
+class CompactionSettings(EnvSettings):
+    """
+    Idle history compaction settings.
+
+    Attributes:
+        idle_seconds: Seconds without a message before a history is compacted (0 disables)
+        expire_seconds: Seconds without a message before the session of a client
+            with no open connection is dropped (0 keeps them)
+        interval: Seconds between sweeps for idle histories
+        level: zlib compression level
+        intern_min_chars: Shortest text that may be interned
+        max_interned: Most texts interned per process
+    """
+    env_prefix = "HISTORY_COMPACTION"
+
+    idle_seconds: float = 300.0
+    expire_seconds: float = 3600.0
+    interval: float = 30.0
+    level: int = 6
+    intern_min_chars: int = 200
+    max_interned: int = 1024
+
+
+class CompactedHistory:
+    """A chat session's history held as one compressed blob."""
+    __slots__ = ("blob", "turns", "text_bytes")
+
+    def __init__(self, blob: bytes, turns: int, text_bytes: int):
+        self.blob = blob
+        self.turns = turns
+        self.text_bytes = text_bytes
+
+
+class InternTable:
+    """
+    Long texts shared by many histories, stored once.
+
+    A text is interned once it is seen in a second client's history, so
+    one-off messages never take a slot, even when one conversation is
+    compacted again after it was expanded.
+    """
+
+    def __init__(self, min_chars: int = 200, max_texts: int = 1024):
+        self.min_chars = min_chars
+        self.max_texts = max_texts
+        self.ids: Dict[str, int] = {}
+        self.texts: List[str] = []
+        # Hashes of long texts seen in one history, and whose; cleared when it grows past a bound
+        self._seen: Dict[int, Any] = {}
+
+    def ref(self, text: str, owner: Any = None) -> Optional[int]:
+        """
+        Index to store instead of the text, or None to store it inline.
+
+        Args:
+            text: Text from a history being compacted
+            owner: Client the history belongs to
+        """
+        if len(text) < self.min_chars:
+            return None
+        index = self.ids.get(text)
+        if index is not None or len(self.texts) >= self.max_texts:
+            return index
+        key = hash(text)
+        seen_by = self._seen.get(key, owner)
+        if seen_by == owner:
+            if len(self._seen) >= 8 * self.max_texts:
+                self._seen.clear()
+            self._seen[key] = owner
+            return None
+        del self._seen[key]
+        index = self.ids[text] = len(self.texts)
+        self.texts.append(text)
+        INTERNED.set(len(self.texts))
+        return index
+
+    def text(self, index: int) -> str:
+        return self.texts[index]
+
+
+class HistoryCompactor:
+    """
+    Compacts idle chat histories and expands them on the next message.
+
+    Args:
+        connections: The server's connection records; sessions are read
+            from and written to their ``session`` field
+        export: Returns a session's history as turns, or None if it cannot
+            be compacted (e.g. it holds images)
+        restore: Starts a session that continues from exported turns
+        settings: Idle threshold, sweep interval and compression settings
+    """
+
+    def __init__(self, connections: ConnectionTable, export: Callable[[Any], Optional[Turns]],
+                 restore: Callable[[Turns], Any], settings: Optional[CompactionSettings] = None):
+        self.connections = connections
+        self.export = export
+        self.restore = restore
+        self.settings = settings or CompactionSettings()
+        self.interned = InternTable(self.settings.intern_min_chars, self.settings.max_interned)
+        # Held while a session is swapped, so a sweep never races a client's message
+        self.lock = threading.Lock()
+        # Calls in progress per client; their sessions are neither compacted nor expired
+        self.busy: Dict[str, int] = {}
+        self.thread: Optional[threading.Thread] = None
+        self.stopped = threading.Event()
+
+    def compact(self, session: Any, owner: Any = None) -> Optional[CompactedHistory]:
+        """
+        Compress a session's history; None if it is empty or cannot be exported.
+
+        Args:
+            session: Chat session to compact
+            owner: Client the session belongs to, so only texts shared
+                between clients are interned
+        """
+        turns = self.export(session)
+        if not turns:
+            return None
+        text_bytes = 0
+        stored = []
+        for role, parts in turns:
+            stored_parts = []
+            for text in parts:
+                text_bytes += len(text.encode())
+                index = self.interned.ref(text, owner)
+                stored_parts.append(text if index is None else index)
+            stored.append([role, stored_parts])
+        blob = zlib.compress(json.dumps(stored, separators=(",", ":")).encode(), self.settings.level)
+        return CompactedHistory(blob, len(turns), text_bytes)
+
+    def expand(self, compacted: CompactedHistory) -> Any:
+        """Start a session that continues a compacted history."""
+        stored = json.loads(zlib.decompress(compacted.blob))
+        turns = [(role, [self.interned.text(part) if isinstance(part, int) else part for part in parts])
+                 for role, parts in stored]
+        return self.restore(turns)
+
+    def session(self, sessions: MutableMapping, client_id: str) -> Any:
+        """
+        The client's chat session for a new message, expanded first if it
+        was compacted.
+
+        Args:
+            sessions: The server's chat session mapping
+            client_id: Client sending the message
+
+        Raises:
+            KeyError: If the client has no session
+        """
+        with self.lock:
+            session = sessions[client_id]
+            if isinstance(session, CompactedHistory):
+                compacted = session
+                session = sessions[client_id] = self.expand(compacted)
+                EXPANSIONS.inc()
+            conn = self.connections.get(client_id)
+            if conn is not None:
+                # A message counts as activity, so the session isn't compacted mid-conversation
+                conn.last_active = time.monotonic()
+        return session
+
+    @contextmanager
+    def hold(self, client_id: str):
+        """
+        Keep the client's session from being compacted or expired while a
+        call uses it, however long the call waits or runs; idle time counts
+        again from when it ends.
+
+        Args:
+            client_id: Client making the call
+        """
+        with self.lock:
+            self.busy[client_id] = self.busy.get(client_id, 0) + 1
+        try:
+            yield
+        finally:
+            with self.lock:
+                count = self.busy.pop(client_id) - 1
+                if count:
+                    self.busy[client_id] = count
+                conn = self.connections.get(client_id)
+                if conn is not None:
+                    conn.last_active = time.monotonic()
+
+    def compacted(self) -> List[CompactedHistory]:
+        """Histories currently held compacted."""
+        return [conn.session for conn in list(self.connections.records.values())
+                if isinstance(conn.session, CompactedHistory)]
+
+    def bind_metrics(self):
+        """Report the compacted histories and their size on /metrics."""
+        COMPACTED.set_function(lambda: len(self.compacted()))
+        TEXT_BYTES.set_function(lambda: sum(history.text_bytes for history in self.compacted()))
+        BLOB_BYTES.set_function(lambda: sum(len(history.blob) for history in self.compacted()))
+
+    def sweep(self) -> int:
+        """Compact every session idle for longer than the threshold; returns how many were."""
+        now = time.monotonic()
+        if self.settings.expire_seconds > 0:
+            self.expire(now - self.settings.expire_seconds)
+        if self.settings.idle_seconds <= 0:
+            return 0
+        cutoff = now - self.settings.idle_seconds
+        compacted = 0
+        for conn in list(self.connections.records.values()):
+            if conn.session is None or isinstance(conn.session, CompactedHistory) or conn.last_active > cutoff:
+                continue
+            with self.lock:
+                session = conn.session
+                # The client may have sent a message while we were getting here
+                if (session is None or isinstance(session, CompactedHistory) or conn.last_active > cutoff
+                        or conn.client_id in self.busy):
+                    continue
+                try:
+                    history = self.compact(session, conn.client_id)
+                except Exception as e:
+                    logger.warning("Failed to compact chat history for client %s: %s", conn.client_id, e)
+                    continue
+                if history is None:
+                    continue
+                conn.session = history
+            COMPACTIONS.inc()
+            compacted += 1
+        if compacted:
+            logger.info("Compacted %d idle chat histories", compacted)
+        return compacted
+
+    def expire(self, cutoff: float) -> int:
+        """
+        Drop the sessions of clients without a connection that were last
+        active before cutoff (a time.monotonic() value); returns how many were.
+        """
+        sessions = self.connections.view("session")
+        expired = 0
+        for conn in list(self.connections.records.values()):
+            if conn.websocket is not None or conn.session is None or conn.last_active > cutoff:
+                continue
+            with self.lock:
+                # The client may have connected or sent a message while we were getting here
+                if (self.connections.get(conn.client_id) is not conn or conn.websocket is not None
+                        or conn.session is None or conn.last_active > cutoff or conn.client_id in self.busy):
+                    continue
+                del sessions[conn.client_id]
+            EXPIRED.inc()
+            expired += 1
+        if expired:
+            logger.info("Dropped %d idle chat sessions of clients without a connection", expired)
+        return expired
+
+    def start(self):
+        """Sweep for idle histories from a daemon thread, unless compaction and expiry are disabled."""
+        if (self.settings.idle_seconds <= 0 and self.settings.expire_seconds <= 0) or self.thread is not None:
+            return
+        self.thread = threading.Thread(target=self._run, name="history-compaction", daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while not self.stopped.wait(self.settings.interval):
+            try:
+                self.sweep()
+            except Exception:
+                logger.exception("Chat history sweep failed")
+
+    def stop(self):
+        self.stopped.set()
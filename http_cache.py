@@ -0,0 +1,287 @@
+"""
+In-process HTTP cache for forwarded GET api_requests.
+
+Follows the shared-cache rules of HTTP caching (RFC 9111), since one
+entry serves every client:
+
+- Responses are stored only if their status is cacheable, they are not
+  ``no-store`` or ``private``, they do not vary on everything (``Vary: *``)
+  and they carry freshness information or a validator. Requests with an
+  Authorization header are only cached when the response explicitly
+  allows it (``public``, ``s-maxage`` or ``must-revalidate``).
+- Freshness comes from ``s-maxage``, ``max-age`` or ``Expires``. Without
+  those it is estimated as 10% of the time since ``Last-Modified``.
+- A stale entry with an ``ETag`` or ``Last-Modified`` is revalidated
+  with a conditional request, and a 304 refreshes it without
+  transferring the body again.
+- Within ``stale-while-revalidate`` a stale entry is served at once while
+  it is revalidated in the background.
+- A non-error response to an unsafe request (POST, PUT, PATCH, DELETE,
+  ...) invalidates the stored response for the same URL.
+
+Entries are kept in LRU order and evicted once their total size exceeds
+the byte budget.
+
+Environment variables:
+    HTTP_CACHE: Set to 0 to disable the cache (default enabled)
+    HTTP_CACHE_MAX_BYTES: Total size of cached responses (default 32 MiB)
+    HTTP_CACHE_MAX_ENTRY_BYTES: Largest response that is cached (default 1 MiB)
+"""
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, Mapping, Optional, Tuple
+
+from metrics import Counter, Gauge
+from protocol import encode
+from settings import EnvSettings
+
+CACHE_REQUESTS = Counter("http_cache_requests_total", "Forwarded GET requests by cache outcome", ["result"])
+CACHE_BYTES = Gauge("http_cache_bytes", "Size of responses held in the HTTP cache")
+CACHE_ENTRIES = Gauge("http_cache_entries", "Responses held in the HTTP cache")
+CACHE_HIT_RATIO = Gauge("http_cache_hit_ratio", "Share of cacheable GETs answered without a full upstream fetch")
+
+# Statuses a cache may store (RFC 9110 section 15.1 "heuristically cacheable")
+CACHEABLE_STATUSES = frozenset({200, 203, 204, 300, 301, 308, 404, 405, 410, 414, 501})
+# Lookup outcomes answered without fetching the body from upstream
+HIT_RESULTS = ("hit", "stale", "revalidated")
+# Methods that don't change the resource, so their responses leave the cache alone (RFC 9110 §9.2.1)
+SAFE_METHODS = frozenset({"GET", "HEAD", "OPTIONS", "TRACE"})
+# Heuristic freshness is capped at one day
+MAX_HEURISTIC_FRESHNESS = 86400.0
+
+
+def header(headers: Mapping[str, Any], name: str) -> Optional[str]:
+    """Case-insensitive header lookup."""
+    name = name.lower()
+    for key, value in headers.items():
+        if key.lower() == name:
+            return str(value)
+    return None
+
+
+def parse_cache_control(value: Optional[str]) -> Dict[str, Optional[str]]:
+    """Parse a Cache-Control header into {directive: argument or None}."""
+    directives = {}
+    for part in (value or "").split(","):
+        name, _, argument = part.strip().partition("=")
+        if name:
+            directives[name.lower()] = argument.strip('"') if argument else None
+    return directives
+
+
+def _seconds(directives: Dict[str, Optional[str]], name: str) -> Optional[float]:
+    try:
+        return max(0.0, float(directives[name]))
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def _date(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        return parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+@dataclass
+class CacheSettings(EnvSettings):
+    """
+    HTTP cache settings.
+
+    Attributes:
+        enabled: Cache forwarded GET responses
+        max_bytes: Total size of cached responses before LRU eviction
+        max_entry_bytes: Responses larger than this are not cached
+    """
+    env_prefix = "HTTP_CACHE"
+    env_switch = "enabled"
+
+    enabled: bool = True
+    max_bytes: int = 32 * 1024 * 1024
+    max_entry_bytes: int = 1024 * 1024
+
+
+class CacheEntry:
+    """A stored response and its freshness."""
+    __slots__ = ("key", "status", "headers", "data", "size", "vary", "stored_at", "initial_age",
+                 "max_age", "stale_while_revalidate", "must_revalidate", "revalidating")
+
+    def __init__(self, key, status: int, headers: Dict[str, Any], data: Any, size: int, vary: Dict[str, Optional[str]]):
+        self.key = key
+        self.status = status
+        self.data = data
+        self.size = size
+        self.vary = vary
+        self.revalidating = False
+        self.update(headers)
+
+    def update(self, headers: Dict[str, Any]):
+        """(Re)compute freshness from response headers, e.g. after a 304."""
+        self.headers = headers
+        self.stored_at = time.monotonic()
+        directives = parse_cache_control(header(headers, "Cache-Control"))
+        self.initial_age = _seconds({"age": header(headers, "Age")}, "age") or 0.0
+        self.must_revalidate = "must-revalidate" in directives or "proxy-revalidate" in directives
+        self.stale_while_revalidate = _seconds(directives, "stale-while-revalidate") or 0.0
+        if "no-cache" in directives:
+            self.max_age = 0.0
+            return
+        max_age = _seconds(directives, "s-maxage")
+        if max_age is None:
+            max_age = _seconds(directives, "max-age")
+        date = _date(header(headers, "Date")) or time.time()
+        if max_age is None and header(headers, "Expires") is not None:
+            # An invalid Expires (e.g. "0") means already expired
+            expires = _date(header(headers, "Expires"))
+            max_age = max(0.0, expires - date) if expires is not None else 0.0
+        if max_age is None:
+            last_modified = _date(header(headers, "Last-Modified"))
+            max_age = min(0.1 * max(0.0, date - last_modified), MAX_HEURISTIC_FRESHNESS) if last_modified else 0.0
+        self.max_age = max_age
+
+    def age(self) -> float:
+        return self.initial_age + time.monotonic() - self.stored_at
+
+    def validators(self) -> Dict[str, str]:
+        """Conditional request headers for revalidating this entry."""
+        conditions = {}
+        etag = header(self.headers, "ETag")
+        if etag:
+            conditions["If-None-Match"] = etag
+        last_modified = header(self.headers, "Last-Modified")
+        if last_modified:
+            conditions["If-Modified-Since"] = last_modified
+        return conditions
+
+    def response_headers(self) -> Dict[str, Any]:
+        """Stored headers with Age set to the entry's current age."""
+        headers = {key: value for key, value in self.headers.items() if key.lower() != "age"}
+        headers["Age"] = str(int(self.age()))
+        return headers
+
+
+class ResponseCache:
+    """
+    Byte-bounded LRU cache of forwarded GET responses.
+
+    Args:
+        settings: Size limits and on/off switch
+    """
+
+    def __init__(self, settings: Optional[CacheSettings] = None):
+        self.settings = settings or CacheSettings()
+        self.entries: "OrderedDict[Tuple, CacheEntry]" = OrderedDict()
+        self.bytes = 0
+        self.results: Dict[str, int] = {}
+
+    @staticmethod
+    def key(endpoint: str, params: Optional[Mapping[str, Any]]) -> Tuple:
+        return (endpoint, tuple(sorted((str(k), str(v)) for k, v in (params or {}).items())))
+
+    def lookup(self, endpoint: str, params: Optional[Mapping[str, Any]],
+               request_headers: Mapping[str, Any]) -> Tuple[Optional[CacheEntry], str]:
+        """
+        Find the stored response for a GET request.
+
+        Returns:
+            (entry, result) where result is "hit" (fresh), "stale" (serve
+            and revalidate in the background), "revalidate" (send a
+            conditional request first), "miss" or "bypass" (not cacheable,
+            e.g. no-store or a client's own conditional request)
+        """
+        if not self.settings.enabled:
+            return None, "bypass"
+        request_directives = parse_cache_control(header(request_headers, "Cache-Control"))
+        if "no-store" in request_directives or any(
+                header(request_headers, name) is not None
+                for name in ("If-None-Match", "If-Modified-Since", "Range")):
+            return None, "bypass"
+        entry = self.entries.get(self.key(endpoint, params))
+        if entry is None or any(header(request_headers, name) != value for name, value in entry.vary.items()):
+            return None, "miss"
+        self.entries.move_to_end(entry.key)
+        age = entry.age()
+        if "no-cache" not in request_directives and age < entry.max_age:
+            return entry, "hit"
+        if ("no-cache" not in request_directives and not entry.must_revalidate
+                and age < entry.max_age + entry.stale_while_revalidate):
+            return entry, "stale"
+        if entry.validators():
+            return entry, "revalidate"
+        return None, "miss"
+
+    def store(self, endpoint: str, params: Optional[Mapping[str, Any]], request_headers: Mapping[str, Any],
+              status: int, headers: Dict[str, Any], data: Any) -> Optional[CacheEntry]:
+        """Store a response if HTTP caching rules allow it; returns the new entry or None."""
+        key = self.key(endpoint, params)
+        if not self.settings.enabled or status not in CACHEABLE_STATUSES:
+            self.discard(key)
+            return None
+        directives = parse_cache_control(header(headers, "Cache-Control"))
+        request_directives = parse_cache_control(header(request_headers, "Cache-Control"))
+        vary = [name.strip() for name in (header(headers, "Vary") or "").split(",") if name.strip()]
+        if ("no-store" in directives or "private" in directives or "no-store" in request_directives
+                or "*" in vary):
+            self.discard(key)
+            return None
+        if header(request_headers, "Authorization") is not None and not (
+                {"public", "s-maxage", "must-revalidate"} & directives.keys()):
+            return None
+        size = len(encode(data)) + sum(len(str(k)) + len(str(v)) for k, v in headers.items())
+        if size > min(self.settings.max_entry_bytes, self.settings.max_bytes):
+            self.discard(key)
+            return None
+        entry = CacheEntry(key, status, headers, data, size, {name: header(request_headers, name) for name in vary})
+        if entry.max_age <= 0 and not entry.validators():
+            # Could never be served without refetching the body
+            self.discard(key)
+            return None
+        self.discard(key)
+        self.entries[key] = entry
+        self.bytes += size
+        while self.bytes > self.settings.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.bytes -= evicted.size
+        return entry
+
+    def freshen(self, entry: CacheEntry, headers: Mapping[str, Any]):
+        """Refresh an entry from a 304 response's headers."""
+        merged = {key: value for key, value in entry.headers.items()
+                  if header(headers, key) is None}
+        merged.update(headers)
+        entry.update(merged)
+
+    def invalidate(self, method: str, endpoint: str, params: Optional[Mapping[str, Any]], status: int):
+        """Drop the stored response for a URL once an unsafe request to it succeeded (RFC 9111 §4.4)."""
+        if method.upper() not in SAFE_METHODS and 200 <= status < 400:
+            self.discard(self.key(endpoint, params))
+
+    def discard(self, key: Tuple):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= entry.size
+
+    def record(self, result: str):
+        """Count a lookup outcome; "revalidate" lookups are recorded once resolved."""
+        self.results[result] = self.results.get(result, 0) + 1
+        CACHE_REQUESTS.labels(result=result).inc()
+
+    def hit_ratio(self) -> float:
+        """Share of cacheable lookups answered without fetching the body upstream."""
+        hits = sum(self.results.get(result, 0) for result in HIT_RESULTS)
+        total = hits + self.results.get("miss", 0)
+        return hits / total if total else 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        return {"entries": len(self.entries), "bytes": self.bytes, "hit_ratio": self.hit_ratio(),
+                **self.results}
+
+    def bind_metrics(self):
+        """Report this cache's size and hit ratio on /metrics."""
+        CACHE_BYTES.set_function(lambda: self.bytes)
+        CACHE_ENTRIES.set_function(lambda: len(self.entries))
+        CACHE_HIT_RATIO.set_function(self.hit_ratio)
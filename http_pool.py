@@ -0,0 +1,140 @@
+"""
+Pooled aiohttp client settings for forwarded API requests.
+
+Builds the ``aiohttp.ClientSession`` used by ``ConnectionManager`` with a
+tuned ``TCPConnector`` (total and per-host connection limits, keep-alive,
+DNS cache TTL) and connect/read timeouts, and reports pool utilisation on
+/metrics: connections in use and idle, requests waiting for a connection,
+how long they waited, and whether each request reused a pooled connection
+or opened a new one.
+"""
+import time
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Callable, Dict, Optional
+
+from metrics import Counter, Gauge, Histogram
+from settings import EnvSettings
+
+if TYPE_CHECKING:
+    import aiohttp
+
+POOL_IN_USE = Gauge("http_pool_connections_in_use", "Upstream HTTP connections serving a request")
+POOL_IDLE = Gauge("http_pool_connections_idle", "Upstream HTTP connections kept alive for reuse")
+POOL_WAITING = Gauge("http_pool_waiting_requests", "Requests waiting for a free upstream HTTP connection")
+POOL_LIMIT = Gauge("http_pool_connections_limit", "Upstream HTTP connection limit (0 = unlimited)")
+POOL_CONNECTIONS = Counter("http_pool_connections_total",
+                           "Upstream HTTP connections acquired, by whether they were reused", ["outcome"])
+POOL_WAIT = Histogram("http_pool_wait_seconds", "Time requests waited for a free upstream HTTP connection")
+
+
+@dataclass
+class HttpPoolSettings(EnvSettings):
+    """
+    Connection pool and timeout settings for outbound HTTP.
+
+    Attributes:
+        limit: Connections open at once across all hosts (0 = unlimited)
+        limit_per_host: Connections open at once to one host (0 = unlimited)
+        keepalive_timeout: Seconds an idle connection is kept for reuse
+        dns_cache_ttl: Seconds resolved addresses are cached (0 disables the cache)
+        connect_timeout: Seconds to wait for a free pooled connection and to connect
+        read_timeout: Seconds to wait between reads of a response
+        total_timeout: Seconds a whole request may take (0 = no limit)
+    """
+    env_prefix = "HTTP_POOL"
+
+    limit: int = 100
+    limit_per_host: int = 20
+    keepalive_timeout: float = 30.0
+    dns_cache_ttl: int = 300
+    connect_timeout: float = 10.0
+    read_timeout: float = 30.0
+    total_timeout: float = 0.0
+
+    def connector(self) -> "aiohttp.TCPConnector":
+        """Build the pooled connector; call from a running event loop."""
+        import aiohttp
+        return aiohttp.TCPConnector(
+            limit=self.limit,
+            limit_per_host=self.limit_per_host,
+            keepalive_timeout=self.keepalive_timeout,
+            use_dns_cache=self.dns_cache_ttl > 0,
+            ttl_dns_cache=self.dns_cache_ttl,
+        )
+
+    def timeout(self, deadline: Optional[float] = None) -> "aiohttp.ClientTimeout":
+        """
+        Session-wide timeouts; ``connect`` includes waiting for a pooled connection.
+
+        Args:
+            deadline: Seconds one request may take in total, for a per-request
+                timeout; the shorter of it and total_timeout applies
+        """
+        import aiohttp
+        total = self.total_timeout or None
+        if deadline is not None and deadline > 0:
+            total = min(total, deadline) if total else deadline
+        return aiohttp.ClientTimeout(
+            total=total,
+            connect=self.connect_timeout or None,
+            sock_read=self.read_timeout or None,
+        )
+
+    def session(self, **kwargs) -> "aiohttp.ClientSession":
+        """Build a ClientSession using this pool, instrumented for /metrics."""
+        import aiohttp
+        return aiohttp.ClientSession(connector=self.connector(), timeout=self.timeout(),
+                                     trace_configs=[trace_config()], **kwargs)
+
+
+def trace_config() -> "aiohttp.TraceConfig":
+    """Record pool waits and connection reuse for requests made through a session."""
+    import aiohttp
+
+    async def on_queued_start(session, context, params):
+        context.queued_at = time.perf_counter()
+
+    async def on_queued_end(session, context, params):
+        POOL_WAIT.observe(time.perf_counter() - context.queued_at)
+
+    async def on_create_end(session, context, params):
+        POOL_CONNECTIONS.labels(outcome="created").inc()
+
+    async def on_reuse(session, context, params):
+        POOL_CONNECTIONS.labels(outcome="reused").inc()
+
+    config = aiohttp.TraceConfig()
+    config.on_connection_queued_start.append(on_queued_start)
+    config.on_connection_queued_end.append(on_queued_end)
+    config.on_connection_create_end.append(on_create_end)
+    config.on_connection_reuseconn.append(on_reuse)
+    return config
+
+
+def pool_stats(session: Optional["aiohttp.ClientSession"]) -> Dict[str, Any]:
+    """
+    Snapshot of a session's connection pool.
+
+    Returns:
+        Dict with limit, limit_per_host, in_use, idle and waiting counts
+        (all zero when there is no open session)
+    """
+    connector = session.connector if session is not None and not session.closed else None
+    if connector is None:
+        return {"limit": 0, "limit_per_host": 0, "in_use": 0, "idle": 0, "waiting": 0}
+    # aiohttp does not expose pool occupancy publicly; tests check these attributes still exist
+    return {
+        "limit": connector.limit,
+        "limit_per_host": connector.limit_per_host,
+        "in_use": len(getattr(connector, "_acquired", ())),
+        "idle": sum(len(conns) for conns in getattr(connector, "_conns", {}).values()),
+        "waiting": sum(len(waiters) for waiters in getattr(connector, "_waiters", {}).values()),
+    }
+
+
+def bind_metrics(get_session: Callable[[], Optional["aiohttp.ClientSession"]]):
+    """Report the pool of the session returned by get_session() on /metrics."""
+    POOL_IN_USE.set_function(lambda: pool_stats(get_session())["in_use"])
+    POOL_IDLE.set_function(lambda: pool_stats(get_session())["idle"])
+    POOL_WAITING.set_function(lambda: pool_stats(get_session())["waiting"])
+    POOL_LIMIT.set_function(lambda: pool_stats(get_session())["limit"])
@@ -0,0 +1,202 @@
+"""
+Logging setup for the servers' hot paths.
+
+Log records are handed to a background listener thread through a queue,
+so formatting and I/O happen off the event loop; only the message and any
+traceback are rendered on the calling thread, while their arguments still
+hold the state they had when the record was logged. Loggers from get_logger()
+tag records with a category and other structured fields, and each category
+is sampled at its own rate (e.g. keep 1% of payload dumps) before a record
+is even created.
+
+Environment variables:
+    LOG_LEVEL: Root log level (default INFO)
+    LOG_FORMAT: "text" (default) or "json"
+    LOG_SAMPLE_RATES: Comma separated category=rate pairs, e.g. "payload=0.1,ping=0"
+"""
+import os
+import copy
+import json
+import queue
+import atexit
+import random
+import logging
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, List, Optional
+
+DEFAULT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Default sampling rates by category; unlisted categories are always kept
+DEFAULT_SAMPLE_RATES = "payload=0.1,ping=0.01"
+
+# Attributes every LogRecord has; anything else was passed as a structured field
+_RESERVED_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "taskName"}
+
+_listener: Optional[QueueListener] = None
+
+# Active sampling rates by category
+_sample_rates: Dict[str, float] = {}
+
+
+def parse_sample_rates(spec: str) -> Dict[str, float]:
+    """Parse "category=rate,..." into a dict."""
+    rates = {}
+    for item in spec.split(","):
+        if "=" in item:
+            category, rate = item.split("=", 1)
+            rates[category.strip()] = float(rate)
+    return rates
+
+
+def should_sample(category: Optional[str], level: int = logging.INFO) -> bool:
+    """Decide whether to keep a record; warnings and errors are always kept."""
+    if level >= logging.WARNING:
+        return True
+    rate = _sample_rates.get(category, 1.0)
+    if rate >= 1.0:
+        return True
+    return rate > 0.0 and random.random() < rate
+
+
+class CategoryAdapter(logging.LoggerAdapter):
+    """Logger adapter that samples by category and merges extra fields."""
+
+    def log(self, level, msg, *args, **kwargs):
+        if not should_sample(self.extra.get("category"), level):
+            return
+        # Attribute the record to our caller rather than this method
+        kwargs.setdefault("stacklevel", 2)
+        super().log(level, msg, *args, **kwargs)
+
+    def process(self, msg, kwargs):
+        kwargs["extra"] = {**self.extra, **kwargs.get("extra", {})}
+        return msg, kwargs
+
+
+def get_logger(name: str, category: Optional[str] = None, **fields):
+    """
+    Get a logger whose records carry a category and structured fields.
+
+    Args:
+        name: Logger name
+        category: Sampling category, e.g. "payload"
+        **fields: Extra fields added to every record
+    """
+    logger = logging.getLogger(name)
+    if category is None and not fields:
+        return logger
+    return CategoryAdapter(logger, {"category": category, **fields})
+
+
+class LazyQueueHandler(QueueHandler):
+    """
+    QueueHandler that leaves the formatter to the listener thread.
+
+    The stock QueueHandler runs the full formatter before enqueueing each
+    record. Here only the %-arguments and the traceback are rendered at
+    enqueue time, since both can change or go away once the caller moves
+    on; the timestamp, structured fields and handler I/O are left to the
+    listener.
+    """
+
+    _exc_formatter = logging.Formatter()
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = self._exc_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class StructuredFormatter(logging.Formatter):
+    """Formatter that appends structured fields, or emits one JSON object per record."""
+
+    def __init__(self, fmt: str = DEFAULT_FORMAT, json_output: bool = False):
+        super().__init__(fmt)
+        self.json_output = json_output
+
+    def format(self, record):
+        fields = {k: v for k, v in vars(record).items() if k not in _RESERVED_ATTRS and v is not None}
+        if self.json_output:
+            entry = {
+                "time": self.formatTime(record),
+                "level": record.levelname,
+                "logger": record.name,
+                "message": record.getMessage(),
+                **fields,
+            }
+            if record.exc_info and not record.exc_text:
+                record.exc_text = self.formatException(record.exc_info)
+            if record.exc_text:
+                entry["exc_info"] = record.exc_text
+            return json.dumps(entry, default=str)
+        text = super().format(record)
+        if fields:
+            text += " " + " ".join(f"{k}={v}" for k, v in fields.items())
+        return text
+
+
+def setup_logging(level: Optional[str] = None, sample_rates: Optional[Dict[str, float]] = None,
+                  json_output: Optional[bool] = None,
+                  handlers: Optional[List[logging.Handler]] = None,
+                  filters: Optional[List[logging.Filter]] = None) -> QueueListener:
+    """
+    Route all logging through a queue to a background listener thread.
+
+    Args:
+        level: Root log level; defaults to LOG_LEVEL or INFO
+        sample_rates: Per-category sampling rates; defaults to LOG_SAMPLE_RATES
+        json_output: Emit JSON lines; defaults to LOG_FORMAT == "json"
+        handlers: Handlers run by the listener; defaults to a StreamHandler
+        filters: Filters run on the calling thread before a record is queued,
+            e.g. to attach context that only exists there
+
+    Returns:
+        The running QueueListener
+    """
+    global _listener
+    stop_logging()
+
+    if level is None:
+        level = os.getenv("LOG_LEVEL", "INFO")
+    if sample_rates is None:
+        sample_rates = parse_sample_rates(os.getenv("LOG_SAMPLE_RATES", DEFAULT_SAMPLE_RATES))
+    _sample_rates.clear()
+    _sample_rates.update(sample_rates)
+    if json_output is None:
+        json_output = os.getenv("LOG_FORMAT", "text").lower() == "json"
+    if handlers is None:
+        handlers = [logging.StreamHandler()]
+
+    formatter = StructuredFormatter(json_output=json_output)
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = LazyQueueHandler(log_queue)
+    for log_filter in filters or ():
+        queue_handler.addFilter(log_filter)
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        if isinstance(handler, LazyQueueHandler):
+            root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level.upper() if isinstance(level, str) else level)
+
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+
+@atexit.register
+def stop_logging():
+    """Flush queued records and stop the listener thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
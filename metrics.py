@@ -0,0 +1,283 @@
+"""
+Lightweight Prometheus-style metrics for the Gemini servers.
+
+Provides counters, gauges and histograms rendered in the Prometheus text
+exposition format, plus the standard metrics every server records for a
+chat turn. Each server process exposes them on GET /metrics.
+"""
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Registry:
+    """Collection of metrics rendered together."""
+
+    def __init__(self):
+        self.metrics: List["Metric"] = []
+
+    def register(self, metric: "Metric"):
+        self.metrics.append(metric)
+        return metric
+
+    def get(self, name: str) -> Optional["Metric"]:
+        for metric in self.metrics:
+            if metric.name == name:
+                return metric
+        return None
+
+    def render(self) -> str:
+        """Render all metrics in the Prometheus text format."""
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+class _Child:
+    """A metric bound to one set of label values."""
+
+    def __init__(self, metric: "Metric", key: Tuple[str, ...]):
+        self._metric = metric
+        self._key = key
+
+    def inc(self, amount: float = 1.0):
+        self._metric._inc(self._key, amount)
+
+    def dec(self, amount: float = 1.0):
+        self._metric._inc(self._key, -amount)
+
+    def set(self, value: float):
+        self._metric._set(self._key, value)
+
+    def observe(self, value: float):
+        self._metric._observe(self._key, value)
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    @contextmanager
+    def track_inprogress(self):
+        self.inc()
+        try:
+            yield
+        finally:
+            self.dec()
+
+
+class Metric:
+    """Base class for labelled metrics."""
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 registry: Optional[Registry] = REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], object] = {}
+        self._default = _Child(self, ())
+        if registry is not None:
+            registry.register(self)
+
+    def labels(self, **labels) -> _Child:
+        """Return the child metric for the given label values."""
+        return _Child(self, tuple(str(labels[name]) for name in self.labelnames))
+
+    def remove(self, **labels):
+        """Drop the series for the given label values, e.g. once what it describes is gone."""
+        with self._lock:
+            self._values.pop(tuple(str(labels[name]) for name in self.labelnames), None)
+
+    # Unlabelled shortcuts
+    def inc(self, amount: float = 1.0):
+        self._default.inc(amount)
+
+    def dec(self, amount: float = 1.0):
+        self._default.dec(amount)
+
+    def set(self, value: float):
+        self._default.set(value)
+
+    def observe(self, value: float):
+        self._default.observe(value)
+
+    def time(self):
+        return self._default.time()
+
+    def track_inprogress(self):
+        return self._default.track_inprogress()
+
+    def _inc(self, key, amount):
+        raise TypeError(f"{self.kind} {self.name} does not support inc/dec")
+
+    def _set(self, key, value):
+        raise TypeError(f"{self.kind} {self.name} does not support set")
+
+    def _observe(self, key, value):
+        raise TypeError(f"{self.kind} {self.name} does not support observe")
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    """Monotonically increasing count."""
+    kind = "counter"
+
+    def _inc(self, key, amount):
+        if amount < 0:
+            raise ValueError("Counters can only increase")
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(tuple(str(labels[name]) for name in self.labelnames), 0.0)
+
+    def samples(self):
+        # Copied under the lock: other threads may add series while this renders
+        with self._lock:
+            items = sorted(self._values.items())
+        if not items and not self.labelnames:
+            return [f"{self.name} 0"]
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+                for key, value in items]
+
+
+class Gauge(Metric):
+    """Value that can go up and down, or be read from a callback at scrape time."""
+    kind = "gauge"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._function: Optional[Callable[[], float]] = None
+
+    def set_function(self, function: Callable[[], float]):
+        """Read the (unlabelled) value from a callback when rendering."""
+        self._function = function
+
+    def _inc(self, key, amount):
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def _set(self, key, value):
+        with self._lock:
+            self._values[key] = float(value)
+
+    def value(self, **labels) -> float:
+        if self._function is not None and not labels:
+            return float(self._function())
+        return self._values.get(tuple(str(labels[name]) for name in self.labelnames), 0.0)
+
+    def samples(self):
+        if self._function is not None:
+            return [f"{self.name} {_format_value(self._function())}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        if not items and not self.labelnames:
+            return [f"{self.name} 0"]
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+                for key, value in items]
+
+
+class Histogram(Metric):
+    """Distribution of observed values in cumulative buckets."""
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS, registry: Optional[Registry] = REGISTRY):
+        super().__init__(name, documentation, labelnames, registry)
+        self.buckets = tuple(sorted(buckets))
+
+    def _observe(self, key, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Per-bucket counts (last slot is +Inf), sum, count
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def count(self, **labels) -> int:
+        state = self._values.get(tuple(str(labels[name]) for name in self.labelnames))
+        return state[2] if state else 0
+
+    def samples(self):
+        lines = []
+        with self._lock:
+            # Bucket counts are updated in place, so copy them along with the keys
+            items = sorted((key, (list(counts), total, count)) for key, (counts, total, count) in self._values.items())
+        if not items and not self.labelnames:
+            items = [((), [[0] * (len(self.buckets) + 1), 0.0, 0])]
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+# Standard metrics recorded by every server for a chat turn
+QUEUE_WAIT = Histogram("gemini_queue_wait_seconds",
+                       "Time from receiving a message until its Gemini call starts")
+GEMINI_LATENCY = Histogram("gemini_request_seconds", "Latency of Gemini API calls")
+TIME_TO_FIRST_CHUNK = Histogram("gemini_time_to_first_chunk_seconds",
+                                "Time from receiving a message until the first response chunk is sent")
+SERIALIZATION = Histogram("message_serialization_seconds", "Time spent encoding outgoing response frames",
+                          buckets=(0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05))
+SEND = Histogram("message_send_seconds", "Time spent sending response frames to clients",
+                 buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0))
+ACTIVE_CONNECTIONS = Gauge("active_connections", "Open client connections")
+CHAT_SESSIONS = Gauge("chat_sessions", "Chat sessions held in memory")
+INFLIGHT_REQUESTS = Gauge("inflight_requests", "Requests currently being processed")
+ERRORS = Counter("errors_total", "Errors by type", ["type"])
+
+
+async def websockets_process_request(path, request_headers):
+    """
+    process_request hook for ``websockets.serve`` that answers GET /metrics
+    over plain HTTP and lets every other path continue the handshake.
+    """
+    if path.split("?", 1)[0] == "/metrics":
+        return 200, [("Content-Type", CONTENT_TYPE)], REGISTRY.render().encode()
+    return None
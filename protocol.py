@@ -0,0 +1,264 @@
+"""
+Message protocol shared by the Gemini WebSocket and HTTP servers.
+
+Incoming frames are decoded and validated in a single pass into typed
+message structs, and routed to handlers through a dispatch table instead
+of per-server if/elif chains on ``data.get("type")``.
+"""
+import json
+import time
+from dataclasses import MISSING, dataclass, field, fields
+from typing import Any, Callable, ClassVar, Dict, List, Optional, Type, Union, get_args, get_origin, get_type_hints
+
+# Use orjson when it is installed; it is several times faster than json
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class ProtocolError(ValueError):
+    """Raised when an incoming frame is not a valid protocol message."""
+
+
+@dataclass
+class Message:
+    """Base class for client messages."""
+    type: ClassVar[str] = ""
+    # perf_counter() timestamp taken when the frame was decoded
+    received_at: float = field(default=0.0, init=False, repr=False, compare=False)
+
+
+@dataclass
+class ChatMessage(Message):
+    """A user prompt to send to the client's chat session."""
+    type: ClassVar[str] = "message"
+    content: str
+    request_id: Optional[str] = None
+    # Send the answer in chunk frames as Gemini produces it, then a done frame
+    stream: bool = False
+
+
+@dataclass
+class ApiRequest(Message):
+    """An HTTP request to forward to an external endpoint."""
+    type: ClassVar[str] = "api_request"
+    endpoint: str
+    method: str = "GET"
+    params: Dict[str, Any] = field(default_factory=dict)
+    headers: Dict[str, Any] = field(default_factory=dict)
+    body: Any = None
+    request_id: Optional[str] = None
+    # Relay the body in api_response_chunk frames instead of one api_response
+    stream: bool = False
+    # Byte cap for a streamed body (the server's cap applies if larger)
+    max_bytes: Optional[int] = None
+    # Seconds the whole upstream call may take, body included
+    timeout: Optional[float] = None
+
+
+@dataclass
+class ApiBatch(Message):
+    """Several api_requests to forward concurrently."""
+    type: ClassVar[str] = "api_batch"
+    # api_request objects, without "type"
+    requests: List[Dict[str, Any]]
+    # "stream": one api_batch_item frame per request as it completes;
+    # "aggregate": one api_batch_response frame with every result in order
+    mode: str = "stream"
+    # Requests run at once (capped by the server's limit)
+    concurrency: Optional[int] = None
+    # Seconds each request may take (capped by the server's limit)
+    timeout: Optional[float] = None
+    request_id: Optional[str] = None
+
+
+@dataclass
+class Ping(Message):
+    """Keep-alive probe; answered with a pong."""
+    type: ClassVar[str] = "ping"
+
+
+@dataclass
+class Pong(Message):
+    """Reply to a server-initiated ping."""
+    type: ClassVar[str] = "pong"
+
+
+@dataclass
+class Resume(Message):
+    """Request to replay an answer interrupted by a dropped connection (see replay.py)."""
+    type: ClassVar[str] = "resume"
+    request_id: str
+    # Highest chunk seq already received; -1 for none
+    last_seq: int = -1
+
+
+@dataclass
+class ChatRequest(Message):
+    """Body of a POST to the HTTP /api/chat endpoint."""
+    type: ClassVar[str] = "chat_request"
+    message: str
+    client_id: str = "anonymous"
+
+
+# Message structs that may arrive over a WebSocket, keyed by their "type"
+MESSAGE_TYPES: Dict[str, Type] = {}
+
+# Cached (name, type hint, required) tuples for each struct
+_SCHEMAS: Dict[Type, tuple] = {}
+
+
+def _schema(cls):
+    """Build and cache the validation schema for a struct."""
+    hints = get_type_hints(cls)
+    schema = []
+    for f in fields(cls):
+        if not f.init:
+            continue
+        required = f.default is MISSING and f.default_factory is MISSING
+        schema.append((f.name, hints[f.name], required))
+    _SCHEMAS[cls] = tuple(schema)
+    return _SCHEMAS[cls]
+
+
+def register_message(cls):
+    """Register a message struct so that decode() recognises its type."""
+    _schema(cls)
+    MESSAGE_TYPES[cls.type] = cls
+    return cls
+
+
+def _matches(value, hint):
+    """Check a decoded JSON value against a field's type hint."""
+    if hint is Any:
+        return True
+    origin = get_origin(hint)
+    if origin is Union:
+        return any(_matches(value, arg) for arg in get_args(hint))
+    if origin is not None:
+        return isinstance(value, origin)
+    if hint is type(None):
+        return value is None
+    if hint is float:
+        return isinstance(value, (int, float)) and not isinstance(value, bool)
+    if hint is int:
+        return isinstance(value, int) and not isinstance(value, bool)
+    return isinstance(value, hint)
+
+
+def loads(raw: Union[str, bytes]):
+    """Parse raw JSON text, raising ProtocolError on malformed input."""
+    try:
+        if orjson is not None:
+            return orjson.loads(raw)
+        return json.loads(raw)
+    except ValueError:
+        raise ProtocolError("Invalid JSON message")
+
+
+def encode(payload: Dict[str, Any]) -> str:
+    """Serialise an outgoing message to JSON text."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(payload).decode()
+        except TypeError:
+            # e.g. str subclass keys such as aiohttp's header names
+            pass
+    return json.dumps(payload)
+
+
+def build(cls: Type, data: Any):
+    """
+    Validate a decoded JSON object against a message struct.
+
+    Args:
+        cls: Registered message struct to build
+        data: Decoded JSON value
+
+    Returns:
+        Instance of cls
+    """
+    if not isinstance(data, dict):
+        raise ProtocolError("Message must be a JSON object")
+    schema = _SCHEMAS.get(cls)
+    if schema is None:
+        schema = _schema(cls)
+    kwargs = {}
+    for name, hint, required in schema:
+        if name in data:
+            value = data[name]
+            if not _matches(value, hint):
+                raise ProtocolError(f"Invalid value for '{name}' for {cls.type}")
+            kwargs[name] = value
+        elif required:
+            raise ProtocolError(f"Missing required field '{name}' for {cls.type}")
+    return cls(**kwargs)
+
+
+def decode(raw: Union[str, bytes], cls: Optional[Type] = None):
+    """
+    Decode and validate a raw frame in one pass.
+
+    Args:
+        raw: JSON text received from the client
+        cls: Optional struct to validate against; by default the struct is
+            chosen from the message's "type" field
+
+    Returns:
+        Typed message struct
+    """
+    received_at = time.perf_counter()
+    data = loads(raw)
+    if cls is None:
+        if not isinstance(data, dict):
+            raise ProtocolError("Message must be a JSON object")
+        msg_type = data.get("type")
+        cls = MESSAGE_TYPES.get(msg_type)
+        if cls is None:
+            raise ProtocolError(f"Unknown message type: {msg_type}")
+    message = build(cls, data)
+    message.received_at = received_at
+    return message
+
+
+def error_frame(content: str) -> str:
+    """Build an encoded error frame."""
+    return encode({"type": "error", "content": content})
+
+
+def with_request_id(frame: Dict[str, Any], message) -> Dict[str, Any]:
+    """Echo a client-supplied request_id so replies can be correlated"""
+    if message.request_id:
+        frame["request_id"] = message.request_id
+    return frame
+
+
+class Dispatcher:
+    """Routes decoded messages to handlers registered per message type."""
+
+    def __init__(self):
+        self.handlers: Dict[str, Callable] = {}
+
+    def on(self, cls: Type):
+        """Decorator registering an async handler for a message struct."""
+        def decorator(handler):
+            self.handlers[cls.type] = handler
+            return handler
+        return decorator
+
+    async def dispatch(self, message, *args, **kwargs):
+        """
+        Call the handler registered for the message's type.
+
+        Raises:
+            ProtocolError: If this server does not handle the message type
+        """
+        handler = self.handlers.get(message.type)
+        if handler is None:
+            raise ProtocolError(f"Unsupported message type: {message.type}")
+        return await handler(message, *args, **kwargs)
+
+
+for _cls in (ChatMessage, ApiRequest, ApiBatch, Ping, Pong, Resume):
+    register_message(_cls)
@@ -0,0 +1,233 @@
+"""
+Replay buffers for answers interrupted by a dropped connection.
+
+An answer to a chat message that carries a ``request_id`` is kept here,
+frame by frame, while it is sent: its ``chunk`` frames with their ``seq``
+and then its final frame (``done``, ``response`` or ``error``). If the
+client's connection drops, the Gemini call keeps running and the rest of
+the answer is still buffered. A client that reconnects with the same
+client ID sends::
+
+    {"type": "resume", "request_id": "...", "last_seq": 3}
+
+with the highest chunk ``seq`` it received (-1 for none). It is sent the
+buffered chunks after that and the final frame. An answer still being
+generated continues on the new connection. The prompt is not sent to
+Gemini again. If nothing is buffered for the request (it expired, was
+evicted, or was never seen), the reply is a ``resume_failed`` frame and
+the client has to send the prompt again.
+
+Buffers are bounded. An answer larger than ``max_request_bytes`` is not
+kept. Past ``max_bytes`` or ``max_requests`` in total, the buffers that
+were least recently written are evicted. A buffer expires ``ttl`` seconds
+after its last frame.
+
+Environment variables:
+    REPLAY_TTL: Seconds an answer is kept after its last frame (default 120, 0 disables buffering)
+    REPLAY_MAX_BYTES: Total bytes of buffered frames (default 32 MiB)
+    REPLAY_MAX_REQUEST_BYTES: Largest answer that is buffered (default 1 MiB)
+    REPLAY_MAX_REQUESTS: Most answers buffered at once (default 10000)
+"""
+import time
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+from metrics import Counter, Gauge
+from protocol import encode
+from settings import EnvSettings
+
+logger = logging.getLogger(__name__)
+
+BUFFERED_REQUESTS = Gauge("replay_buffered_requests", "Answers held for clients that may resume them")
+BUFFERED_BYTES = Gauge("replay_buffered_bytes", "Bytes of answer frames held for resumption")
+RESUMES = Counter("replay_resumes_total", "Resume requests from reconnecting clients", ["outcome"])
+EVICTIONS = Counter("replay_evictions_total", "Answers dropped from the replay buffer before expiring", ["reason"])
+
+Send = Callable[[str], Awaitable[None]]
+
+
+@dataclass
+class ReplaySettings(EnvSettings):
+    """
+    Replay buffer settings.
+
+    Attributes:
+        ttl: Seconds an answer is kept after its last frame (0 disables buffering)
+        max_bytes: Total bytes of buffered frames
+        max_request_bytes: Largest answer that is buffered
+        max_requests: Most answers buffered at once
+    """
+    env_prefix = "REPLAY"
+
+    ttl: float = 120.0
+    max_bytes: int = 32 * 1024 * 1024
+    max_request_bytes: int = 1024 * 1024
+    max_requests: int = 10000
+
+
+def resume_failed_frame(request_id: str) -> str:
+    """Build the reply to a resume of an answer that isn't buffered."""
+    return encode({"type": "resume_failed", "request_id": request_id,
+                   "content": "The answer is no longer available; send the prompt again"})
+
+
+class ReplayStream:
+    """
+    One answer being sent: frames go to the client, if connected, and into the buffer.
+
+    Attributes:
+        key: (client ID, request ID), or None for an answer that isn't buffered
+        frames: (seq, frame) for each chunk frame, then (None, final frame)
+        finished: The final frame has been sent
+        subscriber: send() of the connection the answer is delivered on, if any
+    """
+    __slots__ = ("buffer", "key", "frames", "bytes", "finished", "expires", "subscriber", "dropped")
+
+    def __init__(self, buffer: "ReplayBuffer", key: Optional[Tuple[str, str]], send: Send):
+        self.buffer = buffer
+        self.key = key
+        self.frames: List[Tuple[Optional[int], str]] = []
+        self.bytes = 0
+        self.finished = False
+        self.expires = 0.0
+        self.subscriber: Optional[Send] = send
+        self.dropped = key is None
+
+    async def send(self, frame: str, seq: Optional[int] = None):
+        """
+        Send a chunk frame, or without a seq the answer's final frame.
+
+        While the answer is buffered, a failed send only detaches the client:
+        generation goes on so the client can resume. Otherwise the error is
+        raised, as a plain send() would.
+        """
+        if not self.dropped:
+            self.buffer._record(self, frame, seq)
+        send = self.subscriber
+        if send is None:
+            return
+        try:
+            await send(frame)
+        except Exception as e:
+            if self.dropped:
+                raise
+            if self.subscriber is send:
+                self.subscriber = None
+            logger.debug("Client %s left during an answer, buffering it for resumption: %s", self.key[0], e)
+
+
+class ReplayBuffer:
+    """
+    Answers kept for resumption, keyed by client ID and request ID.
+
+    Args:
+        settings: Size and TTL limits
+    """
+
+    def __init__(self, settings: Optional[ReplaySettings] = None):
+        self.settings = settings or ReplaySettings()
+        # Least recently written first, so expired and evicted answers are at the front
+        self.streams: "OrderedDict[Tuple[str, str], ReplayStream]" = OrderedDict()
+        self.bytes = 0
+
+    def bind_metrics(self):
+        """Report the buffered answers and their size on /metrics."""
+        BUFFERED_REQUESTS.set_function(lambda: len(self.streams))
+        BUFFERED_BYTES.set_function(lambda: self.bytes)
+
+    def open(self, client_id: str, request_id: Optional[str], send: Send) -> ReplayStream:
+        """
+        Start an answer, buffered when it has a request ID.
+
+        Args:
+            client_id: Client the answer is for
+            request_id: The prompt's request_id
+            send: send() of the client's connection
+
+        Returns:
+            The stream to send the answer's chunk and final frames through
+        """
+        if not request_id or self.settings.ttl <= 0:
+            return ReplayStream(self, None, send)
+        key = (client_id, request_id)
+        old = self.streams.get(key)
+        if old is not None:
+            self._drop(old, "replaced")
+        stream = self.streams[key] = ReplayStream(self, key, send)
+        stream.expires = time.monotonic() + self.settings.ttl
+        self._evict()
+        return stream
+
+    async def resume(self, client_id: str, request_id: str, last_seq: int, send: Send) -> bool:
+        """
+        Replay an answer after the chunks a client already has, and deliver the rest as it is generated.
+
+        Args:
+            client_id: Client resuming the answer
+            request_id: The prompt's request_id
+            last_seq: Highest chunk seq the client received (-1 for none)
+            send: send() of the client's new connection
+
+        Returns:
+            Whether the answer was buffered; if not, the prompt must be sent again
+        """
+        self._expire(time.monotonic())
+        stream = self.streams.get((client_id, request_id))
+        if stream is None:
+            RESUMES.labels(outcome="missed").inc()
+            return False
+        stream.subscriber = None
+        # Frames recorded while replaying are picked up by the loop; once it
+        # ends, later frames are delivered live
+        index = 0
+        while index < len(stream.frames):
+            seq, frame = stream.frames[index]
+            index += 1
+            if seq is None or seq > last_seq:
+                await send(frame)
+        if stream.dropped:
+            RESUMES.labels(outcome="evicted").inc()
+            return False
+        if not stream.finished:
+            stream.subscriber = send
+        RESUMES.labels(outcome="resumed").inc()
+        logger.info("Resumed answer %s for client %s after chunk %d", request_id, client_id, last_seq)
+        return True
+
+    def _record(self, stream: ReplayStream, frame: str, seq: Optional[int]):
+        now = time.monotonic()
+        stream.frames.append((seq, frame))
+        stream.bytes += len(frame)
+        self.bytes += len(frame)
+        stream.finished = seq is None
+        stream.expires = now + self.settings.ttl
+        self.streams.move_to_end(stream.key)
+        if stream.bytes > self.settings.max_request_bytes:
+            self._drop(stream, "too_large")
+        self._expire(now)
+        self._evict()
+
+    def _expire(self, now: float):
+        while self.streams:
+            stream = next(iter(self.streams.values()))
+            if stream.expires > now:
+                break
+            self._drop(stream, None)
+
+    def _evict(self):
+        settings = self.settings
+        while self.streams and (self.bytes > settings.max_bytes or len(self.streams) > settings.max_requests):
+            self._drop(next(iter(self.streams.values())), "full")
+
+    def _drop(self, stream: ReplayStream, reason: Optional[str]):
+        """Forget a buffered answer; reason is None when it simply expired."""
+        if self.streams.get(stream.key) is stream:
+            del self.streams[stream.key]
+        self.bytes -= stream.bytes
+        stream.frames = []
+        stream.bytes = 0
+        stream.dropped = True
+        if reason:
+            EVICTIONS.labels(reason=reason).inc()
@@ -0,0 +1,221 @@
+"""
+Weighted fair scheduling of upstream Gemini calls.
+
+Requests are queued per client and dispatched to a fixed pool of worker
+threads with deficit round robin (DRR), so one chatty client_id cannot
+starve the others of the shared quota. Each client has at most one call
+running at a time, across all lanes, which also keeps its chat session's
+history ordered. Running the blocking SDK calls on workers keeps them off the
+servers' event loops.
+
+Requests are grouped into priority lanes (by default "interactive" ahead
+of "batch"): a lane is only served when every lane before it has nothing
+runnable. Within a lane, clients share the workers in proportion to their
+weights. Lanes only order the calls of one scheduler, i.e. one process:
+websocket_server.py puts WebSocket chat ahead of its HTTP event-stream
+callers, but it cannot deprioritise another server's calls.
+
+Environment variables:
+    SCHEDULER_CONCURRENCY: Upstream calls run at once (default 8)
+    SCHEDULER_QUANTUM: Cost credited to a client per round (default 1)
+"""
+import os
+import time
+import asyncio
+import threading
+import contextvars
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Callable, Deque, Dict, Optional, Sequence, Set
+
+from metrics import Counter, Gauge, Histogram
+
+LANES = ("interactive", "batch")
+
+QUEUE_DEPTH = Gauge("scheduler_queue_depth", "Upstream calls waiting to be scheduled", ["lane"])
+QUEUE_WAIT = Histogram("scheduler_queue_wait_seconds", "Time upstream calls wait in the scheduler", ["lane"])
+DISPATCHED = Counter("scheduler_dispatched_total", "Upstream calls started by the scheduler", ["lane"])
+
+
+class _Job:
+    __slots__ = ("fn", "args", "cost", "future", "context", "queued_at")
+
+    def __init__(self, fn, args, cost):
+        self.fn = fn
+        self.args = args
+        self.cost = cost
+        self.future: Future = Future()
+        # Run in the caller's context so tracing spans and log fields carry over
+        self.context = contextvars.copy_context()
+        self.queued_at = time.perf_counter()
+
+
+class _Flow:
+    """Queue of one client's pending calls within a lane."""
+    __slots__ = ("client_id", "lane", "weight", "deficit", "jobs")
+
+    def __init__(self, client_id: str, lane: str, weight: float):
+        self.client_id = client_id
+        self.lane = lane
+        self.weight = weight
+        self.deficit = 0.0
+        self.jobs: Deque[_Job] = deque()
+
+
+class FairScheduler:
+    """
+    Deficit round robin scheduler in front of a blocking upstream API.
+
+    Args:
+        concurrency: Worker threads, i.e. upstream calls run at once
+        lanes: Lane names in priority order, highest first
+        quantum: Cost credited to a client each time its turn comes round
+    """
+
+    def __init__(self, concurrency: int = 8, lanes: Sequence[str] = LANES, quantum: float = 1.0):
+        self.concurrency = concurrency
+        self.lanes = tuple(lanes)
+        self.quantum = quantum
+        self._rings: Dict[str, Deque[_Flow]] = {lane: deque() for lane in self.lanes}
+        self._flows: Dict[tuple, _Flow] = {}
+        self._depth: Dict[str, int] = {lane: 0 for lane in self.lanes}
+        # Clients with a call running, in whichever lane; their other calls wait
+        self._running: Set[str] = set()
+        self._cond = threading.Condition()
+        self._workers = []
+        self._closed = False
+        for lane in self.lanes:
+            QUEUE_DEPTH.labels(lane=lane).set(0)
+
+    @classmethod
+    def from_env(cls, **defaults):
+        settings = dict(defaults)
+        if os.getenv("SCHEDULER_CONCURRENCY"):
+            settings["concurrency"] = int(os.getenv("SCHEDULER_CONCURRENCY"))
+        if os.getenv("SCHEDULER_QUANTUM"):
+            settings["quantum"] = float(os.getenv("SCHEDULER_QUANTUM"))
+        return cls(**settings)
+
+    def depth(self, lane: str) -> int:
+        """Number of calls waiting in a lane."""
+        return self._depth[lane]
+
+    def submit(self, client_id: str, fn: Callable, *args, lane: str = "interactive",
+               weight: float = 1.0, cost: float = 1.0) -> Future:
+        """
+        Queue a call to run on a worker thread when its turn comes.
+
+        Args:
+            client_id: Client the call is made for; calls are fair across clients
+            fn: Blocking callable to run, e.g. chat_session.send_message
+            *args: Arguments for fn
+            lane: Priority lane
+            weight: Client's share relative to other clients in the lane
+            cost: Cost charged against the client's share, e.g. 1 per request
+
+        Returns:
+            A concurrent.futures.Future for fn's result
+        """
+        if lane not in self._rings:
+            raise ValueError(f"Unknown scheduler lane: {lane}")
+        if weight <= 0:
+            # A flow without a share would never earn the credit to run
+            raise ValueError(f"Scheduler weight must be positive: {weight}")
+        job = _Job(fn, args, cost)
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Scheduler is shut down")
+            self._start_workers()
+            key = (lane, client_id)
+            flow = self._flows.get(key)
+            if flow is None:
+                flow = self._flows[key] = _Flow(client_id, lane, weight)
+            flow.weight = weight
+            if not flow.jobs:
+                self._rings[lane].append(flow)
+            flow.jobs.append(job)
+            self._depth[lane] += 1
+            QUEUE_DEPTH.labels(lane=lane).set(self._depth[lane])
+            self._cond.notify()
+        return job.future
+
+    async def run(self, client_id: str, fn: Callable, *args, **kwargs) -> Any:
+        """Schedule a call from a coroutine and await its result."""
+        return await asyncio.wrap_future(self.submit(client_id, fn, *args, **kwargs))
+
+    def call(self, client_id: str, fn: Callable, *args, **kwargs) -> Any:
+        """Schedule a call from a (non-async) thread and block until it returns."""
+        return self.submit(client_id, fn, *args, **kwargs).result()
+
+    def _start_workers(self):
+        while len(self._workers) < self.concurrency:
+            worker = threading.Thread(target=self._work, name=f"scheduler-{len(self._workers)}", daemon=True)
+            self._workers.append(worker)
+            worker.start()
+
+    def _next(self) -> Optional[_Flow]:
+        """Pick the flow whose call runs next; caller holds the lock."""
+        running = self._running
+        for lane in self.lanes:
+            ring = self._rings[lane]
+            if all(flow.client_id in running for flow in ring):
+                continue
+            while True:
+                # First flow in round order whose client has no call running
+                index, flow = next((i, f) for i, f in enumerate(ring) if f.client_id not in running)
+                cost = flow.jobs[0].cost
+                if flow.deficit < cost:
+                    # Its turn: credit its share and move it to the end of the round
+                    flow.deficit += self.quantum * flow.weight
+                    del ring[index]
+                    ring.append(flow)
+                    continue
+                flow.deficit -= cost
+                if len(flow.jobs) > 1 and flow.deficit < flow.jobs[1].cost:
+                    # Share used up for this round
+                    del ring[index]
+                    ring.append(flow)
+                return flow
+        return None
+
+    def _work(self):
+        while True:
+            with self._cond:
+                flow = self._next()
+                while flow is None:
+                    if self._closed:
+                        return
+                    self._cond.wait()
+                    flow = self._next()
+                job = flow.jobs.popleft()
+                self._running.add(flow.client_id)
+                if not flow.jobs:
+                    # An idle client does not bank credit (standard DRR)
+                    self._rings[flow.lane].remove(flow)
+                    flow.deficit = 0.0
+                self._depth[flow.lane] -= 1
+                QUEUE_DEPTH.labels(lane=flow.lane).set(self._depth[flow.lane])
+
+            if job.future.set_running_or_notify_cancel():
+                QUEUE_WAIT.labels(lane=flow.lane).observe(time.perf_counter() - job.queued_at)
+                DISPATCHED.labels(lane=flow.lane).inc()
+                try:
+                    job.future.set_result(job.context.run(job.fn, *job.args))
+                except BaseException as e:
+                    job.future.set_exception(e)
+
+            with self._cond:
+                self._running.discard(flow.client_id)
+                if not flow.jobs:
+                    self._flows.pop((flow.lane, flow.client_id), None)
+                # The client's calls in other lanes may be runnable now too
+                self._cond.notify_all()
+
+    def shutdown(self, wait: bool = True):
+        """Stop the workers once queued calls have run."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if wait:
+            for worker in self._workers:
+                worker.join()
@@ -0,0 +1,136 @@
+"""
+Warm pool of pre-created chat sessions.
+
+Creating a chat session is synchronous SDK work. Done on connect, it adds
+that cost to every handshake, and in a reconnect storm (e.g. after a
+deploy) the event loop spends the burst creating sessions one after
+another. The pool keeps ``size`` fresh sessions ready instead:
+
+- ``acquire()`` / ``take()`` hand one out on connect, and wake a background
+  thread that tops the pool back up.
+- When the pool is empty, ``acquire()`` creates the session on a worker
+  thread, so one slow setup never holds up other connections.
+
+Sessions are only ever handed out once, so conversations never share history.
+
+Environment variables:
+    SESSION_POOL_SIZE: Sessions kept ready (default 16, 0 disables the pool)
+"""
+import time
+import asyncio
+import logging
+import threading
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Callable, Optional
+
+from metrics import Counter, Gauge, Histogram
+from settings import EnvSettings
+
+logger = logging.getLogger(__name__)
+
+POOL_READY = Gauge("session_pool_ready", "Pre-created chat sessions ready to hand out")
+POOL_TAKES = Counter("session_pool_takes_total", "Chat sessions handed out, by whether the pool had one ready",
+                     ["result"])
+SESSION_CREATE = Histogram("session_create_seconds", "Time to create one chat session")
+
+# Seconds the refill thread waits after a failed session creation
+REFILL_BACKOFF = 1.0
+
+
+@dataclass
+class SessionPoolSettings(EnvSettings):
+    """
+    Chat session pool settings.
+
+    Attributes:
+        size: Sessions kept ready (0 disables the pool)
+    """
+    env_prefix = "SESSION_POOL"
+
+    size: int = 16
+
+
+class SessionPool:
+    """
+    Pre-created chat sessions, refilled by a background thread.
+
+    Args:
+        factory: Creates one chat session, e.g. ``gemini_api.chat_session``
+        settings: Pool size
+    """
+
+    def __init__(self, factory: Callable[[], Any], settings: Optional[SessionPoolSettings] = None):
+        self.factory = factory
+        self.settings = settings or SessionPoolSettings()
+        self.sessions = deque()
+        self.wanted = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+        self.closed = False
+
+    def bind_metrics(self):
+        """Report this pool's ready sessions on /metrics."""
+        POOL_READY.set_function(lambda: len(self.sessions))
+
+    def create(self) -> Any:
+        """Create one session, timing it."""
+        started = time.perf_counter()
+        session = self.factory()
+        SESSION_CREATE.observe(time.perf_counter() - started)
+        return session
+
+    def fill(self):
+        """Create sessions until the pool is full."""
+        while not self.closed and len(self.sessions) < self.settings.size:
+            self.sessions.append(self.create())
+
+    def start(self):
+        """
+        Fill the pool, then keep it topped up from a daemon thread. Call once
+        the factory can create sessions, e.g. as a warm-up step.
+        """
+        if self.settings.size <= 0 or self.thread is not None:
+            return
+        self.fill()
+        self.thread = threading.Thread(target=self._refill, name="session-pool", daemon=True)
+        self.thread.start()
+        logger.info("Chat session pool ready with %d sessions", len(self.sessions))
+
+    def _refill(self):
+        while not self.closed:
+            self.wanted.wait()
+            self.wanted.clear()
+            try:
+                self.fill()
+            except Exception as e:
+                logger.warning("Failed to refill chat session pool: %s", e)
+                time.sleep(REFILL_BACKOFF)
+                self.wanted.set()
+
+    def _pop(self) -> Any:
+        try:
+            session = self.sessions.popleft()
+        except IndexError:
+            session = None
+        if self.thread is not None:
+            self.wanted.set()
+        POOL_TAKES.labels(result="miss" if session is None else "hit").inc()
+        return session
+
+    def take(self) -> Any:
+        """Hand out a ready session, or create one here if the pool is empty."""
+        session = self._pop()
+        return self.create() if session is None else session
+
+    async def acquire(self) -> Any:
+        """Hand out a ready session, or create one on a worker thread if the pool is empty."""
+        session = self._pop()
+        if session is None:
+            session = await asyncio.get_running_loop().run_in_executor(None, self.create)
+        return session
+
+    def close(self):
+        """Stop refilling and drop the ready sessions."""
+        self.closed = True
+        self.wanted.set()
+        self.sessions.clear()
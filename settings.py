@@ -0,0 +1,53 @@
+"""
+Settings dataclasses loaded from environment variables.
+
+Each tunable component describes its settings as a dataclass deriving
+from ``EnvSettings``, which gives it a ``from_env()`` reading one variable
+per field, named ``<PREFIX>_<FIELD>`` (e.g. ``ADMISSION_MAX_QUEUE`` for
+``max_queue``) and cast to the field's annotated type. Boolean fields are
+false for "0", "false", "off", "no" and the empty string, true otherwise.
+"""
+import os
+from dataclasses import fields
+from typing import Optional, get_type_hints
+
+FALSE = ("0", "false", "off", "no", "")
+
+
+def parse_bool(value: str) -> bool:
+    """Read a boolean environment variable, e.g. WS_COMPRESSION=off."""
+    return value.strip().lower() not in FALSE
+
+
+class EnvSettings:
+    """
+    Mixin giving a settings dataclass a from_env() constructor.
+
+    Attributes:
+        env_prefix: Environment variable prefix used when from_env() is given none
+        env_switch: Field read from the bare prefix rather than <PREFIX>_<FIELD>,
+            so a component can be turned off with e.g. HTTP_CACHE=0
+    """
+    env_prefix = ""
+    env_switch: Optional[str] = None
+
+    @classmethod
+    def from_env(cls, prefix: Optional[str] = None, **defaults):
+        """
+        Load settings from environment variables named <prefix>_<FIELD>.
+
+        Args:
+            prefix: Environment variable prefix, so servers can be tuned separately
+            **defaults: Per-server defaults used when a variable is not set
+        """
+        prefix = prefix or cls.env_prefix
+        settings = cls(**defaults)
+        types = get_type_hints(cls)
+        for field in fields(cls):
+            name = prefix if field.name == cls.env_switch else f"{prefix}_{field.name.upper()}"
+            value = os.getenv(name)
+            if value is None:
+                continue
+            kind = types[field.name]
+            setattr(settings, field.name, parse_bool(value) if kind is bool else kind(value))
+        return settings
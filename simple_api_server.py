@@ -1,6 +1,14 @@
 import os
-import json
-from flask import Flask, request, jsonify
+import time
+import signal
+import threading
+from flask import Flask, Response, request, jsonify
+from connection import ConnectionTable
+from drain import Drain
+from history_compaction import CompactionSettings, HistoryCompactor
+from metrics import CHAT_SESSIONS, CONTENT_TYPE, ERRORS, GEMINI_LATENCY, INFLIGHT_REQUESTS, QUEUE_WAIT, REGISTRY
+from protocol import ChatRequest, ProtocolError, decode
+from scheduler import FairScheduler
 
 # Configure Flask
 app = Flask(__name__)
@@ -35,32 +43,89 @@ except Exception as e:
     print(f"Failed to initialize Gemini API: {str(e)}")
     raise
 
-# Store chat sessions
-chat_sessions = {}
+# Store chat sessions, one compact record per client (see connection.py)
+connections = ConnectionTable()
+chat_sessions = connections.view("session")
+CHAT_SESSIONS.set_function(lambda: len(chat_sessions))
+
+# Idle chat histories are compressed until the client's next message
+# (override with HISTORY_COMPACTION_* environment variables)
+history_compactor = HistoryCompactor(connections, gemini_api.export_history, gemini_api.restore_session,
+                                     CompactionSettings.from_env("HISTORY_COMPACTION"))
+history_compactor.bind_metrics()
+history_compactor.start()
+
+# Fair scheduling of Gemini calls across clients (override with SCHEDULER_* environment variables)
+scheduler = FairScheduler.from_env()
+
+# Graceful drain on SIGTERM or POST /admin/drain (override with DRAIN_* environment variables)
+drain = Drain.from_env(lambda: INFLIGHT_REQUESTS.value())
+drain.on_flush(history_compactor.stop)
+
+def start_drain(*_):
+    """Drain in a background thread, then stop the server"""
+    if not drain.begin():
+        return False
+    
+    def run():
+        drain.drain_sync()
+        print("Server drained, shutting down")
+        os.kill(os.getpid(), signal.SIGINT)
+    
+    threading.Thread(target=run, name="drain", daemon=True).start()
+    return True
+
+@app.before_request
+def refuse_while_draining():
+    """Turn away new chat requests once draining has started"""
+    if drain.draining and request.path == '/api/chat':
+        return jsonify({"error": "Server draining, retry against another instance"}), 503, {"Retry-After": "1"}
+
+@app.route('/admin/drain', methods=['POST'])
+def admin_drain():
+    """Start a graceful drain (requires DRAIN_TOKEN to be set)"""
+    status, body = drain.admin_response(request.headers.get("X-Admin-Token"), start_drain)
+    return Response(body, status=status, content_type="text/plain")
 
 @app.route('/api/chat', methods=['POST'])
 def chat():
     """Handle chat requests"""
-    data = request.json
-    if not data:
+    raw = request.get_data()
+    if not raw:
         return jsonify({"error": "No data provided"}), 400
     
-    client_id = data.get('client_id', 'anonymous')
-    message = data.get('message')
+    # Decode and validate the request body in one pass
+    try:
+        chat_request = decode(raw, ChatRequest)
+    except ProtocolError as e:
+        ERRORS.labels(type="protocol").inc()
+        return jsonify({"error": str(e)}), 400
+    
+    client_id = chat_request.client_id
+    message = chat_request.message
     
     if not message:
         return jsonify({"error": "No message provided"}), 400
     
-    # Create a new chat session if one doesn't exist
-    if client_id not in chat_sessions:
-        chat_sessions[client_id] = gemini_api.chat_session()
-        print(f"Created new chat session for client {client_id}")
-    
     try:
-        # Get response from Gemini
-        print(f"Processing message from {client_id}: {message[:30]}...")
-        response = chat_sessions[client_id].send_message(message)
-        response_text = response.text
+        # The session is kept out of idle sweeps until the answer is in
+        with history_compactor.hold(client_id):
+            # Create a new chat session if one doesn't exist
+            if client_id not in chat_sessions:
+                chat_sessions[client_id] = gemini_api.chat_session()
+                print(f"Created new chat session for client {client_id}")
+            
+            # Get response from Gemini
+            print(f"Processing message from {client_id}: {message[:30]}...")
+            chat_session = history_compactor.session(chat_sessions, client_id)
+            
+            def call_gemini():
+                QUEUE_WAIT.observe(time.perf_counter() - chat_request.received_at)
+                with GEMINI_LATENCY.time():
+                    return chat_session.send_message(message).text
+            
+            with INFLIGHT_REQUESTS.track_inprogress():
+                response_text = scheduler.call(client_id, call_gemini)
         
         print(f"Got response from Gemini for client {client_id}")
         
@@ -70,9 +135,15 @@ def chat():
         })
     
     except Exception as e:
+        ERRORS.labels(type="gemini").inc()
         print(f"Error processing message: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/metrics')
+def metrics():
+    """Prometheus metrics"""
+    return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
+
 @app.route('/')
 def index():
     """Index route"""
@@ -81,4 +152,5 @@ def index():
 if __name__ == '__main__':
     port = 5000
     print(f"Starting API server on port {port}")
+    signal.signal(signal.SIGTERM, start_drain)
     app.run(host='0.0.0.0', port=port, debug=True) 
\ No newline at end of file
@@ -1,11 +1,25 @@
 import os
-import json
+import time
 import asyncio
 import logging
 import websockets
 import traceback
 from dotenv import load_dotenv
 from gemini_api import GeminiAPI
+from admission import AdmissionController, AdmissionSettings
+from drain import Drain
+from compression import CompressionSettings
+from connection import ConnectionTable
+from heartbeat import HeartbeatMonitor, TimerWheel
+from history_compaction import CompactionSettings, HistoryCompactor
+from metrics import (ACTIVE_CONNECTIONS, CHAT_SESSIONS, ERRORS, GEMINI_LATENCY, INFLIGHT_REQUESTS,
+                     QUEUE_WAIT, SEND, SERIALIZATION, TIME_TO_FIRST_CHUNK, websockets_process_request)
+from protocol import (ChatMessage, Dispatcher, Ping, Pong, ProtocolError, Resume, decode, encode, error_frame,
+                      with_request_id)
+from replay import ReplayBuffer, ReplaySettings, resume_failed_frame
+from scheduler import FairScheduler
+from session_pool import SessionPool, SessionPoolSettings
+from tracing import current_request_id, tracer
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, 
@@ -23,9 +37,157 @@ except Exception as e:
     logger.error(f"Failed to initialize Gemini API: {str(e)}")
     raise
 
-# Store active connections and chat sessions
-active_connections = {}
-chat_sessions = {}
+# WebSocket compression settings (override with WS_COMPRESSION_* environment variables)
+compression_settings = CompressionSettings.from_env("WS_COMPRESSION")
+
+# In-flight request and connection limits (override with ADMISSION_* environment variables)
+admission = AdmissionController(AdmissionSettings.from_env("ADMISSION"))
+admission.bind_metrics()
+# Graceful drain on SIGTERM or the admin endpoint (override with DRAIN_* environment variables)
+drain = Drain.from_env(lambda: admission.inflight + admission.queued, lambda: active_connections.values())
+# Handshake hook for websockets.serve: answers /metrics and /admin/drain, and refuses
+# connections past capacity or while draining
+process_request = admission.connection_gate(lambda: len(active_connections), drain.gate(websockets_process_request))
+
+# Fair scheduling of Gemini calls across clients (override with SCHEDULER_* environment variables)
+scheduler = FairScheduler.from_env()
+
+# Pre-created chat sessions handed out on connect (override with SESSION_POOL_* environment variables)
+session_pool = SessionPool(gemini_api.chat_session, SessionPoolSettings.from_env("SESSION_POOL"))
+session_pool.bind_metrics()
+session_pool.start()
+drain.on_flush(session_pool.close)
+
+# One compact record per connection (see connection.py); active connections
+# and chat sessions are views of the records' socket and session fields
+connections = ConnectionTable()
+active_connections = connections.view("websocket")
+chat_sessions = connections.view("session")
+ACTIVE_CONNECTIONS.set_function(lambda: len(active_connections))
+CHAT_SESSIONS.set_function(lambda: len(chat_sessions))
+
+# Idle chat histories are compressed until the client's next message
+# (override with HISTORY_COMPACTION_* environment variables)
+history_compactor = HistoryCompactor(connections, gemini_api.export_history, gemini_api.restore_session,
+                                     CompactionSettings.from_env("HISTORY_COMPACTION"))
+history_compactor.bind_metrics()
+history_compactor.start()
+drain.on_flush(history_compactor.stop)
+
+# Answers to prompts with a request_id are kept for clients that reconnect
+# mid-answer (override with REPLAY_* environment variables)
+replay = ReplayBuffer(ReplaySettings.from_env("REPLAY"))
+replay.bind_metrics()
+
+def release_session(client_id, reason):
+    """Free the chat session of a connection reaped by the heartbeat monitor"""
+    chat_sessions.pop(client_id, None)
+    logger.info(f"Released chat session for {reason} client {client_id}")
+
+# One timer wheel drives heartbeats and idle reaping for every connection
+# (override with HEARTBEAT_INTERVAL and IDLE_TIMEOUT environment variables)
+heartbeats = HeartbeatMonitor.from_env(TimerWheel(), on_reap=release_session)
+
+# Keep-alive comes from the shared heartbeat wheel, not a websockets task per connection
+SERVE_KWARGS = {"ping_interval": None}
+
+# Dispatch table for client messages
+dispatcher = Dispatcher()
+
+@dispatcher.on(ChatMessage)
+@drain.guard
+@admission.guard
+async def handle_chat_message(message, client_id, send):
+    """Send a user prompt to Gemini and reply with the response"""
+    user_message = message.content
+    
+    # Send acknowledgment
+    with tracer.span("send", frame="status"):
+        await send(encode(with_request_id({
+            "type": "status",
+            "content": "processing"
+        }, message)))
+    
+    # Process the message
+    logger.info(f"Processing message from {client_id} [{current_request_id()}]: {user_message[:30]}...")
+    
+    # The answer also goes into the replay buffer, so it is still generated if the
+    # client drops and can be resumed after a reconnect
+    answer = replay.open(client_id, message.request_id, send)
+    INFLIGHT_REQUESTS.inc()
+    try:
+        # The session is kept out of idle sweeps until the answer is in
+        with history_compactor.hold(client_id):
+            with tracer.span("session_lookup"):
+                chat_session = history_compactor.session(chat_sessions, client_id)
+            loop = asyncio.get_running_loop()
+            
+            def call_gemini():
+                # Runs on a scheduler worker once it is this client's turn
+                QUEUE_WAIT.observe(time.perf_counter() - message.received_at)
+                with tracer.span("upstream", target="gemini", prompt_chars=len(user_message),
+                                 stream=message.stream), GEMINI_LATENCY.time():
+                    if not message.stream:
+                        return chat_session.send_message(user_message).text
+                    chunks = 0
+                    for chunk in chat_session.send_message(user_message, stream=True):
+                        if not chunk.text:
+                            continue
+                        if not chunks:
+                            TIME_TO_FIRST_CHUNK.observe(time.perf_counter() - message.received_at)
+                        frame = encode(with_request_id({"type": "chunk", "seq": chunks, "content": chunk.text},
+                                                       message))
+                        asyncio.run_coroutine_threadsafe(answer.send(frame, chunks), loop).result()
+                        chunks += 1
+                    return chunks
+            
+            # Get response from Gemini
+            with tracer.span("schedule", lane="interactive"):
+                response = await scheduler.run(client_id, call_gemini, lane="interactive")
+        
+        if message.stream:
+            await answer.send(encode(with_request_id({"type": "done", "chunks": response}, message)))
+            logger.info(f"Streamed response to client {client_id} ({response} chunks)")
+            return
+        
+        logger.info(f"Got response from Gemini for client {client_id}")
+        
+        # Send the response
+        with tracer.span("chunk", frame="response", chars=len(response)), SERIALIZATION.time():
+            response_str = encode(with_request_id({
+                "type": "response",
+                "content": response
+            }, message))
+        with tracer.span("send", frame="response", bytes=len(response_str)), SEND.time():
+            await answer.send(response_str)
+        TIME_TO_FIRST_CHUNK.observe(time.perf_counter() - message.received_at)
+        logger.info(f"Sent response to client {client_id}")
+        
+    except Exception as e:
+        ERRORS.labels(type="gemini").inc()
+        error_msg = f"Error processing message: {str(e)}"
+        logger.error(f"{error_msg}\n{traceback.format_exc()}")
+        await answer.send(encode(with_request_id({"type": "error", "content": error_msg}, message)))
+    finally:
+        INFLIGHT_REQUESTS.dec()
+
+@dispatcher.on(Resume)
+async def handle_resume(message, client_id, send):
+    """Replay an answer the client lost when its connection dropped, and continue it on this one"""
+    if not await replay.resume(client_id, message.request_id, message.last_seq, send):
+        logger.info(f"Nothing to resume for request {message.request_id} of client {client_id}")
+        await send(resume_failed_frame(message.request_id))
+
+@dispatcher.on(Ping)
+async def handle_ping(message, client_id, send):
+    """Answer a keep-alive ping from the client"""
+    await send(encode({"type": "pong"}))
+    logger.debug(f"Received ping from client {client_id}, sent pong")
+
+@dispatcher.on(Pong)
+async def handle_pong(message, client_id, send):
+    """Client answered one of our heartbeat pings"""
+    logger.debug(f"Received pong from client {client_id}")
 
 async def handle_websocket(websocket, path):
     """Handle a WebSocket connection."""
@@ -37,94 +199,58 @@ async def handle_websocket(websocket, path):
     logger.info(f"New connection from client: {client_id}")
     
     # Store connection
-    active_connections[client_id] = websocket
+    conn = connections.open(client_id, websocket)
     
     # Create a new chat session for this client
     try:
-        chat_sessions[client_id] = gemini_api.chat_session()
+        chat_sessions[client_id] = await session_pool.acquire()
         logger.info(f"Created chat session for client {client_id}")
     except Exception as e:
+        ERRORS.labels(type="chat_session").inc()
         logger.error(f"Failed to create chat session for client {client_id}: {str(e)}")
         # Send error to client
-        await websocket.send(json.dumps({
-            "type": "error",
-            "content": f"Failed to create chat session: {str(e)}"
-        }))
+        await websocket.send(error_frame(f"Failed to create chat session: {str(e)}"))
         return
     
     try:
         # Send welcome message
         logger.info(f"Sending welcome message to client {client_id}")
-        await websocket.send(json.dumps({
+        await websocket.send(encode({
             "type": "connected",
             "content": "Connected to Gemini WebSocket Server"
         }))
         
-        # Keep the connection open with periodic pings
-        ping_task = asyncio.create_task(periodic_ping(websocket, client_id))
+        # Heartbeats keep the connection open and reap it once dead or idle
+        heartbeats.register(client_id, websocket, conn)
         
         # Process messages
-        async for message in websocket:
-            try:
-                # Parse the message
-                logger.debug(f"Received raw message from client {client_id}: {message}")
-                data = json.loads(message)
-                logger.info(f"Received message from client {client_id}: {data}")
+        async for raw_message in websocket:
+            conn.messages_in += 1
+            heartbeats.seen(client_id, active=False)
+            # Each message gets its own request ID and trace
+            with tracer.trace("receive", client_id=client_id, bytes=len(raw_message)) as root:
+                try:
+                    # Decode, validate and route the message
+                    logger.debug(f"Received raw message from client {client_id}: {raw_message}")
+                    with tracer.span("parse"):
+                        message = decode(raw_message)
+                    root.set_attribute("message_type", message.type)
+                    if not isinstance(message, (Ping, Pong)):
+                        heartbeats.seen(client_id)
+                    logger.info(f"Received message from client {client_id} [{root.request_id}]: {message}")
+                    await dispatcher.dispatch(message, client_id, conn.send)
                 
-                # Handle different message types
-                if data.get("type") == "message":
-                    user_message = data.get("content", "")
-                    
-                    # Send acknowledgment
-                    await websocket.send(json.dumps({
-                        "type": "status",
-                        "content": "processing"
-                    }))
-                    
-                    # Process the message
-                    logger.info(f"Processing message from {client_id}: {user_message[:30]}...")
-                    
+                except ProtocolError as e:
+                    ERRORS.labels(type="protocol").inc()
+                    logger.warning(f"Received invalid message from client {client_id}: {str(e)}")
+                    await websocket.send(error_frame(str(e)))
+                except Exception as e:
+                    ERRORS.labels(type="internal").inc()
+                    logger.error(f"Error handling message [{root.request_id}] from client {client_id}: {str(e)}\n{traceback.format_exc()}")
                     try:
-                        # Get response from Gemini
-                        response = chat_sessions[client_id].send_message(user_message)
-                        response_text = response.text
-                        
-                        logger.info(f"Got response from Gemini for client {client_id}")
-                        
-                        # Send the response
-                        await websocket.send(json.dumps({
-                            "type": "response",
-                            "content": response_text
-                        }))
-                        logger.info(f"Sent response to client {client_id}")
-                        
-                    except Exception as e:
-                        error_msg = f"Error processing message: {str(e)}"
-                        logger.error(f"{error_msg}\n{traceback.format_exc()}")
-                        await websocket.send(json.dumps({
-                            "type": "error",
-                            "content": error_msg
-                        }))
-                
-                elif data.get("type") == "ping":
-                    await websocket.send(json.dumps({"type": "pong"}))
-                    logger.debug(f"Received ping from client {client_id}, sent pong")
-            
-            except json.JSONDecodeError:
-                logger.warning(f"Received invalid JSON from client {client_id}")
-                await websocket.send(json.dumps({
-                    "type": "error",
-                    "content": "Invalid JSON message"
-                }))
-            except Exception as e:
-                logger.error(f"Error handling message from client {client_id}: {str(e)}\n{traceback.format_exc()}")
-                try:
-                    await websocket.send(json.dumps({
-                        "type": "error",
-                        "content": f"Server error: {str(e)}"
-                    }))
-                except:
-                    pass
+                        await websocket.send(error_frame(f"Server error: {str(e)}"))
+                    except:
+                        pass
     
     except websockets.exceptions.ConnectionClosed as e:
         logger.info(f"Connection closed for client {client_id}: {str(e)}")
@@ -133,37 +259,18 @@ async def handle_websocket(websocket, path):
         logger.error(f"Error in WebSocket handler for client {client_id}: {str(e)}\n{traceback.format_exc()}")
     
     finally:
-        # Cancel ping task
-        try:
-            ping_task.cancel()
-        except:
-            pass
-        
-        # Clean up when connection closes
-        if client_id in active_connections:
-            del active_connections[client_id]
-        if client_id in chat_sessions:
-            del chat_sessions[client_id]
-        logger.info(f"Connection closed and cleaned up for client {client_id}")
-
-async def periodic_ping(websocket, client_id):
-    """Send periodic pings to keep the connection alive"""
-    try:
-        while True:
-            await asyncio.sleep(30)  # Send ping every 30 seconds
+        # A client that has already reconnected keeps its new connection's heartbeats and state
+        if connections.get(client_id) is conn:
+            # Stop heartbeats
+            heartbeats.unregister(client_id)
+            
+            # Clean up when connection closes
             if client_id in active_connections:
-                try:
-                    await websocket.send(json.dumps({"type": "ping"}))
-                    logger.debug(f"Sent ping to client {client_id}")
-                except:
-                    logger.warning(f"Failed to send ping to client {client_id}")
-                    break
-            else:
-                break
-    except asyncio.CancelledError:
-        pass
-    except Exception as e:
-        logger.error(f"Error in periodic ping for client {client_id}: {str(e)}")
+                del active_connections[client_id]
+            if client_id in chat_sessions:
+                del chat_sessions[client_id]
+        logger.info(f"Connection closed and cleaned up for client {client_id} "
+                    f"({conn.messages_in} messages in, {conn.messages_out} out)")
 
 async def main():
     """Start the WebSocket server."""
@@ -172,9 +279,13 @@ async def main():
     
     logger.info(f"Starting WebSocket server on {host}:{port}")
     
-    async with websockets.serve(handle_websocket, host, port):
+    async with websockets.serve(handle_websocket, host, port, process_request=process_request,
+                                **SERVE_KWARGS, **compression_settings.serve_kwargs()):
         logger.info(f"Server started. Listening on {host}:{port}")
-        await asyncio.Future()  # Run forever
+        # Run until a drain (SIGTERM or /admin/drain) completes
+        drain.handle_signals()
+        await drain.stopped.wait()
+        logger.info("Server drained, shutting down")
 
 if __name__ == "__main__":
     try:
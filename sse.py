@@ -0,0 +1,104 @@
+"""
+Server-Sent Events (SSE) for clients that can't hold a WebSocket.
+
+A handler written against the WebSocket ``send(frame)`` interface can be
+served over a plain HTTP response: ``event_stream()`` runs it and writes
+every frame it sends as one event, named after the frame's ``"type"``::
+
+    event: chunk
+    data: {"type": "chunk", "seq": 0, "content": "..."}
+
+Frames reach the client as soon as they are sent, so the first bytes go
+out while the answer is still being generated. A comment line is written
+when nothing has been sent for ``keepalive`` seconds, so proxies don't
+close a stream that is waiting on a slow upstream. If the client goes
+away, the handler is cancelled and further sends raise
+``StreamClosed``.
+
+Environment variables:
+    SSE_KEEPALIVE: Seconds of silence before a keep-alive comment (default 15, 0 disables)
+"""
+import json
+import asyncio
+from dataclasses import dataclass
+from typing import AsyncIterator, Awaitable, Callable
+from settings import EnvSettings
+
+MEDIA_TYPE = "text/event-stream"
+
+# Stop caches and proxies (e.g. nginx) from holding events back
+HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+# Ends the queue of frames once the handler returns
+_END = object()
+
+
+class StreamClosed(ConnectionError):
+    """Raised by send() once the client has gone away."""
+
+
+@dataclass
+class SseSettings(EnvSettings):
+    """
+    Event stream settings.
+
+    Attributes:
+        keepalive: Seconds of silence before a keep-alive comment (0 disables)
+    """
+    env_prefix = "SSE"
+
+    keepalive: float = 15.0
+
+
+def format_event(frame: str) -> str:
+    """Format an encoded frame as one event named after its type."""
+    event = json.loads(frame).get("type", "message")
+    # A data line may not contain a newline; encoded JSON never does
+    return f"event: {event}\ndata: {frame}\n\n"
+
+
+async def event_stream(handler: Callable[[Callable[[str], Awaitable[None]]], Awaitable],
+                       settings: SseSettings = None) -> AsyncIterator[str]:
+    """
+    Run a handler and yield the frames it sends as events.
+
+    Args:
+        handler: Coroutine function taking ``send``; the stream ends when it returns
+        settings: Keep-alive settings
+
+    Yields:
+        Formatted events and keep-alive comments
+    """
+    settings = settings or SseSettings()
+    queue = asyncio.Queue()
+    closed = False
+
+    async def send(frame: str):
+        if closed:
+            raise StreamClosed("client closed the event stream")
+        queue.put_nowait(frame)
+
+    async def run():
+        try:
+            await handler(send)
+        finally:
+            queue.put_nowait(_END)
+
+    task = asyncio.create_task(run())
+    try:
+        while True:
+            try:
+                frame = await asyncio.wait_for(queue.get(), settings.keepalive or None)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+            if frame is _END:
+                break
+            yield format_event(frame)
+        # Surface an exception the handler raised
+        await task
+    finally:
+        # Client gone or stream done: stop the handler sending
+        closed = True
+        if not task.done():
+            task.cancel()
@@ -0,0 +1,143 @@
+import os
+import sys
+import json
+import asyncio
+import pytest
+
+# Add parent directory to path to allow importing from the project root
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from admission import AdmissionController, AdmissionSettings, Busy, REJECTED
+from protocol import ChatMessage
+
+class TestAdmissionSettings:
+    """Tests for loading admission limits"""
+
+    def test_from_env(self, monkeypatch):
+        """Limits are read from prefixed environment variables"""
+        monkeypatch.setenv("TEST_ADMISSION_MAX_INFLIGHT", "4")
+        monkeypatch.setenv("TEST_ADMISSION_DEADLINE", "2.5")
+        settings = AdmissionSettings.from_env("TEST_ADMISSION", max_connections=10)
+        assert settings.max_inflight == 4
+        assert settings.deadline == 2.5
+        assert settings.max_connections == 10
+        assert settings.max_inflight_per_client == AdmissionSettings.max_inflight_per_client
+
+@pytest.mark.asyncio
+class TestAdmissionController:
+    """Tests for in-flight limits and load shedding"""
+
+    async def test_per_client_limit(self):
+        """A client cannot exceed its own in-flight limit"""
+        controller = AdmissionController(AdmissionSettings(max_inflight_per_client=1))
+        started = await controller.acquire("a")
+        await controller.acquire("b")
+        before = REJECTED.value(reason="client_limit")
+        with pytest.raises(Busy) as excinfo:
+            await controller.acquire("a")
+        assert excinfo.value.reason == "client_limit"
+        assert excinfo.value.retry_after >= controller.settings.min_retry_after
+        assert REJECTED.value(reason="client_limit") == before + 1
+        controller.release("a", started)
+        assert controller.per_client == {"b": 1}
+        await controller.acquire("a")
+
+    async def test_check_takes_no_slot(self):
+        """check() refuses what acquire() would, without holding anything"""
+        controller = AdmissionController(AdmissionSettings(max_inflight_per_client=1))
+        controller.check("a")
+        assert (controller.inflight, controller.per_client) == (0, {})
+        await controller.acquire("a")
+        with pytest.raises(Busy) as excinfo:
+            controller.check("a")
+        assert excinfo.value.reason == "client_limit"
+        controller.check("b")
+
+    async def test_queued_request_gets_released_slot(self):
+        """Once all slots are taken, the next request waits for one to be released"""
+        controller = AdmissionController(AdmissionSettings(max_inflight=1))
+        started = await controller.acquire("a")
+        waiter = asyncio.create_task(controller.acquire("b"))
+        await asyncio.sleep(0)
+        assert controller.queued == 1
+        assert not waiter.done()
+        controller.release("a", started)
+        await asyncio.wait_for(waiter, 1)
+        assert controller.inflight == 1
+        assert controller.queued == 0
+        assert controller.per_client == {"b": 1}
+
+    async def test_shed_when_deadline_cannot_be_met(self):
+        """Requests expected to wait past the deadline are refused immediately"""
+        controller = AdmissionController(AdmissionSettings(max_inflight=1, deadline=1.0))
+        await controller.acquire("a")
+        controller.service_time = 2.0
+        with pytest.raises(Busy) as excinfo:
+            await controller.acquire("b")
+        assert excinfo.value.reason == "deadline"
+        assert excinfo.value.retry_after == 2.0
+        assert controller.queued == 0
+        assert "b" not in controller.per_client
+
+    async def test_queue_wait_times_out(self):
+        """A queued request gives up once its deadline passes"""
+        controller = AdmissionController(AdmissionSettings(max_inflight=1, deadline=0.05))
+        await controller.acquire("a")
+        with pytest.raises(Busy) as excinfo:
+            await controller.acquire("b")
+        assert excinfo.value.reason == "deadline"
+        assert controller.queued == 0
+        assert controller.inflight == 1
+
+    async def test_queue_full(self):
+        """Requests beyond the queue bound are refused"""
+        controller = AdmissionController(AdmissionSettings(max_inflight=1, max_queue=1))
+        await controller.acquire("a")
+        waiter = asyncio.create_task(controller.acquire("b"))
+        await asyncio.sleep(0)
+        with pytest.raises(Busy) as excinfo:
+            await controller.acquire("c")
+        assert excinfo.value.reason == "queue_full"
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        assert controller.queued == 0
+
+    async def test_guard_replies_busy(self):
+        """Guarded handlers send a busy frame instead of running when refused"""
+        controller = AdmissionController(AdmissionSettings(max_inflight_per_client=1))
+        calls = []
+        sent = []
+
+        async def send(message):
+            sent.append(json.loads(message))
+
+        @controller.guard
+        async def handler(message, client_id, send):
+            calls.append(message.content)
+            await asyncio.sleep(0.01)
+
+        first = asyncio.create_task(handler(ChatMessage(content="one"), "a", send))
+        await asyncio.sleep(0)
+        await handler(ChatMessage(content="two", request_id="r2"), "a", send)
+        await first
+        assert calls == ["one"]
+        assert sent == [{"type": "busy", "retry_after": 0.5, "request_id": "r2"}]
+        assert controller.inflight == 0
+        assert controller.service_time > 0
+
+    async def test_connection_gate(self):
+        """Handshakes are refused with 503 at capacity, but /metrics is still served"""
+        controller = AdmissionController(AdmissionSettings(max_connections=2))
+        connections = 1
+
+        async def metrics(path, headers):
+            return (200, [], b"metrics") if path == "/metrics" else None
+
+        gate = controller.connection_gate(lambda: connections, metrics)
+        assert await gate("/client", {}) is None
+        connections = 2
+        status, headers, body = await gate("/client", {})
+        assert status == 503
+        assert dict(headers)["Retry-After"] == "1"
+        assert await gate("/metrics", {}) == (200, [], b"metrics")
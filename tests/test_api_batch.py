@@ -0,0 +1,129 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import pytest
+import pytest_asyncio
+from aiohttp import web
+
+# Add parent directory to path to allow importing from the project root
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from api_batch import BatchSettings, parse_requests
+from protocol import ApiBatch, ProtocolError, decode
+
+@pytest_asyncio.fixture
+async def upstream():
+    """Local HTTP server whose /delay endpoint answers after ?s= seconds and tracks concurrency"""
+    state = {"active": 0, "peak": 0}
+
+    async def delay(request):
+        state["active"] += 1
+        state["peak"] = max(state["peak"], state["active"])
+        try:
+            await asyncio.sleep(float(request.query.get("s", "0")))
+        finally:
+            state["active"] -= 1
+        return web.json_response({"slept": float(request.query.get("s", "0"))})
+
+    app = web.Application()
+    app.router.add_get("/delay", delay)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    yield f"http://127.0.0.1:{port}", state
+    await runner.cleanup()
+
+@pytest_asyncio.fixture
+async def server():
+    import websocket_server
+    yield websocket_server
+    if websocket_server.manager.http_session is not None:
+        await websocket_server.manager.http_session.close()
+        websocket_server.manager.http_session = None
+
+async def send_batch(server, **batch):
+    frames = []
+
+    async def send(message):
+        frames.append(json.loads(message))
+
+    await server.handle_frame(json.dumps({"type": "api_batch", **batch}), "batch-client", send)
+    return frames
+
+def delayed(url, seconds, **extra):
+    return {"endpoint": f"{url}/delay", "params": {"s": str(seconds)}, **extra}
+
+class TestBatchValidation:
+    """Tests for api_batch validation and limits"""
+
+    def test_limits(self):
+        """Clients may lower the concurrency and timeout but not raise them"""
+        settings = BatchSettings(concurrency=4, timeout=10)
+        assert settings.limits(ApiBatch(requests=[], concurrency=2, timeout=1)) == (2, 1)
+        assert settings.limits(ApiBatch(requests=[], concurrency=50, timeout=60)) == (4, 10)
+        assert settings.limits(ApiBatch(requests=[])) == (4, 10)
+
+    @pytest.mark.parametrize("batch, error", [
+        ({"requests": []}, "no requests"),
+        ({"requests": [{"endpoint": "x"}] * 3}, "the limit is 2"),
+        ({"requests": [{"endpoint": "x"}], "mode": "both"}, "Invalid value for 'mode'"),
+        ({"requests": [{"endpoint": "x"}, {"method": "GET"}]}, "requests[1]: Missing required field 'endpoint'"),
+        ({"requests": [{"endpoint": "x", "stream": True}]}, "streaming is not supported"),
+    ])
+    def test_invalid_batches(self, batch, error):
+        message = decode(json.dumps({"type": "api_batch", **batch}))
+        with pytest.raises(ProtocolError, match=error.replace("[", r"\[").replace("]", r"\]")):
+            parse_requests(message, BatchSettings(max_requests=2))
+
+@pytest.mark.asyncio
+class TestApiBatch:
+    """Tests for api_batch handling in websocket_server"""
+
+    async def test_streams_results_as_they_complete(self, upstream, server):
+        """Results arrive in completion order tagged with their index, then a summary"""
+        url, _ = upstream
+        frames = await send_batch(server, request_id="b1", requests=[
+            delayed(url, 0.3, request_id="slow"), delayed(url, 0), delayed(url, 0.1)])
+        assert [frame["type"] for frame in frames] == ["api_batch_item"] * 3 + ["api_batch_end"]
+        assert [frame["index"] for frame in frames[:3]] == [1, 2, 0]
+        assert all(frame["request_id"] == "b1" for frame in frames)
+        slow = frames[2]["response"]
+        assert slow["status"] == 200 and slow["data"] == {"slept": 0.3} and slow["request_id"] == "slow"
+        assert frames[3]["count"] == 3 and frames[3]["ok"] == 3
+
+    async def test_aggregate_in_request_order(self, upstream, server):
+        url, _ = upstream
+        frames = await send_batch(server, mode="aggregate", requests=[delayed(url, 0.2), delayed(url, 0)])
+        assert len(frames) == 1 and frames[0]["type"] == "api_batch_response"
+        assert [result["index"] for result in frames[0]["results"]] == [0, 1]
+        assert [result["data"]["slept"] for result in frames[0]["results"]] == [0.2, 0]
+
+    async def test_runs_concurrently_within_limit(self, upstream, server):
+        """Requests overlap, but never more than the concurrency limit at once"""
+        url, state = upstream
+        started = time.perf_counter()
+        frames = await send_batch(server, mode="aggregate", concurrency=3,
+                                  requests=[delayed(url, 0.2) for _ in range(9)])
+        elapsed = time.perf_counter() - started
+        assert frames[0]["ok"] == 9
+        assert state["peak"] == 3
+        assert elapsed < 9 * 0.2 * 0.6
+
+    async def test_timeouts_and_failures_are_per_request(self, upstream, server):
+        """A slow or failing request does not hold up or fail the others"""
+        url, _ = upstream
+        frames = await send_batch(server, mode="aggregate", timeout=0.2, requests=[
+            delayed(url, 2), delayed(url, 0), {"endpoint": "http://127.0.0.1:9/unreachable"}])
+        timed_out, ok, failed = frames[0]["results"]
+        assert timed_out["status"] == 504 and "Timed out after 0.2s" in timed_out["data"]["error"]
+        assert ok["status"] == 200
+        assert failed["status"] == 500 and "Error forwarding API request" in failed["data"]["error"]
+        assert (frames[0]["ok"], frames[0]["timeout"], frames[0]["error"]) == (1, 1, 1)
+
+    async def test_invalid_batch_gets_error_frame(self, server):
+        frames = await send_batch(server, requests=[{"endpoint": "x", "stream": True}])
+        assert frames == [{"type": "error", "content": "requests[0]: streaming is not supported in api_batch"}]
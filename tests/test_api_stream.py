@@ -0,0 +1,188 @@
+import os
+import sys
+import json
+import base64
+import asyncio
+import tracemalloc
+import pytest
+import pytest_asyncio
+from aiohttp import web
+
+# Add parent directory to path to allow importing from the project root
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from api_stream import StreamSettings, is_text
+from protocol import ApiRequest, decode
+
+BIG = 4 * 1024 * 1024
+
+@pytest_asyncio.fixture
+async def upstream():
+    """Local HTTP server with large, binary and multi-byte bodies"""
+    async def big(request):
+        response = web.StreamResponse(headers={"Content-Type": "application/json"})
+        await response.prepare(request)
+        await response.write(b"[")
+        line = json.dumps({"id": 0, "name": "x" * 100}).encode()
+        for i in range(BIG // 1024):
+            await response.write((b"," if i else b"") + line.ljust(1023))
+        await response.write(b"]")
+        return response
+
+    async def binary(request):
+        return web.Response(body=bytes(range(256)) * 10, content_type="application/octet-stream")
+
+    async def text(request):
+        return web.Response(text="héllo wörld ✓" * 50, content_type="text/plain", charset="utf-8")
+
+    async def empty(request):
+        return web.Response(status=204)
+
+    app = web.Application()
+    for path, handler in (("/big", big), ("/binary", binary), ("/text", text), ("/empty", empty)):
+        app.router.add_get(path, handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    yield f"http://127.0.0.1:{port}"
+    await runner.cleanup()
+
+@pytest_asyncio.fixture
+async def manager():
+    import websocket_server
+    manager = websocket_server.ConnectionManager()
+    yield manager
+    if manager.http_session is not None:
+        await manager.http_session.close()
+
+async def forward(manager, url, **kwargs):
+    frames = []
+
+    async def send(message):
+        frames.append(json.loads(message))
+
+    await manager.forward_api_request(ApiRequest(endpoint=url, stream=True, request_id="r1", **kwargs),
+                                      "client", send)
+    return frames
+
+class TestStreamSettings:
+    """Tests for stream settings helpers"""
+
+    def test_cap(self):
+        """The client may lower the byte cap but not raise it"""
+        settings = StreamSettings(max_bytes=1000)
+        assert settings.cap() == 1000
+        assert settings.cap(10) == 10
+        assert settings.cap(5000) == 1000
+        assert StreamSettings(max_bytes=0).cap(5000) == 5000
+
+    def test_from_env(self, monkeypatch):
+        monkeypatch.setenv("API_STREAM_CHUNK_BYTES", "1024")
+        assert StreamSettings.from_env("API_STREAM").chunk_bytes == 1024
+
+    @pytest.mark.parametrize("content_type, expected", [
+        ("application/json; charset=utf-8", True),
+        ("text/html", True),
+        ("application/problem+json", True),
+        ("image/png", False),
+        (None, False),
+    ])
+    def test_is_text(self, content_type, expected):
+        assert is_text(content_type) is expected
+
+    def test_protocol_fields(self):
+        """stream and max_bytes are optional api_request fields"""
+        message = decode(json.dumps({"type": "api_request", "endpoint": "x", "stream": True, "max_bytes": 10}))
+        assert message.stream is True and message.max_bytes == 10
+        assert decode(json.dumps({"type": "api_request", "endpoint": "x"})).stream is False
+
+@pytest.mark.asyncio
+class TestStreamedApiRequest:
+    """Tests for api_request with "stream": true"""
+
+    async def test_large_body_in_sequenced_chunks(self, upstream, manager):
+        """A large body arrives as bounded, numbered chunks that reassemble to the original"""
+        frames = await forward(manager, f"{upstream}/big")
+        chunks, end = frames[:-1], frames[-1]
+        assert {frame["type"] for frame in chunks} == {"api_response_chunk"}
+        assert [frame["seq"] for frame in chunks] == list(range(len(chunks)))
+        assert all(frame["request_id"] == "r1" for frame in frames)
+        assert chunks[0]["status"] == 200 and "headers" in chunks[0] and "headers" not in chunks[1]
+        assert max(len(frame["data"]) for frame in chunks) <= 64 * 1024
+        body = "".join(frame["data"] for frame in chunks)
+        assert len(json.loads(body)) == BIG // 1024
+        assert end == {"type": "api_response_end", "chunks": len(chunks), "bytes": len(body.encode()),
+                       "truncated": False, "request_id": "r1"}
+
+    async def test_byte_cap_truncates(self, upstream, manager):
+        """Relaying stops at the client's byte cap"""
+        frames = await forward(manager, f"{upstream}/big", max_bytes=100000)
+        end = frames[-1]
+        assert end["truncated"] is True and end["bytes"] == 100000
+        assert len("".join(frame["data"] for frame in frames[:-1])) == 100000
+        # The pooled session still works after abandoning a body
+        assert (await forward(manager, f"{upstream}/text"))[-1]["truncated"] is False
+
+    async def test_binary_body_is_base64(self, upstream, manager):
+        frames = await forward(manager, f"{upstream}/binary")
+        assert all(frame["encoding"] == "base64" for frame in frames[:-1])
+        assert b"".join(base64.b64decode(frame["data"]) for frame in frames[:-1]) == bytes(range(256)) * 10
+
+    async def test_multibyte_characters_not_split(self, upstream, manager, monkeypatch):
+        """Text is decoded incrementally, so chunk boundaries inside a character are harmless"""
+        import websocket_server
+        monkeypatch.setattr(websocket_server, "stream_settings", StreamSettings(chunk_bytes=7))
+        frames = await forward(manager, f"{upstream}/text")
+        assert len(frames) > 10
+        assert "".join(frame["data"] for frame in frames[:-1]) == "héllo wörld ✓" * 50
+
+    async def test_no_empty_chunks(self, upstream, manager, monkeypatch):
+        """Blocks that end mid-character aren't sent as empty chunks"""
+        import websocket_server
+        monkeypatch.setattr(websocket_server, "stream_settings", StreamSettings(chunk_bytes=1))
+        frames = await forward(manager, f"{upstream}/text")
+        chunks = frames[:-1]
+        assert all(frame["data"] for frame in chunks)
+        assert [frame["seq"] for frame in chunks] == list(range(len(chunks)))
+        assert frames[-1]["chunks"] == len(chunks)
+        assert "".join(frame["data"] for frame in chunks) == "héllo wörld ✓" * 50
+
+    async def test_slow_client_is_not_a_slow_upstream(self, upstream, manager, monkeypatch):
+        """The breaker times the upstream reads, not the sends to the client"""
+        import websocket_server
+        from circuit_breaker import BreakerRegistry, BreakerSettings
+        registry = BreakerRegistry(BreakerSettings(slow_call_seconds=0.2))
+        monkeypatch.setattr(websocket_server, "breakers", registry)
+
+        async def send(message):
+            await asyncio.sleep(0.2)
+
+        await manager.forward_api_request(ApiRequest(endpoint=f"{upstream}/text", stream=True), "client", send)
+        breaker = registry.get(upstream)
+        assert len(breaker.calls) == 1 and breaker.slow == 0
+
+    async def test_empty_body(self, upstream, manager):
+        """An empty body still reports status and headers"""
+        frames = await forward(manager, f"{upstream}/empty")
+        assert frames[0]["status"] == 204 and frames[0]["data"] == ""
+        assert frames[1]["type"] == "api_response_end" and frames[1]["bytes"] == 0
+
+    async def test_memory_stays_bounded(self, upstream, manager):
+        """Peak allocation while streaming is far below the response size"""
+        await forward(manager, f"{upstream}/text")  # warm up the session
+        sent = 0
+
+        async def send(message):
+            nonlocal sent
+            sent += len(message)
+
+        tracemalloc.start()
+        try:
+            await manager.forward_api_request(ApiRequest(endpoint=f"{upstream}/big", stream=True), "client", send)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        assert sent > BIG
+        assert peak < BIG / 4
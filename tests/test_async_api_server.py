@@ -0,0 +1,110 @@
+import os
+import sys
+import json
+import asyncio
+import pytest
+import httpx
+from unittest.mock import AsyncMock, MagicMock, patch
+
+# Add parent directory to path to allow importing from the project root
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from admission import Busy
+
+def make_async_chat_session(text="This is a mock response from the Gemini API."):
+    session = MagicMock()
+    response = MagicMock()
+    response.text = text
+    session.send_message_async = AsyncMock(return_value=response)
+    return session
+
+@pytest.fixture
+def server(mock_gemini_api):
+    """The async API server module, with an empty session store"""
+    import async_api_server
+    with patch.object(async_api_server, "chat_sessions", {}):
+        yield async_api_server
+
+async def post(server, body):
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        return await client.post("/api/chat", content=body if isinstance(body, (str, bytes)) else json.dumps(body))
+
+@pytest.mark.asyncio
+class TestAsyncApiServer:
+    """Tests for the async /api/chat endpoint"""
+
+    async def test_chat(self, server):
+        """Answers with the same body as the Flask server"""
+        session = make_async_chat_session()
+        with patch.object(server.gemini_api, "chat_session", return_value=session):
+            response = await post(server, {"client_id": "c1", "message": "Hello"})
+        assert response.status_code == 200
+        assert response.json() == {"response": "This is a mock response from the Gemini API.", "client_id": "c1"}
+        session.send_message_async.assert_awaited_once_with("Hello")
+
+    async def test_session_kept_per_client(self, server):
+        """A client's later messages continue its chat session"""
+        session = make_async_chat_session()
+        chat_session = MagicMock(return_value=session)
+        with patch.object(server.gemini_api, "chat_session", chat_session):
+            await post(server, {"client_id": "c1", "message": "First"})
+            await post(server, {"client_id": "c1", "message": "Second"})
+        assert chat_session.call_count == 1
+        assert session.send_message_async.await_count == 2
+
+    async def test_one_call_per_session_at_a_time(self, server):
+        """Concurrent messages from one client reach its session one after another"""
+        active = []
+        overlapped = False
+
+        async def send_message_async(message):
+            nonlocal overlapped
+            overlapped |= bool(active)
+            active.append(message)
+            await asyncio.sleep(0.01)
+            active.remove(message)
+            return MagicMock(text=message)
+
+        session = MagicMock()
+        session.send_message_async = send_message_async
+        server.chat_sessions["c1"] = session
+        responses = await asyncio.gather(*(post(server, {"client_id": "c1", "message": f"m{i}"}) for i in range(2)))
+        assert [r.status_code for r in responses] == [200, 200]
+        assert not overlapped
+
+    async def test_invalid_requests(self, server):
+        """Empty bodies, bad JSON and missing messages are refused with 400"""
+        for body in ("", "not json", {"client_id": "c1"}, {"client_id": "c1", "message": ""}):
+            response = await post(server, body)
+            assert response.status_code == 400
+            assert "error" in response.json()
+
+    async def test_gemini_error(self, server):
+        """A failing Gemini call is answered with 500 and the error"""
+        session = make_async_chat_session()
+        session.send_message_async.side_effect = RuntimeError("quota exceeded")
+        server.chat_sessions["c1"] = session
+        response = await post(server, {"client_id": "c1", "message": "Hello"})
+        assert response.status_code == 500
+        assert response.json() == {"error": "quota exceeded"}
+
+    async def test_busy(self, server):
+        """Requests past admission limits get 503 with Retry-After"""
+        with patch.object(server.admission, "acquire", AsyncMock(side_effect=Busy(0.2, "queue_full"))):
+            response = await post(server, {"client_id": "c1", "message": "Hello"})
+        assert response.status_code == 503
+        assert response.headers["retry-after"] == "1"
+
+class TestServerSettings:
+    """Tests for the async server's settings"""
+
+    def test_from_env(self, monkeypatch, mock_gemini_api):
+        """Host, port and workers are read from the environment"""
+        from async_api_server import ServerSettings
+        monkeypatch.setenv("ASYNC_API_PORT", "5050")
+        monkeypatch.setenv("ASYNC_API_WORKERS", "3")
+        settings = ServerSettings.from_env()
+        assert (settings.host, settings.port, settings.workers) == ("0.0.0.0", 5050, 3)
+        # Sessions are per worker, so more than one is opt-in
+        assert ServerSettings().workers == 1
@@ -0,0 +1,215 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import pytest
+import pytest_asyncio
+from aiohttp import web
+
+# Add parent directory to path to allow importing from the project root
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import circuit_breaker
+from circuit_breaker import (CLOSED, HALF_OPEN, OPEN, BREAKER_REJECTED, BREAKER_STATE, BREAKER_TRANSITIONS,
+                             BreakerRegistry, BreakerSettings, CircuitBreaker, CircuitOpen)
+from protocol import ApiRequest
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(circuit_breaker.time, "monotonic", clock)
+    return clock
+
+SETTINGS = BreakerSettings(window=10, min_calls=4, failure_rate=0.5, slow_call_seconds=1,
+                           slow_call_rate=0.75, open_seconds=5, half_open_calls=2)
+
+def calls(breaker, outcomes, duration=0.01):
+    for ok in outcomes:
+        breaker.acquire()
+        breaker.record(ok, duration)
+
+class TestCircuitBreaker:
+    """Tests for the breaker state machine"""
+
+    def test_opens_on_error_rate(self, clock):
+        breaker = CircuitBreaker("api.example.com", SETTINGS)
+        calls(breaker, [True, False, True])
+        assert breaker.state == CLOSED  # below min_calls
+        calls(breaker, [False])
+        assert breaker.state == OPEN
+        assert BREAKER_STATE.value(host="api.example.com") == 1
+        with pytest.raises(CircuitOpen) as error:
+            breaker.acquire()
+        assert error.value.retry_after == 5
+
+    def test_opens_on_slow_calls(self, clock):
+        breaker = CircuitBreaker("slow.example.com", SETTINGS)
+        calls(breaker, [True] * 2, duration=2)
+        calls(breaker, [True] * 2, duration=0.1)
+        assert breaker.state == CLOSED  # half the calls were slow
+        calls(breaker, [True] * 3, duration=2)
+        assert breaker.state == CLOSED  # 5 of 7
+        calls(breaker, [True], duration=2)
+        assert breaker.state == OPEN
+
+    def test_old_calls_leave_the_window(self, clock):
+        breaker = CircuitBreaker("window.example.com", SETTINGS)
+        calls(breaker, [False, False, True])
+        clock.now += 11
+        calls(breaker, [True, False, True, True])
+        assert breaker.state == CLOSED
+        assert breaker.snapshot()["failure_rate"] == 0.25
+
+    def test_half_open_probes(self, clock):
+        """After open_seconds a limited number of probes decide whether to close"""
+        breaker = CircuitBreaker("probe.example.com", SETTINGS)
+        calls(breaker, [False] * 4)
+        clock.now += 5
+        breaker.acquire()
+        assert breaker.state == HALF_OPEN
+        breaker.acquire()
+        with pytest.raises(CircuitOpen):
+            breaker.acquire()  # both probe slots taken
+        breaker.record(True, 0.1)
+        breaker.record(True, 0.1)
+        assert breaker.state == CLOSED
+
+    def test_failed_probe_reopens(self, clock):
+        breaker = CircuitBreaker("reopen.example.com", SETTINGS)
+        calls(breaker, [False] * 4)
+        clock.now += 5
+        breaker.acquire()
+        breaker.record(False, 0.1)
+        assert breaker.state == OPEN and breaker.retry_after() == 5
+
+    def test_guard(self, clock):
+        """guard() records exceptions and failed responses, and releases cancelled probes"""
+        breaker = CircuitBreaker("guard.example.com", SETTINGS)
+        with pytest.raises(ValueError):
+            with breaker.guard():
+                raise ValueError("boom")
+        with breaker.guard() as call:
+            call.ok = False
+        assert breaker.snapshot()["calls"] == 2 and breaker.snapshot()["failure_rate"] == 1.0
+        calls(breaker, [False] * 2)
+        clock.now += 5
+        with pytest.raises(asyncio.CancelledError):
+            with breaker.guard():
+                raise asyncio.CancelledError()
+        assert breaker.state == HALF_OPEN and breaker.probes == 0
+
+    def test_registry_keys_by_host(self):
+        registry = BreakerRegistry(BreakerSettings(max_hosts=2))
+        assert registry.get("https://A.example.com/x") is registry.get("https://a.example.com/y?z=1")
+        assert registry.get("http://a.example.com:8080/") is not registry.get("https://a.example.com/")
+        registry.get("https://c.example.com/")
+        # The least recently used breaker was dropped
+        assert list(registry.breakers) == ["a.example.com", "c.example.com"]
+
+    def test_eviction_drops_host_series(self, clock):
+        registry = BreakerRegistry(BreakerSettings(**{**vars(SETTINGS), "max_hosts": 1}))
+        breaker = registry.get("https://gone.example.com/")
+        calls(breaker, [False] * 4)
+        with pytest.raises(CircuitOpen):
+            breaker.acquire()
+        clock.now += 5
+        calls(breaker, [True] * 2)
+        assert breaker.state == CLOSED
+        registry.get("https://next.example.com/")
+        assert list(registry.breakers) == ["next.example.com"]
+        for metric in (BREAKER_STATE, BREAKER_TRANSITIONS, BREAKER_REJECTED):
+            assert not any('host="gone.example.com"' in line for line in metric.samples())
+
+@pytest_asyncio.fixture
+async def upstream():
+    """Local HTTP server with failing and hanging endpoints"""
+    hits = {"fail": 0, "hang": 0}
+
+    async def fail(request):
+        hits["fail"] += 1
+        return web.json_response({"error": "down"}, status=502)
+
+    async def hang(request):
+        hits["hang"] += 1
+        await asyncio.sleep(float(request.query.get("s", "10")))
+        return web.json_response({})
+
+    app = web.Application()
+    app.router.add_get("/fail", fail)
+    app.router.add_get("/hang", hang)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    yield f"http://127.0.0.1:{port}", hits
+    await runner.cleanup()
+
+@pytest_asyncio.fixture
+async def server(monkeypatch):
+    import websocket_server
+    monkeypatch.setattr(websocket_server, "breakers", BreakerRegistry(SETTINGS))
+    manager = websocket_server.ConnectionManager()
+    yield websocket_server, manager
+    if manager.http_session is not None:
+        await manager.http_session.close()
+
+async def forward(manager, **request):
+    frames = []
+
+    async def send(message):
+        frames.append(json.loads(message))
+
+    await manager.forward_api_request(ApiRequest(**request), "client", send)
+    return frames[-1]
+
+@pytest.mark.asyncio
+class TestForwardedRequestBreakers:
+    """Tests for circuit breakers and deadlines in forward_api_request"""
+
+    async def test_failing_host_fails_fast(self, upstream, server):
+        url, hits = upstream
+        module, manager = server
+        for _ in range(4):
+            assert (await forward(manager, endpoint=f"{url}/fail"))["status"] == 502
+        started = time.perf_counter()
+        refused = await forward(manager, endpoint=f"{url}/fail", request_id="r9")
+        assert time.perf_counter() - started < 0.05
+        assert refused["status"] == 503 and refused["request_id"] == "r9"
+        assert "Circuit open" in refused["data"]["error"] and refused["retry_after"] > 0
+        assert hits["fail"] == 4
+        # Streamed requests are refused too
+        streamed = await forward(manager, endpoint=f"{url}/fail", stream=True)
+        assert streamed["status"] == 503
+        # Breaker state is exposed
+        host = url.split("//")[1]
+        assert module.read_breakers()[host]["state"] == "open"
+
+    async def test_deadline_from_message(self, upstream, server):
+        """A request's timeout bounds the whole upstream call and counts as a failure"""
+        url, hits = upstream
+        _, manager = server
+        started = time.perf_counter()
+        # The upstream answers soon after the deadline, so teardown doesn't wait on it
+        frame = await forward(manager, endpoint=f"{url}/hang", params={"s": "0.5"}, timeout=0.2,
+                              request_id="r1")
+        assert time.perf_counter() - started < 2
+        assert frame["status"] == 500 and "Timeout" in frame["data"]["error"]
+        # Failed requests can be correlated like any other reply
+        assert frame["request_id"] == "r1"
+        from websocket_server import breakers
+        assert breakers.get(url).snapshot()["failure_rate"] == 1.0
+
+    async def test_timeout_kwarg_only_when_asked(self, server):
+        _, manager = server
+        assert "timeout" not in manager.request_kwargs(ApiRequest(endpoint="http://x"), "client")
+        kwargs = manager.request_kwargs(ApiRequest(endpoint="http://x", timeout=2), "client")
+        assert kwargs["timeout"].total == 2
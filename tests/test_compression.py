@@ -0,0 +1,74 @@
+import os
+import sys
+import pytest
+from websockets.extensions.permessage_deflate import PerMessageDeflate
+from websockets.frames import Frame, Opcode
+
+# Add parent directory to path to allow importing from the project root
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from compression import CompressionSettings, ThresholdPerMessageDeflate, ThresholdPerMessageDeflateFactory
+
+def make_pair(min_size):
+    """Server-side threshold extension and the matching client-side decoder"""
+    server = ThresholdPerMessageDeflate(False, False, 15, 12, {"memLevel": 5}, min_size=min_size)
+    client = PerMessageDeflate(False, False, 12, 15)
+    return server, client
+
+class TestThresholdCompression:
+    """Tests for permessage-deflate with a minimum frame size"""
+    
+    def test_small_frames_not_compressed(self):
+        """Frames below the threshold are sent as-is"""
+        server, client = make_pair(min_size=512)
+        frame = server.encode(Frame(Opcode.TEXT, b'{"type": "pong"}'))
+        assert not frame.rsv1
+        assert client.decode(frame).data == b'{"type": "pong"}'
+    
+    def test_large_frames_compressed(self):
+        """Frames above the threshold are compressed and decode correctly"""
+        server, client = make_pair(min_size=512)
+        data = b'{"type": "response", "content": "' + b"hello world " * 200 + b'"}'
+        frame = server.encode(Frame(Opcode.TEXT, data))
+        assert frame.rsv1
+        assert len(frame.data) < len(data)
+        assert client.decode(frame).data == data
+    
+    def test_mixed_frames_keep_context(self):
+        """Skipping small frames does not desynchronise context takeover"""
+        server, client = make_pair(min_size=100)
+        messages = [b"x" * 1000, b"small", b"y" * 1000 + b"x" * 1000, b"tiny", b"x" * 2000]
+        for data in messages:
+            assert client.decode(server.encode(Frame(Opcode.TEXT, data))).data == data
+    
+    def test_control_frames_untouched(self):
+        """Control frames are never compressed"""
+        server, _ = make_pair(min_size=0)
+        frame = Frame(Opcode.PING, b"x" * 100)
+        assert server.encode(frame) is frame
+
+class TestCompressionSettings:
+    """Tests for per-server compression settings"""
+    
+    def test_disabled(self):
+        """Disabling compression offers no extensions"""
+        settings = CompressionSettings(enabled=False)
+        assert settings.serve_kwargs() == {"compression": None, "extensions": []}
+    
+    def test_enabled_extensions(self):
+        """Enabled settings offer the threshold extension factory"""
+        settings = CompressionSettings(window_bits=10, mem_level=4, min_size=64)
+        [factory] = settings.serve_kwargs()["extensions"]
+        assert isinstance(factory, ThresholdPerMessageDeflateFactory)
+        assert factory.server_max_window_bits == 10
+        assert factory.compress_settings["memLevel"] == 4
+        assert factory.min_size == 64
+    
+    def test_from_env(self, monkeypatch):
+        """Settings can be overridden from the environment"""
+        monkeypatch.setenv("TEST_WS_COMPRESSION", "off")
+        monkeypatch.setenv("TEST_WS_COMPRESSION_MIN_SIZE", "2048")
+        settings = CompressionSettings.from_env("TEST_WS_COMPRESSION", window_bits=11)
+        assert settings.enabled is False
+        assert settings.min_size == 2048
+        assert settings.window_bits == 11
@@ -0,0 +1,119 @@
+import os
+import sys
+import json
+import pytest
+
+# Add parent directory to path to allow importing from the project root
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from connection import Connection, ConnectionTable
+
+# Bytes one idle connection's record may take (see bench_connection_memory.py
+# for the whole server's budget per connection)
+RECORD_BUDGET = 128
+
+class FakeWebSocket:
+    def __init__(self):
+        self.sent = []
+
+    async def send(self, message):
+        self.sent.append(json.loads(message))
+
+class TestConnection:
+    """Tests for the compact per-connection record"""
+
+    def test_record_is_compact(self):
+        """Records have no per-instance dict and stay within budget"""
+        conn = Connection("client", FakeWebSocket())
+        assert not hasattr(conn, "__dict__")
+        assert sys.getsizeof(conn) <= RECORD_BUDGET
+        with pytest.raises(AttributeError):
+            conn.extra = 1
+
+    @pytest.mark.asyncio
+    async def test_send_counts_messages(self):
+        """Frames sent through the record are counted"""
+        ws = FakeWebSocket()
+        conn = Connection("client", ws)
+        await conn.send(json.dumps({"type": "pong"}))
+        assert ws.sent == [{"type": "pong"}]
+        assert conn.messages_out == 1
+
+class TestConnectionTable:
+    """Tests for the connection table and its mapping views"""
+
+    def test_views_share_one_record(self):
+        """Socket and session of a client live on the same record"""
+        table = ConnectionTable()
+        sockets, sessions = table.view("websocket"), table.view("session")
+        ws = FakeWebSocket()
+        conn = table.open("a", ws)
+        sessions["a"] = "session-a"
+        assert table.get("a") is conn
+        assert conn.session == "session-a"
+        assert sockets["a"] is ws
+        assert dict(sessions) == {"a": "session-a"}
+        assert list(sockets.values()) == [ws]
+        assert (len(sockets), len(sessions), len(table)) == (1, 1, 1)
+
+    def test_unset_field_reads_as_missing(self):
+        """A record without a session is not in the session view"""
+        table = ConnectionTable()
+        sessions = table.view("session")
+        table.open("a", FakeWebSocket())
+        assert "a" not in sessions
+        assert sessions.pop("a", None) is None
+        with pytest.raises(KeyError):
+            sessions["a"]
+        with pytest.raises(KeyError):
+            del sessions["a"]
+        assert "b" not in sessions
+
+    def test_record_dropped_once_empty(self):
+        """Deleting both the socket and the session removes the record"""
+        table = ConnectionTable()
+        sockets, sessions = table.view("websocket"), table.view("session")
+        table.open("a", FakeWebSocket())
+        sessions["a"] = "session-a"
+        del sessions["a"]
+        assert len(table) == 1
+        del sockets["a"]
+        assert len(table) == 0
+        assert (len(sockets), len(sessions)) == (0, 0)
+
+    def test_setting_a_field_creates_record(self):
+        """Code that writes a view directly still gets a record"""
+        table = ConnectionTable()
+        sessions = table.view("session")
+        sessions["a"] = "session-a"
+        assert table.get("a").websocket is None
+        assert len(sessions) == 1
+
+    def test_open_replaces_earlier_record(self):
+        """A reconnect with the same client ID starts from a fresh record"""
+        table = ConnectionTable()
+        sockets, sessions = table.view("websocket"), table.view("session")
+        first = table.open("a", FakeWebSocket())
+        sessions["a"] = "old session"
+        first.messages_in = 5
+        second = table.open("a", FakeWebSocket())
+        assert second is not first
+        assert second.messages_in == 0
+        assert "a" not in sessions
+        assert (len(sockets), len(sessions)) == (1, 0)
+
+    def test_counts_stay_consistent(self):
+        """View lengths match their contents through many changes"""
+        table = ConnectionTable()
+        sockets, sessions = table.view("websocket"), table.view("session")
+        for i in range(100):
+            table.open(f"c{i}", FakeWebSocket())
+            sessions[f"c{i}"] = i
+        for i in range(0, 100, 2):
+            sessions.pop(f"c{i}")
+            sockets.pop(f"c{i}")
+        for i in range(1, 100, 4):
+            sessions[f"c{i}"] = None
+        assert len(sockets) == len(list(sockets)) == 50
+        assert len(sessions) == len(list(sessions)) == 25
+        assert len(table) == 50
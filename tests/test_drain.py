@@ -0,0 +1,133 @@
+import os
+import sys
+import json
+import asyncio
+import pytest
+
+# Add parent directory to path to allow importing from the project root
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from drain import DRAINING, Drain
+from protocol import ChatMessage
+
+class FakeWebSocket:
+    def __init__(self):
+        self.sent = []
+        self.closed = None
+
+    async def send(self, message):
+        self.sent.append(json.loads(message))
+
+    async def close(self, code, reason):
+        self.closed = (code, reason)
+
+class TestDrain:
+    """Tests for draining a server before it stops"""
+
+    def test_from_env(self, monkeypatch):
+        """Deadline and admin token are read from the environment"""
+        monkeypatch.setenv("DRAIN_DEADLINE", "5")
+        monkeypatch.setenv("DRAIN_TOKEN", "secret")
+        drain = Drain.from_env(lambda: 0)
+        assert drain.deadline == 5.0
+        assert drain.authorized("secret")
+        assert not drain.authorized("wrong")
+        assert not drain.authorized(None)
+
+    def test_admin_endpoint_needs_token(self):
+        """The admin endpoint is hidden without a token and refuses a wrong one"""
+        started = []
+        start = lambda: started.append(1) or len(started) == 1
+        assert Drain(lambda: 0).admin_response("anything", start)[0] == 404
+        drain = Drain(lambda: 0, token="secret")
+        assert drain.admin_response("wrong", start)[0] == 403
+        assert drain.admin_response("secret", start) == (202, "Draining\n")
+        assert drain.admin_response("secret", start) == (202, "Already draining\n")
+
+    def test_drain_sync_waits_for_inflight(self):
+        """Threaded servers wait for in-flight requests before flushing"""
+        pending = [3]
+        flushed = []
+
+        def inflight():
+            pending[0] = max(0, pending[0] - 1)
+            return pending[0]
+
+        drain = Drain(inflight, deadline=5)
+        drain.on_flush(lambda: flushed.append(pending[0]))
+        drain.drain_sync()
+        assert drain.draining
+        assert flushed == [0]
+
+@pytest.mark.asyncio
+class TestAsyncDrain:
+    """Tests for draining the WebSocket servers"""
+
+    async def test_drain_waits_then_tells_clients_to_reconnect(self):
+        """In-flight work finishes, flush hooks run, then clients are sent reconnect and closed"""
+        inflight = [1]
+        events = []
+        ws = FakeWebSocket()
+        drain = Drain(lambda: inflight[0], lambda: [ws], deadline=5)
+
+        @drain.on_flush
+        async def flush():
+            events.append(("flush", inflight[0], ws.sent[:]))
+
+        assert drain.start()
+        assert not drain.start()
+        assert DRAINING.value() == 1
+        await asyncio.sleep(0.1)
+        assert not drain.stopped.is_set()
+        inflight[0] = 0
+        await asyncio.wait_for(drain.stopped.wait(), 1)
+        assert events == [("flush", 0, [])]
+        assert ws.sent == [{"type": "reconnect", "reason": "server draining"}]
+        assert ws.closed == (1012, "server draining")
+
+    async def test_deadline_bounds_the_wait(self):
+        """Requests still running at the deadline do not hold up the drain"""
+        ws = FakeWebSocket()
+        drain = Drain(lambda: 1, lambda: [ws], deadline=0.1)
+        await asyncio.wait_for(drain.drain(), 1)
+        assert drain.stopped.is_set()
+        assert ws.closed == (1012, "server draining")
+
+    async def test_guard_replies_reconnect_while_draining(self):
+        """Requests arriving during a drain are turned away with a reconnect frame"""
+        drain = Drain(lambda: 0)
+        calls = []
+        sent = []
+
+        async def send(message):
+            sent.append(json.loads(message))
+
+        @drain.guard
+        async def handler(message, client_id, send):
+            calls.append(message.content)
+
+        await handler(ChatMessage(content="before"), "a", send)
+        drain.begin()
+        await handler(ChatMessage(content="after", request_id="r1"), "a", send)
+        assert calls == ["before"]
+        assert sent == [{"type": "reconnect", "reason": "server draining", "request_id": "r1"}]
+
+    async def test_gate(self):
+        """The handshake hook serves the admin endpoint and refuses connections while draining"""
+        drain = Drain(lambda: 0, token="secret")
+
+        async def metrics(path, headers):
+            return (200, [], b"metrics") if path == "/metrics" else None
+
+        gate = drain.gate(metrics)
+        assert await gate("/client", {}) is None
+        status, headers, body = await gate("/admin/drain", {"X-Admin-Token": "wrong"})
+        assert status == 403
+        status, headers, body = await gate("/admin/drain", {"X-Admin-Token": "secret"})
+        assert status == 202
+        assert drain.draining
+        status, headers, body = await gate("/client", {})
+        assert status == 503
+        assert dict(headers)["Retry-After"] == "1"
+        assert await gate("/metrics", {}) == (200, [], b"metrics")
+        await asyncio.wait_for(drain.stopped.wait(), 1)
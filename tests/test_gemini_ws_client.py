@@ -0,0 +1,377 @@
+import os
+import sys
+import json
+import asyncio
+import pytest
+import pytest_asyncio
+import websockets
+
+# Add parent directory to path to allow importing from the project root
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from replay import ReplayBuffer, resume_failed_frame
+from gemini_ws_client import (ChatConnection, ChatError, ClientSettings, ConnectionLost, GeminiWSClient, ServerBusy,
+                              SyncGeminiWSClient)
+
+FAST_RECONNECT = ClientSettings(initial_delay=0.01, max_delay=0.05)
+
+class FakeServer:
+    """WebSocket server speaking the chat protocol; answers are echoes unless overridden"""
+
+    def __init__(self, echo_request_id=True, latency=0, replay=None):
+        self.echo_request_id = echo_request_id
+        self.latency = latency
+        # Answers kept for resumption, or None for a server that can't resume
+        self.replay = replay
+        self.connections = []
+        self.paths = []
+        self.received = []
+        self.server = None
+
+    async def start(self):
+        self.server = await websockets.serve(self.handler, "127.0.0.1", 0)
+        return f"ws://127.0.0.1:{self.server.sockets[0].getsockname()[1]}"
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def handler(self, websocket, path=None):
+        self.connections.append(websocket)
+        # websockets < 13 exposes the path on the connection, later versions on its request
+        path = path or getattr(websocket, "path", None) or websocket.request.path
+        self.paths.append(path)
+        await websocket.send(json.dumps({"type": "connected", "content": "Connected"}))
+        async for raw in websocket:
+            frame = json.loads(raw)
+            self.received.append(frame)
+            if frame["type"] == "message":
+                # Answered in order, one at a time, as the servers do
+                await self.answer(self.replier(websocket, path, frame), frame["content"])
+            elif frame["type"] == "resume":
+                if self.replay is None or not await self.replay.resume(path, frame["request_id"], frame["last_seq"],
+                                                                       websocket.send):
+                    await websocket.send(resume_failed_frame(frame["request_id"]))
+
+    def replier(self, websocket, path, request):
+        """send() for frames answering one request"""
+        stream = self.replay.open(path, request["request_id"], websocket.send) if self.replay else None
+
+        async def send(frame):
+            if self.echo_request_id:
+                frame["request_id"] = request["request_id"]
+            if stream is None or frame["type"] == "status":
+                await websocket.send(json.dumps(frame))
+            else:
+                await stream.send(json.dumps(frame), frame.get("seq"))
+        send.websocket = websocket
+        return send
+
+    async def answer(self, send, content):
+        await send({"type": "status", "content": "processing"})
+        await asyncio.sleep(self.latency)
+        await send({"type": "response", "content": f"echo: {content}"})
+
+@pytest_asyncio.fixture
+async def server():
+    fake = FakeServer()
+    fake.url = await fake.start()
+    yield fake
+    await fake.stop()
+
+async def wait_for(condition, timeout=2.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline, "condition not met in time"
+        await asyncio.sleep(0.01)
+
+@pytest.mark.asyncio
+class TestChatConnection:
+    """Tests for the persistent, reconnecting chat connection"""
+
+    async def test_prompts_share_one_connection(self, server):
+        """Every prompt is sent on the same connection, opened once"""
+        connection = ChatConnection(server.url, "client-1", FAST_RECONNECT)
+        connection.start()
+        try:
+            assert await connection.ask("one", timeout=2) == "echo: one"
+            assert await connection.ask("two", timeout=2) == "echo: two"
+            assert connection.state == "connected"
+        finally:
+            await connection.close()
+        assert len(server.connections) == 1
+        assert server.paths == ["/client-1"]
+        assert connection.state == "closed"
+
+    async def test_answers_server_pings(self, server):
+        """Heartbeat pings from the server are answered with pongs"""
+        connection = ChatConnection(server.url, "client-1", FAST_RECONNECT)
+        connection.start()
+        try:
+            await asyncio.wait_for(connection.connected.wait(), 2)
+            await server.connections[0].send(json.dumps({"type": "ping"}))
+            await wait_for(lambda: {"type": "pong"} in server.received)
+        finally:
+            await connection.close()
+
+    async def test_skips_malformed_frames(self, server):
+        """A frame that isn't a JSON object is skipped and the connection keeps working"""
+        async def garbled(send, content):
+            await send.websocket.send("not json")
+            await send.websocket.send("[1, 2]")
+            await send({"type": "response", "content": f"echo: {content}"})
+        server.answer = garbled
+        connection = ChatConnection(server.url, "client-1", FAST_RECONNECT)
+        connection.start()
+        try:
+            assert await connection.ask("hello", timeout=2) == "echo: hello"
+            assert await connection.ask("again", timeout=2) == "echo: again"
+            assert len(server.connections) == 1
+        finally:
+            await connection.close()
+
+    async def test_reconnects_after_drop(self, server):
+        """A dropped connection is reopened and the next prompt goes out on it"""
+        connection = ChatConnection(server.url, "client-1", FAST_RECONNECT)
+        connection.start()
+        try:
+            assert await connection.ask("before", timeout=2) == "echo: before"
+            await server.connections[0].close()
+            await wait_for(lambda: len(server.connections) == 2)
+            assert await connection.ask("after", timeout=2) == "echo: after"
+            assert connection.connects == 2
+        finally:
+            await connection.close()
+
+    async def test_keeps_retrying_until_server_is_up(self):
+        """Connection attempts continue with backoff while the server is down"""
+        fake = FakeServer()
+        url = await fake.start()
+        await fake.stop()
+        connection = ChatConnection(url, "client-1", FAST_RECONNECT)
+        connection.start()
+        try:
+            await asyncio.sleep(0.1)
+            assert connection.state == "connecting"
+            assert connection.last_error
+            with pytest.raises(asyncio.TimeoutError):
+                await connection.ask("hello", timeout=0.05)
+        finally:
+            await connection.close()
+
+    async def test_error_frame(self, server):
+        """An error frame fails the prompt"""
+        async def fail(send, content):
+            await send({"type": "error", "content": "quota exceeded"})
+        server.answer = fail
+        connection = ChatConnection(server.url, "client-1", FAST_RECONNECT)
+        connection.start()
+        try:
+            with pytest.raises(ChatError, match="quota exceeded"):
+                await connection.ask("hello", timeout=2)
+        finally:
+            await connection.close()
+
+    async def test_drop_before_answer(self, server):
+        """A prompt whose connection drops mid-answer fails with ConnectionLost if the server can't resume it"""
+        async def drop(send, content):
+            await send({"type": "status", "content": "processing"})
+            await send.websocket.close()
+        server.answer = drop
+        connection = ChatConnection(server.url, "client-1", FAST_RECONNECT)
+        connection.start()
+        try:
+            with pytest.raises(ConnectionLost):
+                await connection.ask("hello", timeout=2)
+        finally:
+            await connection.close()
+
+    async def test_pipelined_prompts(self, server):
+        """Prompts go out without waiting for earlier answers, and each gets its own answer"""
+        server.latency = 0.05
+        connection = ChatConnection(server.url, "client-1", FAST_RECONNECT)
+        connection.start()
+        try:
+            responses = [await connection.send(f"m{i}") for i in range(3)]
+            # All three were sent before the first answer arrived
+            assert not any(response.done for response in responses)
+            assert len(connection.pending) == 3
+            assert [await response for response in responses] == ["echo: m0", "echo: m1", "echo: m2"]
+            assert len({response.request_id for response in responses}) == 3
+            assert not connection.pending
+        finally:
+            await connection.close()
+
+    async def test_answers_without_request_id(self):
+        """Frames without a request_id go to the oldest pending request, skipping abandoned answers"""
+        fake = FakeServer(echo_request_id=False, latency=0.05)
+        url = await fake.start()
+        connection = ChatConnection(url, "client-1", FAST_RECONNECT)
+        connection.start()
+        try:
+            with pytest.raises(asyncio.TimeoutError):
+                await connection.ask("slow", timeout=0.01)
+            assert await connection.ask("next", timeout=2) == "echo: next"
+        finally:
+            await connection.close()
+            await fake.stop()
+
+    async def test_busy_frame(self, server):
+        """A refused prompt raises ServerBusy with the retry hint"""
+        async def busy(send, content):
+            await send({"type": "busy", "retry_after": 0.5})
+        server.answer = busy
+        connection = ChatConnection(server.url, "client-1", FAST_RECONNECT)
+        connection.start()
+        try:
+            with pytest.raises(ServerBusy) as info:
+                await connection.ask("hello", timeout=2)
+            assert info.value.retry_after == 0.5
+        finally:
+            await connection.close()
+
+    async def test_resume_after_drop(self):
+        """An answer cut off by a dropped connection is resumed after the last chunk received"""
+        fake = FakeServer(replay=ReplayBuffer())
+
+        async def drop_midway(send, content):
+            for seq, word in enumerate(content.split()):
+                if seq == 2:
+                    await send.websocket.close()
+                    await asyncio.sleep(0.1)
+                await send({"type": "chunk", "seq": seq, "content": word})
+            await send({"type": "done", "chunks": seq + 1})
+        fake.answer = drop_midway
+        url = await fake.start()
+        connection = ChatConnection(url, "client-1", FAST_RECONNECT)
+        connection.start()
+        try:
+            response = await connection.send("one two three four", stream=True)
+            assert [piece async for piece in response] == ["one", "two", "three", "four"]
+            assert connection.connects == 2
+            resumes = [frame for frame in fake.received if frame["type"] == "resume"]
+            assert resumes == [{"type": "resume", "request_id": response.request_id, "last_seq": 1}]
+            assert sum(frame["type"] == "message" for frame in fake.received) == 1
+        finally:
+            await connection.close()
+            await fake.stop()
+
+    async def test_resume_disabled(self, server):
+        """With resume off, requests fail as soon as their connection drops"""
+        server.latency = 0.3
+        connection = ChatConnection(server.url, "client-1", ClientSettings(initial_delay=5, resume=False))
+        connection.start()
+        try:
+            response = await connection.send("hello")
+            await wait_for(lambda: server.received)
+            await server.connections[0].close()
+            with pytest.raises(ConnectionLost):
+                await asyncio.wait_for(response, 2)
+        finally:
+            await connection.close()
+
+    async def test_pipelined_requests_fail_on_drop(self, server):
+        """Every request pending on a dropped connection fails with ConnectionLost"""
+        server.latency = 0.3
+        connection = ChatConnection(server.url, "client-1", FAST_RECONNECT)
+        connection.start()
+        try:
+            responses = [await connection.send(f"m{i}") for i in range(2)]
+            await wait_for(lambda: server.received)
+            await server.connections[0].close()
+            for response in responses:
+                with pytest.raises(ConnectionLost):
+                    await asyncio.wait_for(response, 2)
+        finally:
+            await connection.close()
+
+@pytest.mark.asyncio
+class TestGeminiWSClient:
+    """Tests for the pooled client"""
+
+    async def test_pool_connections(self, server):
+        """Each pooled connection has its own client ID"""
+        async with GeminiWSClient(server.url, "app", ClientSettings(pool_size=3, initial_delay=0.01)) as client:
+            await wait_for(lambda: client.status()["connections"] == 3)
+            assert sorted(server.paths) == ["/app-0", "/app-1", "/app-2"]
+            assert client.state == "connected"
+        assert client.state == "closed"
+
+    async def test_key_pins_connection(self, server):
+        """Prompts with the same key share a connection; unkeyed prompts spread over the pool"""
+        server.latency = 0.05
+        async with GeminiWSClient(server.url, "app", ClientSettings(pool_size=2, initial_delay=0.01)) as client:
+            await wait_for(lambda: client.status()["connections"] == 2)
+            assert client.connection("chat-1") is client.connection("chat-1")
+            first = await client.send("a")
+            second = await client.send("b")
+            assert first is not second
+            assert [len(c.pending) for c in client.connections] == [1, 1]
+            assert [await first, await second] == ["echo: a", "echo: b"]
+            assert await client.ask("c", key="chat-1", timeout=2) == "echo: c"
+
+    async def test_stream(self, server):
+        """A response can be iterated for its text as chunk frames arrive"""
+        async def chunks(send, content):
+            for n, word in enumerate(content.split()):
+                await send({"type": "chunk", "seq": n, "content": word})
+            await send({"type": "done", "chunks": n + 1})
+        server.answer = chunks
+        async with GeminiWSClient(server.url, "app", FAST_RECONNECT) as client:
+            response = await client.send("one two three")
+            assert [piece async for piece in response] == ["one", "two", "three"]
+            assert await response == "onetwothree"
+
+    async def test_stream_error(self, server):
+        """Iterating a failed response raises its error after the text received so far"""
+        async def fail(send, content):
+            await send({"type": "chunk", "seq": 0, "content": "partial"})
+            await send({"type": "error", "content": "quota exceeded"})
+        server.answer = fail
+        async with GeminiWSClient(server.url, "app", FAST_RECONNECT) as client:
+            pieces = []
+            with pytest.raises(ChatError, match="quota exceeded"):
+                async for piece in await client.send("hello"):
+                    pieces.append(piece)
+            assert pieces == ["partial"]
+
+@pytest.mark.asyncio
+class TestSyncGeminiWSClient:
+    """Tests for the thread-backed wrapper used by Streamlit"""
+
+    async def test_ask_from_a_thread(self, server):
+        """Blocking callers share the background connection"""
+        client = SyncGeminiWSClient(server.url, "client-1", FAST_RECONNECT)
+        try:
+            assert await asyncio.to_thread(client.ask, "one", None, 2) == "echo: one"
+            assert await asyncio.to_thread(client.ask, "two", None, 2) == "echo: two"
+            assert client.status()["state"] == "connected"
+        finally:
+            client.close()
+        await asyncio.to_thread(client.thread.join, 2)
+        assert not client.thread.is_alive()
+        assert len(server.connections) == 1
+
+    async def test_stream_from_a_thread(self, server):
+        """Blocking callers can iterate an answer as it arrives"""
+        client = SyncGeminiWSClient(server.url, "client-1", FAST_RECONNECT)
+        try:
+            assert await asyncio.to_thread(lambda: list(client.stream("hello", timeout=2))) == ["echo: hello"]
+        finally:
+            client.close()
+
+def test_backoff_delays():
+    """Delays are jittered under a bound that grows to the maximum"""
+    settings = ClientSettings(initial_delay=1, max_delay=8, multiplier=2)
+    delays = settings.delays()
+    bounds = [1, 2, 4, 8, 8, 8]
+    for bound in bounds:
+        assert 0 <= next(delays) <= bound
+
+def test_settings_from_env(monkeypatch):
+    """Settings are read from GEMINI_WS_* variables"""
+    monkeypatch.setenv("GEMINI_WS_POOL_SIZE", "4")
+    monkeypatch.setenv("GEMINI_WS_KEEPALIVE", "0")
+    monkeypatch.setenv("GEMINI_WS_RESUME", "off")
+    settings = ClientSettings.from_env()
+    assert (settings.pool_size, settings.keepalive, settings.max_delay, settings.resume) == (4, 0.0, 30.0, False)
@@ -0,0 +1,219 @@
+import os
+import sys
+import json
+import asyncio
+import pytest
+
+# Add parent directory to path to allow importing from the project root
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import heartbeat
+from connection import ConnectionTable
+from heartbeat import REAPED, HeartbeatMonitor, TimerWheel
+
+class TestTimerWheel:
+    """Tests for the hierarchical timer wheel"""
+
+    def run_ticks(self, wheel, ticks):
+        for _ in range(ticks):
+            wheel.advance()
+
+    def test_timers_fire_on_their_tick(self):
+        """Timers on every level, and past the wheel's span, fire exactly when due"""
+        wheel = TimerWheel(tick=1.0, slots=4, levels=2)
+        fired = []
+        for delay in (1, 3, 4, 5, 13, 16, 21, 40):
+            wheel.schedule(delay, lambda d: fired.append((d, wheel._ticks)), delay)
+        assert wheel.pending == 8
+        self.run_ticks(wheel, 40)
+        assert fired == [(d, d) for d in (1, 3, 4, 5, 13, 16, 21, 40)]
+        assert wheel.pending == 0
+
+    def test_delay_rounds_up_to_a_tick(self):
+        """Timers never fire early"""
+        wheel = TimerWheel(tick=0.5, slots=8, levels=2)
+        fired = []
+        wheel.schedule(0.6, fired.append, "late")
+        wheel.schedule(0, fired.append, "next")
+        self.run_ticks(wheel, 1)
+        assert fired == ["next"]
+        self.run_ticks(wheel, 1)
+        assert fired == ["next", "late"]
+
+    def test_cancel(self):
+        """Cancelled timers do not fire and are no longer pending"""
+        wheel = TimerWheel(tick=1.0, slots=4, levels=2)
+        fired = []
+        keep = wheel.schedule(6, fired.append, "keep")
+        drop = wheel.schedule(6, fired.append, "drop")
+        drop.cancel()
+        drop.cancel()
+        assert wheel.pending == 1
+        self.run_ticks(wheel, 6)
+        assert fired == ["keep"]
+        keep.cancel()
+        assert wheel.pending == 0
+
+    def test_callback_errors_are_contained(self):
+        """A failing callback does not stop other timers in the same tick"""
+        wheel = TimerWheel(tick=1.0, slots=4, levels=1)
+        fired = []
+        wheel.schedule(1, lambda: 1 / 0)
+        wheel.schedule(1, fired.append, "ok")
+        wheel.advance()
+        assert fired == ["ok"]
+
+class FakeWebSocket:
+    def __init__(self, fail=False):
+        self.sent = []
+        self.closed = None
+        self.fail = fail
+
+    async def send(self, message):
+        if self.fail:
+            raise ConnectionError("broken pipe")
+        self.sent.append(json.loads(message))
+
+    async def close(self, code, reason):
+        self.closed = (code, reason)
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(heartbeat.time, "monotonic", clock)
+    monkeypatch.setattr(heartbeat.random, "random", lambda: 0.0)
+    return clock
+
+@pytest.mark.asyncio
+class TestHeartbeatMonitor:
+    """Tests for heartbeats, dead peer detection and idle reaping"""
+
+    async def step(self, monitor, clock, seconds):
+        """Advance the clock and the wheel together, then let pings go out"""
+        for _ in range(int(seconds / monitor.wheel.tick)):
+            clock.now += monitor.wheel.tick
+            monitor.wheel.advance()
+        for _ in range(10):
+            await asyncio.sleep(0)
+
+    def monitor(self, **kwargs):
+        wheel = TimerWheel(tick=1.0, slots=8, levels=3)
+        # The tests advance the wheel themselves instead of the real-time driver
+        wheel.start = lambda: None
+        reaped = []
+        monitor = HeartbeatMonitor(wheel, on_reap=lambda c, r: reaped.append((c, r)), **kwargs)
+        return monitor, reaped
+
+    async def test_pings_quiet_connection(self, clock):
+        """A connection with no traffic for an interval is pinged"""
+        monitor, reaped = self.monitor(interval=10, idle_timeout=600)
+        ws = FakeWebSocket()
+        monitor.register("a", ws)
+        await self.step(monitor, clock, 10)
+        assert ws.sent == [{"type": "ping"}]
+        monitor.seen("a", active=False)
+        await self.step(monitor, clock, 10)
+        assert ws.sent == [{"type": "ping"}] * 2
+        assert reaped == []
+
+    async def test_traffic_defers_ping(self, clock):
+        """Recent frames prove the peer is alive, so no ping is needed"""
+        monitor, reaped = self.monitor(interval=10, idle_timeout=600)
+        ws = FakeWebSocket()
+        monitor.register("a", ws)
+        await self.step(monitor, clock, 5)
+        monitor.seen("a")
+        await self.step(monitor, clock, 5)
+        assert ws.sent == []
+        await self.step(monitor, clock, 5)
+        assert ws.sent == [{"type": "ping"}]
+
+    async def test_dead_peer_is_reaped(self, clock):
+        """A peer that answers nothing for an interval after a ping is closed"""
+        monitor, reaped = self.monitor(interval=10, idle_timeout=600)
+        ws = FakeWebSocket()
+        monitor.register("a", ws)
+        before = REAPED.value(reason="dead")
+        await self.step(monitor, clock, 10)
+        assert ws.sent == [{"type": "ping"}]
+        await self.step(monitor, clock, 10)
+        assert reaped == [("a", "dead")]
+        assert ws.closed == (1011, "dead timeout")
+        assert "a" not in monitor.connections
+        assert monitor.wheel.pending == 0
+        assert REAPED.value(reason="dead") == before + 1
+
+    async def test_failed_ping_reaps(self, clock):
+        """A connection whose ping cannot be sent is reaped straight away"""
+        monitor, reaped = self.monitor(interval=10, idle_timeout=600)
+        monitor.register("a", FakeWebSocket(fail=True))
+        await self.step(monitor, clock, 10)
+        assert reaped == [("a", "dead")]
+
+    async def test_idle_connection_is_reaped(self, clock):
+        """Heartbeat traffic alone does not keep an idle connection open"""
+        monitor, reaped = self.monitor(interval=10, idle_timeout=25)
+        ws = FakeWebSocket()
+        monitor.register("a", ws)
+        for _ in range(5):
+            monitor.seen("a", active=False)
+            await self.step(monitor, clock, 5)
+        assert reaped == [("a", "idle")]
+        assert ws.closed == (1001, "idle timeout")
+
+    async def test_close_errors_surface(self, clock, monkeypatch):
+        """A failing close is logged, and no background task is left behind"""
+        monitor, reaped = self.monitor(interval=10, idle_timeout=5)
+        ws = FakeWebSocket()
+
+        async def close(code, reason):
+            raise ConnectionError("reset")
+
+        ws.close = close
+        warnings = []
+        monkeypatch.setattr(heartbeat.logger, "warning", lambda *args: warnings.append(args))
+        monitor.register("a", ws)
+        await self.step(monitor, clock, 10)
+        assert reaped == [("a", "idle")]
+        assert monitor._tasks == set()
+        assert any(isinstance(arg, ConnectionError) for args in warnings for arg in args)
+
+    async def test_unregister_cancels_heartbeat(self, clock):
+        """Closed connections leave no pending timers behind"""
+        monitor, reaped = self.monitor(interval=10, idle_timeout=600)
+        ws = FakeWebSocket()
+        monitor.register("a", ws)
+        monitor.unregister("a")
+        monitor.seen("a")
+        assert monitor.wheel.pending == 0
+        await self.step(monitor, clock, 30)
+        assert ws.sent == [] and reaped == []
+
+    async def test_shares_server_record(self, clock):
+        """Heartbeat state is kept on the server's own connection record"""
+        monitor, reaped = self.monitor(interval=10, idle_timeout=600)
+        ws = FakeWebSocket()
+        conn = ConnectionTable().open("a", ws)
+        monitor.register("a", ws, conn)
+        assert monitor.connections["a"] is conn
+        assert conn.timer is not None
+        await self.step(monitor, clock, 10)
+        assert ws.sent == [{"type": "ping"}]
+        assert conn.pinged_at is not None
+        monitor.unregister("a")
+        assert conn.timer is None
+        assert monitor.wheel.pending == 0
+
+    async def test_from_env(self, monkeypatch):
+        """Interval and idle timeout are read from the environment"""
+        monkeypatch.setenv("HEARTBEAT_INTERVAL", "5")
+        monkeypatch.setenv("IDLE_TIMEOUT", "60")
+        monitor = HeartbeatMonitor.from_env(TimerWheel())
+        assert (monitor.interval, monitor.idle_timeout) == (5.0, 60.0)
@@ -0,0 +1,202 @@
+import os
+import sys
+import time
+import pytest
+
+# Add parent directory to path to allow importing from the project root
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from connection import ConnectionTable
+from history_compaction import (COMPACTIONS, EXPANSIONS, EXPIRED, CompactedHistory, CompactionSettings,
+                                HistoryCompactor, InternTable)
+
+SYSTEM_PROMPT = "You are a helpful assistant for UK statistics. " * 10
+
+class FakeSession:
+    """Chat session holding its history as (role, [texts]) turns"""
+    def __init__(self, turns=None):
+        self.turns = list(turns or [])
+
+def make_compactor(**settings):
+    table = ConnectionTable()
+    compactor = HistoryCompactor(table, lambda session: session.turns, FakeSession,
+                                 CompactionSettings(**settings))
+    return table, table.view("session"), compactor
+
+def conversation(n):
+    return [("user", [SYSTEM_PROMPT, f"question {n}"]), ("model", [f"answer {n} " * 20])]
+
+def make_idle(table, client_id, seconds=60):
+    table.get(client_id).last_active = time.monotonic() - seconds
+
+class TestCompactionSettings:
+    """Tests for compaction settings"""
+
+    def test_from_env(self, monkeypatch):
+        """Settings are read from the environment"""
+        monkeypatch.setenv("HISTORY_COMPACTION_IDLE_SECONDS", "10")
+        monkeypatch.setenv("HISTORY_COMPACTION_LEVEL", "9")
+        settings = CompactionSettings.from_env()
+        assert (settings.idle_seconds, settings.level) == (10.0, 9)
+        assert CompactionSettings.from_env("OTHER").idle_seconds == 300.0
+
+class TestInternTable:
+    """Tests for interning of repeated long texts"""
+
+    def test_interns_when_shared(self):
+        """A long text is stored inline once and interned when another client has it too"""
+        table = InternTable(min_chars=10)
+        assert table.ref("a long repeated text", "a") is None
+        index = table.ref("a long repeated text", "b")
+        assert index == 0
+        assert table.ref("a long repeated text", "c") == 0
+        assert table.text(index) == "a long repeated text"
+
+    def test_own_texts_not_interned(self):
+        """One client's history compacted again doesn't intern its own texts"""
+        table = InternTable(min_chars=10)
+        for _ in range(3):
+            assert table.ref("a long answer of one client", "a") is None
+        assert table.texts == []
+
+    def test_short_texts_and_full_table(self):
+        """Short texts are never interned, nor anything once the table is full"""
+        table = InternTable(min_chars=10, max_texts=1)
+        assert table.ref("short") is None
+        assert table.ref("short") is None
+        for owner in ("a", "b"):
+            table.ref("first long text", owner)
+        assert table.ref("second long text", "a") is None
+        assert table.ref("second long text", "b") is None
+        assert table.texts == ["first long text"]
+
+class TestHistoryCompactor:
+    """Tests for compacting idle chat histories"""
+
+    def test_roundtrip(self):
+        """A compacted history expands back to the same turns"""
+        _, _, compactor = make_compactor()
+        turns = conversation(1) + conversation(2)
+        history = compactor.compact(FakeSession(turns))
+        assert history.turns == 4
+        assert len(history.blob) < history.text_bytes
+        assert compactor.expand(history).turns == turns
+
+    def test_repeated_prompt_interned(self):
+        """A prompt shared by conversations is stored once, not in every blob"""
+        _, _, compactor = make_compactor(intern_min_chars=100)
+        first = compactor.compact(FakeSession(conversation(1)), "a")
+        second = compactor.compact(FakeSession(conversation(2)), "b")
+        third = compactor.compact(FakeSession(conversation(3)), "c")
+        assert compactor.interned.texts == [SYSTEM_PROMPT]
+        assert len(third.blob) < len(first.blob)
+        assert compactor.expand(second).turns == conversation(2)
+        assert compactor.expand(third).turns == conversation(3)
+
+    def test_empty_or_unexportable_history_kept(self):
+        """Sessions with nothing to compact are left alone"""
+        table, sessions, compactor = make_compactor()
+        sessions["empty"] = FakeSession()
+        sessions["images"] = FakeSession(conversation(1))
+        compactor.export = lambda session: None if session is sessions["images"] else session.turns
+        make_idle(table, "empty")
+        make_idle(table, "images")
+        assert compactor.sweep() == 0
+        assert not compactor.compacted()
+
+    def test_sweep_compacts_only_idle_sessions(self):
+        """Sessions idle past the threshold are compacted, active ones are not"""
+        table, sessions, compactor = make_compactor(idle_seconds=30)
+        compactions = COMPACTIONS.value()
+        sessions["idle"] = FakeSession(conversation(1))
+        sessions["active"] = FakeSession(conversation(2))
+        make_idle(table, "idle")
+        assert compactor.sweep() == 1
+        assert isinstance(sessions["idle"], CompactedHistory)
+        assert isinstance(sessions["active"], FakeSession)
+        assert COMPACTIONS.value() == compactions + 1
+        # Already compacted histories are skipped
+        assert compactor.sweep() == 0
+        assert len(compactor.compacted()) == 1
+
+    def test_session_expands_on_next_message(self):
+        """The next message gets a live session continuing the history"""
+        table, sessions, compactor = make_compactor(idle_seconds=30)
+        expansions = EXPANSIONS.value()
+        sessions["a"] = FakeSession(conversation(1))
+        make_idle(table, "a")
+        compactor.sweep()
+        session = compactor.session(sessions, "a")
+        assert isinstance(session, FakeSession)
+        assert session.turns == conversation(1)
+        assert sessions["a"] is session
+        assert EXPANSIONS.value() == expansions + 1
+        # The message counts as activity, so the next sweep leaves it alone
+        assert compactor.sweep() == 0
+
+    def test_session_missing_client(self):
+        """Clients without a session still raise KeyError"""
+        _, sessions, compactor = make_compactor()
+        with pytest.raises(KeyError):
+            compactor.session(sessions, "nobody")
+
+    def test_background_sweep(self):
+        """The sweep thread compacts idle sessions and stops when asked"""
+        table, sessions, compactor = make_compactor(idle_seconds=0.05, interval=0.01)
+        sessions["a"] = FakeSession(conversation(1))
+        compactor.start()
+        try:
+            deadline = time.monotonic() + 2
+            while not isinstance(table.get("a").session, CompactedHistory):
+                assert time.monotonic() < deadline, "history not compacted in time"
+                time.sleep(0.01)
+        finally:
+            compactor.stop()
+        compactor.thread.join(2)
+        assert not compactor.thread.is_alive()
+
+    def test_disabled(self):
+        """An idle threshold of 0 turns compaction off, and with expiry off too there is no sweep"""
+        table, sessions, compactor = make_compactor(idle_seconds=0)
+        sessions["a"] = FakeSession(conversation(1))
+        make_idle(table, "a")
+        assert compactor.sweep() == 0
+        assert isinstance(sessions["a"], FakeSession)
+        _, _, compactor = make_compactor(idle_seconds=0, expire_seconds=0)
+        compactor.start()
+        assert compactor.thread is None
+
+    def test_session_in_use_not_swept(self):
+        """A call outlasting the idle threshold keeps its session, and idle time restarts when it ends"""
+        table, sessions, compactor = make_compactor(idle_seconds=60, expire_seconds=600)
+        sessions["a"] = FakeSession(conversation(1))
+        with compactor.hold("a"):
+            session = compactor.session(sessions, "a")
+            # The call waits in the scheduler and runs long past both thresholds
+            make_idle(table, "a", 900)
+            assert compactor.sweep() == 0
+            assert sessions["a"] is session
+            session.turns += conversation(2)
+        assert compactor.busy == {}
+        assert compactor.sweep() == 0
+        make_idle(table, "a")
+        assert compactor.sweep() == 1
+        assert compactor.expand(sessions["a"]).turns == conversation(1) + conversation(2)
+
+    def test_expires_sessions_without_connection(self):
+        """Idle sessions of clients with no open connection are dropped, compacted or not"""
+        table, sessions, compactor = make_compactor(idle_seconds=60, expire_seconds=600)
+        for client_id in ("sse", "compacted", "recent", "connected"):
+            sessions[client_id] = FakeSession(conversation(1))
+        table.get("connected").websocket = object()
+        for client_id in ("sse", "connected"):
+            make_idle(table, client_id, 900)
+        make_idle(table, "compacted", 120)
+        before = EXPIRED.value()
+        compactor.sweep()
+        assert "sse" not in sessions and table.get("sse") is None
+        assert isinstance(sessions["compacted"], CompactedHistory)
+        make_idle(table, "compacted", 900)
+        compactor.sweep()
+        assert set(sessions) == {"recent", "connected"} and len(sessions) == 2
+        assert EXPIRED.value() == before + 2
@@ -0,0 +1,255 @@
+import os
+import sys
+import json
+import asyncio
+import pytest
+import pytest_asyncio
+from aiohttp import web
+
+# Add parent directory to path to allow importing from the project root
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import http_cache
+from http_cache import CacheSettings, ResponseCache, parse_cache_control
+from protocol import ApiRequest
+
+URL = "https://api.example.com/items"
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(http_cache.time, "monotonic", clock)
+    return clock
+
+class TestResponseCache:
+    """Tests for HTTP caching rules"""
+
+    def test_parse_cache_control(self):
+        """Directives are lower-cased and arguments unquoted"""
+        assert parse_cache_control('Max-Age=60, no-cache, stale-while-revalidate="30"') == {
+            "max-age": "60", "no-cache": None, "stale-while-revalidate": "30"}
+
+    def test_fresh_then_stale_then_revalidate(self, clock):
+        """An entry is a hit while fresh, served stale within stale-while-revalidate, then revalidated"""
+        cache = ResponseCache()
+        headers = {"Cache-Control": "max-age=60, stale-while-revalidate=30", "ETag": '"v1"'}
+        assert cache.store(URL, {"page": 1}, {}, 200, headers, {"items": [1]})
+        entry, result = cache.lookup(URL, {"page": "1"}, {})
+        assert result == "hit" and entry.data == {"items": [1]}
+        clock.now += 70
+        assert cache.lookup(URL, {"page": 1}, {})[1] == "stale"
+        clock.now += 30
+        entry, result = cache.lookup(URL, {"page": 1}, {})
+        assert result == "revalidate"
+        assert entry.validators() == {"If-None-Match": '"v1"'}
+        assert cache.lookup(URL, {"page": 2}, {})[1] == "miss"
+
+    def test_freshen_from_304(self, clock):
+        """A 304 refreshes the entry's headers and freshness"""
+        cache = ResponseCache()
+        entry = cache.store(URL, None, {}, 200, {"Cache-Control": "max-age=10", "ETag": '"v1"', "X-Kept": "yes"}, "body")
+        clock.now += 20
+        assert cache.lookup(URL, None, {})[1] == "revalidate"
+        cache.freshen(entry, {"Cache-Control": "max-age=100", "ETag": '"v1"'})
+        assert cache.lookup(URL, None, {})[1] == "hit"
+        assert entry.headers["X-Kept"] == "yes"
+        assert entry.response_headers()["Age"] == "0"
+
+    def test_age_header_counts_against_freshness(self, clock):
+        """Time spent in upstream caches (Age) is deducted from max-age"""
+        cache = ResponseCache()
+        cache.store(URL, None, {}, 200, {"Cache-Control": "max-age=60", "Age": "50"}, "body")
+        clock.now += 11
+        assert cache.lookup(URL, None, {})[1] == "miss"
+
+    def test_expires_and_heuristic_freshness(self, clock):
+        """Expires is used without max-age, and Last-Modified gives a heuristic lifetime"""
+        cache = ResponseCache()
+        date = "Mon, 19 Oct 2026 08:00:00 GMT"
+        cache.store(URL, {"a": 1}, {}, 200, {"Date": date, "Expires": "Mon, 19 Oct 2026 08:01:00 GMT"}, "a")
+        cache.store(URL, {"b": 1}, {}, 200, {"Date": date, "Last-Modified": "Mon, 19 Oct 2026 07:00:00 GMT"}, "b")
+        clock.now += 59
+        assert cache.lookup(URL, {"a": 1}, {})[1] == "hit"
+        assert cache.lookup(URL, {"b": 1}, {})[1] == "hit"
+        clock.now += 2
+        assert cache.lookup(URL, {"a": 1}, {})[1] == "miss"
+        clock.now += 300
+        assert cache.lookup(URL, {"b": 1}, {})[1] == "revalidate"
+
+    @pytest.mark.parametrize("status, headers, request_headers", [
+        (200, {"Cache-Control": "no-store", "ETag": '"x"'}, {}),
+        (200, {"Cache-Control": "private, max-age=60"}, {}),
+        (200, {"Cache-Control": "max-age=60", "Vary": "*"}, {}),
+        (200, {"Cache-Control": "max-age=60"}, {"Authorization": "Bearer t"}),
+        (200, {"Content-Type": "application/json"}, {}),
+        (500, {"Cache-Control": "max-age=60"}, {}),
+    ])
+    def test_not_stored(self, status, headers, request_headers):
+        """Responses that HTTP caching rules forbid a shared cache to reuse are not stored"""
+        cache = ResponseCache()
+        assert cache.store(URL, None, request_headers, status, headers, "body") is None
+        assert cache.entries == {}
+
+    def test_authorized_public_response_is_stored(self):
+        """An Authorization request may be cached when the response is explicitly public"""
+        cache = ResponseCache()
+        assert cache.store(URL, None, {"Authorization": "Bearer t"}, 200, {"Cache-Control": "public, max-age=60"}, "x")
+
+    def test_request_directives(self):
+        """Client no-cache forces revalidation; no-store and conditional requests bypass the cache"""
+        cache = ResponseCache()
+        cache.store(URL, None, {}, 200, {"Cache-Control": "max-age=60", "ETag": '"v1"'}, "body")
+        assert cache.lookup(URL, None, {"cache-control": "no-cache"})[1] == "revalidate"
+        assert cache.lookup(URL, None, {"Cache-Control": "no-store"})[1] == "bypass"
+        assert cache.lookup(URL, None, {"If-None-Match": '"v0"'})[1] == "bypass"
+
+    def test_vary(self):
+        """A stored response is only reused for requests matching its Vary headers"""
+        cache = ResponseCache()
+        cache.store(URL, None, {"Accept-Language": "en"}, 200,
+                    {"Cache-Control": "max-age=60", "Vary": "Accept-Language"}, "hello")
+        assert cache.lookup(URL, None, {"accept-language": "en"})[1] == "hit"
+        assert cache.lookup(URL, None, {"Accept-Language": "fr"})[1] == "miss"
+
+    def test_lru_eviction_by_bytes(self):
+        """The least recently used entries are evicted to stay within the byte budget"""
+        cache = ResponseCache(CacheSettings(max_bytes=300, max_entry_bytes=200))
+        headers = {"Cache-Control": "max-age=60"}
+        for name in ("a", "b"):
+            cache.store(URL, {"k": name}, {}, 200, headers, "x" * 100)
+        cache.lookup(URL, {"k": "a"}, {})
+        cache.store(URL, {"k": "c"}, {}, 200, headers, "x" * 100)
+        assert [key[1][0][1] for key in cache.entries] == ["a", "c"]
+        assert cache.bytes <= 300
+        assert cache.store(URL, {"k": "big"}, {}, 200, headers, "x" * 500) is None
+
+    def test_unsafe_requests_invalidate(self):
+        """A successful unsafe request drops the stored response for its URL; errors and safe methods don't"""
+        cache = ResponseCache()
+        cache.store(URL, {"k": "a"}, {}, 200, {"Cache-Control": "max-age=60"}, "body")
+        cache.invalidate("GET", URL, {"k": "a"}, 200)
+        cache.invalidate("post", URL, {"k": "a"}, 500)
+        cache.invalidate("PUT", URL, {"k": "b"}, 200)
+        assert cache.lookup(URL, {"k": "a"}, {})[1] == "hit"
+        cache.invalidate("DELETE", URL, {"k": "a"}, 204)
+        assert cache.lookup(URL, {"k": "a"}, {})[1] == "miss"
+        assert cache.bytes == 0
+
+    def test_hit_ratio(self):
+        """Hits, stale hits and revalidations count towards the hit ratio; bypasses do not"""
+        cache = ResponseCache()
+        for result in ("hit", "hit", "stale", "revalidated", "miss", "bypass"):
+            cache.record(result)
+        assert cache.hit_ratio() == 0.8
+        assert cache.stats()["miss"] == 1
+
+@pytest_asyncio.fixture
+async def upstream():
+    """Local HTTP server with an ETag-validated endpoint"""
+    state = {"version": 1, "requests": [], "cache_control": "max-age=0, stale-while-revalidate=60"}
+
+    async def items(request):
+        state["requests"].append(request.headers.get("If-None-Match"))
+        etag = f'"v{state["version"]}"'
+        headers = {"ETag": etag, "Cache-Control": state["cache_control"]}
+        if request.headers.get("If-None-Match") == etag:
+            return web.Response(status=304, headers=headers)
+        return web.json_response({"version": state["version"]}, headers=headers)
+
+    async def update(request):
+        state["version"] += 1
+        return web.json_response({"version": state["version"]}, status=201)
+
+    app = web.Application()
+    app.router.add_get("/items", items)
+    app.router.add_post("/items", update)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    yield f"http://127.0.0.1:{port}/items", state
+    await runner.cleanup()
+
+@pytest.mark.asyncio
+class TestForwardedRequestCache:
+    """Tests for the cache in front of forward_api_request"""
+
+    async def forward(self, manager, url, **kwargs):
+        sent = []
+
+        async def send(message):
+            sent.append(json.loads(message))
+
+        await manager.forward_api_request(ApiRequest(endpoint=url, **kwargs), "client", send)
+        return sent[0]
+
+    async def test_revalidation_and_stale_while_revalidate(self, upstream, monkeypatch):
+        """Stale entries are served at once and refreshed in the background with conditional requests"""
+        import websocket_server
+        url, state = upstream
+        monkeypatch.setattr(websocket_server, "response_cache", ResponseCache())
+        manager = websocket_server.ConnectionManager()
+        try:
+            first = await self.forward(manager, url)
+            assert first["data"] == {"version": 1} and "cache" not in first
+            # max-age=0 with stale-while-revalidate: served from cache, revalidated in the background
+            second = await self.forward(manager, url)
+            assert second["cache"] == "stale" and second["data"] == {"version": 1}
+            await asyncio.gather(*manager.revalidations)
+            assert state["requests"] == [None, '"v1"']
+            # Upstream changed: the background revalidation fetches the new body
+            state["version"] = 2
+            await self.forward(manager, url)
+            await asyncio.gather(*manager.revalidations)
+            third = await self.forward(manager, url)
+            assert third["data"] == {"version": 2}
+            # Without stale-while-revalidate a stale entry is revalidated before answering
+            state["cache_control"] = "no-cache"
+            await self.forward(manager, url, headers={"Cache-Control": "no-cache"})
+            fourth = await self.forward(manager, url)
+            assert fourth["cache"] == "revalidated" and fourth["status"] == 200
+            assert fourth["data"] == {"version": 2}
+            assert state["requests"][-1] == '"v2"'
+            assert websocket_server.response_cache.hit_ratio() > 0
+        finally:
+            if manager.http_session is not None:
+                await manager.http_session.close()
+
+    async def test_non_get_requests_bypass_cache(self, upstream, monkeypatch):
+        """Only GET requests use the cache"""
+        import websocket_server
+        url, state = upstream
+        monkeypatch.setattr(websocket_server, "response_cache", ResponseCache())
+        manager = websocket_server.ConnectionManager()
+        try:
+            await self.forward(manager, url, method="POST", body={"a": 1})
+            assert websocket_server.response_cache.entries == {}
+            assert websocket_server.response_cache.results == {}
+        finally:
+            if manager.http_session is not None:
+                await manager.http_session.close()
+
+    async def test_post_invalidates_cached_get(self, upstream, monkeypatch):
+        """A successful POST to a cached URL means the next GET goes upstream"""
+        import websocket_server
+        url, state = upstream
+        state["cache_control"] = "max-age=60"
+        monkeypatch.setattr(websocket_server, "response_cache", ResponseCache())
+        manager = websocket_server.ConnectionManager()
+        try:
+            await self.forward(manager, url)
+            assert (await self.forward(manager, url))["cache"] == "hit"
+            assert (await self.forward(manager, url, method="POST", body={"a": 1}))["status"] == 201
+            after = await self.forward(manager, url)
+            assert "cache" not in after and after["data"] == {"version": 2}
+        finally:
+            if manager.http_session is not None:
+                await manager.http_session.close()
@@ -0,0 +1,132 @@
+import os
+import sys
+import asyncio
+import pytest
+import pytest_asyncio
+from aiohttp import web
+
+# Add parent directory to path to allow importing from the project root
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from http_pool import POOL_CONNECTIONS, POOL_WAIT, HttpPoolSettings, pool_stats
+
+@pytest_asyncio.fixture
+async def upstream():
+    """Local HTTP server with a fast and a slow endpoint"""
+    release = asyncio.Event()
+
+    async def fast(request):
+        return web.json_response({"ok": True})
+
+    async def slow(request):
+        await release.wait()
+        return web.json_response({"ok": True})
+
+    app = web.Application()
+    app.router.add_get("/fast", fast)
+    app.router.add_get("/slow", slow)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    yield f"http://127.0.0.1:{port}", release
+    release.set()
+    await runner.cleanup()
+
+class TestHttpPoolSettings:
+    """Tests for loading pool settings"""
+
+    def test_from_env(self, monkeypatch):
+        """Settings are read from prefixed environment variables"""
+        monkeypatch.setenv("TEST_POOL_LIMIT_PER_HOST", "4")
+        monkeypatch.setenv("TEST_POOL_READ_TIMEOUT", "2.5")
+        settings = HttpPoolSettings.from_env("TEST_POOL", limit=50)
+        assert settings.limit == 50
+        assert settings.limit_per_host == 4
+        assert settings.read_timeout == 2.5
+        assert settings.dns_cache_ttl == HttpPoolSettings.dns_cache_ttl
+
+    def test_timeout(self):
+        """Zero timeouts mean no limit"""
+        timeout = HttpPoolSettings(connect_timeout=3, read_timeout=0, total_timeout=0).timeout()
+        assert (timeout.total, timeout.connect, timeout.sock_read) == (None, 3, None)
+
+    def test_no_session_stats(self):
+        """Stats are zero before a session exists"""
+        assert pool_stats(None) == {"limit": 0, "limit_per_host": 0, "in_use": 0, "idle": 0, "waiting": 0}
+
+@pytest.mark.asyncio
+class TestPooledSession:
+    """Tests for the pooled upstream session"""
+
+    async def test_connector_settings(self):
+        """The connector applies the configured limits and DNS cache"""
+        session = HttpPoolSettings(limit=7, limit_per_host=3, keepalive_timeout=5, dns_cache_ttl=0).session()
+        try:
+            assert session.connector.limit == 7
+            assert session.connector.limit_per_host == 3
+            assert not session.connector.use_dns_cache
+            assert pool_stats(session)["limit_per_host"] == 3
+        finally:
+            await session.close()
+        assert pool_stats(session)["limit"] == 0
+
+    async def test_connector_internals(self):
+        """pool_stats reads private connector attributes, which an aiohttp upgrade could rename"""
+        session = HttpPoolSettings().session()
+        try:
+            for name in ("_acquired", "_conns", "_waiters"):
+                assert hasattr(session.connector, name), f"aiohttp connector has no {name}"
+        finally:
+            await session.close()
+
+    async def test_connections_are_reused(self, upstream):
+        """Sequential requests to one host share a kept-alive connection"""
+        url, _ = upstream
+        created = POOL_CONNECTIONS.value(outcome="created")
+        reused = POOL_CONNECTIONS.value(outcome="reused")
+        session = HttpPoolSettings().session()
+        try:
+            for _ in range(3):
+                async with session.get(f"{url}/fast") as response:
+                    assert (await response.json()) == {"ok": True}
+            stats = pool_stats(session)
+            assert (stats["in_use"], stats["idle"]) == (0, 1)
+        finally:
+            await session.close()
+        assert POOL_CONNECTIONS.value(outcome="created") == created + 1
+        assert POOL_CONNECTIONS.value(outcome="reused") == reused + 2
+
+    async def test_per_host_limit_queues_requests(self, upstream):
+        """Requests beyond the per-host limit wait for a connection, and the wait is reported"""
+        url, release = upstream
+        session = HttpPoolSettings(limit_per_host=1).session()
+        waits = POOL_WAIT.count()
+
+        async def get(path):
+            async with session.get(f"{url}/{path}") as response:
+                return response.status
+
+        try:
+            first = asyncio.create_task(get("slow"))
+            second = asyncio.create_task(get("fast"))
+            await asyncio.sleep(0.2)
+            stats = pool_stats(session)
+            assert (stats["in_use"], stats["waiting"]) == (1, 1)
+            release.set()
+            assert await asyncio.gather(first, second) == [200, 200]
+        finally:
+            await session.close()
+        assert POOL_WAIT.count() == waits + 1
+
+    async def test_read_timeout(self, upstream):
+        """A response slower than the read timeout fails instead of hanging"""
+        url, _ = upstream
+        session = HttpPoolSettings(read_timeout=0.1).session()
+        try:
+            with pytest.raises(asyncio.TimeoutError):
+                async with session.get(f"{url}/slow") as response:
+                    await response.read()
+        finally:
+            await session.close()
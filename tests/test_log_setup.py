@@ -0,0 +1,108 @@
+import os
+import sys
+import json
+import logging
+import pytest
+
+# Add parent directory to path to allow importing from the project root
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from log_setup import LazyQueueHandler, get_logger, parse_sample_rates, setup_logging, stop_logging
+
+class ListHandler(logging.Handler):
+    """Collects formatted records"""
+    def __init__(self):
+        super().__init__()
+        self.lines = []
+    
+    def emit(self, record):
+        self.lines.append(self.format(record))
+
+@pytest.fixture
+def collected():
+    """Route logging through the queue listener into a list"""
+    handler = ListHandler()
+    root = logging.getLogger()
+    level = root.level
+    yield handler, lambda **kwargs: setup_logging(handlers=[handler], **kwargs)
+    stop_logging()
+    for h in list(root.handlers):
+        if isinstance(h, LazyQueueHandler):
+            root.removeHandler(h)
+    root.setLevel(level)
+
+class TestLogSetup:
+    """Tests for the queued, sampled logging setup"""
+    
+    def test_parse_sample_rates(self):
+        """Sampling rates are parsed from category=rate pairs"""
+        assert parse_sample_rates("payload=0.1, ping=0") == {"payload": 0.1, "ping": 0.0}
+        assert parse_sample_rates("") == {}
+    
+    def test_records_reach_listener(self, collected):
+        """Records are formatted by the listener with structured fields"""
+        handler, setup = collected
+        setup(level="INFO", sample_rates={}, json_output=False)
+        logging.getLogger("test").info("hello %s", "world", extra={"client_id": "c1"})
+        stop_logging()
+        assert len(handler.lines) == 1
+        assert "hello world" in handler.lines[0]
+        assert "client_id=c1" in handler.lines[0]
+    
+    def test_json_output(self, collected):
+        """JSON mode emits one object per record"""
+        handler, setup = collected
+        setup(level="INFO", sample_rates={}, json_output=True)
+        get_logger("test", category="api", client_id="c2").info("status %d", 200)
+        stop_logging()
+        entry = json.loads(handler.lines[0])
+        assert entry["message"] == "status 200"
+        assert entry["category"] == "api"
+        assert entry["client_id"] == "c2"
+    
+    def test_category_sampling(self, collected):
+        """Categories sampled at 0 are dropped, except warnings and errors"""
+        handler, setup = collected
+        setup(level="DEBUG", sample_rates={"payload": 0.0}, json_output=False)
+        payload_logger = get_logger("test.payload", category="payload")
+        for _ in range(10):
+            payload_logger.debug("dropped")
+        payload_logger.warning("kept")
+        get_logger("test", category="other").debug("unsampled")
+        stop_logging()
+        assert len(handler.lines) == 2
+        assert "kept" in handler.lines[0]
+        assert "unsampled" in handler.lines[1]
+    
+    def test_message_rendered_at_call_time(self):
+        """Arguments are rendered when the record is enqueued, not when the listener formats it"""
+        queued = []
+        handler = LazyQueueHandler(type("Queue", (), {"put_nowait": staticmethod(queued.append)})())
+        state = {"step": 1}
+        record = logging.LogRecord("test", logging.INFO, __file__, 1, "state %s", (state,), None)
+        handler.handle(record)
+        state["step"] = 2
+        assert queued[0].msg == "state {'step': 1}"
+        assert queued[0].args is None
+        assert queued[0].getMessage() == "state {'step': 1}"
+    
+    def test_traceback_rendered_at_call_time(self, collected):
+        """Tracebacks are rendered before the record is queued"""
+        handler, setup = collected
+        setup(level="INFO", sample_rates={}, json_output=True)
+        queued = []
+        queue_handler = LazyQueueHandler(type("Queue", (), {"put_nowait": staticmethod(queued.append)})())
+        try:
+            raise ValueError("boom")
+        except ValueError:
+            record = logging.getLogger("test").makeRecord("test", logging.ERROR, __file__, 1, "failed", (),
+                                                          sys.exc_info())
+        queue_handler.handle(record)
+        assert queued[0].exc_info is None
+        assert "ValueError: boom" in queued[0].exc_text
+        try:
+            raise ValueError("boom")
+        except ValueError:
+            logging.getLogger("test").exception("failed")
+        stop_logging()
+        assert "ValueError: boom" in json.loads(handler.lines[0])["exc_info"]
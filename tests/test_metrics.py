@@ -0,0 +1,100 @@
+import os
+import sys
+import threading
+import pytest
+
+# Add parent directory to path to allow importing from the project root
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from metrics import Counter, Gauge, Histogram, Registry, websockets_process_request
+
+class TestMetrics:
+    """Tests for the Prometheus-style metrics"""
+    
+    def test_counter_with_labels(self):
+        """Counters render one sample per label set"""
+        registry = Registry()
+        errors = Counter("errors_total", "Errors by type", ["type"], registry=registry)
+        errors.labels(type="gemini").inc()
+        errors.labels(type="gemini").inc()
+        errors.labels(type="protocol").inc()
+        text = registry.render()
+        assert "# TYPE errors_total counter" in text
+        assert 'errors_total{type="gemini"} 2' in text
+        assert 'errors_total{type="protocol"} 1' in text
+        with pytest.raises(ValueError):
+            errors.labels(type="gemini").inc(-1)
+    
+    def test_gauge(self):
+        """Gauges can be incremented, set, or read from a callback"""
+        registry = Registry()
+        inflight = Gauge("inflight", "In flight", registry=registry)
+        with inflight.track_inprogress():
+            assert inflight.value() == 1
+        assert inflight.value() == 0
+        sessions = Gauge("sessions", "Sessions", registry=registry)
+        store = {"a": 1, "b": 2}
+        sessions.set_function(lambda: len(store))
+        assert "sessions 2" in registry.render()
+    
+    def test_histogram_buckets(self):
+        """Histogram buckets are cumulative and include +Inf, sum and count"""
+        registry = Registry()
+        latency = Histogram("latency_seconds", "Latency", buckets=(0.1, 1.0), registry=registry)
+        for value in (0.05, 0.5, 0.5, 5.0):
+            latency.observe(value)
+        text = registry.render()
+        assert 'latency_seconds_bucket{le="0.1"} 1' in text
+        assert 'latency_seconds_bucket{le="1"} 3' in text
+        assert 'latency_seconds_bucket{le="+Inf"} 4' in text
+        assert "latency_seconds_sum 6.05" in text
+        assert "latency_seconds_count 4" in text
+    
+    def test_empty_histogram(self):
+        """Unobserved histograms still render zeroed samples"""
+        registry = Registry()
+        Histogram("empty_seconds", "Empty", buckets=(1.0,), registry=registry)
+        assert 'empty_seconds_bucket{le="+Inf"} 0' in registry.render()
+    
+    def test_histogram_timer(self):
+        """The timer context manager records one observation"""
+        latency = Histogram("timer_seconds", "Timer", registry=None)
+        with latency.time():
+            pass
+        assert latency.count() == 1
+    
+    def test_render_while_observing(self):
+        """Rendering takes a consistent copy while other threads record"""
+        registry = Registry()
+        latency = Histogram("busy_seconds", "Busy", ["worker"], buckets=(0.5,), registry=registry)
+        done = threading.Event()
+        
+        def observe(worker):
+            while not done.is_set():
+                latency.labels(worker=worker).observe(1.0)
+        
+        threads = [threading.Thread(target=observe, args=(str(i),)) for i in range(4)]
+        interval = sys.getswitchinterval()
+        # Switch threads often, so an unlocked read would see series change mid-render
+        sys.setswitchinterval(1e-6)
+        for thread in threads:
+            thread.start()
+        try:
+            for _ in range(200):
+                samples = latency.samples()
+                buckets = [line for line in samples if 'le="+Inf"' in line]
+                counts = [line for line in samples if line.startswith("busy_seconds_count")]
+                assert [b.rsplit(" ", 1)[1] for b in buckets] == [c.rsplit(" ", 1)[1] for c in counts]
+        finally:
+            done.set()
+            for thread in threads:
+                thread.join()
+            sys.setswitchinterval(interval)
+
+@pytest.mark.asyncio
+async def test_websockets_process_request():
+    """The websockets hook answers /metrics and passes other paths through"""
+    status, headers, body = await websockets_process_request("/metrics", {})
+    assert status == 200
+    assert b"# TYPE" in body
+    assert await websockets_process_request("/client123", {}) is None
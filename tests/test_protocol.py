@@ -0,0 +1,94 @@
+import os
+import sys
+import json
+import pytest
+
+# Add parent directory to path to allow importing from the project root
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from protocol import (ApiRequest, ChatMessage, ChatRequest, Dispatcher, Ping, ProtocolError, Resume,
+                      decode, encode, error_frame)
+
+class TestDecode:
+    """Tests for decoding and validating client messages"""
+    
+    def test_decode_message(self):
+        """A chat message decodes into a typed struct"""
+        message = decode(json.dumps({"type": "message", "content": "Hello"}))
+        assert isinstance(message, ChatMessage)
+        assert message.content == "Hello"
+        assert message.request_id is None
+    
+    def test_decode_api_request_defaults(self):
+        """Optional api_request fields fall back to their defaults"""
+        message = decode(json.dumps({"type": "api_request", "endpoint": "https://api.example.com"}))
+        assert isinstance(message, ApiRequest)
+        assert message.method == "GET"
+        assert message.params == {}
+        assert message.headers == {}
+        assert message.body is None
+    
+    def test_decode_bytes(self):
+        """Binary frames are accepted"""
+        assert isinstance(decode(b'{"type": "ping"}'), Ping)
+        assert isinstance(decode(b'{"type": "resume", "request_id": "r1"}'), Resume)
+    
+    @pytest.mark.parametrize("raw, error", [
+        ("not a json string", "Invalid JSON"),
+        ("[1, 2]", "JSON object"),
+        ('{"type": "unknown"}', "Unknown message type"),
+        ('{"content": "no type"}', "Unknown message type"),
+        ('{"type": "message"}', "Missing required field 'content'"),
+        ('{"type": "message", "content": 42}', "Invalid value for 'content'"),
+        ('{"type": "api_request", "endpoint": "x", "params": []}', "Invalid value for 'params'"),
+        ('{"type": "resume", "request_id": 5}', "Invalid value for 'request_id'"),
+        # No server can act on a cancel, so it is not part of the protocol
+        ('{"type": "cancel", "request_id": "r1"}', "Unknown message type"),
+    ])
+    def test_decode_invalid(self, raw, error):
+        """Malformed frames are rejected before reaching a handler"""
+        with pytest.raises(ProtocolError) as excinfo:
+            decode(raw)
+        assert error in str(excinfo.value)
+    
+    def test_decode_as_struct(self):
+        """Frames without a type field can be validated against a given struct"""
+        chat_request = decode('{"message": "Hi"}', ChatRequest)
+        assert chat_request.message == "Hi"
+        assert chat_request.client_id == "anonymous"
+    
+    def test_encode_roundtrip(self):
+        """Encoded frames are plain JSON text"""
+        payload = {"type": "response", "content": "héllo"}
+        assert json.loads(encode(payload)) == payload
+        assert json.loads(error_frame("boom")) == {"type": "error", "content": "boom"}
+
+    def test_encode_str_subclass_keys(self):
+        """Header dicts with str subclass keys (e.g. aiohttp's istr) still encode"""
+        class HeaderName(str):
+            pass
+        payload = {"type": "api_response", "headers": {HeaderName("Content-Type"): "application/json"}}
+        assert json.loads(encode(payload)) == {"type": "api_response", "headers": {"Content-Type": "application/json"}}
+
+@pytest.mark.asyncio
+class TestDispatcher:
+    """Tests for the message dispatch table"""
+    
+    async def test_dispatch_to_handler(self):
+        """Messages are routed to the handler registered for their type"""
+        dispatcher = Dispatcher()
+        received = []
+        
+        @dispatcher.on(Ping)
+        async def handle_ping(message, client_id):
+            received.append((message, client_id))
+            return "pong"
+        
+        assert await dispatcher.dispatch(Ping(), "client") == "pong"
+        assert received == [(Ping(), "client")]
+    
+    async def test_dispatch_unsupported(self):
+        """Unhandled message types raise a ProtocolError"""
+        dispatcher = Dispatcher()
+        with pytest.raises(ProtocolError):
+            await dispatcher.dispatch(Resume(request_id="r1"), "client")
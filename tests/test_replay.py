@@ -0,0 +1,126 @@
+import os
+import sys
+import json
+import pytest
+from unittest.mock import AsyncMock, patch
+
+# Add parent directory to path to allow importing from the project root
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from replay import ReplayBuffer, ReplaySettings, resume_failed_frame
+
+def chunk(seq, content="x"):
+    return json.dumps({"type": "chunk", "seq": seq, "content": content, "request_id": "r1"})
+
+DONE = json.dumps({"type": "done", "chunks": 3, "request_id": "r1"})
+
+def sent(send):
+    return [call.args[0] for call in send.call_args_list]
+
+async def write(stream, chunks=3, done=True):
+    for seq in range(chunks):
+        await stream.send(chunk(seq), seq)
+    if done:
+        await stream.send(DONE)
+
+@pytest.mark.asyncio
+class TestReplayBuffer:
+    """Tests for the buffers of answers kept for resumption"""
+
+    async def test_answer_sent_live(self):
+        """Frames reach the connected client as they are sent"""
+        buffer = ReplayBuffer()
+        send = AsyncMock()
+        await write(buffer.open("c1", "r1", send))
+        assert sent(send) == [chunk(0), chunk(1), chunk(2), DONE]
+        assert buffer.bytes == sum(len(frame) for frame in sent(send))
+
+    async def test_resume_finished_answer(self):
+        """A resume replays the chunks after last_seq and the final frame"""
+        buffer = ReplayBuffer()
+        await write(buffer.open("c1", "r1", AsyncMock()))
+        send = AsyncMock()
+        assert await buffer.resume("c1", "r1", 0, send)
+        assert sent(send) == [chunk(1), chunk(2), DONE]
+
+    async def test_resume_answer_in_progress(self):
+        """An answer still being generated continues on the resuming connection"""
+        buffer = ReplayBuffer()
+        old = AsyncMock(side_effect=ConnectionError("gone"))
+        stream = buffer.open("c1", "r1", old)
+        # The client has left: sending doesn't raise, so generation goes on
+        await write(stream, chunks=2, done=False)
+        new = AsyncMock()
+        assert await buffer.resume("c1", "r1", -1, new)
+        await stream.send(chunk(2), 2)
+        await stream.send(DONE)
+        assert sent(new) == [chunk(0), chunk(1), chunk(2), DONE]
+        assert old.await_count == 1
+
+    async def test_unbuffered_answer(self):
+        """Without a request_id nothing is kept, and a failed send raises"""
+        buffer = ReplayBuffer()
+        stream = buffer.open("c1", None, AsyncMock(side_effect=ConnectionError("gone")))
+        with pytest.raises(ConnectionError):
+            await stream.send(chunk(0), 0)
+        assert not buffer.streams and buffer.bytes == 0
+
+    async def test_resume_unknown(self):
+        """Only the client an answer belongs to can resume it"""
+        buffer = ReplayBuffer()
+        await write(buffer.open("c1", "r1", AsyncMock()))
+        send = AsyncMock()
+        assert not await buffer.resume("c2", "r1", -1, send)
+        assert not await buffer.resume("c1", "r2", -1, send)
+        send.assert_not_awaited()
+        assert json.loads(resume_failed_frame("r2"))["type"] == "resume_failed"
+
+    async def test_large_answer_not_kept(self):
+        """An answer past max_request_bytes is dropped, and live sends raise again"""
+        buffer = ReplayBuffer(ReplaySettings(max_request_bytes=len(chunk(0)) * 2))
+        send = AsyncMock()
+        stream = buffer.open("c1", "r1", send)
+        await write(stream, chunks=3, done=False)
+        assert not buffer.streams and buffer.bytes == 0
+        assert not await buffer.resume("c1", "r1", -1, AsyncMock())
+        send.side_effect = ConnectionError("gone")
+        with pytest.raises(ConnectionError):
+            await stream.send(DONE)
+
+    async def test_evicts_least_recently_written(self):
+        """Past max_requests or max_bytes, the answers written longest ago go first"""
+        buffer = ReplayBuffer(ReplaySettings(max_requests=2))
+        streams = [buffer.open("c1", f"r{n}", AsyncMock()) for n in range(2)]
+        await streams[0].send(chunk(0), 0)
+        buffer.open("c1", "r2", AsyncMock())
+        assert list(buffer.streams) == [("c1", "r0"), ("c1", "r2")]
+
+        buffer = ReplayBuffer(ReplaySettings(max_bytes=len(chunk(0)) * 3))
+        for n in range(4):
+            await buffer.open("c1", f"r{n}", AsyncMock()).send(chunk(0), 0)
+        assert list(buffer.streams) == [("c1", "r1"), ("c1", "r2"), ("c1", "r3")]
+        assert buffer.bytes == len(chunk(0)) * 3
+
+    async def test_expires_after_ttl(self):
+        """An answer is forgotten ttl seconds after its last frame"""
+        buffer = ReplayBuffer(ReplaySettings(ttl=10))
+        with patch("replay.time.monotonic", return_value=100.0):
+            await write(buffer.open("c1", "r1", AsyncMock()))
+        with patch("replay.time.monotonic", return_value=109.0):
+            assert await buffer.resume("c1", "r1", -1, AsyncMock())
+        with patch("replay.time.monotonic", return_value=110.0):
+            assert not await buffer.resume("c1", "r1", -1, AsyncMock())
+        assert buffer.bytes == 0
+
+    async def test_disabled(self):
+        """A ttl of 0 turns buffering off"""
+        buffer = ReplayBuffer(ReplaySettings(ttl=0))
+        await write(buffer.open("c1", "r1", AsyncMock()))
+        assert not buffer.streams
+
+def test_settings_from_env(monkeypatch):
+    """Limits are read from REPLAY_* variables"""
+    monkeypatch.setenv("REPLAY_TTL", "30")
+    monkeypatch.setenv("REPLAY_MAX_REQUESTS", "5")
+    settings = ReplaySettings.from_env()
+    assert (settings.ttl, settings.max_requests, settings.max_bytes) == (30.0, 5, 32 * 1024 * 1024)
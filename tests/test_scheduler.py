@@ -0,0 +1,149 @@
+import os
+import sys
+import time
+import threading
+import contextvars
+import pytest
+
+# Add parent directory to path to allow importing from the project root
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from scheduler import DISPATCHED, FairScheduler
+
+def blocked(scheduler, lane="interactive"):
+    """Occupy the scheduler's only worker until the returned event is set"""
+    release = threading.Event()
+    started = threading.Event()
+
+    def hold():
+        started.set()
+        release.wait(5)
+
+    future = scheduler.submit("holder", hold, lane=lane)
+    started.wait(5)
+    return release, future
+
+def record(order, name):
+    return lambda: order.append(name)
+
+class TestFairScheduler:
+    """Tests for deficit round robin scheduling of upstream calls"""
+
+    def test_round_robin_across_clients(self):
+        """A client with a backlog does not delay others' calls behind all of its own"""
+        scheduler = FairScheduler(concurrency=1)
+        order = []
+        release, holder = blocked(scheduler)
+        futures = [scheduler.submit("chatty", record(order, "chatty")) for _ in range(4)]
+        futures += [scheduler.submit("quiet", record(order, "quiet")) for _ in range(2)]
+        assert scheduler.depth("interactive") == 6
+        release.set()
+        for future in [holder] + futures:
+            future.result(5)
+        assert order == ["chatty", "quiet", "chatty", "quiet", "chatty", "chatty"]
+        assert scheduler.depth("interactive") == 0
+        scheduler.shutdown()
+
+    def test_weights(self):
+        """Clients are served in proportion to their weights"""
+        scheduler = FairScheduler(concurrency=1)
+        order = []
+        release, holder = blocked(scheduler)
+        futures = [scheduler.submit("gold", record(order, "gold"), weight=2) for _ in range(6)]
+        futures += [scheduler.submit("free", record(order, "free"), weight=1) for _ in range(6)]
+        release.set()
+        for future in futures:
+            future.result(5)
+        assert order[:6].count("gold") == 4
+        assert order[:6].count("free") == 2
+        scheduler.shutdown()
+
+    def test_priority_lanes(self):
+        """Interactive calls run before batch calls queued earlier"""
+        scheduler = FairScheduler(concurrency=1)
+        order = []
+        release, holder = blocked(scheduler)
+        before = DISPATCHED.value(lane="batch")
+        futures = [scheduler.submit("api", record(order, "batch"), lane="batch") for _ in range(2)]
+        futures += [scheduler.submit("ws", record(order, "interactive"), lane="interactive") for _ in range(2)]
+        release.set()
+        for future in futures:
+            future.result(5)
+        assert order == ["interactive", "interactive", "batch", "batch"]
+        assert DISPATCHED.value(lane="batch") == before + 2
+        scheduler.shutdown()
+
+    def test_one_call_per_client_at_a_time(self):
+        """Calls for the same client never overlap, so chat history stays ordered"""
+        scheduler = FairScheduler(concurrency=4)
+        running = []
+        peak = []
+        lock = threading.Lock()
+
+        def call():
+            with lock:
+                running.append(1)
+                peak.append(len(running))
+            time.sleep(0.01)
+            with lock:
+                running.pop()
+
+        futures = [scheduler.submit("same", call) for _ in range(5)]
+        for future in futures:
+            future.result(5)
+        assert max(peak) == 1
+        scheduler.shutdown()
+
+    def test_one_call_per_client_across_lanes(self):
+        """A client's calls in different lanes never overlap, as they share its chat session"""
+        scheduler = FairScheduler(concurrency=4)
+        running = []
+        peak = []
+        lock = threading.Lock()
+
+        def call():
+            with lock:
+                running.append(1)
+                peak.append(len(running))
+            time.sleep(0.01)
+            with lock:
+                running.pop()
+
+        futures = [scheduler.submit("same", call, lane=lane) for lane in ("interactive", "batch") * 3]
+        futures.append(scheduler.submit("other", lambda: None, lane="batch"))
+        for future in futures:
+            future.result(5)
+        assert max(peak) == 1
+        scheduler.shutdown()
+
+    def test_context_and_errors_propagate(self):
+        """Calls run in the submitter's context, and their exceptions reach the caller"""
+        scheduler = FairScheduler(concurrency=2)
+        request_id = contextvars.ContextVar("request_id")
+        request_id.set("req_1")
+        assert scheduler.call("c", request_id.get) == "req_1"
+
+        def fail():
+            raise RuntimeError("quota exceeded")
+
+        with pytest.raises(RuntimeError, match="quota exceeded"):
+            scheduler.call("c", fail)
+        with pytest.raises(ValueError):
+            scheduler.submit("c", fail, lane="unknown")
+        scheduler.shutdown()
+
+    def test_weight_must_be_positive(self):
+        """A weight that could never earn credit is refused instead of stalling the workers"""
+        scheduler = FairScheduler(concurrency=1)
+        for weight in (0, -1):
+            with pytest.raises(ValueError):
+                scheduler.submit("c", lambda: None, weight=weight)
+        assert scheduler.call("c", lambda: "ok") == "ok"
+        scheduler.shutdown()
+
+    @pytest.mark.asyncio
+    async def test_run_from_coroutine(self):
+        """Coroutines await scheduled calls without blocking the event loop"""
+        scheduler = FairScheduler(concurrency=1)
+        assert await scheduler.run("c", lambda x: x * 2, 21) == 42
+        scheduler.shutdown()
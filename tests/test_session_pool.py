@@ -0,0 +1,115 @@
+import os
+import sys
+import time
+import itertools
+import threading
+import pytest
+
+# Add parent directory to path to allow importing from the project root
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from session_pool import POOL_TAKES, SessionPool, SessionPoolSettings
+
+def counting_factory():
+    counter = itertools.count()
+    return lambda: f"session-{next(counter)}"
+
+def wait_until(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not met in time"
+        time.sleep(0.01)
+
+class TestSessionPool:
+    """Tests for the warm pool of chat sessions"""
+
+    def test_from_env(self, monkeypatch):
+        """Pool size is read from the environment"""
+        monkeypatch.setenv("SESSION_POOL_SIZE", "4")
+        assert SessionPoolSettings.from_env().size == 4
+        assert SessionPoolSettings.from_env("OTHER_POOL").size == 16
+
+    def test_start_fills_pool(self):
+        """Starting creates the ready sessions up front"""
+        pool = SessionPool(counting_factory(), SessionPoolSettings(size=3))
+        pool.start()
+        try:
+            assert list(pool.sessions) == ["session-0", "session-1", "session-2"]
+        finally:
+            pool.close()
+
+    def test_take_hands_out_once_and_refills(self):
+        """Each session is handed out once and the pool is topped back up"""
+        pool = SessionPool(counting_factory(), SessionPoolSettings(size=2))
+        pool.start()
+        try:
+            hits = POOL_TAKES.value(result="hit")
+            taken = [pool.take(), pool.take()]
+            assert taken == ["session-0", "session-1"]
+            assert POOL_TAKES.value(result="hit") == hits + 2
+            wait_until(lambda: len(pool.sessions) == 2)
+            assert set(pool.sessions).isdisjoint(taken)
+        finally:
+            pool.close()
+
+    def test_take_when_empty_creates_session(self):
+        """An empty pool still hands out a fresh session"""
+        pool = SessionPool(counting_factory(), SessionPoolSettings(size=0))
+        pool.start()
+        misses = POOL_TAKES.value(result="miss")
+        assert pool.take() == "session-0"
+        assert pool.take() == "session-1"
+        assert POOL_TAKES.value(result="miss") == misses + 2
+        assert pool.thread is None
+
+    @pytest.mark.asyncio
+    async def test_acquire_miss_runs_off_event_loop(self):
+        """On a miss the session is created on a worker thread, not the event loop"""
+        threads = []
+
+        def factory():
+            threads.append(threading.current_thread())
+            return "session"
+
+        pool = SessionPool(factory, SessionPoolSettings(size=0))
+        assert await pool.acquire() == "session"
+        assert threads[0] is not threading.main_thread()
+
+    @pytest.mark.asyncio
+    async def test_acquire_hit(self):
+        """A ready session is handed out without creating one"""
+        pool = SessionPool(counting_factory(), SessionPoolSettings(size=1))
+        pool.start()
+        try:
+            assert await pool.acquire() == "session-0"
+        finally:
+            pool.close()
+
+    def test_refill_survives_factory_errors(self, monkeypatch):
+        """A failing factory is retried by the refill thread"""
+        monkeypatch.setattr("session_pool.REFILL_BACKOFF", 0.01)
+        calls = itertools.count()
+
+        def flaky():
+            n = next(calls)
+            if n in (1, 2):
+                raise RuntimeError("backend unavailable")
+            return n
+
+        pool = SessionPool(flaky, SessionPoolSettings(size=1))
+        pool.start()
+        try:
+            assert pool.take() == 0
+            wait_until(lambda: len(pool.sessions) == 1)
+            assert pool.take() == 3
+        finally:
+            pool.close()
+
+    def test_close_stops_refilling(self):
+        """A closed pool drops its sessions and stops its thread"""
+        pool = SessionPool(counting_factory(), SessionPoolSettings(size=2))
+        pool.start()
+        pool.close()
+        assert not pool.sessions
+        pool.thread.join(2)
+        assert not pool.thread.is_alive()
@@ -0,0 +1,55 @@
+import os
+import sys
+from dataclasses import dataclass
+
+# Add parent directory to path to allow importing from the project root
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from settings import EnvSettings, parse_bool
+
+@dataclass
+class ExampleSettings(EnvSettings):
+    env_prefix = "EXAMPLE"
+    env_switch = "enabled"
+
+    enabled: bool = True
+    name: str = "default"
+    size: int = 4
+    ratio: float = 0.5
+    verbose: bool = False
+
+class TestEnvSettings:
+    """Tests for loading settings dataclasses from the environment"""
+
+    def test_defaults(self):
+        """Without variables, the dataclass defaults and per-server defaults apply"""
+        assert ExampleSettings.from_env() == ExampleSettings()
+        assert ExampleSettings.from_env(size=8).size == 8
+
+    def test_cast_by_field_type(self, monkeypatch):
+        """Each field is read from <PREFIX>_<FIELD> and cast to its annotated type"""
+        monkeypatch.setenv("EXAMPLE_NAME", "api")
+        monkeypatch.setenv("EXAMPLE_SIZE", "16")
+        monkeypatch.setenv("EXAMPLE_RATIO", "0.25")
+        monkeypatch.setenv("EXAMPLE_VERBOSE", "yes")
+        settings = ExampleSettings.from_env(size=8)
+        assert (settings.name, settings.size, settings.ratio, settings.verbose) == ("api", 16, 0.25, True)
+
+    def test_prefix(self, monkeypatch):
+        """A prefix passed in replaces the class's, so servers can be tuned separately"""
+        monkeypatch.setenv("EXAMPLE_SIZE", "16")
+        monkeypatch.setenv("OTHER_SIZE", "32")
+        assert ExampleSettings.from_env("OTHER").size == 32
+
+    def test_switch(self, monkeypatch):
+        """The switch field is read from the bare prefix"""
+        monkeypatch.setenv("EXAMPLE", "off")
+        monkeypatch.setenv("EXAMPLE_ENABLED", "1")
+        assert not ExampleSettings.from_env().enabled
+
+    def test_parse_bool(self):
+        """Common spellings of false are false, anything else true"""
+        for value in ("0", "false", "OFF", "no", "", " False "):
+            assert not parse_bool(value)
+        for value in ("1", "true", "on", "yes"):
+            assert parse_bool(value)
@@ -0,0 +1,181 @@
+import os
+import sys
+import json
+import asyncio
+import pytest
+import httpx
+from unittest.mock import AsyncMock, MagicMock, patch
+
+# Add parent directory to path to allow importing from the project root
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from admission import Busy
+from sse import SseSettings, StreamClosed, event_stream, format_event
+
+class FakeChunk:
+    def __init__(self, text):
+        self.text = text
+
+class StreamingChatSession:
+    """Chat session answering in fixed chunks"""
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.prompts = []
+
+    def send_message(self, content, stream=False):
+        assert stream
+        self.prompts.append(content)
+        return (FakeChunk(text) for text in self.chunks)
+
+def parse_events(body):
+    """(event name, data) of each event in an event stream body"""
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines() if not line.startswith(":"))
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+async def collect(stream):
+    return [event async for event in stream]
+
+class TestEventStream:
+    """Tests for running a frame handler as an event stream"""
+
+    def test_format_event(self):
+        """Events are named after the frame type"""
+        assert format_event('{"type": "chunk", "content": "a"}') == \
+            'event: chunk\ndata: {"type": "chunk", "content": "a"}\n\n'
+
+    @pytest.mark.asyncio
+    async def test_frames_become_events(self):
+        """Every frame sent is yielded in order and the stream ends with the handler"""
+        async def handler(send):
+            await send('{"type": "status"}')
+            await send('{"type": "done"}')
+
+        events = await collect(event_stream(handler))
+        assert [event.split("\n")[0] for event in events] == ["event: status", "event: done"]
+
+    @pytest.mark.asyncio
+    async def test_keepalive(self):
+        """A comment is sent while the handler is silent"""
+        async def handler(send):
+            await asyncio.sleep(0.05)
+            await send('{"type": "done"}')
+
+        events = await collect(event_stream(handler, SseSettings(keepalive=0.01)))
+        assert events[0] == ": keep-alive\n\n"
+        assert events[-1].startswith("event: done")
+
+    @pytest.mark.asyncio
+    async def test_closing_stops_handler(self):
+        """When the client goes away the handler is cancelled and sends fail"""
+        sends = []
+        cancelled = asyncio.Event()
+
+        async def handler(send):
+            sends.append(send)
+            await send('{"type": "status"}')
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        stream = event_stream(handler)
+        assert (await stream.__anext__()).startswith("event: status")
+        await stream.aclose()
+        await asyncio.wait_for(cancelled.wait(), 1)
+        with pytest.raises(StreamClosed):
+            await sends[0]('{"type": "chunk"}')
+
+    def test_settings_from_env(self, monkeypatch):
+        """Keep-alive interval is read from the environment"""
+        monkeypatch.setenv("SSE_KEEPALIVE", "5")
+        assert SseSettings.from_env().keepalive == 5.0
+
+@pytest.mark.asyncio
+@pytest.mark.usefixtures("mock_gemini_api")
+class TestChatStreamEndpoint:
+    """Tests for POST /api/chat/stream on the FastAPI app"""
+
+    async def post(self, body):
+        from websocket_server import app
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.post("/api/chat/stream", content=json.dumps(body))
+
+    async def test_streams_chunks(self):
+        """Status, one chunk event per Gemini chunk, then done"""
+        import websocket_server
+        session = StreamingChatSession(["Hello", ", ", "world"])
+        with patch.object(websocket_server.manager, "chat_sessions", {}), \
+                patch.object(websocket_server.session_pool, "acquire", AsyncMock(return_value=session)):
+            response = await self.post({"client_id": "sse-client", "message": "Hi"})
+            assert websocket_server.manager.chat_sessions["sse-client"] is session
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/event-stream")
+        events = parse_events(response.text)
+        assert [name for name, _ in events] == ["status", "chunk", "chunk", "chunk", "done"]
+        assert "".join(data["content"] for name, data in events if name == "chunk") == "Hello, world"
+        assert [data["seq"] for name, data in events if name == "chunk"] == [0, 1, 2]
+        assert events[-1][1] == {"type": "done", "chunks": 3, "chars": 12}
+        assert session.prompts == ["Hi"]
+
+    async def test_batch_lane(self):
+        """HTTP callers are scheduled in the batch lane, behind WebSocket chat"""
+        import websocket_server
+        from scheduler import DISPATCHED
+        before = DISPATCHED.value(lane="batch")
+        with patch.object(websocket_server.manager, "chat_sessions", {"sse-client": StreamingChatSession(["ok"])}):
+            await self.post({"client_id": "sse-client", "message": "Hi"})
+        assert DISPATCHED.value(lane="batch") == before + 1
+
+    async def test_shares_session_with_websocket(self):
+        """A client's existing chat session is continued, not replaced"""
+        import websocket_server
+        session = StreamingChatSession(["ok"])
+        acquire = AsyncMock()
+        with patch.object(websocket_server.manager, "chat_sessions", {"ws-client": session}), \
+                patch.object(websocket_server.session_pool, "acquire", acquire):
+            await self.post({"client_id": "ws-client", "message": "Follow-up"})
+        acquire.assert_not_called()
+        assert session.prompts == ["Follow-up"]
+
+    async def test_gemini_error_event(self):
+        """A failing Gemini call ends the stream with an error event"""
+        import websocket_server
+        session = StreamingChatSession([])
+        session.send_message = lambda content, stream=False: (_ for _ in ()).throw(RuntimeError("quota"))
+        with patch.object(websocket_server.manager, "chat_sessions", {"c": session}):
+            response = await self.post({"client_id": "c", "message": "Hi"})
+        events = parse_events(response.text)
+        assert [name for name, _ in events] == ["status", "error"]
+        assert "quota" in events[-1][1]["content"]
+
+    async def test_invalid_request(self):
+        """Requests without a message are refused before streaming"""
+        response = await self.post({"client_id": "c"})
+        assert response.status_code == 400
+        assert "message" in response.json()["error"]
+
+    async def test_busy(self):
+        """Requests past admission limits get 503 with Retry-After"""
+        import websocket_server
+        with patch.object(websocket_server.admission, "check", MagicMock(side_effect=Busy(1.5, "queue_full"))):
+            response = await self.post({"client_id": "c", "message": "Hi"})
+        assert response.status_code == 503
+        assert response.headers["retry-after"] == "2"
+
+    async def test_slot_held_only_while_streaming(self):
+        """A response whose body is never sent holds no admission slot, and a sent one gives it back"""
+        import websocket_server
+        admission = websocket_server.admission
+        request = MagicMock()
+        request.body = AsyncMock(return_value=json.dumps({"client_id": "slot-client", "message": "Hi"}).encode())
+        response = await websocket_server.chat_stream(request)
+        assert "slot-client" not in admission.per_client
+        await response.body_iterator.aclose()
+        with patch.object(websocket_server.manager, "chat_sessions", {"slot-client": StreamingChatSession(["ok"])}):
+            await self.post({"client_id": "slot-client", "message": "Hi"})
+        assert "slot-client" not in admission.per_client
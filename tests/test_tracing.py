@@ -0,0 +1,130 @@
+import os
+import sys
+import json
+import asyncio
+import logging
+import pytest
+
+# Add parent directory to path to allow importing from the project root
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from tracing import FileSpanExporter, RequestIdFilter, Tracer, current_request_id, new_request_id
+
+def read_lines(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+@pytest.fixture
+def trace_file(tmp_path):
+    return str(tmp_path / "spans.jsonl")
+
+class TestTracing:
+    """Tests for request tracing spans and the file exporter"""
+
+    def test_new_request_id_is_unique(self):
+        """Request IDs are unique even when generated in the same second"""
+        ids = {new_request_id() for _ in range(1000)}
+        assert len(ids) == 1000
+        assert all(request_id.startswith("req_") for request_id in ids)
+
+    def test_spans_are_nested_and_exported(self, trace_file):
+        """Child spans share the trace and point at their parent"""
+        exporter = FileSpanExporter(trace_file)
+        tracer = Tracer(exporter)
+        with tracer.trace("receive", client_id="c1") as root:
+            with tracer.span("parse"):
+                pass
+            with tracer.span("upstream", target="gemini") as upstream:
+                with tracer.span("chunk"):
+                    pass
+                upstream.set_attribute("status", 200)
+        exporter.shutdown()
+
+        spans = {span["name"]: span for span in read_lines(trace_file)}
+        assert set(spans) == {"receive", "parse", "upstream", "chunk"}
+        assert {span["trace_id"] for span in spans.values()} == {root.trace_id}
+        assert {span["request_id"] for span in spans.values()} == {root.request_id}
+        assert spans["receive"]["parent_id"] is None
+        assert spans["parse"]["parent_id"] == spans["receive"]["span_id"]
+        assert spans["chunk"]["parent_id"] == spans["upstream"]["span_id"]
+        assert spans["upstream"]["attributes"] == {"target": "gemini", "status": 200}
+        assert spans["receive"]["attributes"] == {"client_id": "c1"}
+        assert spans["receive"]["duration_ms"] >= spans["upstream"]["duration_ms"]
+
+    def test_errors_are_recorded(self, trace_file):
+        """A span records the exception that escaped it"""
+        exporter = FileSpanExporter(trace_file)
+        tracer = Tracer(exporter)
+        with pytest.raises(RuntimeError):
+            with tracer.trace("receive"):
+                with tracer.span("upstream"):
+                    raise RuntimeError("quota exceeded")
+        exporter.shutdown()
+
+        spans = {span["name"]: span for span in read_lines(trace_file)}
+        assert "quota exceeded" in spans["upstream"]["error"]
+        assert "quota exceeded" in spans["receive"]["error"]
+
+    def test_otlp_format(self, trace_file):
+        """OTLP output carries hex IDs, nanosecond timestamps and typed attributes"""
+        exporter = FileSpanExporter(trace_file, otlp=True, service_name="test-server")
+        tracer = Tracer(exporter)
+        with tracer.trace("receive", bytes=42):
+            with tracer.span("send"):
+                pass
+        exporter.shutdown()
+
+        batches = read_lines(trace_file)
+        resource = batches[0]["resourceSpans"][0]
+        assert resource["resource"]["attributes"][0]["value"] == {"stringValue": "test-server"}
+        spans = [span for batch in batches
+                 for span in batch["resourceSpans"][0]["scopeSpans"][0]["spans"]]
+        by_name = {span["name"]: span for span in spans}
+        assert len(by_name["receive"]["traceId"]) == 32
+        assert len(by_name["send"]["spanId"]) == 16
+        assert by_name["send"]["parentSpanId"] == by_name["receive"]["spanId"]
+        assert int(by_name["receive"]["endTimeUnixNano"]) >= int(by_name["receive"]["startTimeUnixNano"])
+        attributes = {a["key"]: a["value"] for a in by_name["receive"]["attributes"]}
+        assert attributes["bytes"] == {"intValue": "42"}
+        assert attributes["request_id"]["stringValue"].startswith("req_")
+
+    def test_disabled_tracer_still_assigns_request_ids(self):
+        """Without an exporter, child spans are no-ops but the request ID is set"""
+        tracer = Tracer()
+        assert current_request_id() is None
+        with tracer.trace("receive", request_id="req_given") as root:
+            with tracer.span("parse") as span:
+                span.set_attribute("ignored", True)
+                assert current_request_id() == "req_given"
+        assert root.request_id == "req_given"
+        assert current_request_id() is None
+
+    @pytest.mark.asyncio
+    async def test_concurrent_traces_are_isolated(self, trace_file):
+        """Concurrent tasks keep their own current span"""
+        exporter = FileSpanExporter(trace_file)
+        tracer = Tracer(exporter)
+
+        async def handle(client_id):
+            with tracer.trace("receive", client_id=client_id) as root:
+                await asyncio.sleep(0.01)
+                with tracer.span("send"):
+                    await asyncio.sleep(0.01)
+                    assert current_request_id() == root.request_id
+                return root
+
+        roots = await asyncio.gather(*(handle(f"c{i}") for i in range(5)))
+        exporter.shutdown()
+
+        parents = {span["parent_id"]: span["trace_id"] for span in read_lines(trace_file) if span["name"] == "send"}
+        assert parents == {root.span_id: root.trace_id for root in roots}
+
+    def test_request_id_filter(self):
+        """Log records made inside a trace are tagged with its request ID"""
+        record = logging.LogRecord("test", logging.INFO, __file__, 1, "hello", (), None)
+        log_filter = RequestIdFilter()
+        assert log_filter.filter(record)
+        assert not hasattr(record, "request_id")
+        with Tracer().trace("receive") as root:
+            log_filter.filter(record)
+        assert record.request_id == root.request_id
@@ -0,0 +1,123 @@
+import os
+import sys
+import json
+import asyncio
+import threading
+import pytest
+
+# Add parent directory to path to allow importing from the project root
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from warmup import SERVER_READY, Warmup, WarmupFailed
+
+class TestWarmup:
+    """Tests for fast start and warm-up readiness"""
+
+    def test_from_env(self, monkeypatch):
+        """Fast start and the wait timeout are read from the environment"""
+        monkeypatch.setenv("FAST_START", "1")
+        monkeypatch.setenv("WARMUP_TIMEOUT", "5")
+        warmup = Warmup.from_env()
+        assert warmup.background
+        assert warmup.timeout == 5.0
+        monkeypatch.setenv("FAST_START", "0")
+        assert not Warmup.from_env().background
+
+    def test_inline_runs_steps_in_order(self):
+        """Without fast start the steps run at start(), once"""
+        ran = []
+        warmup = Warmup()
+        warmup.step(lambda: ran.append("first"))
+        warmup.step(lambda: ran.append("second"))
+        assert warmup.status()[1] == {"status": "warming"}
+        warmup.start()
+        warmup.start()
+        assert ran == ["first", "second"]
+        assert warmup.ready
+        status, body = warmup.status()
+        assert status == 200
+        assert body["status"] == "ready"
+        assert SERVER_READY.value() == 1
+
+    def test_inline_failure_raises(self):
+        """A failing step stops an inline start-up, as before fast start"""
+        warmup = Warmup()
+
+        @warmup.step
+        def broken():
+            raise ValueError("no API key")
+
+        with pytest.raises(ValueError):
+            warmup.start()
+        assert not warmup.ready
+        status, body = warmup.status()
+        assert status == 503
+        assert body == {"status": "failed", "error": "no API key"}
+
+    @pytest.mark.asyncio
+    async def test_background_wait(self):
+        """Fast start returns at once; waiters are released when the steps finish"""
+        release = threading.Event()
+        warmup = Warmup(background=True, timeout=5)
+        warmup.step(lambda: release.wait(5))
+        warmup.start()
+        assert not warmup.ready
+        assert warmup.status()[0] == 503
+        waiter = asyncio.create_task(warmup.wait())
+        await asyncio.sleep(0.1)
+        assert not waiter.done()
+        release.set()
+        await asyncio.wait_for(waiter, 2)
+        assert warmup.ready
+
+    @pytest.mark.asyncio
+    async def test_wait_starts_warmup(self):
+        """Waiting starts a warm-up the server never started"""
+        ran = []
+        warmup = Warmup(background=True, timeout=5)
+        warmup.step(lambda: ran.append(1))
+        await warmup.wait()
+        assert ran == [1]
+
+    @pytest.mark.asyncio
+    async def test_wait_fails(self):
+        """Waiters get WarmupFailed when a step fails or warm-up is too slow"""
+        warmup = Warmup(background=True, timeout=5)
+        warmup.step(lambda: 1 / 0)
+        with pytest.raises(WarmupFailed):
+            await warmup.wait()
+
+        release = threading.Event()
+        slow = Warmup(background=True, timeout=0.1)
+        slow.step(lambda: release.wait(5))
+        with pytest.raises(WarmupFailed, match="still warming up"):
+            await slow.wait()
+        release.set()
+
+    @pytest.mark.asyncio
+    async def test_gate_serves_ready(self):
+        """The websockets hook answers /ready and passes other paths on"""
+        async def process_request(path, request_headers):
+            return 404, [], b"next"
+
+        warmup = Warmup()
+        gate = warmup.gate(process_request)
+        status, headers, body = await gate("/ready", {})
+        assert status == 503
+        assert json.loads(body) == {"status": "warming"}
+        warmup.start()
+        status, _, body = await gate("/ready", {})
+        assert status == 200
+        assert json.loads(body)["status"] == "ready"
+        assert await gate("/other", {}) == (404, [], b"next")
+        assert await warmup.gate()("/other", {}) is None
+
+@pytest.mark.parametrize("module", ["websocket_server.py", "simple_websocket_server.py", "simple_api_server.py",
+                                    "async_api_server.py"])
+def test_main_block_is_last(module):
+    """Nothing follows a server's __main__ block, which only returns once the server stops"""
+    import ast
+    with open(os.path.join(os.path.dirname(__file__), '..', module)) as f:
+        body = ast.parse(f.read()).body
+    mains = [i for i, node in enumerate(body) if isinstance(node, ast.If) and "__main__" in ast.unparse(node.test)]
+    assert mains == [len(body) - 1]
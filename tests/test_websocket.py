@@ -193,6 +193,74 @@ class TestWebSocketServer:
             assert response_data["type"] == "error"
             assert "Invalid JSON" in response_data["content"]
 
+    async def test_websocket_echoes_request_id(self, mock_websocket):
+        """A client-supplied request_id is echoed on every reply frame"""
+        with patch('websocket_server.manager.connect'), \
+             patch('websocket_server.manager.chat_sessions', {}) as mock_sessions, \
+             patch('websocket_server.manager.send_message') as mock_send, \
+             patch.object(mock_websocket, 'receive_text', new_callable=AsyncMock) as mock_receive:
+            client_id = "test_client"
+            mock_sessions[client_id] = make_mock_chat_session()
+            mock_receive.return_value = json.dumps({"type": "message", "content": "Hi", "request_id": "abc-1"})
+            await websocket_endpoint(mock_websocket, client_id)
+            frames = [json.loads(call.args[0]) for call in mock_send.call_args_list]
+            assert [frame["type"] for frame in frames] == ["status", "response"]
+            assert all(frame["request_id"] == "abc-1" for frame in frames)
+
+    async def test_websocket_streams_chunks(self, mock_websocket):
+        """A message with stream set is answered in chunk frames and a done frame"""
+        with patch('websocket_server.manager.connect'), \
+             patch('websocket_server.manager.chat_sessions', {}) as mock_sessions, \
+             patch('websocket_server.manager.send_message') as mock_send, \
+             patch.object(mock_websocket, 'receive_text', new_callable=AsyncMock) as mock_receive:
+            client_id = "test_client"
+            session = mock_sessions[client_id] = MagicMock()
+            session.send_message.return_value = iter([MagicMock(text="Hel"), MagicMock(text=""), MagicMock(text="lo")])
+            mock_receive.return_value = json.dumps({"type": "message", "content": "Hi", "request_id": "abc-1",
+                                                    "stream": True})
+            await websocket_endpoint(mock_websocket, client_id)
+            session.send_message.assert_called_once_with("Hi", stream=True)
+            frames = [json.loads(call.args[0]) for call in mock_send.call_args_list]
+            assert [(frame["type"], frame.get("seq"), frame.get("content")) for frame in frames] == [
+                ("status", None, "processing"), ("chunk", 0, "Hel"), ("chunk", 1, "lo"), ("done", None, None)]
+            assert frames[-1]["chunks"] == 2
+
+    async def test_websocket_resume_after_drop(self):
+        """An answer interrupted by a dropped connection is finished and replayed on resume"""
+        from websocket_server import handle_frame
+        session = MagicMock()
+        session.send_message.return_value = iter([MagicMock(text="Hel"), MagicMock(text="lo")])
+        delivered = []
+
+        async def send_until_drop(frame):
+            if len(delivered) == 2:
+                raise ConnectionError("client went away")
+            delivered.append(json.loads(frame))
+
+        with patch('websocket_server.manager.chat_sessions', {"c1": session}):
+            await handle_frame(json.dumps({"type": "message", "content": "Hi", "request_id": "r1", "stream": True}),
+                               "c1", send_until_drop)
+        assert [frame["type"] for frame in delivered] == ["status", "chunk"]
+
+        resumed = AsyncMock()
+        await handle_frame(json.dumps({"type": "resume", "request_id": "r1", "last_seq": 0}), "c1", resumed)
+        frames = [json.loads(call.args[0]) for call in resumed.call_args_list]
+        assert [(frame["type"], frame.get("seq")) for frame in frames] == [("chunk", 1), ("done", None)]
+        assert session.send_message.call_count == 1
+
+        # Other clients' answers, and unknown ones, can't be resumed
+        for client_id, request_id in (("c2", "r1"), ("c1", "r2")):
+            refused = AsyncMock()
+            await handle_frame(json.dumps({"type": "resume", "request_id": request_id}), client_id, refused)
+            assert json.loads(refused.call_args.args[0])["type"] == "resume_failed"
+
+    async def test_unhandled_message_type(self):
+        """A valid message this server doesn't handle gets an error frame, not a server error"""
+        from websocket_server import handle_frame
+        send = AsyncMock()
+        await handle_frame(json.dumps({"type": "pong"}), "c1", send)
+        assert json.loads(send.call_args.args[0]) == {"type": "error", "content": "Unsupported message type: pong"}
+
 # Simple tests that don't need TestClient
 class TestSimpleEndpoints:
     """Simple tests for endpoints without using TestClient"""
@@ -202,6 +270,27 @@ class TestSimpleEndpoints:
         from websocket_server import read_root
         response = read_root()
         assert response == {"status": "Gemini WebSocket Server is running"}
+    
+    def test_metrics_endpoint(self):
+        """Test the metrics endpoint renders the server metrics"""
+        from websocket_server import read_metrics
+        response = read_metrics()
+        assert response.media_type.startswith("text/plain")
+        body = response.body.decode()
+        assert "# TYPE gemini_request_seconds histogram" in body
+        assert "# TYPE active_connections gauge" in body
+        assert "# TYPE errors_total counter" in body
+    
+    @pytest.mark.asyncio
+    async def test_admin_drain_endpoint_requires_token(self):
+        """The drain endpoint is hidden without DRAIN_TOKEN and refuses a wrong token"""
+        from websocket_server import admin_drain, drain
+        response = await admin_drain(x_admin_token="anything")
+        assert response.status_code == 404
+        with patch.object(drain, "token", "secret"):
+            response = await admin_drain(x_admin_token="wrong")
+        assert response.status_code == 403
+        assert not drain.draining
 
 # --- Integration test for real API ---
 @pytest.mark.integration
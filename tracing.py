@@ -0,0 +1,261 @@
+"""
+Lightweight request tracing for the Gemini servers.
+
+Every incoming message gets a unique request ID and a trace made of
+spans (receive, parse, session_lookup, upstream, chunk, send). Finished
+spans are written by a background thread to a local file, either as one
+JSON object per span or as OTLP/JSON lines that OpenTelemetry tooling
+can import, so slow requests can be broken down after the fact.
+
+Environment variables:
+    TRACE_FILE: Path of the span sink; spans are not exported when unset
+    TRACE_FORMAT: "jsonl" (default) or "otlp"
+    TRACE_SERVICE: Service name recorded with OTLP output (default gemini-server)
+"""
+import os
+import json
+import time
+import uuid
+import queue
+import atexit
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+_current_span: contextvars.ContextVar = contextvars.ContextVar("current_span", default=None)
+
+
+def new_request_id() -> str:
+    """Return a new globally unique request ID."""
+    return f"req_{uuid.uuid4().hex}"
+
+
+class Span:
+    """A timed operation within a request's trace."""
+    __slots__ = ("trace_id", "span_id", "parent_id", "request_id", "name",
+                 "start_ns", "end_ns", "_start_perf", "attributes", "error")
+
+    def __init__(self, name: str, trace_id: str, request_id: str, parent_id: Optional[str] = None,
+                 attributes: Optional[Dict[str, Any]] = None):
+        self.trace_id = trace_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.request_id = request_id
+        self.name = name
+        self.start_ns = time.time_ns()
+        self._start_perf = time.perf_counter_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes = attributes or {}
+        self.error: Optional[str] = None
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def finish(self):
+        # Wall-clock start plus a monotonic duration
+        self.end_ns = self.start_ns + (time.perf_counter_ns() - self._start_perf)
+
+    @property
+    def duration_ms(self) -> float:
+        end_ns = self.end_ns if self.end_ns is not None else time.time_ns()
+        return (end_ns - self.start_ns) / 1e6
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "request_id": self.request_id,
+            "name": self.name,
+            "start_time": self.start_ns / 1e9,
+            "duration_ms": round(self.duration_ms, 3),
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+class _NoopSpan:
+    """Stand-in yielded for child spans when export is disabled."""
+    request_id = None
+
+    def set_attribute(self, key, value):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def to_otlp(spans: List[Span], service_name: str) -> Dict[str, Any]:
+    """Convert finished spans into an OTLP/JSON ExportTraceServiceRequest."""
+    otlp_spans = []
+    for span in spans:
+        attributes = {"request_id": span.request_id, **span.attributes}
+        otlp_span = {
+            "traceId": span.trace_id,
+            "spanId": span.span_id,
+            "name": span.name,
+            "kind": 2 if span.parent_id is None else 1,
+            "startTimeUnixNano": str(span.start_ns),
+            "endTimeUnixNano": str(span.end_ns),
+            "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in attributes.items() if v is not None],
+            "status": {"code": 2, "message": span.error} if span.error else {"code": 1},
+        }
+        if span.parent_id:
+            otlp_span["parentSpanId"] = span.parent_id
+        otlp_spans.append(otlp_span)
+    return {"resourceSpans": [{
+        "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": service_name}}]},
+        "scopeSpans": [{"scope": {"name": "gemini.tracing"}, "spans": otlp_spans}],
+    }]}
+
+
+class FileSpanExporter:
+    """Writes finished spans to a file from a background thread."""
+
+    def __init__(self, path: str, otlp: bool = False, service_name: str = "gemini-server"):
+        self.path = path
+        self.otlp = otlp
+        self.service_name = service_name
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+        self._thread.start()
+
+    def export(self, span: Span):
+        self._queue.put(span)
+
+    def _drain(self, first: Span) -> List[Span]:
+        batch = [first]
+        while len(batch) < 512:
+            try:
+                span = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if span is None:
+                self._queue.put(None)
+                break
+            batch.append(span)
+        return batch
+
+    def _run(self):
+        with open(self.path, "a", encoding="utf-8") as sink:
+            while True:
+                span = self._queue.get()
+                if span is None:
+                    break
+                batch = self._drain(span)
+                try:
+                    if self.otlp:
+                        sink.write(json.dumps(to_otlp(batch, self.service_name)) + "\n")
+                    else:
+                        sink.writelines(json.dumps(s.to_dict(), default=str) + "\n" for s in batch)
+                    sink.flush()
+                except Exception as e:
+                    logging.getLogger(__name__).warning("Failed to write spans to %s: %s", self.path, e)
+
+    def shutdown(self):
+        """Flush pending spans and stop the writer thread."""
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(timeout=5)
+
+
+class Tracer:
+    """Creates request traces and exports their spans."""
+
+    def __init__(self, exporter: Optional[FileSpanExporter] = None):
+        self.exporter = exporter
+
+    @classmethod
+    def from_env(cls):
+        path = os.getenv("TRACE_FILE")
+        if not path:
+            return cls()
+        exporter = FileSpanExporter(
+            path,
+            otlp=os.getenv("TRACE_FORMAT", "jsonl").lower() == "otlp",
+            service_name=os.getenv("TRACE_SERVICE", "gemini-server"),
+        )
+        atexit.register(exporter.shutdown)
+        return cls(exporter)
+
+    @property
+    def enabled(self) -> bool:
+        return self.exporter is not None
+
+    @contextmanager
+    def trace(self, name: str, request_id: Optional[str] = None, **attributes):
+        """
+        Start a new trace for one request; the root span is always created
+        so its request ID is available to logs even when export is off.
+
+        Args:
+            name: Root span name
+            request_id: Existing request ID to use instead of a new one
+            **attributes: Attributes recorded on the root span
+        """
+        trace_id = uuid.uuid4().hex
+        span = Span(name, trace_id, request_id or f"req_{trace_id}", attributes=attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = repr(e)
+            raise
+        finally:
+            _current_span.reset(token)
+            self._finish(span)
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        """Time a child span of the current span."""
+        parent = _current_span.get()
+        if parent is None or not self.enabled:
+            yield _NOOP_SPAN
+            return
+        span = Span(name, parent.trace_id, parent.request_id, parent.span_id, attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = repr(e)
+            raise
+        finally:
+            _current_span.reset(token)
+            self._finish(span)
+
+    def _finish(self, span: Span):
+        span.finish()
+        if self.exporter is not None:
+            self.exporter.export(span)
+
+
+def current_request_id() -> Optional[str]:
+    """Request ID of the trace active in this context, if any."""
+    span = _current_span.get()
+    return span.request_id if span is not None else None
+
+
+class RequestIdFilter(logging.Filter):
+    """Logging filter that tags records with the active request ID."""
+
+    def filter(self, record):
+        request_id = current_request_id()
+        if request_id is not None and not hasattr(record, "request_id"):
+            record.request_id = request_id
+        return True
+
+
+# Tracer shared by the servers, configured from the environment
+tracer = Tracer.from_env()
@@ -0,0 +1,155 @@
+"""
+Fast start: bind the port first, warm up in the background.
+
+Server modules register their expensive start-up work (importing the
+Gemini SDK, initialising models) as warm-up steps. By default the steps
+run inline at import time, as before. With FAST_START=1 the server binds
+its port first and then runs them on a background thread, started once it
+is listening so the warm-up does not compete with the rest of start-up:
+
+- ``GET /ready`` answers 503 until warm-up has finished, then 200, so a
+  load balancer or orchestrator only routes traffic to warm workers.
+  Liveness checks should keep using ``/``.
+- Connections that arrive before then wait for warm-up (up to
+  WARMUP_TIMEOUT) instead of failing.
+
+Environment variables:
+    FAST_START: Set to 1 to run warm-up in the background after binding (default off)
+    WARMUP_TIMEOUT: Seconds a connection waits for warm-up to finish (default 60)
+"""
+import os
+import time
+import asyncio
+import logging
+import threading
+from http import HTTPStatus
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from metrics import Gauge
+from protocol import encode
+
+logger = logging.getLogger(__name__)
+
+SERVER_READY = Gauge("server_ready", "1 once warm-up has finished and the server is ready, else 0")
+WARMUP_SECONDS = Gauge("warmup_seconds", "Time the start-up warm-up took")
+
+READY_PATH = "/ready"
+
+
+class WarmupFailed(Exception):
+    """Raised to callers waiting for a warm-up that failed or timed out."""
+
+
+class Warmup:
+    """
+    Start-up steps run before a server is ready.
+
+    Args:
+        background: Run the steps on a background thread (fast start)
+            instead of inline
+        timeout: Seconds wait() waits for the steps to finish
+    """
+
+    def __init__(self, background: bool = False, timeout: float = 60.0):
+        self.background = background
+        self.timeout = timeout
+        self.steps: List[Callable[[], Any]] = []
+        self.started = False
+        self.done = threading.Event()
+        self.error: Optional[BaseException] = None
+        self.seconds: Optional[float] = None
+        SERVER_READY.set(0)
+
+    @classmethod
+    def from_env(cls, **defaults):
+        settings = dict(defaults)
+        if os.getenv("FAST_START"):
+            settings["background"] = os.getenv("FAST_START").strip().lower() not in ("0", "false", "no", "off")
+        if os.getenv("WARMUP_TIMEOUT"):
+            settings["timeout"] = float(os.getenv("WARMUP_TIMEOUT"))
+        return cls(**settings)
+
+    def step(self, function: Callable[[], Any]) -> Callable[[], Any]:
+        """Register a start-up step; steps run in registration order."""
+        self.steps.append(function)
+        return function
+
+    def start(self):
+        """
+        Run the steps once: on a background thread in fast-start mode,
+        otherwise inline, re-raising the first step's failure.
+        """
+        if self.started:
+            return
+        self.started = True
+        if self.background:
+            logger.info("Fast start: warming up in the background")
+            threading.Thread(target=self._run, name="warmup", daemon=True).start()
+            return
+        self._run()
+        if self.error is not None:
+            raise self.error
+
+    def _run(self):
+        started = time.perf_counter()
+        try:
+            for step in self.steps:
+                step()
+        except Exception as e:
+            self.error = e
+            logger.exception("Warm-up step %s failed", getattr(step, "__name__", step))
+        else:
+            SERVER_READY.set(1)
+        finally:
+            self.seconds = time.perf_counter() - started
+            WARMUP_SECONDS.set(self.seconds)
+            self.done.set()
+        if self.error is None:
+            logger.info("Warm-up finished in %.2fs", self.seconds)
+
+    @property
+    def ready(self) -> bool:
+        return self.done.is_set() and self.error is None
+
+    async def wait(self):
+        """
+        Wait for warm-up to finish without blocking the event loop.
+
+        Raises:
+            WarmupFailed: If a step failed or warm-up took longer than the timeout
+        """
+        if not self.done.is_set():
+            # In case the server never started it
+            self.start()
+            deadline = time.monotonic() + self.timeout
+            while not self.done.is_set():
+                if time.monotonic() >= deadline:
+                    raise WarmupFailed(f"Server still warming up after {self.timeout:.0f}s")
+                await asyncio.sleep(0.05)
+        if self.error is not None:
+            raise WarmupFailed(f"Server warm-up failed: {self.error}")
+
+    def status(self) -> Tuple[HTTPStatus, Dict[str, Any]]:
+        """Readiness for the /ready endpoint; returns ``(status, body)``."""
+        if self.ready:
+            return HTTPStatus.OK, {"status": "ready", "warmup_seconds": round(self.seconds, 3)}
+        if self.error is not None:
+            return HTTPStatus.SERVICE_UNAVAILABLE, {"status": "failed", "error": str(self.error)}
+        return HTTPStatus.SERVICE_UNAVAILABLE, {"status": "warming"}
+
+    def gate(self, process_request=None):
+        """
+        Build a ``process_request`` hook for ``websockets.serve`` that serves
+        GET /ready.
+
+        Args:
+            process_request: Hook to run for every other path
+        """
+        async def gate(path, request_headers):
+            if path == READY_PATH:
+                status, body = self.status()
+                return status, [("Content-Type", "application/json")], encode(body).encode()
+            if process_request is not None:
+                return await process_request(path, request_headers)
+            return None
+        return gate
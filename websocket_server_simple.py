@@ -1,10 +1,21 @@
+import time
 import asyncio
-import json
 import logging
 import os
 import traceback
 import websockets
 from gemini_api import GeminiAPI
+from admission import AdmissionController, AdmissionSettings
+from drain import Drain
+from compression import CompressionSettings
+from connection import ConnectionTable
+from history_compaction import CompactionSettings, HistoryCompactor
+from metrics import (ACTIVE_CONNECTIONS, CHAT_SESSIONS, ERRORS, GEMINI_LATENCY, INFLIGHT_REQUESTS,
+                     QUEUE_WAIT, SEND, SERIALIZATION, TIME_TO_FIRST_CHUNK, websockets_process_request)
+from protocol import ChatMessage, Dispatcher, Ping, ProtocolError, decode, encode, error_frame
+from scheduler import FairScheduler
+from session_pool import SessionPool, SessionPoolSettings
+from tracing import current_request_id, tracer
 
 # Configure logging
 logging.basicConfig(
@@ -13,9 +24,28 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Store active connections and chat sessions
-active_connections = {}
-chat_sessions = {}
+# WebSocket compression settings (override with WS_COMPRESSION_* environment variables)
+compression_settings = CompressionSettings.from_env("WS_COMPRESSION")
+
+# In-flight request and connection limits (override with ADMISSION_* environment variables)
+admission = AdmissionController(AdmissionSettings.from_env("ADMISSION"))
+admission.bind_metrics()
+# Graceful drain on SIGTERM or the admin endpoint (override with DRAIN_* environment variables)
+drain = Drain.from_env(lambda: admission.inflight + admission.queued, lambda: active_connections.values())
+# Handshake hook for websockets.serve: answers /metrics and /admin/drain, and refuses
+# connections past capacity or while draining
+process_request = admission.connection_gate(lambda: len(active_connections), drain.gate(websockets_process_request))
+
+# Fair scheduling of Gemini calls across clients (override with SCHEDULER_* environment variables)
+scheduler = FairScheduler.from_env()
+
+# One compact record per connection (see connection.py); active connections
+# and chat sessions are views of the records' socket and session fields
+connections = ConnectionTable()
+active_connections = connections.view("websocket")
+chat_sessions = connections.view("session")
+ACTIVE_CONNECTIONS.set_function(lambda: len(active_connections))
+CHAT_SESSIONS.set_function(lambda: len(chat_sessions))
 
 # Initialize Gemini API
 try:
@@ -43,6 +73,78 @@ except Exception as e:
     logger.error(f"Failed to initialize Gemini API: {str(e)}")
     raise
 
+# Pre-created chat sessions handed out on connect (override with SESSION_POOL_* environment variables)
+session_pool = SessionPool(gemini_api.chat_session, SessionPoolSettings.from_env("SESSION_POOL"))
+session_pool.bind_metrics()
+session_pool.start()
+drain.on_flush(session_pool.close)
+
+# Idle chat histories are compressed until the client's next message
+# (override with HISTORY_COMPACTION_* environment variables)
+history_compactor = HistoryCompactor(connections, gemini_api.export_history, gemini_api.restore_session,
+                                     CompactionSettings.from_env("HISTORY_COMPACTION"))
+history_compactor.bind_metrics()
+history_compactor.start()
+drain.on_flush(history_compactor.stop)
+
+# Dispatch table for client messages
+dispatcher = Dispatcher()
+
+@dispatcher.on(ChatMessage)
+@drain.guard
+@admission.guard
+async def handle_chat_message(message, client_id, send):
+    """Process a user prompt with Gemini and send back the response"""
+    content = message.content
+    
+    # Send acknowledgment
+    with tracer.span("send", frame="status"):
+        await send(encode({
+            "type": "status",
+            "content": "Processing your request..."
+        }))
+    logger.info(f"✅ PROCESSING: {client_id} [{current_request_id()}] - Message: {content[:30]}...")
+    
+    # Process with Gemini
+    logger.info(f"Processing message: {content[:30]}...")
+    with INFLIGHT_REQUESTS.track_inprogress():
+        try:
+            # The session is kept out of idle sweeps until the answer is in
+            with history_compactor.hold(client_id):
+                with tracer.span("session_lookup"):
+                    chat_session = history_compactor.session(chat_sessions, client_id)
+                
+                def call_gemini():
+                    # Runs on a scheduler worker once it is this client's turn
+                    QUEUE_WAIT.observe(time.perf_counter() - message.received_at)
+                    with tracer.span("upstream", target="gemini", prompt_chars=len(content)), GEMINI_LATENCY.time():
+                        return chat_session.send_message(content).text
+                
+                with tracer.span("schedule", lane="interactive"):
+                    response_text = await scheduler.run(client_id, call_gemini, lane="interactive")
+        except Exception:
+            ERRORS.labels(type="gemini").inc()
+            raise
+        
+        # Send response back
+        with tracer.span("chunk", frame="response", chars=len(response_text)), SERIALIZATION.time():
+            response_str = encode({
+                "type": "response",
+                "content": response_text
+            })
+        with tracer.span("send", frame="response", bytes=len(response_str)), SEND.time():
+            await send(response_str)
+        TIME_TO_FIRST_CHUNK.observe(time.perf_counter() - message.received_at)
+    logger.info(f"✅ RESPONSE SENT: {client_id} [{current_request_id()}] - Length: {len(response_text)} chars")
+
+@dispatcher.on(Ping)
+async def handle_ping(message, client_id, send):
+    """Respond to ping"""
+    await send(encode({
+        "type": "pong"
+    }))
+    logger.info(f"✅ PING-PONG: {client_id}")
+
 async def handle_client(websocket, path):
     """Handle websocket connection for each client"""
     # Extract client ID from the path or generate one
@@ -52,13 +154,13 @@ async def handle_client(websocket, path):
     
     logger.info(f"New connection from client: {client_id}")
     
+    # Store the connection
+    conn = connections.open(client_id, websocket)
+    logger.info(f"✅ CLIENT REGISTERED: {client_id} (Total active: {len(active_connections)})")
+    
     try:
-        # Store the connection
-        active_connections[client_id] = websocket
-        logger.info(f"✅ CLIENT REGISTERED: {client_id} (Total active: {len(active_connections)})")
-        
         # Create a chat session for this client
-        chat_sessions[client_id] = gemini_api.chat_session()
+        chat_sessions[client_id] = await session_pool.acquire()
         logger.info(f"Created chat session for client {client_id}")
         
         # Send welcome message
@@ -66,57 +168,29 @@ async def handle_client(websocket, path):
             "type": "connected",
             "content": "Connected to Gemini WebSocket Server"
         }
-        await websocket.send(json.dumps(welcome_msg))
+        await websocket.send(encode(welcome_msg))
         logger.info(f"✅ WELCOME MESSAGE SENT: {client_id}")
         
         # Process messages from the client
-        async for message in websocket:
-            try:
-                # Parse the message
-                data = json.loads(message)
-                logger.info(f"Received message from {client_id}: {data}")
-                
-                if data.get("type") == "message":
-                    content = data.get("content", "")
-                    
-                    # Send acknowledgment
-                    await websocket.send(json.dumps({
-                        "type": "status",
-                        "content": "Processing your request..."
-                    }))
-                    logger.info(f"✅ PROCESSING: {client_id} - Message: {content[:30]}...")
-                    
-                    # Process with Gemini
-                    logger.info(f"Processing message: {content[:30]}...")
-                    response = chat_sessions[client_id].send_message(content)
-                    response_text = response.text
-                    
-                    # Send response back
-                    await websocket.send(json.dumps({
-                        "type": "response",
-                        "content": response_text
-                    }))
-                    logger.info(f"✅ RESPONSE SENT: {client_id} - Length: {len(response_text)} chars")
+        async for raw_message in websocket:
+            conn.messages_in += 1
+            # Each message gets its own request ID and trace
+            with tracer.trace("receive", client_id=client_id, bytes=len(raw_message)) as root:
+                try:
+                    # Decode, validate and route the message
+                    with tracer.span("parse"):
+                        message = decode(raw_message)
+                    root.set_attribute("message_type", message.type)
+                    logger.info(f"Received message from {client_id} [{root.request_id}]: {message}")
+                    await dispatcher.dispatch(message, client_id, conn.send)
                 
-                elif data.get("type") == "ping":
-                    # Respond to ping
-                    await websocket.send(json.dumps({
-                        "type": "pong"
-                    }))
-                    logger.info(f"✅ PING-PONG: {client_id}")
-            
-            except json.JSONDecodeError:
-                logger.warning(f"Received invalid JSON from client {client_id}")
-                await websocket.send(json.dumps({
-                    "type": "error",
-                    "content": "Invalid message format"
-                }))
-            except Exception as e:
-                logger.error(f"Error processing message: {str(e)}")
-                await websocket.send(json.dumps({
-                    "type": "error", 
-                    "content": f"Error processing your request: {str(e)}"
-                }))
+                except ProtocolError as e:
+                    ERRORS.labels(type="protocol").inc()
+                    logger.warning(f"Received invalid message from client {client_id}: {str(e)}")
+                    await websocket.send(error_frame(f"Invalid message format: {str(e)}"))
+                except Exception as e:
+                    logger.error(f"Error processing message [{root.request_id}]: {str(e)}")
+                    await websocket.send(error_frame(f"Error processing your request: {str(e)}"))
     
     except websockets.exceptions.ConnectionClosed as e:
         logger.info(f"Connection closed for client {client_id}: {str(e)}")
@@ -125,11 +199,12 @@ async def handle_client(websocket, path):
         logger.error(f"Error handling client {client_id}: {str(e)}\n{traceback.format_exc()}")
     
     finally:
-        # Clean up
-        if client_id in active_connections:
-            del active_connections[client_id]
-        if client_id in chat_sessions:
-            del chat_sessions[client_id]
+        # A client that has already reconnected keeps its new connection's record and session
+        if connections.get(client_id) is conn:
+            if client_id in active_connections:
+                del active_connections[client_id]
+            if client_id in chat_sessions:
+                del chat_sessions[client_id]
         logger.info(f"❌ CLIENT DISCONNECTED: {client_id} (Total active: {len(active_connections)})")
 
 async def main():
@@ -139,10 +214,13 @@ async def main():
     
     logger.info(f"Starting WebSocket server on {host}:{port}")
     
-    async with websockets.serve(handle_client, host, port):
+    async with websockets.serve(handle_client, host, port, process_request=process_request,
+                                **compression_settings.serve_kwargs()):
         logger.info(f"✅ SERVER RUNNING: ws://{host}:{port} - Ready to accept connections")
-        # Keep the server running
-        await asyncio.Future()
+        # Keep the server running until a drain (SIGTERM or /admin/drain) completes
+        drain.handle_signals()
+        await drain.stopped.wait()
+        logger.info("⚠️ Server drained, shutting down")
 
 if __name__ == "__main__":
     try: